@@ -15,6 +15,7 @@
 #      TNO
 
 import importlib
+import itertools
 import json
 import urllib
 import uuid
@@ -32,6 +33,7 @@ from flask_session import Session
 from flask_socketio import SocketIO, emit
 from pyecore.ecore import EDate
 
+import src.area_layer as area_layer
 import src.esdl_config as esdl_config
 import src.settings as settings
 from esdl import esdl
@@ -57,7 +59,7 @@ from extensions.mapeditor_settings import MAPEDITOR_UI_SETTINGS, MapEditorSettin
 from extensions.pico_rooftoppv_potential import PICORooftopPVPotential
 from extensions.port_profile_viewer import PortProfileViewer
 from extensions.profiles import Profiles
-from extensions.session_manager import del_session, delete_sessions_on_disk, get_handler, get_session, \
+from extensions.session_manager import commit_session, del_session, delete_sessions_on_disk, get_handler, get_session, \
     get_session_for_esid, schedule_session_clean_up, set_handler, set_session, set_session_for_esid, valid_session
 from extensions.settings_storage import SettingsStorage
 from extensions.shapefile_converter import ShapefileConverter
@@ -77,7 +79,9 @@ from src.esdl_services import ESDLServices
 from src.essim_kpis import ESSIM_KPIs
 from src.essim_validation import validate_ESSIM
 from src.log import get_logger
-from src.process_es_area_bld import get_building_information, process_energy_system, get_building_connections
+from src.process_es_area_bld import get_building_information, process_energy_system, get_building_connections, \
+    emit_energy_system_skeleton, emit_load_progress
+from src.process_es_delta import reset_emitted_state
 from src.user_logging import UserLogging
 from src.version import __long_version__ as mapeditor_version
 from src.view_modes import ViewModes
@@ -109,6 +113,7 @@ wms_layers = WMSLayers(settings_storage)
 
 # handler to retrieve ESDL documentation
 esdl_doc = EcoreDocumentation(esdlEcoreFile="esdl/esdl.ecore")
+ESDLEcore.cache_attribute_descriptors(esdl_doc=esdl_doc)
 
 
 def is_running_in_uwsgi():
@@ -233,6 +238,10 @@ def before_request():
     session['client_id'] = request.cookies.get(app.config['SESSION_COOKIE_NAME'])  # get cookie id
 
 
+# also called after each socket.io event, as Flask-SocketIO handles events in a request context
+app.teardown_request(commit_session)
+
+
 @app.route('/')
 def index():
     store_enabled = settings.esdl_store_config or settings.mondaine_hub_config
@@ -400,8 +409,8 @@ def logout():
 
 
 # Cant find out why send_file does not work in uWSGI with threading.
-# Now we send manually the ESDL as string, which is (probably) not efficient.
-# This still works with a 1.6 MB file... Not sure if this scales any further...
+# Now we stream the ESDL in chunks while it is being serialized, such that the complete ESDL string is never
+# created in memory.
 @app.route('/esdl')
 def download_esdl():
     """Sends the current ESDL file to the browser as an attachment"""
@@ -425,14 +434,17 @@ def download_esdl():
 
         user_email = get_session('user-email')
         user_actions_logging.store_logging(user_email, "download esdl", name, "", "", {})
-        content = esh.to_string(es_id=active_es_id)
+        # stream a frozen view, as the energy system can be edited while the file is being sent
+        content = stream_frozen_view(esh.freeze(es_id=active_es_id))
+        # serialize the first chunk here, so errors at the start are reported instead of sending a broken file
+        content = itertools.chain([next(content)], content)
 
         #wrapped_io = FileWrapper(stream)
         #logger.debug(content)
         headers = dict()
         #headers['Content-Type'] =  'application/esdl+xml'
         headers['Content-Disposition'] = 'attachment; filename="{}"'.format(name)
-        headers['Content-Length'] = len(content)
+        # no Content-Length: it is unknown until the last chunk is serialized, so chunked transfer encoding is used
         return Response(content, mimetype='application/esdl+xml', direct_passthrough=True, headers=headers)
         #return send_file(stream, as_attachment=True, mimetype='application/esdl+xml', attachment_filename=name)
     except Exception as e:
@@ -442,6 +454,12 @@ def download_esdl():
 
 
 
+def stream_frozen_view(es_view):
+    """Yields the ESDL of a frozen view in chunks, closes the view when done or when the download is aborted"""
+    with es_view:
+        yield from es_view.to_chunks()
+
+
 @app.route('/<path:path>')
 def serve_static(path):
     # logger.debug('in serve_static(): '+ path)
@@ -495,7 +513,7 @@ def create_ESDL_store_item(id, esh, title, description, email):
         store_url = default_store_url
 
     if store_url:
-        esdlstr = esh.to_string()
+        esdlstr = esh.to_string(compact=True)
         try:
             payload = {'id': id, 'title': title, 'description': description, 'email':email, 'esdl': esdlstr}
             requests.post(store_url, data=payload)
@@ -590,7 +608,7 @@ def update_store_item(store_id, title, descr, email, tags, esh):
         store_url = default_store_url
 
     if store_url:
-        esdlstr = esh.to_string()
+        esdlstr = esh.to_string(compact=True)
 
         payload = {'id': store_id, 'title': title, 'description': descr, 'email': email, 'tags': tags, 'esdl': esdlstr}
         try:
@@ -607,7 +625,7 @@ def create_new_store_item(store_id, title, descr, email, tags, esh):
         store_url = default_store_url
 
     if store_url:
-        esdlstr = esh.to_string()
+        esdlstr = esh.to_string(compact=True)
 
         payload = {'id': store_id, 'title': title, 'description': descr, 'email': email, 'tags': tags, 'esdl': esdlstr}
         try:
@@ -900,20 +918,8 @@ def split_conductor(conductor, location, mode, conductor_container):
         # officially we should duplicate all Point in this code
         line1.point.append(esdl.Point(lat=begin_point.lat, lon=begin_point.lon, elevation=begin_point.elevation))
 
+        min_dist_segm = ESDLGeometry.closest_segment(geometry, location['lat'], location['lng'])
         points.pop(0)
-        min_dist = 1e99
-        segm_ctr = 0
-        min_dist_segm = 0
-        for point in points:
-            p1 = {'x': begin_point.lat, 'y': begin_point.lon}
-            p2 = {'x': point.lat, 'y': point.lon}
-            p =  {'x': location['lat'], 'y': location['lng']}
-            dist = ESDLGeometry.distance_point_to_line(p, p1, p2)
-            if dist < min_dist:
-                min_dist = dist
-                min_dist_segm = segm_ctr
-            begin_point = point
-            segm_ctr += 1
 
         # copy appropriate points in original conductor to either line1 or line2
         points = geometry.point
@@ -982,19 +988,9 @@ def split_conductor(conductor, location, mode, conductor_container):
         esh.add_object_to_dict(active_es_id, new_port2)
 
         # calculate line lengths
-        start = line1.point[0]
-        length = 0
-        for i in range(1, len(line1.point)):
-            length += ESDLGeometry.distance((start.lat, start.lon), (line1.point[i].lat, line1.point[i].lon)) * 1000
-            start = line1.point[i]
-        new_cond1.length = round(length, 2)
-
-        start = line2.point[0]
-        length = 0
-        for i in range(1, len(line2.point)):
-            length += ESDLGeometry.distance((start.lat, start.lon), (line2.point[i].lat, line2.point[i].lon)) * 1000
-            start = line2.point[i]
-        new_cond2.length = round(length, 2)
+        length1, length2 = ESDLGeometry.line_lengths([line1, line2])
+        new_cond1.length = round(float(length1), 2)
+        new_cond2.length = round(float(length2), 2)
 
         logger.debug('split-conductor: line1 length={}, line2 length={}'.format(new_cond1.length, new_cond2.length))
         # assign line geometry to the correct conductor
@@ -1135,38 +1131,40 @@ def update_coordinates(message):
     coords = message['coordinates']
 
     object = esh.get_by_id(active_es_id, obj_id)
-    # object can be an EnergyAsset, Building, Potential or Note
-    if object:
-        if isinstance(object, esdl.Note):
-            geom = object.mapLocation
-        else:
-            geom = object.geometry
-
-        if isinstance(geom, esdl.Point):
-            point = esdl.Point(lon=float(coords['lng']), lat=float(coords['lat']))
+    # the browser sends an update for every move, moving an object around is undone as one action
+    with esh.get_undo_journal(active_es_id).action('Move {}'.format(obj_id), coalesce_key=('move', obj_id)):
+        # object can be an EnergyAsset, Building, Potential or Note
+        if object:
             if isinstance(object, esdl.Note):
-                object.mapLocation = point
+                geom = object.mapLocation
             else:
-                object.geometry = point
-        # elif isinstance(geom, esdl.Polygon):
-            # Do nothing in case of a polygon
-            # only update the connection locations and mappings based on the center of the polygon
-            # that is given as a parameter.
+                geom = object.geometry
 
-        # update coordinates in asset_list
-        asset_list = get_session_for_esid(active_es_id, 'asset_list')
-        for a in asset_list:
-            if a[3] == obj_id:
-                a[5] = [coords['lat'], coords['lng']]
-                break # ready searching
+            if isinstance(geom, esdl.Point):
+                point = esdl.Point(lon=float(coords['lng']), lat=float(coords['lat']))
+                if isinstance(object, esdl.Note):
+                    object.mapLocation = point
+                else:
+                    object.geometry = point
+            # elif isinstance(geom, esdl.Polygon):
+                # Do nothing in case of a polygon
+                # only update the connection locations and mappings based on the center of the polygon
+                # that is given as a parameter.
+
+            # update coordinates in asset_list
+            asset_list = get_session_for_esid(active_es_id, 'asset_list')
+            for a in asset_list:
+                if a[3] == obj_id:
+                    a[5] = [coords['lat'], coords['lng']]
+                    break # ready searching
 
-        if isinstance(object, (esdl.EnergyAsset, esdl.AbstractBuilding)):
-            # Update locations of connections on moving assets
-            update_asset_connection_locations(obj_id, coords['lat'], coords['lng'])
+            if isinstance(object, (esdl.EnergyAsset, esdl.AbstractBuilding)):
+                # Update locations of connections on moving assets
+                update_asset_connection_locations(obj_id, coords['lat'], coords['lng'])
 
-            # TODO: Check if this is still required
-            if message['asspot'] == 'building':
-                send_alert("Assets in building with locations are not updated yet")
+                # TODO: Check if this is still required
+                if message['asspot'] == 'building':
+                    send_alert("Assets in building with locations are not updated yet")
 
 
 @socketio.on('update-line-coord', namespace='/esdl')
@@ -1178,29 +1176,30 @@ def update_line_coordinates(message):
     esh = get_handler()
     asset = esh.get_by_id(active_es_id, ass_id)
 
-    if asset:
-        ports = asset.port
-        polyline_data = message['polyline']
-        # logger.debug(polyline_data)
-        # logger.debug(type(polyline_data))
-        polyline_length = float(message['length'])
-        asset.length = polyline_length
-
-        line = esdl.Line()
-        for i in range(0, len(polyline_data)):
-            coord = polyline_data[i]
-            point = esdl.Point(lon=coord['lng'], lat=coord['lat'])
-            line.point.append(point)
-        asset.geometry = line
-
-        # update coordinates in asset_list
-        asset_list = get_session_for_esid(active_es_id, 'asset_list')
-        for a in asset_list:
-            if a[3] == ass_id:
-                a[5] = [(coord['lat'], coord['lng']) for coord in polyline_data]
-                break  # ready searching
+    with esh.get_undo_journal(active_es_id).action('Edit line {}'.format(ass_id), coalesce_key=('move', ass_id)):
+        if asset:
+            ports = asset.port
+            polyline_data = message['polyline']
+            # logger.debug(polyline_data)
+            # logger.debug(type(polyline_data))
+            polyline_length = float(message['length'])
+            asset.length = polyline_length
+
+            line = esdl.Line()
+            for i in range(0, len(polyline_data)):
+                coord = polyline_data[i]
+                point = esdl.Point(lon=coord['lng'], lat=coord['lat'])
+                line.point.append(point)
+            asset.geometry = line
+
+            # update coordinates in asset_list
+            asset_list = get_session_for_esid(active_es_id, 'asset_list')
+            for a in asset_list:
+                if a[3] == ass_id:
+                    a[5] = [(coord['lat'], coord['lng']) for coord in polyline_data]
+                    break  # ready searching
 
-        update_transport_connection_locations(ass_id, asset, polyline_data)
+            update_transport_connection_locations(ass_id, asset, polyline_data)
 
 
 @socketio.on('update-polygon-coord', namespace='/esdl')
@@ -1212,21 +1211,19 @@ def update_polygon_coordinates(message):
     esh = get_handler()
     asset = esh.get_by_id(active_es_id, ass_id)
 
-    if asset:
-        polygon_data = message['polygon']
-        # logger.debug(polygon_data)
-        # logger.debug(type(polygon_data))
-        polygon_area = int(message['polygon_area'])
-        asset.surfaceArea = polygon_area
+    with esh.get_undo_journal(active_es_id).action('Edit polygon {}'.format(ass_id), coalesce_key=('move', ass_id)):
+        if asset:
+            polygon_data = message['polygon']
+            # logger.debug(polygon_data)
+            # logger.debug(type(polygon_data))
+            polygon_area = int(message['polygon_area'])
+            asset.surfaceArea = polygon_area
 
-        polygon_data = ESDLGeometry.remove_duplicates_in_polygon(polygon_data)
-        polygon_data = ESDLGeometry.remove_latlng_annotation_in_array_of_arrays(polygon_data)
-        polygon_data = ESDLGeometry.exchange_polygon_coordinates(polygon_data)  # --> [lon, lat]
-        polygon = ESDLGeometry.convert_pcoordinates_into_polygon(polygon_data)  # expects [lon, lat]
-        asset.geometry = polygon
+            polygon = ESDLGeometry.convert_leaflet_coordinates_into_polygon(polygon_data)
+            asset.geometry = polygon
 
-        polygon_center = ESDLGeometry.calculate_polygon_center(polygon)
-        update_polygon_asset_connection_locations(ass_id, polygon_center)
+            polygon_center = ESDLGeometry.calculate_polygon_center(polygon)
+            update_polygon_asset_connection_locations(ass_id, polygon_center)
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -1466,6 +1463,30 @@ def call_process_energy_system(esh, filename=None, es_title=None, app_context=No
     process_energy_system(esh, filename, es_title, app_context, force_update_es_id, zoom)
 
 
+@executor.job
+def call_load_and_process_energy_system(esdl_string, filename):
+    """Loads a (large) ESDL in the background, showing the outline of the area first and the progress of loading"""
+    esh = EnergySystemHandler()
+    try:
+        es, parse_info = esh.load_from_string(esdl_string=esdl_string, name=filename,
+                                              on_skeleton=emit_energy_system_skeleton, on_progress=emit_load_progress)
+        if len(parse_info) > 0:
+            info = ''
+            for line in parse_info:
+                info += line + "\n"
+            send_alert("Warnings while opening {}:\n\n{}".format(filename, info))
+    except Exception as e:
+        logger.exception(f"Error opening {filename}")
+        send_alert("Error opening {}. Exception is: {}".format(filename, e))
+        emit('clear_ui')
+        return
+
+    set_handler(esh)
+    set_session('active_es_id', es.id)
+    set_session('es_filename', filename)
+    process_energy_system(esh, filename)
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #  React on commands from the browser (add, remove, ...)
 # ---------------------------------------------------------------------------------------------------------------------
@@ -1496,6 +1517,14 @@ def process_command(message):
     #  session.modified = True
     # logger.debug (get_handler().instance[0].area.name)
 
+    # the changes of a command are undone and redone as one action, which is also ended when the command returns
+    # early or fails
+    with esh.get_undo_journal(active_es_id).action(label=message['cmd']):
+        return _execute_command(message, esh, es_edit, active_es_id, area_bld_list, user_email)
+
+
+def _execute_command(message, esh, es_edit, active_es_id, area_bld_list, user_email):
+    """Executes a command from the browser in the active energy system, see process_command()"""
     if message['cmd'] == 'add_object':
         area_bld_id = message['area_bld_id']
         asset_id = message['asset_id']
@@ -2981,12 +3010,40 @@ def process_command(message):
     if message['cmd'] == 'refresh_esdl':
         print('refresh_esdl')
         esh = get_handler()
-        call_process_energy_system.submit(esh, force_update_es_id=es_edit.id, zoom=False)  # run in seperate thread
+        refresh_es_id = message.get('es_id', es_edit.id)
+        if message.get('full', False):
+            # browser is out of sync, redraw the complete energy system instead of sending a delta
+            reset_emitted_state(refresh_es_id)
+        call_process_energy_system.submit(esh, force_update_es_id=refresh_es_id, zoom=False)  # run in seperate thread
 
     set_handler(esh)
     session.modified = True
 
 
+@socketio.on('undo', namespace='/esdl')
+def undo_edit():
+    replay_edit(undo=True)
+
+
+@socketio.on('redo', namespace='/esdl')
+def redo_edit():
+    replay_edit(undo=False)
+
+
+def replay_edit(undo):
+    """Undoes or redoes the last action in the active energy system and sends the changes to the browser"""
+    active_es_id = get_session('active_es_id')
+    esh = get_handler()
+    action = esh.undo(active_es_id) if undo else esh.redo(active_es_id)
+    if action is None:
+        send_alert('Nothing to {}'.format('undo' if undo else 'redo'))
+        return
+    logger.debug('{} {}'.format('Undo' if undo else 'Redo', action))
+    set_handler(esh)
+    session.modified = True
+    call_process_energy_system.submit(esh, force_update_es_id=active_es_id, zoom=False)  # run in seperate thread
+
+
 @executor.job
 def query_esdl_services(params):
     esh = get_handler()
@@ -3017,6 +3074,13 @@ def set_active_es_id(id):
     logger.debug("========== Setting active es_id to {} =============".format(id))
 
 
+@socketio.on('get_area_layer_geometries', namespace='/esdl')
+def get_area_layer_geometries(message):
+    es_id = message['es_id']
+    band, geometries = area_layer.get_area_layer_geometries(es_id, message['zoom'])
+    emit('area_layer_geometries', {'es_id': es_id, 'zoom_band': band, 'geometries': geometries})
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #  React on commands from the browser (add, remove, ...)
 # ---------------------------------------------------------------------------------------------------------------------
@@ -3050,6 +3114,15 @@ def process_file_command(message):
     if message['cmd'] == 'load_esdl_from_file':
         file_content = message['file_content']
         filename = message['filename']
+        if len(file_content) >= settings.esdl_load_config['background_threshold']:
+            set_session("es_info_list", {})
+            emit('clear_ui')
+            emit('clear_esdl_layer_list')
+            del_session('store_item_metadata')
+            emit('store_item_metadata', {})
+            call_load_and_process_energy_system.submit(file_content, filename)
+            return
+
         esh = EnergySystemHandler()
 
         try:
@@ -0,0 +1,631 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Append-only journal of the changes of an energy system, to restore it after the process that kept it in memory has
+been restarted.
+
+The journal of an energy system is kept in a directory with checkpoints (the binary encoding of the energy system,
+see esdl/resources/binary.py) and journal files with the changes since a checkpoint, one JSON array per line:
+
+    checkpoint.<generation>.bin
+    journal.<generation>.log
+
+An EditJournal observes the resource of the energy system and appends a record for every change of an attribute,
+reference or containment. Objects are referred to by their id, or by a path from the closest container with an id
+(e.g. the points of a line). New objects are written with all their contents. Removed objects are observed as well,
+such that they can be referred to by the number of the record that removed them when they (or their contents) are
+added again. Records are buffered and written and fsynced in batches: when flush() is called (at the end of each
+request), when many records are buffered and at most FSYNC_INTERVAL after a record has been buffered, such that the
+changes of background jobs are written as well. When the journal becomes too long, flush() writes a new checkpoint.
+
+A checkpoint is written to a temporary file and renamed, such that a checkpoint is either complete or absent. The
+journal of the previous generation is only removed after the new checkpoint has been written, and a restore replays
+all journals from the generation of the last checkpoint onwards. A partially written last record (of a crash while
+writing) is ignored.
+
+EditJournalDirectory keeps the journals of all energy systems of all sessions in a local directory:
+<path>/<client_id>/<es_id>/, and a meta.json per session with the energy systems of the session.
+"""
+from pyecore.ecore import EObject, EReference, EAttribute, EClass
+from pyecore.notification import EObserver, Notification, Kind
+from pyecore.resources import Resource
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from esdl.resources import binary
+from urllib.parse import quote, unquote
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+FSYNC_INTERVAL = 1.0                # seconds, maximum time records are buffered
+FLUSH_RECORDS = 1000                # number of buffered records that are written at once
+CHECKPOINT_BYTES = 8 * 2**20        # size of the journal files after which a new checkpoint is written
+
+_KINDS = {Kind.SET: 's', Kind.UNSET: 'u', Kind.ADD: 'a', Kind.ADD_MANY: 'A', Kind.REMOVE: 'r',
+          Kind.REMOVE_MANY: 'R'}
+_SET, _UNSET, _ADD, _ADD_MANY, _REMOVE, _REMOVE_MANY = 's', 'u', 'a', 'A', 'r', 'R'
+
+# cache of the id attribute of EClasses (or None)
+_id_attributes = dict()
+
+
+def _id_attribute(eclass: EClass):
+    if eclass not in _id_attributes:
+        _id_attributes[eclass] = next((a for a in eclass.eAllAttributes() if a.iD), None)
+    return _id_attributes[eclass]
+
+
+def _id_of(obj: EObject):
+    id_attribute = _id_attribute(obj.eClass)
+    if id_attribute is None:
+        return None
+    value = obj.eGet(id_attribute)
+    return value if value and ' ' not in value else None
+
+
+def _reference(obj: EObject, detached=None, skip_id=False):
+    """
+    [id] of obj, or [id of the closest container with an id, path from that container]. The root of the energy
+    system is referred to as None, the root of a removed subtree as {'m': number of the record that removed it}.
+    Returns None for objects that are neither in the energy system nor in a removed subtree (of this journal).
+    """
+    segments = []
+    while True:
+        obj_id = None if skip_id else _id_of(obj)
+        skip_id = False
+        if obj_id is not None:
+            break
+        container = obj.eContainer()
+        if not isinstance(container, EObject):
+            if detached and obj in detached:
+                obj_id = {'m': detached[obj]}
+            elif obj.eResource is None:
+                return None
+            break
+        feature = obj.eContainmentFeature()
+        if feature.many:
+            segments.append('{}.{}'.format(feature.name, container.eGet(feature).index(obj)))
+        else:
+            segments.append(feature.name)
+        obj = container
+    return [obj_id, '/'.join(reversed(segments))] if segments else [obj_id]
+
+
+def _is_container_reference(feature) -> bool:
+    # set by pyecore when an object is added to a containment with an opposite, which is recorded instead
+    return isinstance(feature, EReference) and feature.eOpposite is not None and feature.eOpposite.containment
+
+
+class EditJournal(EObserver):
+    """Writes the changes of the objects in a resource to the journal files in directory"""
+    def __init__(self, resource: Resource, directory: str):
+        super().__init__()
+        self.resource = resource
+        self.directory = directory
+        self.generation = 0
+        self.records = 0            # in the journal file of this generation (written and buffered)
+        self.journal_bytes = 0
+        self._buffer = []
+        self._file = None
+        self._last_flush = time.monotonic()
+        self._flush_timer = None
+        self._lock = threading.RLock()     # changes are made by request threads and background jobs
+        self._detached = dict()     # removed objects -> number of the record that removed them
+        self._moving = set()        # objects that are set to a new container, before they are removed from the old
+        self._observed = set()      # objects in removed subtrees, which are not notified through the resource
+        self._last_notification = None
+        os.makedirs(directory, exist_ok=True)
+        existing = _generations(directory, 'checkpoint.')
+        self.generation = max(existing, default=0)
+        self.checkpoint()
+        self.observe(resource)
+
+    def close(self, delete=False):
+        """Stops recording (after writing the buffered records) and removes the files when delete is True"""
+        with self._lock:
+            if self in self.resource.listeners:
+                self.resource.listeners.remove(self)
+            self._stop_observing()
+            if getattr(self.resource, 'edit_journal', None) is self:
+                del self.resource.edit_journal
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if delete:
+                self._buffer.clear()
+                self._close_file()
+                shutil.rmtree(self.directory, ignore_errors=True)
+            else:
+                self.flush(checkpoint=False)
+                self._close_file()
+
+    def checkpoint(self):
+        """Writes the energy system to a new checkpoint and starts a new journal"""
+        with self._lock:
+            self.flush(checkpoint=False)
+            self._close_file()
+            generation = self.generation + 1
+            fd, tmp_file = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(binary.encode(self.resource))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, os.path.join(self.directory, _file_name('checkpoint.', generation)))
+            self.generation = generation
+            self.records = 0
+            self.journal_bytes = 0
+            # removed objects are not part of the checkpoint, they are written as new objects when added again
+            self._detached.clear()
+            self._stop_observing()
+            for prefix in ('checkpoint.', 'journal.'):
+                for old_generation in _generations(self.directory, prefix):
+                    if old_generation < generation:
+                        os.remove(os.path.join(self.directory, _file_name(prefix, old_generation)))
+
+    def flush(self, checkpoint=True):
+        """Writes and fsyncs the buffered records, and writes a new checkpoint when the journal has become too long"""
+        with self._lock:
+            if self._buffer:
+                if self._file is None:
+                    self._file = open(os.path.join(self.directory, 'journal.{}.log'.format(self.generation)), 'ab')
+                data = ''.join(self._buffer).encode('UTF-8')
+                self._buffer.clear()
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.journal_bytes += len(data)
+            self._last_flush = time.monotonic()
+            if checkpoint and self.journal_bytes > CHECKPOINT_BYTES:
+                self.checkpoint()
+
+    def _flush_buffered(self):
+        with self._lock:
+            self._flush_timer = None
+            try:
+                self.flush(checkpoint=False)
+            except Exception as e:
+                logger.exception('Cannot write edit journal {}: {}'.format(self.directory, e))
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _stop_observing(self):
+        for obj in self._observed:
+            if self in obj.listeners:
+                obj.listeners.remove(self)
+        self._observed.clear()
+
+    def _observe(self, value):
+        # changes in removed subtrees are recorded as well, they can be added to the energy system again
+        for v in ([value] if isinstance(value, EObject) else value):
+            for obj in (v, *v.eAllContents()):
+                if obj not in self._observed:
+                    self._observed.add(obj)
+                    obj.listeners.append(self)
+
+    def notifyChanged(self, notification: Notification):
+        with self._lock:
+            # observed objects that are (again) in the resource notify both the resource and the journal itself
+            if notification is self._last_notification:
+                return
+            self._last_notification = notification
+            self._record(notification)
+
+    def _record(self, notification: Notification):
+        feature = notification.feature
+        if feature.derived or feature.transient or _is_container_reference(feature):
+            return
+        kind = notification.kind
+        if kind not in _KINDS:
+            logger.warning('Edit journal cannot record {} notification of {}'.format(kind.name, feature.name))
+            return
+        if kind == Kind.REMOVE:
+            old = notification.old
+            if old in self._moving:
+                # the object has already been recorded as set to its new container
+                self._moving.discard(old)
+                return
+        notifier = notification.notifier
+        # the id of an object is referred to by its previous value
+        id_changed = kind in (Kind.SET, Kind.UNSET) and feature is _id_attribute(notifier.eClass)
+        owner_reference = _reference(notifier, self._detached, skip_id=id_changed)
+        if owner_reference is None:
+            return      # a change of an object that is not part of the energy system or of a removed subtree
+        if id_changed and notification.old and ' ' not in notification.old:
+            owner_reference = [notification.old]
+        record = [_KINDS[kind], owner_reference, feature.name]
+        containment = isinstance(feature, EReference) and feature.containment
+        if kind in (Kind.SET, Kind.ADD, Kind.ADD_MANY):
+            new = notification.new
+            if kind == Kind.ADD_MANY:
+                record.append([self._encode(feature, v, containment, notification.notifier) for v in new])
+            else:
+                record.append(self._encode(feature, new, containment, notification.notifier))
+        elif kind == Kind.REMOVE and not containment:
+            record.append(self._encode(feature, notification.old, False, None))
+        else:
+            record.append(None)
+        position = getattr(notification, 'position', None)
+        if position is not None:
+            record.append(position)
+        if containment and kind in (Kind.SET, Kind.UNSET, Kind.REMOVE, Kind.REMOVE_MANY):
+            old = notification.old
+            for v in (old if kind == Kind.REMOVE_MANY else [old]):
+                if v is not None:
+                    self._detached[v] = self.records
+                    self._observe(v)
+        if containment and kind in (Kind.SET, Kind.ADD, Kind.ADD_MANY) and notifier.eResource is None:
+            # added to a removed subtree
+            new = notification.new
+            if new is not None:
+                self._observe(new)
+        self._append(record)
+
+    def _append(self, record):
+        self._buffer.append(json.dumps(record, separators=(',', ':')) + '\n')
+        self.records += 1
+        if len(self._buffer) >= FLUSH_RECORDS or time.monotonic() - self._last_flush > FSYNC_INTERVAL:
+            self.flush(checkpoint=False)
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(FSYNC_INTERVAL, self._flush_buffered)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _encode(self, feature, value, containment, owner):
+        if value is None:
+            return None
+        if isinstance(feature, EAttribute):
+            return value if isinstance(value, dict) else feature._eType.to_string(value)
+        if not containment:
+            return _reference(value, self._detached)
+        if value in self._detached:
+            return {'m': self._detached.pop(value)}
+        container = value.eContainer()
+        if isinstance(container, EObject) and container is not owner:
+            # set to a new container, it will be removed from its current container after this notification
+            reference = _reference(value, self._detached)
+            if reference is not None:
+                self._moving.add(value)
+                return {'p': reference}
+        return {'n': _encode_tree(value, self._detached)}
+
+
+def _encode_tree(obj: EObject, detached) -> dict:
+    """All set features of obj and its contents"""
+    attributes = dict()
+    contents = dict()
+    references = dict()
+    for feature in obj._isset:
+        if feature.derived or feature.transient or _is_container_reference(feature):
+            continue
+        value = obj.eGet(feature)
+        if isinstance(feature, EAttribute):
+            to_string = feature._eType.to_string
+            if feature.many:
+                attributes[feature.name] = [to_string(v) for v in value]
+            elif value is not None:
+                attributes[feature.name] = value if isinstance(value, dict) else to_string(value)
+        elif feature.containment:
+            values = value if feature.many else [value] if value is not None else []
+            contents[feature.name] = [_encode_tree(v, detached) for v in values]
+        else:
+            values = value if feature.many else [value] if value is not None else []
+            references[feature.name] = [r for r in (_reference(v, detached) for v in values) if r is not None]
+    tree = {'c': obj.eClass.name}
+    if attributes:
+        tree['a'] = attributes
+    if contents:
+        tree['k'] = contents
+    if references:
+        tree['r'] = references
+    return tree
+
+
+def _file_name(prefix, generation):
+    return '{}{}.{}'.format(prefix, generation, 'bin' if prefix == 'checkpoint.' else 'log')
+
+
+def _generations(directory, prefix) -> list:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [int(name.split('.')[1]) for name in names if name.startswith(prefix) and name.split('.')[1].isdigit()]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  Restore
+# ---------------------------------------------------------------------------------------------------------------------
+class _Replayer:
+    """Applies the records of a journal to the energy system of a resource"""
+    def __init__(self, resource: Resource):
+        self.resource = resource
+        self.objects = resource.uuid_dict
+        self.detached = dict()      # number of the record that removed an object -> the object
+        self.pending = []           # references to objects that do not exist yet: (owner, feature, reference)
+        self.record_number = 0
+
+    def resolve(self, reference):
+        obj_id = reference[0]
+        if obj_id is None:
+            obj = self.resource.contents[0]
+        elif isinstance(obj_id, dict):
+            obj = self.detached.get(obj_id['m'])
+        else:
+            obj = self.objects.get(obj_id)
+        if obj is None:
+            raise KeyError('Unknown object {}'.format(obj_id))
+        if len(reference) > 1:
+            for segment in reference[1].split('/'):
+                name, _, index = segment.partition('.')
+                obj = obj.eGet(name)[int(index)] if index else obj.eGet(name)
+        return obj
+
+    def replay(self, record):
+        kind, owner_reference, feature_name, value = record[:4]
+        position = record[4] if len(record) > 4 else None
+        owner = self.resolve(owner_reference)
+        feature = owner.eClass.findEStructuralFeature(feature_name)
+        containment = isinstance(feature, EReference) and feature.containment
+        # both sides of references with an opposite are recorded, except for containments
+        update_opposite = not isinstance(feature, EReference) or feature.eOpposite is None or containment
+        if kind in (_SET, _UNSET):
+            if containment:
+                old = owner.eGet(feature)
+                if old is not None:
+                    self.detached[self.record_number] = old
+            owner.eGet(feature)     # creates the EValue if the feature has never been used
+            owner.__dict__[feature.name]._set(self._decode(owner, feature, value), update_opposite)
+            if feature is _id_attribute(owner.eClass) and _id_of(owner) is not None:
+                self.objects[_id_of(owner)] = owner
+        elif kind in (_ADD, _ADD_MANY):
+            collection = owner.eGet(feature)
+            for v in (value if kind == _ADD_MANY else [value]):
+                decoded = self._decode(owner, feature, v)
+                if decoded is None:
+                    continue
+                if position is None:
+                    collection.append(decoded, update_opposite)
+                else:
+                    collection.insert(position, decoded, update_opposite)
+        elif kind == _REMOVE:
+            collection = owner.eGet(feature)
+            if position is not None:
+                removed = collection[position]
+            elif containment:
+                raise ValueError('Cannot replay the removal of an object at an unknown position')
+            elif value is None:
+                # a reference to an object that is not part of the energy system
+                self.record_number += 1
+                return
+            else:
+                removed = self.resolve(value)
+            collection.remove(removed, update_opposite)
+            if containment:
+                self.detached[self.record_number] = removed
+        elif kind == _REMOVE_MANY:
+            raise ValueError('Cannot replay the removal of many objects')
+        self.record_number += 1
+
+    def _decode(self, owner, feature, value):
+        if value is None:
+            return None
+        if isinstance(feature, EAttribute):
+            return value if isinstance(value, dict) else feature._eType.from_string(value)
+        if not feature.containment:
+            try:
+                return self.resolve(value)
+            except KeyError:
+                self.pending.append((owner, feature, value))
+                return None
+        if 'm' in value:
+            return self.detached.pop(value['m'])
+        if 'p' in value:
+            return self.resolve(value['p'])
+        references = []
+        obj = self._create(value['n'], references)
+        for ref_owner, ref_feature, reference in references:
+            self._add_reference(ref_owner, ref_feature, reference)
+        return obj
+
+    def _create(self, tree, references):
+        obj = esdl.getEClassifier(tree['c'])()
+        eclass = obj.eClass
+        for name, value in tree.get('a', {}).items():
+            feature = eclass.findEStructuralFeature(name)
+            if feature.many:
+                obj.eGet(feature).extend(feature._eType.from_string(v) for v in value)
+            else:
+                obj.eSet(feature, value if isinstance(value, dict) else feature._eType.from_string(value))
+        obj_id = _id_of(obj)
+        if obj_id is not None:
+            self.objects[obj_id] = obj
+        for name, values in tree.get('k', {}).items():
+            feature = eclass.findEStructuralFeature(name)
+            children = [self._create(v, references) for v in values]
+            if feature.many:
+                obj.eGet(feature).extend(children)
+            elif children:
+                obj.eSet(feature, children[0])
+        for name, values in tree.get('r', {}).items():
+            feature = eclass.findEStructuralFeature(name)
+            references.extend((obj, feature, v) for v in values)
+        return obj
+
+    def _add_reference(self, owner, feature, reference):
+        # both ends of references within a new object are set, the other end may not have been recorded (e.g. when
+        # it is part of the same tree, or was part of a removed subtree)
+        try:
+            target = self.resolve(reference)
+        except KeyError:
+            self.pending.append((owner, feature, reference))
+            return
+        _set_reference(owner, feature, target)
+        if feature.eOpposite is not None:
+            _set_reference(target, feature.eOpposite, owner)
+
+    def resolve_pending(self):
+        for owner, feature, reference in self.pending:
+            try:
+                self._add_reference(owner, feature, reference)
+            except KeyError:
+                logger.warning('Cannot restore reference {}.{} to {}'.format(owner.eClass.name, feature.name,
+                                                                             reference))
+        self.pending.clear()
+
+
+def _set_reference(owner, feature, target):
+    if feature.many:
+        if target not in owner.eGet(feature):
+            owner.eGet(feature).append(target, False)
+    elif owner.eGet(feature) is not target:
+        owner.__dict__[feature.name]._set(target, False)
+
+
+def read_records(directory, generation):
+    """Returns the records of the journal of a generation, without a partially written last record"""
+    records = []
+    try:
+        with open(os.path.join(directory, _file_name('journal.', generation)), 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    logger.warning('Ignoring incomplete last record of journal in {}'.format(directory))
+                    break
+                records.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def latest_checkpoint(directory):
+    """Returns the generation and the binary encoding of the latest checkpoint in directory, or (None, None)"""
+    generations = _generations(directory, 'checkpoint.')
+    if not generations:
+        return None, None
+    generation = max(generations)
+    with open(os.path.join(directory, _file_name('checkpoint.', generation)), 'rb') as f:
+        return generation, f.read()
+
+
+def replay_journals(resource: Resource, directory, generation):
+    """Applies the journals of generation and later to the energy system of resource"""
+    for journal_generation in sorted(g for g in _generations(directory, 'journal.') if g >= generation):
+        replayer = _Replayer(resource)
+        for record in read_records(directory, journal_generation):
+            replayer.replay(record)
+        replayer.resolve_pending()
+
+
+class EditJournalDirectory:
+    """The edit journals of the energy systems of all sessions, in <path>/<client_id>/<es_id>"""
+    META_FILE = 'meta.json'
+
+    def __init__(self, path):
+        self.path = path
+        self._meta = dict()     # client_id -> last written meta
+        os.makedirs(path, exist_ok=True)
+
+    def _client_dir(self, client_id):
+        return os.path.join(self.path, quote(client_id, safe=''))
+
+    def has_client(self, client_id):
+        return os.path.exists(os.path.join(self._client_dir(client_id), self.META_FILE))
+
+    def sync(self, client_id, esh: EnergySystemHandler):
+        """
+        Starts journals for the energy systems of the handler that have none yet, stops the journals of energy
+        systems that have been removed from the handler, and flushes the records of all journals
+        """
+        client_dir = self._client_dir(client_id)
+        es_dirs = dict()
+        for es_id, uri in esh.esid_uri_dict.items():
+            resource = esh.rset.resources.get(uri)
+            if resource is None or not resource.contents:
+                continue
+            es_dir = quote(es_id, safe='')
+            journal = getattr(resource, 'edit_journal', None)
+            if journal is None or os.path.dirname(journal.directory) != client_dir:
+                journal = EditJournal(resource, os.path.join(client_dir, es_dir))
+                resource.edit_journal = journal
+            else:
+                journal.flush()
+            es_dirs[es_dir] = resource
+        main = next((es_dir for es_dir, resource in es_dirs.items() if resource is esh.resource), None)
+        meta = {'main': main, 'energy_systems': sorted(es_dirs)}
+        if self._meta.get(client_id) != meta:
+            for name in os.listdir(client_dir):
+                if name not in es_dirs and os.path.isdir(os.path.join(client_dir, name)):
+                    shutil.rmtree(os.path.join(client_dir, name), ignore_errors=True)
+            fd, tmp_file = tempfile.mkstemp(dir=client_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, os.path.join(client_dir, self.META_FILE))
+            self._meta[client_id] = meta
+
+    def restore(self, client_id) -> EnergySystemHandler:
+        """Returns a handler with the energy systems of a session as they were at the last record of the journal"""
+        client_dir = self._client_dir(client_id)
+        with open(os.path.join(client_dir, self.META_FILE)) as f:
+            meta = json.load(f)
+        es_dirs = sorted(meta['energy_systems'], key=lambda es_dir: es_dir != meta['main'])
+        esh = EnergySystemHandler()
+        for index, es_dir in enumerate(es_dirs):
+            directory = os.path.join(client_dir, es_dir)
+            generation, data = latest_checkpoint(directory)
+            if generation is None:
+                continue
+            name = 'restored_{}'.format(unquote(es_dir))
+            if index == 0:
+                es, _ = esh.load_from_binary(data, name=name)
+            else:
+                es, _ = esh.add_from_binary(name, data)
+            resource = es.eResource
+            replay_journals(resource, directory, generation)
+            es = resource.contents[0]
+            if es.id not in esh.esid_uri_dict:
+                # the id of the energy system has been changed
+                uri = next(uri for uri, r in esh.rset.resources.items() if r is resource)
+                esh.esid_uri_dict = {k: v for k, v in esh.esid_uri_dict.items() if v != uri}
+                esh.esid_uri_dict[es.id] = uri
+            if index == 0:
+                esh.energy_system = es
+        self._meta.pop(client_id, None)
+        return esh
+
+    def delete(self, client_id):
+        shutil.rmtree(self._client_dir(client_id), ignore_errors=True)
+        self._meta.pop(client_id, None)
+
+    def clean_up(self, timeout):
+        now = time.time()
+        for name in os.listdir(self.path):
+            client_dir = os.path.join(self.path, name)
+            meta_file = os.path.join(client_dir, self.META_FILE)
+            last_modified = max([os.path.getmtime(os.path.join(root, f))
+                                 for root, _, files in os.walk(client_dir) for f in files], default=0)
+            if os.path.isdir(client_dir) and (now - last_modified > timeout or not os.path.exists(meta_file)):
+                logger.info('Cleaning up edit journal of client_id={}'.format(unquote(name)))
+                shutil.rmtree(client_dir, ignore_errors=True)
+                self._meta.pop(unquote(name), None)
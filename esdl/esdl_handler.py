@@ -13,19 +13,30 @@
 
 from pyecore.resources import ResourceSet, URI
 from pyecore.ecore import EEnum, EAttribute, EObject, EReference, EClass, EStructuralFeature
-from pyecore.valuecontainer import ECollection
+from pyecore.valuecontainer import ECollection, EList
 from pyecore.utils import alias
 from pyecore.resources.resource import HttpURI
-from esdl.resources.xmlresource import XMLResource
+from esdl.resources.xmlresource import XMLResource, LoadOptions, SaveOptions, DEFAULT_CHUNK_SIZE
+from esdl.resources import binary
+from esdl.object_index import ObjectIndex
+from esdl.frozen_view import FrozenView
+from esdl.undo import UndoJournal
 from esdl import esdl
 from uuid import uuid4
 from io import BytesIO
+import struct
+import zlib
 import src.log as log
 from esdl import support_functions
 
 #logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = log.get_logger(__name__)
 
+SNAPSHOT_MAGIC = b'ESDLSNAP'
+SNAPSHOT_FORMAT_VERSION = 2    # zlib compressed binary encoding of each energy system
+SNAPSHOT_COMPRESSION_LEVEL = 1  # compression is mostly gained with the lowest level already, and it is fast
+SNAPSHOT_HEADER = '<8sBI'  # magic, format version, number of energy systems
+
 
 class EnergySystemHandler:
 
@@ -61,6 +72,14 @@ class EnergySystemHandler:
         setattr(EObject, '__deepcopy__', support_functions.deepcopy)
         setattr(EObject, 'deepcopy', support_functions.deepcopy)
 
+        # add the position of inserted and removed elements to the notifications of collections
+        setattr(ECollection, 'insert', support_functions.insert_with_position)
+        setattr(ECollection, 'remove', support_functions.remove_with_position)
+        setattr(ECollection, 'pop', support_functions.pop_with_position)
+        setattr(EList, '__setitem__', support_functions.setitem_with_position)
+        # frozen views can be read while the energy system is changed in another thread
+        support_functions.lock_model_changes()
+
         # have a nice __repr__ for some ESDL classes when printing ESDL objects (includes all Assets and EnergyAssets)
         esdl.EnergySystem.__repr__ = \
             lambda x: '{}: ({})'.format(x.name, EnergySystemHandler.attr_to_dict(x))
@@ -76,7 +95,22 @@ class EnergySystemHandler:
         self.rset.resource_factory['esdl'] = XMLResource
         self.rset.resource_factory['*'] = XMLResource
 
-    def load_file(self, uri_or_filename) -> (esdl.EnergySystem, []):
+    @staticmethod
+    def load_options(on_skeleton=None, on_progress=None):
+        """
+        Options to load an energy system incrementally (see XMLResource.load)
+        :param on_skeleton: function(es) that is called when the energy system, its instance and the attributes and
+                            geometry of the top area are loaded, before the rest of the energy system
+        :param on_progress: function(LoadProgress) that is called regularly while loading
+        """
+        options = dict()
+        if on_skeleton:
+            options[LoadOptions.ON_SKELETON] = on_skeleton
+        if on_progress:
+            options[LoadOptions.ON_PROGRESS] = on_progress
+        return options or None
+
+    def load_file(self, uri_or_filename, on_skeleton=None, on_progress=None) -> (esdl.EnergySystem, []):
         """Loads a EnergySystem file or URI into a new resourceSet
         :returns EnergySystem and the parse warnings as a tuple (es, parse_info)"""
         if isinstance(uri_or_filename, str):
@@ -86,7 +120,7 @@ class EnergySystemHandler:
                 uri = URI(uri_or_filename)
         else:
             uri = uri_or_filename
-        return self.load_uri(uri)
+        return self.load_uri(uri, on_skeleton, on_progress)
 
     def import_file(self, uri_or_filename):
         """
@@ -101,12 +135,12 @@ class EnergySystemHandler:
             uri = uri_or_filename
         return self.add_uri(uri)
 
-    def load_uri(self, uri) -> (esdl.EnergySystem, []):
+    def load_uri(self, uri, on_skeleton=None, on_progress=None) -> (esdl.EnergySystem, []):
         """Loads a new resource in a new resourceSet
         :returns: EnergySystem and the parse warnings as a tuple (es, parse_info)
         """
         self._new_resource_set()
-        self.resource = self.rset.get_resource(uri)
+        self.resource = self.rset.get_resource(uri, options=self.load_options(on_skeleton, on_progress))
         parse_info = []
         if isinstance(self.resource, XMLResource):
             parse_info = self.resource.get_parse_information()
@@ -140,9 +174,10 @@ class EnergySystemHandler:
         self.add_object_to_dict(tmp_resource.contents[0].id, tmp_resource.contents[0], False)
         return tmp_resource.contents[0], parse_info
 
-    def load_from_string(self, esdl_string, name='from_string'):
+    def load_from_string(self, esdl_string, name='from_string', on_skeleton=None, on_progress=None):
         """
         Loads an energy system from a string and adds it to a *new* resourceSet
+        :param on_skeleton, on_progress: see load_options()
         :returns: EnergySystem and the parse warnings as a tuple (es, parse_info)
          """
         if name is '': name = str(uuid4())
@@ -150,7 +185,7 @@ class EnergySystemHandler:
         self._new_resource_set()
         self.resource = self.rset.create_resource(uri)
         try:
-            self.resource.load()
+            self.resource.load(options=self.load_options(on_skeleton, on_progress))
             self.energy_system = self.resource.contents[0]
             parse_info = []
             if isinstance(self.resource, XMLResource):
@@ -185,6 +220,9 @@ class EnergySystemHandler:
         :returns: EnergySystem and the parse warnings as a tuple (es, parse_info)
         """
         uri = StringURI(name + '.esdl', esdl_string)
+        if uri.normalize() in self.rset.resources:
+            # get_resource() would return the already loaded resource with this name instead of loading the string
+            uri = StringURI(name + '_' + str(uuid4()) + '.esdl', esdl_string)
         # self.add_uri(uri)
         try:
             tmp_resource = self.rset.get_resource(uri)
@@ -193,6 +231,13 @@ class EnergySystemHandler:
                 parse_info = tmp_resource.get_parse_information()
             tmp_es = tmp_resource.contents[0]
             self.validate(es=tmp_es)
+            if tmp_es.id in self.esid_uri_dict:
+                # a new version of an energy system that was already loaded (e.g. returned by an ESDL service)
+                # replaces the old one, otherwise there would be two energy systems with the same id
+                old_resource = self.rset.resources.pop(self.esid_uri_dict[tmp_es.id], None)
+                if old_resource is not None and old_resource is self.resource:
+                    self.resource = tmp_resource
+                    self.energy_system = tmp_es
             self.esid_uri_dict[tmp_es.id] = uri.normalize()
             self.add_object_to_dict(tmp_es.id, tmp_es, True)
             return tmp_resource.contents[0], parse_info
@@ -201,22 +246,139 @@ class EnergySystemHandler:
             raise
 
 
-    def to_string(self, es_id=None):
+    def load_from_binary(self, data: bytes, name='from_binary'):
+        """
+        Loads an energy system from its binary encoding (see to_binary()) and adds it to a *new* resourceSet
+        :returns: EnergySystem and the parse warnings (always empty) as a tuple (es, parse_info), as load_from_string()
+        """
+        uri = StringURI(name + '.esdl')
+        self._new_resource_set()
+        self.resource = self.rset.create_resource(uri)
+        binary.decode(self.resource, data)
+        self.energy_system = self.resource.contents[0]
+        self.validate()
+        self.esid_uri_dict[self.energy_system.id] = uri.normalize()
+        self.add_object_to_dict(self.energy_system.id, self.energy_system, False)
+        return self.energy_system, []
+
+    def add_from_binary(self, name, data: bytes):
+        """
+        Loads an energy system from its binary encoding (see to_binary()) and adds it to the *existing* resourceSet
+        :returns: EnergySystem and the parse warnings (always empty) as a tuple (es, parse_info), as add_from_string()
+        """
+        uri = StringURI(name + '.esdl')
+        if uri.normalize() in self.rset.resources:
+            uri = StringURI(name + '_' + str(uuid4()) + '.esdl')
+        tmp_resource = self.rset.create_resource(uri)
+        binary.decode(tmp_resource, data)
+        tmp_es = tmp_resource.contents[0]
+        self.validate(es=tmp_es)
+        if tmp_es.id in self.esid_uri_dict:
+            old_resource = self.rset.resources.pop(self.esid_uri_dict[tmp_es.id], None)
+            if old_resource is not None and old_resource is self.resource:
+                self.resource = tmp_resource
+                self.energy_system = tmp_es
+        self.esid_uri_dict[tmp_es.id] = uri.normalize()
+        self.add_object_to_dict(tmp_es.id, tmp_es, False)
+        return tmp_es, []
+
+    @staticmethod
+    def save_options(compact=False):
+        """
+        Returns the options for XMLResource.save() and serialize()
+        :param compact: serializes without indentation and default values, for ESDL that is sent to other services
+                        or stored instead of shown to or downloaded by users
+        """
+        return {SaveOptions.COMPACT: True} if compact else None
+
+    def to_string(self, es_id=None, compact=False):
         # to use strings as resources, we simulate a string as being a URI
         uri = StringURI('to_string_'+str(uuid4())+'.esdl')
+        options = self.save_options(compact)
         if es_id is None:
-            self.resource.save(uri)
+            self.resource.save(uri, options=options)
         else:
             if es_id in self.esid_uri_dict:
                 my_uri = self.esid_uri_dict[es_id]
                 resource = self.rset.resources[my_uri]
-                resource.save(uri)
+                resource.save(uri, options=options)
             else:
                 # TODO: what to do? original behaviour
-                self.resource.save(uri)
+                self.resource.save(uri, options=options)
         # return the string
         return uri.getvalue()
 
+    def to_chunks(self, es_id=None, chunk_size=DEFAULT_CHUNK_SIZE, compact=False):
+        """
+        Returns a generator that serializes the energy system incrementally and yields it as UTF-8 encoded chunks of
+        bytes, e.g. to be used as body of a streaming HTTP response or request without creating the whole ESDL
+        string in memory.
+        """
+        if es_id is not None and es_id in self.esid_uri_dict:
+            resource = self.rset.resources[self.esid_uri_dict[es_id]]
+        else:
+            resource = self.resource
+        return resource.serialize(self.save_options(compact), chunk_size=chunk_size)
+
+    def to_binary(self, es_id=None) -> bytes:
+        """
+        Returns the binary encoding of the energy system, which is smaller and faster to create and to load (with
+        load_from_binary() or add_from_binary()) than XML. Only for use within the MapEditor, e.g. to keep a copy
+        of an energy system; other services and users get XML.
+        """
+        return binary.encode(self.get_resource(es_id))
+
+    def get_undo_journal(self, es_id=None) -> UndoJournal:
+        """Returns the undo journal of an energy system, that records its changes from the first time it is requested"""
+        return UndoJournal.of(self.get_resource(es_id))
+
+    def undo(self, es_id=None):
+        """Undoes the last action in the undo journal of an energy system, returns it (None if there was none)"""
+        action = self.get_undo_journal(es_id).undo()
+        if action is not None:
+            self._update_dict_after_replay(es_id, action, undone=True)
+        return action
+
+    def redo(self, es_id=None):
+        """Redoes the last undone action of an energy system, returns it (None if there was none)"""
+        action = self.get_undo_journal(es_id).redo()
+        if action is not None:
+            self._update_dict_after_replay(es_id, action, undone=False)
+        return action
+
+    def _update_dict_after_replay(self, es_id, action, undone):
+        """Keeps the objects by id (see get_by_id()) up to date with the objects that an undo or redo added or removed"""
+        resource = self.get_resource(es_id)
+        added = []
+        removed = []
+        for change in action.changes:
+            if isinstance(change.feature, EReference) and change.feature.containment:
+                old, new = (change.new, change.old) if undone else (change.old, change.new)
+                removed.extend(_objects(old))
+                added.extend(_objects(new))
+        for obj in removed:
+            if obj.eResource is not resource:
+                for o in (obj, *obj.eAllContents()):
+                    if getattr(o, 'id', None) is not None and resource.uuid_dict.get(o.id) is o:
+                        del resource.uuid_dict[o.id]
+        for obj in added:
+            if obj.eResource is resource:
+                self.add_object_to_dict(es_id, obj, recursive=True)
+
+    def freeze(self, es_id=None) -> FrozenView:
+        """
+        Returns a copy-on-write view of the energy system as it is now, that does not change when the energy system
+        is edited afterwards, e.g. to serialize it in the background. Close the view when it is not used anymore.
+        """
+        if es_id is not None and es_id in self.esid_uri_dict:
+            return FrozenView(self.rset.resources[self.esid_uri_dict[es_id]])
+        return FrozenView(self.resource)
+
+    def write_to(self, output, es_id=None):
+        """Serializes the energy system incrementally to a binary file-like object (anything with a write method)"""
+        for chunk in self.to_chunks(es_id):
+            output.write(chunk)
+
     def to_bytesio(self):
         """Returns a BytesIO stream for the energy system"""
         uri = StringURI('bytes_io_to_string.esdl')
@@ -338,6 +500,12 @@ class EnergySystemHandler:
                 self.get_resource(es_id).uuid_dict[esdl_object.id] = esdl_object
             else:
                 logger.warning('Id has not been set for object {}({})'.format(esdl_object.eClass.name, esdl_object))
+        # the object index is updated by notifications when the object is added to the model, but objects that were
+        # added to the model before the index was created (e.g. in a different resource) are added here too
+        resource = self.get_resource(es_id)
+        index = getattr(resource, 'object_index', None)
+        if index is not None and esdl_object.eResource is resource:
+            index.add(esdl_object, recursive=False)
 
     def remove_object_from_dict(self, es_id, esdl_object: EObject, recursive=False):
         if recursive:
@@ -346,22 +514,29 @@ class EnergySystemHandler:
         if hasattr(esdl_object, 'id'):
             if esdl_object.id is not None and self.get_resource(es_id):
                 del self.get_resource(es_id).uuid_dict[esdl_object.id]
+        index = getattr(self.get_resource(es_id), 'object_index', None)
+        if index is not None:
+            index.remove(esdl_object, recursive=False)
 
     def remove_object_from_dict_by_id(self, es_id, object_id):
         del self.get_resource(es_id).uuid_dict[object_id]
 
-    # returns a generator of all assets of a specific type. Not only the ones defined in  the main Instance's Area
+    def get_object_index(self, es_id=None) -> ObjectIndex:
+        """Returns the index of all objects by type of this energy system, it is created when first used"""
+        return ObjectIndex.of(self.get_resource(es_id))
+
+    # returns a list of all assets of a specific type. Not only the ones defined in  the main Instance's Area
     # e.g. QuantityAndUnits can be defined in the KPI of an Area or in the EnergySystemInformation object
-    # this function returns all of them at once
+    # this function returns all of them at once, in the order of the document
     # @staticmethod
     def get_all_instances_of_type(self, esdl_type, es_id):
-        all_instances = list()
-        for esdl_element in self.get_energy_system(es_id=es_id).eAllContents():
-            if isinstance(esdl_element, esdl_type):
-                all_instances.append(esdl_element)
-        return all_instances
+        return self.get_object_index(es_id).instances_of(esdl_type.eClass, ordered=True)
         #return esdl_type.allInstances()
 
+    def get_all_instances_of_type_in_container(self, esdl_type, container: EObject, es_id):
+        """Returns all instances of esdl_type that are (indirectly) contained in container, e.g. an Area"""
+        return self.get_object_index(es_id).instances_of_in_container(esdl_type.eClass, container, ordered=True)
+
     # Creates a dict of all the attributes of an ESDL object, useful for printing/debugging
     @staticmethod
     def attr_to_dict(esdl_object):
@@ -409,17 +584,68 @@ class EnergySystemHandler:
     def __getstate__(self):
         state = dict()
         #print('Serialize rset {}'.format(self.rset.resources))
-        print('Serializing EnergySystem...', end ="")
-        state['energySystem'] = self.to_string()
-        print('done')
+        state['snapshot'] = self.to_snapshot()
         return state
 
     def __setstate__(self, state):
         self.__init__()
         #print('Deserialize rset {}'.format(self.rset.resources))
-        print('Deserializing EnergySystem...', end="")
-        self.load_from_string(state['energySystem'])
-        print('done')
+        if 'snapshot' in state:
+            self.restore_snapshot(state['snapshot'])
+        else:
+            # state pickled by a previous version
+            self.load_from_string(state['energySystem'])
+
+    def to_snapshot(self) -> bytes:
+        """
+        Creates a compact binary snapshot of all the energy systems in this handler, e.g. to store it in a session
+        store that is shared by multiple processes. The snapshot contains a header with a format version and for each
+        energy system its id, the URI of its resource, if it is the main energy system and its zlib compressed binary
+        encoding (see to_binary()).
+        """
+        main_uri = self.resource.uri.normalize() if self.resource is not None else None
+        entries = [(es_id, uri) for es_id, uri in self.esid_uri_dict.items() if uri in self.rset.resources]
+        output = BytesIO()
+        output.write(struct.pack(SNAPSHOT_HEADER, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(entries)))
+        for es_id, uri in entries:
+            _write_snapshot_string(output, es_id)
+            _write_snapshot_string(output, uri)
+            output.write(struct.pack('<?', uri == main_uri))
+            data = zlib.compress(binary.encode(self.rset.resources[uri]), SNAPSHOT_COMPRESSION_LEVEL)
+            output.write(struct.pack('<I', len(data)))
+            output.write(data)
+        return output.getvalue()
+
+    def restore_snapshot(self, snapshot: bytes):
+        """Replaces the energy systems of this handler with the energy systems in a snapshot created by to_snapshot()"""
+        magic, format_version, count = struct.unpack_from(SNAPSHOT_HEADER, snapshot)
+        if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError('Not an energy system snapshot or unsupported snapshot version {}'.format(format_version))
+        self._new_resource_set()
+        self.esid_uri_dict = {}
+        self.energy_system = None
+        offset = struct.calcsize(SNAPSHOT_HEADER)
+        for _ in range(count):
+            es_id, offset = _read_snapshot_string(snapshot, offset)
+            uri_string, offset = _read_snapshot_string(snapshot, offset)
+            is_main, length = struct.unpack_from('<?I', snapshot, offset)
+            offset += struct.calcsize('<?I')
+            data = zlib.decompress(snapshot[offset:offset + length])
+            offset += length
+            uri = StringURI(uri_string)
+            resource = self.rset.create_resource(uri)
+            binary.decode(resource, data)
+            self.esid_uri_dict[es_id] = uri.normalize()
+            self.add_object_to_dict(es_id, resource.contents[0], False)
+            if is_main or self.resource is None:
+                self.resource = resource
+                self.energy_system = resource.contents[0]
+
+    @staticmethod
+    def from_snapshot(snapshot: bytes):
+        esh = EnergySystemHandler()
+        esh.restore_snapshot(snapshot)
+        return esh
 
 
     def update_version(self, es_id) -> str:
@@ -443,10 +669,31 @@ class EnergySystemHandler:
 
 
 
+def _write_snapshot_string(output, value: str):
+    data = value.encode('UTF-8')
+    output.write(struct.pack('<H', len(data)))
+    output.write(data)
+
+
+def _read_snapshot_string(snapshot: bytes, offset: int):
+    length, = struct.unpack_from('<H', snapshot, offset)
+    offset += 2
+    return snapshot[offset:offset + length].decode('UTF-8'), offset + length
+
+
+def _objects(value) -> list:
+    """Returns the objects of the old or new value of a change"""
+    if value is None:
+        return []
+    return [value] if isinstance(value, EObject) else [v for v in value if isinstance(v, EObject)]
+
+
 class StringURI(URI):
     def __init__(self, uri, text=None):
         super(StringURI, self).__init__(uri)
-        if text is not None:
+        if isinstance(text, bytes):
+            self.__stream = BytesIO(text)
+        elif text is not None:
             self.__stream = BytesIO(text.encode('UTF-8'))
 
     def getvalue(self):
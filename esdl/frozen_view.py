@@ -0,0 +1,257 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Copy-on-write views of an energy system, for code that needs a stable version of the energy system (e.g. to send it
+to ESSIM) while the user keeps on editing it.
+
+Creating a view copies nothing: the view shares all objects with the energy system and observes the notifications of
+its resource. Only when a feature of an object is changed for the first time, the value it had before the change is
+remembered in the view. Objects that are removed from the resource are observed directly, as the resource does not
+notify their changes anymore. Reading through the view (eGet(), eAllContents(), serialize()) gives the remembered
+values of changed features and the current values of all others.
+
+The previous value of a feature with many values is reconstructed from its current value and the notification, which
+requires the position of removed elements (see support_functions.remove_with_position()).
+
+pyecore notifies a change after it has been made. A view can be read in another thread than the one that changes the
+energy system, so changes (including their notification) and reads of values through a view hold
+support_functions.model_lock, see support_functions.lock_model_changes().
+"""
+from pyecore.ecore import EObject, EReference, EStructuralFeature
+from pyecore.notification import EObserver, Notification, Kind
+from pyecore.resources import Resource
+from pyecore.valuecontainer import ECollection
+from esdl.resources.xmlresource import XMLResource, SaveOptions, DEFAULT_CHUNK_SIZE
+from esdl.support_functions import model_lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FrozenView(EObserver):
+    """
+    Read-only view of the contents of a resource at the moment the view was created. Close the view when it is not
+    needed anymore, or use it as a context manager, as it remembers the old values of all changes until then.
+    """
+    def __init__(self, resource: Resource):
+        super().__init__()
+        self.resource = resource
+        self.root = resource.contents[0]
+        self._frozen = dict()      # EObject -> {feature name: value before the first change}
+        self._isset = dict()       # EObject -> features that were set before the first change of the object
+        self._containers = dict()  # EObject -> (container, containment feature) before it was moved or removed
+        self._observed = dict()    # objects that are removed from the resource and observed directly
+        self.closed = False
+        self.observe(resource)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Stops observing the resource and forgets all remembered values"""
+        if self.closed:
+            return
+        self.closed = True
+        self.resource.listeners.remove(self)
+        for obj in self._observed:
+            obj.listeners.remove(self)
+        self._frozen.clear()
+        self._isset.clear()
+        self._containers.clear()
+        self._observed.clear()
+
+    def notifyChanged(self, notification: Notification):
+        obj = notification.notifier
+        feature = notification.feature
+        if isinstance(feature, EReference) and feature.containment and \
+                notification.kind in (Kind.SET, Kind.UNSET, Kind.REMOVE, Kind.REMOVE_MANY):
+            self._detached(notification.old, obj, feature)
+
+        frozen = self._frozen.get(obj)
+        if frozen is None:
+            # pyecore adds the feature to _isset after the notification
+            frozen = self._frozen[obj] = dict()
+            self._isset[obj] = tuple(obj._isset)
+        if feature.name not in frozen:
+            frozen[feature.name] = self._value_before(obj, feature, notification)
+
+    def _detached(self, value, container: EObject, feature: EReference):
+        if value is None:
+            return
+        for v in ([value] if isinstance(value, EObject) else value):
+            if v in self._containers:
+                continue
+            self._containers[v] = (container, feature)
+            for obj in (v, *v.eAllContents()):
+                if obj not in self._observed:
+                    self._observed[obj] = None
+                    obj.listeners.append(self)
+
+    @staticmethod
+    def _value_before(obj: EObject, feature: EStructuralFeature, notification: Notification):
+        if not feature.many:
+            return notification.old
+        values = list(obj.__getattribute__(feature.name))
+        kind = notification.kind
+        position = getattr(notification, 'position', None)
+        if kind == Kind.ADD:
+            _remove_added(values, notification.new, position)
+        elif kind == Kind.ADD_MANY:
+            for value in reversed(notification.new):
+                _remove_added(values, value, None)
+        elif kind == Kind.REMOVE:
+            values.insert(len(values) if position is None else position, notification.old)
+        elif kind == Kind.REMOVE_MANY:
+            positions = getattr(notification, 'position', None)
+            if positions is None:
+                logger.warning('Cannot determine the previous order of {}.{}, the removed values are added at the '
+                               'end'.format(obj.eClass.name, feature.name))
+                values.extend(notification.old)
+            else:
+                # back at their original positions, from the first to the last
+                for position, value in sorted(zip(positions, notification.old), key=lambda p: p[0]):
+                    values.insert(position, value)
+        else:
+            logger.warning('Cannot determine the previous value of {}.{} for a {} notification'.format(
+                obj.eClass.name, feature.name, kind.name))
+        return tuple(values)
+
+    def eGet(self, obj: EObject, feature):
+        """
+        Returns the value of a feature (or feature name) of obj in the view, a tuple for features with many values
+        """
+        if isinstance(feature, str):
+            feature = obj.eClass.findEStructuralFeature(feature)
+        return self._get(obj, feature.name)
+
+    def _get(self, obj: EObject, name):
+        with model_lock:
+            frozen = self._frozen.get(obj)
+            if frozen is not None and name in frozen:
+                return frozen[name]
+            value = obj.__getattribute__(name)
+            return tuple(value) if isinstance(value, ECollection) else value
+
+    def eIsSet(self, obj: EObject, feature: EStructuralFeature) -> bool:
+        with model_lock:
+            isset = self._isset.get(obj)
+            return feature in (obj._isset if isset is None else isset)
+
+    def eContainer(self, obj: EObject):
+        with model_lock:
+            container = self._containers.get(obj)
+            return obj.eContainer() if container is None else container[0]
+
+    def eContainmentFeature(self, obj: EObject):
+        with model_lock:
+            container = self._containers.get(obj)
+            return obj.eContainmentFeature() if container is None else container[1]
+
+    def eContents(self, obj: EObject) -> list:
+        contents = []
+        for feature in obj.eClass.eAllReferences():
+            if feature.containment and not feature.derived:
+                value = self.eGet(obj, feature)
+                if feature.many:
+                    contents.extend(value)
+                elif value is not None:
+                    contents.append(value)
+        return contents
+
+    def eAllContents(self, obj: EObject = None):
+        """Iterates over all objects contained in obj (by default the root of the view), as EObject.eAllContents()"""
+        contents = self.eContents(self.root if obj is None else obj)
+        yield from contents
+        for child in contents:
+            yield from self.eAllContents(child)
+
+    def contains(self, obj: EObject) -> bool:
+        """Returns if obj is part of the view: contained in its root when the view was created"""
+        while obj is not None:
+            if obj is self.root:
+                return True
+            obj = self.eContainer(obj)
+        return False
+
+    def serialize(self, options=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Serializes the view to ESDL, see XMLResource.serialize()"""
+        return _FrozenViewWriter(self).serialize(options, chunk_size)
+
+    def to_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE, compact=False):
+        return self.serialize({SaveOptions.COMPACT: True} if compact else None, chunk_size)
+
+    def to_string(self, compact=False) -> str:
+        return b''.join(self.to_chunks(compact=compact)).decode('UTF-8')
+
+
+def _remove_added(values: list, value, position):
+    if position is not None and position < len(values) and values[position] is value:
+        del values[position]
+        return
+    for i in range(len(values) - 1, -1, -1):
+        if values[i] is value:
+            del values[i]
+            return
+    if value in values:
+        values.remove(value)
+
+
+class _FrozenViewWriter(XMLResource):
+    """XMLResource that serializes the objects of a view instead of its own contents"""
+    def __init__(self, view: FrozenView):
+        super().__init__(view.resource.uri)
+        self.view = view
+        self.contents = [view.root]   # not appended, that would make this the resource of the root
+        self._id_attributes = dict()
+
+    def _object_state(self, obj):
+        view = self.view
+        with model_lock:
+            isset = view._isset.get(obj)
+            if isset is None:
+                isset = tuple(obj._isset)
+
+        def get_value(name):
+            return view._get(obj, name)
+        return isset, get_value
+
+    def _containment_feature(self, obj):
+        return None if obj is self.view.root else self.view.eContainmentFeature(obj)
+
+    def _build_path_from(self, obj):
+        if not isinstance(obj, EObject) or not self.view.contains(obj):
+            return super()._build_path_from(obj)
+        eclass = obj.eClass
+        if eclass not in self._id_attributes:
+            self._id_attributes[eclass] = self.get_id_attribute(eclass)
+        id_attribute = self._id_attributes[eclass]
+        if id_attribute:
+            id_value = self.view.eGet(obj, id_attribute)
+            if id_value is not None and ' ' not in id_value:
+                return id_attribute._eType.to_string(id_value), False
+        return self._fragment(obj), False
+
+    def _fragment(self, obj):
+        container = self.view.eContainer(obj) if obj is not self.view.root else None
+        if container is None:
+            return '/'
+        feature = self.view.eContainmentFeature(obj)
+        if feature.many:
+            return '{}/@{}.{}'.format(self._fragment(container), feature.name,
+                                      self.view.eGet(container, feature).index(obj))
+        return '{}/@{}'.format(self._fragment(container), feature.name)
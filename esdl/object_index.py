@@ -0,0 +1,205 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Index of all objects in a resource by their EClass, such that queries like 'all EnergyAssets' or 'all Sensors in this
+Area' do not have to iterate over all the objects in the energy system (using eAllContents()).
+
+The index is created once per resource (the first time it is used) and is kept up to date by observing the
+containment notifications of the resource. Objects that are removed from the model are rechecked the next time the
+index is queried, as pyecore first sends a REMOVE notification for an object that is moved to another container.
+
+The index only knows the EClass of the objects, not their containers: instances_of_in_container() checks the
+container chain of each instance of the EClass (with the result per container cached during the query), which is
+linear in the number of instances and their containers. A map of container -> instances would have to be updated for
+all the objects in a subtree when it is moved, which happens more often in the editor than these queries.
+The instances are grouped per EClass, unless they are requested in document order (the order of eAllContents()).
+"""
+from pyecore.ecore import EObject, EClass, EReference
+from pyecore.notification import EObserver, Notification, Kind
+from pyecore.resources import Resource
+import logging
+
+logger = logging.getLogger(__name__)
+
+# cache of all the classes that are an instance of a certain EClass (the EClass itself and all its subclasses)
+_subclasses_cache = dict()
+
+
+def _all_subclasses(eclass: EClass) -> list:
+    if eclass not in _subclasses_cache:
+        _subclasses_cache[eclass] = [c for c in eclass.ePackage.eClassifiers
+                                     if isinstance(c, EClass) and (c is eclass or eclass in c.eAllSuperTypes())]
+    return _subclasses_cache[eclass]
+
+
+def document_position_function():
+    """
+    Returns a function that gives the position of an object in its tree as a sortable list, such that sorting objects
+    on it gives the order of eAllContents(). The positions within a container are cached by the returned function.
+    """
+    feature_positions = dict()      # EClass -> {containment feature name: position in eAllReferences()}
+    positions = dict()              # (id of container, feature name) -> {id of object: position in the feature}
+
+    def position(obj):
+        path = []
+        container = obj.eContainer()
+        while isinstance(container, EObject):
+            feature = obj.eContainmentFeature()
+            features = feature_positions.get(container.eClass)
+            if features is None:
+                features = {f.name: i for i, f in enumerate(r for r in container.eClass.eAllReferences()
+                                                            if r.containment)}
+                feature_positions[container.eClass] = features
+            index = 0
+            if feature.many:
+                key = (id(container), feature.name)
+                if key not in positions:
+                    positions[key] = {id(o): i for i, o in enumerate(container.eGet(feature))}
+                index = positions[key].get(id(obj), 0)
+            path.append((features.get(feature.name, 0), index))
+            obj = container
+            container = obj.eContainer()
+        path.reverse()
+        return path
+
+    return position
+
+
+class ObjectIndex(EObserver):
+    """
+    Keeps the objects of a resource in insertion ordered buckets (a dict used as an ordered set) per EClass.
+    Use ObjectIndex.of(resource) to get (or create) the index of a resource.
+    """
+    def __init__(self, resource: Resource):
+        super().__init__()
+        self.resource = resource
+        self._by_eclass = dict()  # EClass -> {EObject: None}
+        self._removed = dict()    # objects to recheck, as they might have been moved within this resource
+        for root in resource.contents:
+            self._add_tree(root)
+        self.observe(resource)
+
+    @staticmethod
+    def of(resource: Resource) -> 'ObjectIndex':
+        index = getattr(resource, 'object_index', None)
+        if index is None:
+            index = ObjectIndex(resource)
+            resource.object_index = index
+        return index
+
+    def notifyChanged(self, notification: Notification):
+        feature = notification.feature
+        if not isinstance(feature, EReference) or not feature.containment:
+            return
+        kind = notification.kind
+        if kind in (Kind.SET, Kind.UNSET, Kind.REMOVE, Kind.REMOVE_MANY):
+            self._remove_values(notification.old)
+        if kind in (Kind.SET, Kind.ADD, Kind.ADD_MANY):
+            self._add_values(notification.new)
+
+    def add(self, eobject: EObject, recursive=True):
+        self._check_removed()
+        if recursive:
+            self._add_tree(eobject)
+        else:
+            self._add_object(eobject)
+
+    def remove(self, eobject: EObject, recursive=True):
+        if recursive:
+            self._remove_values(eobject)
+        else:
+            self._remove_object(eobject)
+            self._removed[eobject] = None
+
+    def instances_of(self, eclass: EClass, exact=False, ordered=False) -> list:
+        """
+        Returns all instances of eclass in the resource, including instances of its subclasses if exact is False
+        :param ordered: sort the instances in document order, instead of grouping them per EClass
+        """
+        self._check_removed()
+        if exact:
+            result = list(self._by_eclass.get(eclass, ()))
+        else:
+            result = []
+            for sub_eclass in _all_subclasses(eclass):
+                result.extend(self._by_eclass.get(sub_eclass, ()))
+        if ordered:
+            result.sort(key=document_position_function())
+        return result
+
+    def instances_of_in_container(self, eclass: EClass, container: EObject, exact=False, ordered=False) -> list:
+        """Returns all instances of eclass that are (directly or indirectly) contained in container"""
+        inside = {container: True}   # containers of the instances -> whether they are contained in container
+        result = []
+        for obj in self.instances_of(eclass, exact):
+            parents = []
+            parent = obj.eContainer()
+            while parent is not None and parent not in inside:
+                parents.append(parent)
+                parent = parent.eContainer()
+            is_inside = parent is not None and inside[parent]
+            for p in parents:
+                inside[p] = is_inside
+            if is_inside:
+                result.append(obj)
+        if ordered:
+            result.sort(key=document_position_function())
+        return result
+
+    def _add_values(self, value):
+        if value is None:
+            return
+        if isinstance(value, EObject):
+            self._add_tree(value)
+        else:
+            for v in value:
+                self._add_tree(v)
+
+    def _remove_values(self, value):
+        if value is None:
+            return
+        values = [value] if isinstance(value, EObject) else list(value)
+        for v in values:
+            self._remove_object(v)
+            for child in v.eAllContents():
+                self._remove_object(child)
+            self._removed[v] = None
+
+    def _add_tree(self, eobject: EObject):
+        self._add_object(eobject)
+        for child in eobject.eAllContents():
+            self._add_object(child)
+
+    def _add_object(self, eobject: EObject):
+        bucket = self._by_eclass.get(eobject.eClass)
+        if bucket is None:
+            bucket = self._by_eclass[eobject.eClass] = dict()
+        bucket[eobject] = None
+        self._removed.pop(eobject, None)
+
+    def _remove_object(self, eobject: EObject):
+        bucket = self._by_eclass.get(eobject.eClass)
+        if bucket is not None:
+            bucket.pop(eobject, None)
+
+    def _check_removed(self):
+        if not self._removed:
+            return
+        removed = self._removed
+        self._removed = dict()
+        for eobject in removed:
+            if eobject.eResource is self.resource:
+                # object has been moved to another container in this resource
+                self._add_tree(eobject)
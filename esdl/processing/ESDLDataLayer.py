@@ -162,10 +162,9 @@ class ESDLDataLayer:
         es = esh.get_energy_system(active_es_id)
         area = es.instance[0].area
         object_list = list()
-        for area_asset in area.eAllContents():
-            if isinstance(area_asset, type):
-                object_list.append({'id': area_asset.id, 'name': area_asset.name})
-        return object_list       
+        for area_asset in esh.get_all_instances_of_type_in_container(type, area, active_es_id):
+            object_list.append({'id': area_asset.id, 'name': area_asset.name})
+        return object_list
 
     @staticmethod
     def remove_control_strategy(asset):
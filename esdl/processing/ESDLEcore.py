@@ -12,9 +12,10 @@
 #  Manager:
 #      TNO
 
-from pyecore.ecore import EAttribute, ECollection, EEnum, EReference, EClass, EObject, EStructuralFeature
+from pyecore.ecore import EAttribute, ECollection, EEnum, EReference, EClass, EObject
 from pyecore.resources import Resource
 from esdl.processing.EcoreDocumentation import EcoreDocumentation
+from esdl.object_index import ObjectIndex, document_position_function
 import esdl
 
 
@@ -25,57 +26,79 @@ Contains functions that leverage the ecore functionality to e.g. list attributes
 """
 
 
+# (EClass, EcoreDocumentation) -> [(EAttribute, description of the attribute without its value)], sorted by name
+_attribute_descriptors = dict()
+
+
+def get_attribute_descriptors(eclass: EClass, esdl_doc: EcoreDocumentation = None):
+    """
+    Returns the attributes of an EClass with everything get_asset_attributes() sends to the frontend except their
+    value (type, default, options, documentation and unit). They are determined once per EClass and cached.
+    """
+    key = (eclass, esdl_doc)
+    descriptors = _attribute_descriptors.get(key)
+    if descriptors is None:
+        descriptors = list()
+        for x in eclass.eAllStructuralFeatures():
+            if isinstance(x, EAttribute):
+                attr = dict()
+                attr['name'] = x.name
+                attr['type'] = x.eType.name
+                attr['required'] = x.required or x.lowerBound > 0
+                attr['value'] = None
+                if isinstance(x.eType, EEnum):
+                    attr['type'] = 'EEnum'
+                    attr['enum_type'] = x.eType.name
+                    attr['options'] = list(lit.name for lit in x.eType.eLiterals)
+                    attr['default'] = x.eType.default_value.name
+                else:
+                    attr['default'] = x.eType.default_value
+                    if x.eType.default_value is not None:
+                        attr['default'] = x.eType.to_string(x.eType.default_value)
+                if x.eType.name == 'EBoolean':
+                    attr['options'] = ['true', 'false']
+                attr['doc'] = x.__doc__
+                if x.__doc__ is None and esdl_doc is not None:
+                    attr['doc'] = esdl_doc.get_doc(eclass.name, x.name)
+                if esdl_doc is not None:
+                    attr['unit'] = esdl_doc.get_unit(eclass.name, x.name)
+                descriptors.append((x, attr))
+        descriptors.sort(key=lambda d: d[1]['name'])
+        _attribute_descriptors[key] = descriptors
+    return descriptors
+
+
+def cache_attribute_descriptors(package=esdl.esdl, esdl_doc: EcoreDocumentation = None):
+    """Determines the attribute descriptors of all classes of a package, e.g. at startup"""
+    for classifier in package.eClassifiers.values():
+        if isinstance(classifier, type):
+            # classes of a static meta model are python classes
+            classifier = classifier.eClass
+        if isinstance(classifier, EClass):
+            get_attribute_descriptors(classifier, esdl_doc)
+
+
 def get_asset_attributes(asset, esdl_doc: EcoreDocumentation = None):
     attributes = list()
-    for x in asset.eClass.eAllStructuralFeatures():
-        # print('{} is of type {}'.format(x.name, x.eClass.name))
-        if isinstance(x, EAttribute):
-            attr = dict()
-            attr['name'] = x.name
-            attr['type'] = x.eType.name
-            attr['required'] = x.required or x.lowerBound > 0
-            # if isinstance(x., EEnum):
-            #    attr['value'] = list(es.eGet(x))
-            attr['value'] = asset.eGet(x)
-            if attr['value'] is not None:
-                if x.many:
-                    if isinstance(attr['value'], ECollection):
-                        if isinstance(x.eType, EStructuralFeature):
-                            attr['value'] = [x.name for x in attr['value']]
-                            attr['many'] = True
-                        elif isinstance(x.eType, EEnum):
-                            attr['value'] = [x.name for x in attr['value']]
-                            attr['many'] = True
-                        else:
-                            # primitive type
-                            attr['value'] = list(attr['value'])
-                            attr['many'] = True
-                            pass
+    for x, descriptor in get_attribute_descriptors(asset.eClass, esdl_doc):
+        attr = dict(descriptor)
+        value = asset.eGet(x)
+        if value is not None:
+            if x.many:
+                if isinstance(value, ECollection):
+                    if isinstance(x.eType, EEnum):
+                        value = [v.name for v in value]
                     else:
-                        attr['value'] = list(x.eType.to_string(attr['value']))
+                        # primitive type
+                        value = list(value)
+                    attr['many'] = True
                 else:
-                    attr['value'] = x.eType.to_string(attr['value'])
-            if isinstance(x.eType, EEnum):
-                attr['type'] = 'EEnum'
-                attr['enum_type'] = x.eType.name
-                attr['options'] = list(lit.name for lit in x.eType.eLiterals)
-                attr['default'] = x.eType.default_value.name
+                    value = list(x.eType.to_string(value))
             else:
-                attr['default'] = x.eType.default_value
-                if x.eType.default_value is not None:
-                    attr['default'] = x.eType.to_string(x.eType.default_value)
-            if x.eType.name == 'EBoolean':
-                attr['options'] = ['true', 'false']
-            attr['doc'] = x.__doc__
-            if x.__doc__ is None and esdl_doc is not None:
-                attr['doc'] = esdl_doc.get_doc(asset.eClass.name, x.name)
-            if esdl_doc is not None:
-                attr['unit'] = esdl_doc.get_unit(asset.eClass.name, x.name)
-
-            attributes.append(attr)
-    # print(attributes)
-    attrs_sorted = sorted(attributes, key=lambda a: a['name'])
-    return attrs_sorted
+                value = x.eType.to_string(value)
+        attr['value'] = value
+        attributes.append(attr)
+    return attributes
 
 
 """
@@ -203,22 +226,31 @@ def resolve_fragment(resource: Resource, fragment: str):
 
 
 """
-Calculates a list of all possible reference values for a specific reference
+Calculates a list of all possible reference values for a specific reference, in the order of the document
 Was based on allInstances() for each possible subtype in the types list, but this WeakSet is shared among all loggedin
-users... so now a slow version to find it by iterating through all nodes of the XML graph.
-TODO: find a more efficient way then by iterating through all the elements 
+users... It then iterated through all nodes of the XML graph; now the instances of the types are taken from the object
+index of the resource (see ObjectIndex) and sorted in document order.
 """
 
 
 def get_reachable_references(root: EObject, types: list, repr_function=string_repr):
     result = list()
-    for instance in root.eAllContents():
+    resource = root.eResource
+    if resource is not None:
+        # use the object index of the resource instead of iterating over all objects in the energy system
+        index = ObjectIndex.of(resource)
+        instances = [instance for type_name in types
+                     for instance in index.instances_of(esdl.getEClassifier(type_name).eClass, exact=True)
+                     if instance is not root and instance.eRoot() is root]
+        instances.sort(key=document_position_function())
+    else:
         # search through all objects to find instances of type in types
-        if instance.eClass.name in types:
-            ref = {'repr': repr_function(instance)}
-            if hasattr(instance, 'id'):
-                ref['id'] = instance.id
-            ref['fragment'] = instance.eURIFragment()
-            result.append(ref)
+        instances = [instance for instance in root.eAllContents() if instance.eClass.name in types]
+    for instance in instances:
+        ref = {'repr': repr_function(instance)}
+        if hasattr(instance, 'id'):
+            ref['id'] = instance.id
+        ref['fragment'] = instance.eURIFragment()
+        result.append(ref)
 
     return result
@@ -13,8 +13,9 @@
 #      TNO
 
 from esdl import esdl
+from esdl.processing import GeometryArrays, GeometryKernels
 from utils.RDWGSConverter import RDWGSConverter
-import math
+import numpy as np
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -45,124 +46,83 @@ def distance(origin, destination):
     """
     lat1, lon1 = origin
     lat2, lon2 = destination
-    radius = 6371  # km
+    return float(GeometryKernels.haversine(lat1, lon1, lat2, lon2))
 
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) * math.sin(dlat / 2) +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dlon / 2) * math.sin(dlon / 2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    d = radius * c
 
-    return d
+def line_coordinates(line):
+    """Returns the latitudes and longitudes of the points of an esdl.Line (or SubPolygon) as two NumPy arrays"""
+    points = line.point
+    lats = np.fromiter((p.lat for p in points), dtype=np.float64, count=len(points))
+    lons = np.fromiter((p.lon for p in points), dtype=np.float64, count=len(points))
+    return lats, lons
+
+
+def line_length(line):
+    """Returns the length of an esdl.Line in m"""
+    return GeometryKernels.polyline_length(*line_coordinates(line)) * 1000
+
+
+def line_lengths(lines):
+    """Returns the lengths in m of many esdl.Lines as a NumPy array, calculated in one call"""
+    lats, lons, offsets = [], [], []
+    for line in lines:
+        offsets.append(len(lats))
+        for point in line.point:
+            lats.append(point.lat)
+            lons.append(point.lon)
+    return GeometryKernels.polyline_lengths(lats, lons, offsets) * 1000
+
+
+def update_conductor_lengths(conductors):
+    """
+    Recalculates the length (in m, rounded to cm) of all conductors with a Line geometry, e.g. all pipes of a heat
+    network. Returns the conductors that were updated.
+    """
+    conductors = [c for c in conductors if isinstance(c.geometry, esdl.Line)]
+    for conductor, length in zip(conductors, line_lengths(c.geometry for c in conductors)):
+        conductor.length = round(float(length), 2)
+    return conductors
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 #  Split a conductor into two pieces
 # ---------------------------------------------------------------------------------------------------------------------
 def distance_point_to_line(p, p1, p2):
-    x = p1['x']
-    y = p1['y']
-    dx = p2['x'] - x
-    dy = p2['y'] - y
-    dot = dx * dx + dy * dy
-
-    if dot > 0:
-        t = ((p['x'] - x) * dx + (p['y'] - y) * dy) / dot
+    """Returns the squared planar distance between point p and the segment p1-p2 (dicts with 'x' and 'y')"""
+    return float(GeometryKernels.point_to_segments_distance(p['x'], p['y'], p1['x'], p1['y'], p2['x'], p2['y']))
 
-        if t > 1:
-            x = p2['x']
-            y = p2['y']
-        else:
-            if t > 0:
-                x += dx * t
-                y += dy * t
 
-    dx = p['x'] - x
-    dy = p['y'] - y
-
-    return dx * dx + dy * dy
+def closest_segment(line, lat, lon):
+    """Returns the index of the segment of an esdl.Line that is closest to (lat, lon), 0 for a single point"""
+    lats, lons = line_coordinates(line)
+    index = GeometryKernels.closest_segment(lat, lon, lats, lons)
+    return 0 if index is None else index
 
 # ---------------------------------------------------------------------------------------------------------------------
 #  Boundary information processing
 # ---------------------------------------------------------------------------------------------------------------------
 def convert_coordinates_into_subpolygon(coord_list):
-    # print(coord_list)
-    # [[x1,y1], [x2,y2], ...]
-
     # coord_list contains coordinates in [lon, lat] order!
-
-    subpolygon = esdl.SubPolygon()
-    for coord_pairs in coord_list:
-        point = esdl.Point()
-        point.lat = float(coord_pairs[1])
-        point.lon = float(coord_pairs[0])
-        subpolygon.point.append(point)
-    return subpolygon
+    return GeometryArrays.subpolygon_from_array(coord_list)
 
 
 def convert_pcoordinates_into_polygon(coord_list):
-    polygon = esdl.Polygon()
-
-    coord_exterior = coord_list[0]
-    exterior = convert_coordinates_into_subpolygon(coord_exterior)
-    polygon.exterior = exterior
-
-    if len(coord_list) > 1:
-        coord_list.pop(0)  # remove exterior polygon
-        for coord_interior in coord_list:  # iterate over remaining interiors
-            interior = convert_coordinates_into_subpolygon(coord_interior)
-            polygon.interior.append(interior)
-
-    return polygon
+    # [exterior, interior, ...], with coordinates in [lon, lat] order
+    return GeometryArrays.polygon_from_arrays(coord_list)
 
 
 def convert_mpcoordinates_into_multipolygon(coord_list):
-    mp = esdl.MultiPolygon()
-    for coord_polygon in coord_list:
-        polygon = convert_pcoordinates_into_polygon(coord_polygon)
-        mp.polygon.append(polygon)
+    return GeometryArrays.multipolygon_from_arrays(coord_list)
 
-    return mp
 
+def convert_leaflet_coordinates_into_polygon(latlng_list):
+    # [exterior, interior, ...], with {'lat': .., 'lng': ..} coordinates of which duplicates are removed
+    return GeometryArrays.polygon_from_arrays([GeometryArrays.leaflet_to_array(ring) for ring in latlng_list])
 
-def create_boundary_from_geometry(geometry):
-    if isinstance(geometry, esdl.Polygon):
-        exterior = geometry.exterior
-        interiors = geometry.interior
-
-        ar = []
-        ar.append(parse_esdl_subpolygon(exterior))
-        for interior in interiors:
-            ar.append(parse_esdl_subpolygon(interior))
-
-        geom = {
-            'type': 'Polygon',  # TODO: was POLYGON
-            'coordinates': ar
-        }
-        # print(geom)
-
-    if isinstance(geometry, esdl.MultiPolygon):
-        polygons = geometry.polygon
-        mp = []
-        for polygon in polygons:
-            exterior = polygon.exterior
-            interiors = polygon.interior
-
-            ar = []
-            ar.append(parse_esdl_subpolygon(exterior))
-            for interior in interiors:
-                ar.append(parse_esdl_subpolygon(interior))
-
-            mp.append(ar)
-
-        geom = {
-            'type': 'MultiPolygon',
-            'coordinates': mp
-        }
 
-    return geom
+def create_boundary_from_geometry(geometry):
+    """Returns the GeoJSON geometry of an esdl.Polygon or esdl.MultiPolygon, with closed rings"""
+    return GeometryArrays.to_geojson(geometry)
 
 
 def create_geojson(id, name, KPIs, boundary_wgs):
@@ -178,35 +138,12 @@ def create_geojson(id, name, KPIs, boundary_wgs):
 
 
 def parse_esdl_subpolygon(subpol, close=True):
-    ar = []
-    points = subpol.point
-    firstlat = points[0].lat
-    firstlon = points[0].lon
-    for point in points:
-        lat = point.lat
-        lon = point.lon
-        ar.append([lon, lat])
-    if close:
-        ar.append([firstlon, firstlat])  # close the polygon: TODO: check if necessary??
-    return ar
+    # returns [[lon, lat], ...], closed by repeating the first point if close is True
+    return GeometryArrays.points_to_list(subpol.point, close)
 
 
 def create_boundary_from_contour(contour):
-    exterior = contour.exterior
-    interiors = contour.interior
-
-    ar = []
-    ar.append(parse_esdl_subpolygon(exterior))
-    for interior in interiors:
-        ar.append(parse_esdl_subpolygon(interior))
-
-    geom = {
-        'type': 'Polygon',
-        'coordinates': ar
-    }
-    # print(geom)
-
-    return geom
+    return GeometryArrays.to_geojson(contour)
 
 
 def create_geometry_from_geom(geom):
@@ -235,10 +172,8 @@ def create_geometry_from_geom(geom):
 def convert_polygon_rd_to_wgs(coords):
     RDWGS = RDWGSConverter()
 
-    for i in range(0, len(coords)):
-        for j in range(0, len(coords[i])):
-            point = coords[i][j]
-            coords[i][j] = RDWGS.fromRdToWgs(point)
+    for ring in coords:
+        ring[:] = RDWGS.fromRdToWgsArray([point[:2] for point in ring]).tolist()
 
     return coords
 
@@ -246,42 +181,29 @@ def convert_polygon_rd_to_wgs(coords):
 def convert_mp_rd_to_wgs(coords):
     RDWGS = RDWGSConverter()
 
-    for i in range(0, len(coords)):
-        for j in range(0, len(coords[i])):
-            for k in range(0, len(coords[i][j])):
-                point = coords[i][j][k]
-                coords[i][j][k] = RDWGS.fromRdToWgs(point)
+    for polygon in coords:
+        for ring in polygon:
+            ring[:] = RDWGS.fromRdToWgsArray([point[:2] for point in ring]).tolist()
 
     return coords
 
 
 def exchange_coordinates(coords):
-
-    for i in range(0, len(coords)):
-        point = coords[i]
-        coords[i] = [point[1], point[0]]
-
+    # swaps [x, y] into [y, x] in place (and drops any other elements, such as the elevation)
+    if len(coords):
+        coords[:] = np.asarray(coords)[:, 1::-1].tolist()
     return coords
 
 
 def exchange_polygon_coordinates(coords):
-
-    for i in range(0, len(coords)):
-        for j in range(0, len(coords[i])):
-            point = coords[i][j]
-            coords[i][j] = [point[1], point[0]]
-
+    for ring in coords:
+        exchange_coordinates(ring)
     return coords
 
 
 def exchange_multipolygon_coordinates(coords):
-
-    for i in range(0, len(coords)):
-        for j in range(0, len(coords[i])):
-            for k in range(0, len(coords[i][j])):
-                point = coords[i][j][k]
-                coords[i][j][k] = [point[1], point[0]]
-
+    for polygon in coords:
+        exchange_polygon_coordinates(polygon)
     return coords
 
 
@@ -291,29 +213,14 @@ def calculate_polygon_center(polygon):
     :param polygon:
     :return:
     """
-    exterior = polygon.exterior
-    pts = exterior.point
-
-    first = pts[0]
-    last = pts[len(pts) - 1]
-
-    if first.lat != last.lat or first.lon != last.lon:
-        pts.append(first)
-
-    twice_area = 0
-    x = 0
-    y = 0
-
-    for i in range(0, len(pts)):
-        j = (i + (len(pts) - 1)) % len(pts)
-        p1 = pts[i]
-        p2 = pts[j]
-        f = (p1.lon - first.lon) * (p2.lat - first.lat) - (p2.lon - first.lon) * (p1.lat - first.lat)
-        twice_area += f
-        x += (p1.lat + p2.lat - 2 * first.lat) * f
-        y += (p1.lon + p2.lon - 2 * first.lon) * f
-    f = twice_area * 3
-    return x / f + first.lat, y / f + first.lon
+    coordinates = GeometryArrays.subpolygon_to_array(polygon.exterior)
+    lon = coordinates[:, 0] - coordinates[0, 0]
+    lat = coordinates[:, 1] - coordinates[0, 1]
+    prev_lon = np.roll(lon, 1)      # the ring is closed: the point before the first one is the last one
+    prev_lat = np.roll(lat, 1)
+    f = lon * prev_lat - prev_lon * lat
+    f3 = f.sum() * 3
+    return float((lat + prev_lat) @ f / f3 + coordinates[0, 1]), float((lon + prev_lon) @ f / f3 + coordinates[0, 0])
 
 
 def remove_latlng_annotation_in_array(coords):
@@ -364,31 +271,11 @@ def create_ESDL_geometry(shape):
         geometry = esdl.Point(lon=float(shape['coordinates']['lng']), lat=float(shape['coordinates']['lat']))
 
     elif shape['type'].upper() == 'POLYLINE':
-        polyline_data = shape['coordinates']
-        geometry = esdl.Line()
-
-        i = 0
-        prev_lat = 0
-        prev_lng = 0
-        while i < len(polyline_data):
-            coord = polyline_data[i]
-
-            # Don't understand why, but sometimes coordinates come in twice
-            if prev_lat != coord['lat'] or prev_lng != coord['lng']:
-                point = esdl.Point(lat=float(coord['lat']), lon=float(coord['lng']))
-                geometry.point.append(point)
-                prev_lat = coord['lat']
-                prev_lng = coord['lng']
-            i += 1
+        # Don't understand why, but sometimes coordinates come in twice
+        geometry = GeometryArrays.line_from_array(GeometryArrays.leaflet_to_array(shape['coordinates']))
 
     elif shape['type'].upper() == 'POLYGON' or shape['type'].upper() == 'RECTANGLE':
-        polygon_data = shape['coordinates']  # [lat, lon]
-        print(polygon_data)
-        polygon_data = remove_duplicates_in_polygon(polygon_data)
-        polygon_data = remove_latlng_annotation_in_array_of_arrays(polygon_data)
-        polygon_data = exchange_polygon_coordinates(polygon_data)  # --> [lon, lat]
-
-        geometry = convert_pcoordinates_into_polygon(polygon_data)  # expects [lon, lat]
+        geometry = convert_leaflet_coordinates_into_polygon(shape['coordinates'])  # [{'lat': .., 'lng': ..}]
 
     # elif shape['type'] == 'rectangle':
     #     rect_data = shape['coordinates']
@@ -14,79 +14,188 @@
 
 from pyecore.resources import ResourceSet, URI
 from pyecore.utils import DynamicEPackage
-from pyecore.ecore import EModelElement, EAnnotation
+from pyecore.ecore import EModelElement, EAnnotation, EClass
 from pyecore.resources.resource import HttpURI
 from esdl.resources.xmlresource import XMLResource
+import hashlib
+import json
+import os
+import sys
 import src.log as log
 
 logger = log.get_logger(__name__)
 
 esdlVersion = "unknown"
 
+# documentation index generated from esdl/esdl.ecore, see EcoreDocumentation.write_index()
+DEFAULT_INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'esdl_doc_index.json')
+INDEX_FORMAT = 2
+UNIT_ANNOTATION = 'http://www.tno.nl/esdl/attribute/unit'
+
+
 class EcoreDocumentation:
     """This class loads the dynamic meta-model and returns the documentation for attributes as these are
-    not present in the static meta-model"""
-    def __init__(self, esdlEcoreFile=None):
-            self.esdl = None
-            self.rset = None
-            self.esdl_model = None
-            self.resource = None
-            if esdlEcoreFile is None:
-                self.esdlEcoreFile = 'https://raw.githubusercontent.com/EnergyTransition/ESDL/master/esdl/model/esdl.ecore'
-            else:
-                self.esdlEcoreFile = esdlEcoreFile
-            self._init_metamodel()
-            global esdlVersion
-            esdlVersion = self.get_esdl_version()
+    not present in the static meta-model.
+
+    The documentation and units of the features of all classes are kept in an index, that only contains the features
+    a class defines itself and the names of its supertypes; the inherited features are looked up (and cached) when a
+    class is first used. The index is read from index_file when it has been generated from the same ecore file (or when the ecore file is a
+    URL, such that it does not have to be downloaded), otherwise it is built from the dynamic meta-model. The dynamic
+    meta-model itself (esdl, esdl_model, rset) is only loaded when it is used."""
+    def __init__(self, esdlEcoreFile=None, index_file=DEFAULT_INDEX_FILE):
+        self._rset = None
+        self._esdl = None
+        self._esdl_model = None
+        self.resource = None
+        if esdlEcoreFile is None:
+            self.esdlEcoreFile = 'https://raw.githubusercontent.com/EnergyTransition/ESDL/master/esdl/model/esdl.ecore'
+        else:
+            self.esdlEcoreFile = esdlEcoreFile
+        self.index = self._read_index(index_file)
+        if self.index is None:
+            self.index = self.build_index()
+        self._class_features = dict()   # class name -> {feature name: (doc, unit)} including inherited features
+        global esdlVersion
+        esdlVersion = self.get_esdl_version()
 
     def _init_metamodel(self):
-            self.rset = ResourceSet()
+        self._rset = ResourceSet()
+
+        # Assign files with the .esdl extension to the XMLResource instead of default XMI
+        self._rset.resource_factory['esdl'] = lambda uri: XMLResource(uri)
+
+        # Read esdl.ecore as meta model
+        logger.info('Initalizing ESDL metamodel for documentation from {}'.format(self.esdlEcoreFile))
+        mm_uri = URI(self.esdlEcoreFile)
+        if self.esdlEcoreFile[:4] == 'http':
+            mm_uri = HttpURI(self.esdlEcoreFile)
+        esdl_model_resource = self._rset.get_resource(mm_uri)
+
+        esdl_model = esdl_model_resource.contents[0]
+        self._esdl_model = esdl_model
+        # logger.debug('Namespace: {}'.format(esdl_model.nsURI))
+        self._rset.metamodel_registry[esdl_model.nsURI] = esdl_model
+
+        # Create a dynamic model from the loaded esdl.ecore model, which we can use to build Energy Systems
+        self._esdl = DynamicEPackage(esdl_model)
+        logger.info("Initialized ESDL version {}".format(self._get_model_version()))
+
+    @property
+    def esdl_model(self):
+        if self._esdl_model is None:
+            self._init_metamodel()
+        return self._esdl_model
 
-            # Assign files with the .esdl extension to the XMLResource instead of default XMI
-            self.rset.resource_factory['esdl'] = lambda uri: XMLResource(uri)
+    @property
+    def esdl(self):
+        if self._esdl is None:
+            self._init_metamodel()
+        return self._esdl
+
+    @property
+    def rset(self):
+        if self._rset is None:
+            self._init_metamodel()
+        return self._rset
 
-            # Read esdl.ecore as meta model
-            logger.info('Initalizing ESDL metamodel for documentation from {}'.format(self.esdlEcoreFile))
-            mm_uri = URI(self.esdlEcoreFile)
-            if self.esdlEcoreFile[:4] == 'http':
-                mm_uri = HttpURI(self.esdlEcoreFile)
-            esdl_model_resource = self.rset.get_resource(mm_uri)
+    def _source_digest(self):
+        """SHA-256 of the ecore file, or None when it is a URL"""
+        if self.esdlEcoreFile[:4] == 'http':
+            return None
+        with open(self.esdlEcoreFile, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
 
-            esdl_model = esdl_model_resource.contents[0]
-            self.esdl_model = esdl_model
-            # logger.debug('Namespace: {}'.format(esdl_model.nsURI))
-            self.rset.metamodel_registry[esdl_model.nsURI] = esdl_model
+    def _read_index(self, index_file):
+        if index_file is None or not os.path.exists(index_file):
+            return None
+        try:
+            with open(index_file, 'r', encoding='UTF-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning('Cannot read ESDL documentation index {}: {}'.format(index_file, e))
+            return None
+        if index.get('format') != INDEX_FORMAT:
+            return None
+        digest = self._source_digest()
+        if digest is not None and index.get('source') != digest:
+            logger.warning('ESDL documentation index {} was not generated from {}, run "python -m '
+                           'esdl.processing.EcoreDocumentation" to update it'.format(index_file, self.esdlEcoreFile))
+            return None
+        logger.info("Read ESDL documentation index of ESDL version {}".format(index['version']))
+        return index
+
+    def build_index(self):
+        """
+        Returns the documentation index of the dynamic meta-model: for each class the names of its supertypes and the
+        documentation of the features it defines, as [documentation, unit] for features with a unit
+        """
+        classes = dict()
+        for classifier in self.esdl_model.eClassifiers:
+            if isinstance(classifier, EClass):
+                features = dict()
+                for feature in classifier.eStructuralFeatures:
+                    annotation: EAnnotation = feature.getEAnnotation(UNIT_ANNOTATION)
+                    unit = annotation.details.get('unit', '') if annotation else None
+                    features[feature.name] = [feature.__doc__, unit] if unit else feature.__doc__
+                classes[classifier.name] = [[supertype.name for supertype in classifier.eSuperTypes], features]
+        return {'format': INDEX_FORMAT, 'version': self._get_model_version(), 'source': self._source_digest(),
+                'classes': classes}
 
-            # Create a dynamic model from the loaded esdl.ecore model, which we can use to build Energy Systems
-            self.esdl = DynamicEPackage(esdl_model)
-            logger.info("Initialized ESDL version {}".format(self.get_esdl_version()))
+    def write_index(self, index_file=DEFAULT_INDEX_FILE):
+        """Writes the documentation index of the ecore file to index_file"""
+        index = self.build_index()
+        with open(index_file, 'w', encoding='UTF-8') as f:
+            json.dump(index, f, separators=(',', ':'), sort_keys=True)
+        self.index = index
+        self._class_features.clear()
 
+    def _features(self, className):
+        """:returns: {feature name: (doc, unit)} of all (also inherited) features of a class, None for unknown classes"""
+        features = self._class_features.get(className)
+        if features is None:
+            entry = self.index['classes'].get(className)
+            if entry is None:
+                return None
+            supertypes, own_features = entry
+            features = dict()
+            for supertype in supertypes:
+                features.update(self._features(supertype) or {})
+            for name, doc in own_features.items():
+                features[name] = tuple(doc) if isinstance(doc, list) else (doc, '')
+            self._class_features[className] = features
+        return features
 
     def get_doc(self, className, attributeName):
         """ Returns the documentation of an attribute from the dynamic meta model,
         because the static meta model does not contain attribute documentation"""
-        ecoreClass = self.esdl_model.getEClassifier(className)
-        if ecoreClass is None: return None
-        attr = ecoreClass.findEStructuralFeature(attributeName)
-        if attr is None: return None
-        # logger.debug('Retrieving doc for {}: {}'.format(attributeName, attr.__doc__))
-        return attr.__doc__
+        features = self._features(className)
+        if features is None: return None
+        doc_and_unit = features.get(attributeName)
+        if doc_and_unit is None: return None
+        return doc_and_unit[0]
 
     def get_unit(self, className:str, attributeName:str) -> str:
         """
         :value: EmodelElement (e.g. EObject) that has an annotation attached
         :returns: The unit attached to this annotation or empty string
         """
-        ecoreClass = self.esdl_model.getEClassifier(className)
-        if ecoreClass is None: return None
-        attr = ecoreClass.findEStructuralFeature(attributeName)
-        if attr is None: return None
-
-        annotation: EAnnotation = attr.getEAnnotation('http://www.tno.nl/esdl/attribute/unit')
-        unit = annotation.details.get('unit', '') if annotation else None
-        return unit if unit else ''
+        features = self._features(className)
+        if features is None: return None
+        doc_and_unit = features.get(attributeName)
+        if doc_and_unit is None: return None
+        return doc_and_unit[1]
 
     def get_esdl_version(self):
+        return self.index['version']
+
+    def _get_model_version(self):
         annotation: EAnnotation = self.esdl_model.getEAnnotation('http://www.tno.nl/esdl/version')
         version = annotation.details.get('version', '') if annotation else None
         return version if version else 'unknown'
+
+
+if __name__ == '__main__':
+    # python -m esdl.processing.EcoreDocumentation [esdl.ecore] [index file]
+    ecore_file = sys.argv[1] if len(sys.argv) > 1 else 'esdl/esdl.ecore'
+    EcoreDocumentation(esdlEcoreFile=ecore_file, index_file=None).write_index(
+        sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_FILE)
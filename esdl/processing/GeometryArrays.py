@@ -0,0 +1,221 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Conversion of geometries between ESDL, shapely, GeoJSON and WKB through packed coordinate arrays.
+
+A ring or line is an (n, 2) NumPy array of [lon, lat] coordinates (the order of GeoJSON and shapely, an optional third
+column is the elevation). A polygon is a list of rings, the exterior first, and a multipolygon a list of polygons.
+The coordinates of esdl.Points are read and written in bulk, and new Points are created without the type checks and
+notifications of their attributes (see support_functions.init_attribute_value()), which is where converting large
+polygon-heavy energy systems (buildings, boundaries) used to spend its time.
+"""
+
+from itertools import chain
+import numpy as np
+from shapely import wkb
+from shapely.geometry import Point, LineString, Polygon, MultiPolygon
+from esdl import esdl
+from esdl.support_functions import gc_paused, init_attribute_value, GC_PAUSE_MIN_OBJECTS
+
+_POINT = esdl.Point.eClass
+_LAT = _POINT.findEStructuralFeature('lat')
+_LON = _POINT.findEStructuralFeature('lon')
+_ELEVATION = _POINT.findEStructuralFeature('elevation')
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  ESDL points <-> coordinate arrays
+# ---------------------------------------------------------------------------------------------------------------------
+def points_to_list(points, close=False) -> list:
+    """
+    Returns the [lon, lat] coordinates of a list of esdl.Points as nested lists (for JSON), with the first point
+    repeated at the end if close is True. Reading the attributes of the Points is what takes time, so this is faster
+    than converting an array to lists.
+    """
+    coordinates = [[p.lon, p.lat] for p in points]
+    if close and coordinates:
+        coordinates.append(list(coordinates[0]))
+    return coordinates
+
+
+def points_to_array(points) -> np.ndarray:
+    """Returns the [lon, lat] coordinates of a list of esdl.Points as an (n, 2) array"""
+    return np.array([(p.lon, p.lat) for p in points], dtype=np.float64).reshape(len(points), 2)
+
+
+def array_to_points(coordinates) -> list:
+    """Returns new esdl.Points for [lon, lat] or [lon, lat, elevation] coordinates (an array or nested lists)"""
+    if len(coordinates) == 0:
+        return []
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    points = []
+    with gc_paused(len(coordinates) >= GC_PAUSE_MIN_OBJECTS):
+        if coordinates.shape[1] > 2:
+            for lon, lat, elevation in coordinates[:, :3].tolist():
+                point = esdl.Point()
+                init_attribute_value(point, _LAT, lat)
+                init_attribute_value(point, _LON, lon)
+                init_attribute_value(point, _ELEVATION, elevation)
+                points.append(point)
+        else:
+            for lon, lat in coordinates.tolist():
+                point = esdl.Point()
+                init_attribute_value(point, _LAT, lat)
+                init_attribute_value(point, _LON, lon)
+                points.append(point)
+    return points
+
+
+def leaflet_to_array(latlngs) -> np.ndarray:
+    """
+    Returns the [lon, lat] coordinates of a list of leaflet {'lat': .., 'lng': ..} dicts, without the coordinates
+    that are sent twice in a row (and without a first point at (0, 0))
+    """
+    n = len(latlngs)
+    coordinates = np.fromiter(chain.from_iterable((c['lng'], c['lat']) for c in latlngs), dtype=np.float64,
+                              count=2 * n).reshape(n, 2)
+    previous = np.vstack((np.zeros((1, 2)), coordinates[:-1]))
+    return coordinates[(coordinates != previous).any(axis=1)]
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  ESDL geometries <-> coordinate arrays
+# ---------------------------------------------------------------------------------------------------------------------
+def line_to_array(line) -> np.ndarray:
+    return points_to_array(line.point)
+
+
+def line_from_array(coordinates):
+    line = esdl.Line()
+    line.point.extend(array_to_points(coordinates))
+    return line
+
+
+def subpolygon_to_array(subpolygon, close=False) -> np.ndarray:
+    """Returns the coordinates of an esdl.SubPolygon, with the first point repeated at the end if close is True"""
+    coordinates = points_to_array(subpolygon.point)
+    if close and len(coordinates):
+        coordinates = np.vstack((coordinates, coordinates[:1]))
+    return coordinates
+
+
+def subpolygon_from_array(coordinates):
+    subpolygon = esdl.SubPolygon()
+    subpolygon.point.extend(array_to_points(coordinates))
+    return subpolygon
+
+
+def polygon_to_arrays(polygon, close=False) -> list:
+    """Returns the rings of an esdl.Polygon: the exterior followed by the interiors"""
+    return [subpolygon_to_array(polygon.exterior, close)] + \
+        [subpolygon_to_array(interior, close) for interior in polygon.interior]
+
+
+def polygon_from_arrays(rings):
+    polygon = esdl.Polygon()
+    polygon.exterior = subpolygon_from_array(rings[0])
+    polygon.interior.extend([subpolygon_from_array(ring) for ring in rings[1:]])
+    return polygon
+
+
+def multipolygon_to_arrays(multipolygon, close=False) -> list:
+    return [polygon_to_arrays(polygon, close) for polygon in multipolygon.polygon]
+
+
+def multipolygon_from_arrays(polygons):
+    multipolygon = esdl.MultiPolygon()
+    multipolygon.polygon.extend([polygon_from_arrays(rings) for rings in polygons])
+    return multipolygon
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  GeoJSON
+# ---------------------------------------------------------------------------------------------------------------------
+def to_geojson(geometry, close=True) -> dict:
+    """Returns a GeoJSON geometry dict for an ESDL Point, Line, Polygon or MultiPolygon"""
+    if isinstance(geometry, esdl.Point):
+        return {'type': 'Point', 'coordinates': [geometry.lon, geometry.lat]}
+    if isinstance(geometry, esdl.Line):
+        return {'type': 'LineString', 'coordinates': points_to_list(geometry.point)}
+    if isinstance(geometry, esdl.Polygon):
+        return {'type': 'Polygon', 'coordinates': _polygon_lists(geometry, close)}
+    if isinstance(geometry, esdl.MultiPolygon):
+        return {'type': 'MultiPolygon', 'coordinates': [_polygon_lists(polygon, close)
+                                                        for polygon in geometry.polygon]}
+    raise Exception('Cannot convert {} to GeoJSON'.format(type(geometry).__name__))
+
+
+def _polygon_lists(polygon, close) -> list:
+    return [points_to_list(polygon.exterior.point, close)] + \
+        [points_to_list(interior.point, close) for interior in polygon.interior]
+
+
+def from_geojson(geojson_geometry):
+    """Returns an ESDL geometry for a GeoJSON Point, LineString, Polygon or MultiPolygon, or None for other types"""
+    geometry_type = geojson_geometry['type']
+    coordinates = geojson_geometry['coordinates']
+    if geometry_type == 'Point':
+        return esdl.Point(lon=float(coordinates[0]), lat=float(coordinates[1]))
+    if geometry_type == 'LineString':
+        return line_from_array(coordinates)
+    if geometry_type == 'Polygon':
+        return polygon_from_arrays(coordinates)
+    if geometry_type == 'MultiPolygon':
+        return multipolygon_from_arrays(coordinates)
+    return None
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  shapely and WKB
+# ---------------------------------------------------------------------------------------------------------------------
+def to_shapely(geometry):
+    """Returns a shapely geometry for an ESDL Point, Line, Polygon or MultiPolygon (the CRS is not transformed)"""
+    if isinstance(geometry, esdl.Point):
+        return Point(geometry.lon, geometry.lat)
+    if isinstance(geometry, esdl.Line):
+        return LineString(line_to_array(geometry))
+    if isinstance(geometry, esdl.Polygon):
+        rings = polygon_to_arrays(geometry)
+        return Polygon(rings[0], rings[1:])
+    if isinstance(geometry, esdl.MultiPolygon):
+        return MultiPolygon([(rings[0], rings[1:]) for rings in multipolygon_to_arrays(geometry)])
+    raise Exception('Cannot convert {} to a shapely geometry'.format(type(geometry).__name__))
+
+
+def _polygon_rings(polygon) -> list:
+    return [np.asarray(polygon.exterior.coords)] + [np.asarray(interior.coords) for interior in polygon.interiors]
+
+
+def from_shapely(shape):
+    """Returns an ESDL geometry for a shapely Point, LineString, Polygon or MultiPolygon"""
+    if isinstance(shape, Point):
+        return esdl.Point(lon=shape.x, lat=shape.y)
+    if isinstance(shape, LineString):
+        return line_from_array(np.asarray(shape.coords))
+    if isinstance(shape, Polygon):
+        return polygon_from_arrays(_polygon_rings(shape))
+    if isinstance(shape, MultiPolygon):
+        return multipolygon_from_arrays([_polygon_rings(polygon) for polygon in shape.geoms])
+    raise Exception('Cannot convert a shapely {} to an ESDL geometry'.format(shape.geom_type))
+
+
+def to_wkb(geometry, hex=False):
+    """Returns the WKB of an ESDL geometry, as a hexadecimal string (as in esdl.WKB.value) if hex is True"""
+    return wkb.dumps(to_shapely(geometry), hex=hex)
+
+
+def from_wkb(data):
+    """Returns an ESDL geometry for WKB bytes or a hexadecimal WKB string"""
+    return from_shapely(wkb.loads(data, hex=isinstance(data, str)))
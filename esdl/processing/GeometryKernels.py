@@ -0,0 +1,114 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Geometry kernels on NumPy coordinate arrays.
+
+All functions accept scalars or arrays (that are broadcast against each other) and calculate the result for all
+coordinates in one call, instead of calling a Python function per point. WGS84 coordinates are given in degrees,
+distances are returned in km (as ESDLGeometry.distance() always did). Many polylines can be processed at once by
+concatenating their coordinates and passing the offsets of the first point of each polyline (see polyline_lengths()).
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371.0  # km
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Returns the great-circle (haversine) distance in km between (lat1, lon1) and (lat2, lon2)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(c, dtype=np.float64)) for c in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Returns the initial bearing in degrees (0 is north, 90 is east) from (lat1, lon1) towards (lat2, lon2)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(c, dtype=np.float64)) for c in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def segment_lengths(lats, lons):
+    """Returns the lengths in km of the segments of the polyline through the points (lats[i], lons[i])"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return haversine(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def segment_bearings(lats, lons):
+    """Returns the bearings in degrees of the segments of the polyline through the points (lats[i], lons[i])"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return bearing(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def polyline_length(lats, lons) -> float:
+    """Returns the length in km of the polyline through the points (lats[i], lons[i])"""
+    if len(lats) < 2:
+        return 0.0
+    return float(segment_lengths(lats, lons).sum())
+
+
+def polyline_lengths(lats, lons, offsets):
+    """
+    Returns the lengths in km of many polylines at once. The coordinates of all polylines are concatenated in lats and
+    lons, offsets contains the position of the first point of each polyline. Segments between the last point of a
+    polyline and the first point of the next one are not counted. Polylines with less than two points have length 0.
+    """
+    offsets = np.asarray(offsets, dtype=np.intp)
+    if len(offsets) == 0:
+        return np.empty(0)
+    ends = np.append(offsets[1:], len(lats))
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths(lats, lons)))) if len(lats) else np.zeros(1)
+    # the offset of an empty polyline at the end equals the number of points, clamp it to the last cumulative length
+    last = len(cumulative) - 1
+    lengths = cumulative[np.minimum(np.maximum(ends - 1, offsets), last)] - cumulative[np.minimum(offsets, last)]
+    lengths[ends - offsets < 2] = 0.0
+    return lengths
+
+
+def point_to_segments_distance(x, y, x1, y1, x2, y2):
+    """
+    Returns the squared planar distance between the point (x, y) and the segments from (x1, y1) to (x2, y2), as
+    ESDLGeometry.distance_point_to_line() does for a single segment
+    """
+    x, y, x1, y1, x2, y2 = (np.asarray(c, dtype=np.float64) for c in (x, y, x1, y1, x2, y2))
+    dx = x2 - x1
+    dy = y2 - y1
+    dot = dx * dx + dy * dy
+    t = np.divide((x - x1) * dx + (y - y1) * dy, dot, out=np.zeros(np.broadcast(x, x1, dot).shape), where=dot > 0)
+    t = np.clip(t, 0, 1)
+    dx = x - (x1 + dx * t)
+    dy = y - (y1 + dy * t)
+    return dx * dx + dy * dy
+
+
+def point_to_polyline_distances(x, y, xs, ys):
+    """Returns the squared planar distances between the point (x, y) and each segment of the polyline (xs, ys)"""
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    return point_to_segments_distance(x, y, xs[:-1], ys[:-1], xs[1:], ys[1:])
+
+
+def closest_segment(x, y, xs, ys):
+    """
+    Returns the index of the segment of the polyline (xs, ys) that is closest to the point (x, y), the first one if
+    several segments are equally close, or None if the polyline has no segments
+    """
+    if len(xs) < 2:
+        return None
+    return int(np.argmin(point_to_polyline_distances(x, y, xs, ys)))
@@ -0,0 +1,444 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Binary encoding of the contents of a resource, for internal round trips (session snapshots, copies of an energy
+system for background work) where XML is only overhead. XML stays the format for files and other services.
+
+The encoding is a header followed by the root objects and the non-containment references:
+
+    b'ESDLBIN' format-version
+    number-of-roots object*
+    number-of-referencing-features (object-index feature number-of-values reference*)*
+
+An object is its EClass followed by its set features and a 0. EClasses, features and strings are numbered in the
+order they are first used: the first time they are written in full, later by their number. Numbers are unsigned
+LEB128 varints. Attribute values are written by type: strings by number, doubles as 8 bytes, integers as zigzag
+varints, enum literals by index, other types with to_string(). Lists of points with only a latitude and longitude
+(the coordinates of lines and polygons) are written as a packed array of doubles.
+
+Objects are numbered in the order they are written, references to objects in the resource are written as that
+number and resolved after all objects have been decoded. References to objects in other resources are written as
+their URI and decoded into proxies, references to objects that are not in a resource are left out (as in XML).
+"""
+from pyecore.ecore import EProxy, EEnum
+from esdl.resources.xmlresource import _writer_plan, _ATTRIBUTE, _ATTRIBUTE_MANY, _CONTAINMENT, \
+    _CONTAINMENT_MANY, _REFERENCE, _REFERENCE_MANY
+from esdl.support_functions import gc_paused, init_attribute_value, GC_PAUSE_MIN_BYTES
+from esdl import esdl
+from array import array
+import struct
+import sys
+
+MAGIC = b'ESDLBIN'
+FORMAT_VERSION = 1
+
+# how attribute values are written
+_STRING = 0
+_DOUBLE = 1
+_INTEGER = 2
+_BOOLEAN = 3
+_ENUM = 4
+_OTHER = 5
+
+_double = struct.Struct('<d')
+_POINT = esdl.Point.eClass
+_LAT_LON = {_POINT.findEStructuralFeature('lat'), _POINT.findEStructuralFeature('lon')}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class _Codec:
+    """How a feature of an EClass is written and read"""
+    __slots__ = ('feature', 'kind', 'value_type', 'literals', 'is_id', 'update_opposite')
+
+    def __init__(self, feature, kind):
+        self.feature = feature
+        self.kind = kind
+        self.value_type = None
+        self.literals = None
+        self.is_id = False
+        # both sides of a reference with an opposite are written, unless the opposite is not serialized
+        opposite = getattr(feature, 'eOpposite', None)
+        self.update_opposite = opposite is not None and (opposite.derived or opposite.transient)
+        if kind in (_ATTRIBUTE, _ATTRIBUTE_MANY):
+            etype = feature._eType
+            python_type = getattr(etype, 'eType', None)
+            self.is_id = bool(feature.iD)
+            if isinstance(etype, EEnum):
+                self.value_type = _ENUM
+                self.literals = list(etype.eLiterals)
+            elif python_type is str:
+                self.value_type = _STRING
+            elif python_type is bool:
+                self.value_type = _BOOLEAN
+            elif python_type is float:
+                self.value_type = _DOUBLE
+            elif python_type is int:
+                self.value_type = _INTEGER
+            else:
+                self.value_type = _OTHER
+
+
+# cache of the codecs of the features of an EClass, in the order of its writer plan and by feature
+_codecs_cache = dict()
+
+
+def _codecs(eclass) -> tuple:
+    codecs = _codecs_cache.get(eclass)
+    if codecs is None:
+        ordered = [_Codec(feature, kind) for feature, _, kind, _, _ in _writer_plan(eclass)
+                   if kind in (_ATTRIBUTE, _ATTRIBUTE_MANY, _CONTAINMENT, _CONTAINMENT_MANY, _REFERENCE,
+                               _REFERENCE_MANY)]
+        codecs = _codecs_cache[eclass] = (ordered, {codec.feature: codec for codec in ordered})
+    return codecs
+
+
+def _is_plain_point(obj) -> bool:
+    return obj.eClass is _POINT and obj._isset == _LAT_LON
+
+
+def _pack_doubles(values: list) -> bytes:
+    packed = array('d', values)
+    if _BIG_ENDIAN:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class _Encoder:
+    def __init__(self, resource):
+        self.resource = resource
+        self.out = bytearray()
+        self.eclasses = dict()      # EClass -> number
+        self.features = dict()      # feature -> number
+        self.strings = dict()       # string -> number
+        self.objects = dict()       # EObject -> number
+        self.references = []        # (object number, codec, values) of all set non-containment references
+
+    def varint(self, n):
+        out = self.out
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def string(self, value: str):
+        number = self.strings.get(value)
+        if number is None:
+            self.strings[value] = len(self.strings)
+            data = value.encode('UTF-8')
+            self.varint(0)
+            self.varint(len(data))
+            self.out += data
+        else:
+            self.varint(number + 1)
+
+    def eclass(self, eclass):
+        number = self.eclasses.get(eclass)
+        if number is None:
+            self.eclasses[eclass] = len(self.eclasses)
+            self.varint(0)
+            self.string(eclass.ePackage.nsURI)
+            self.string(eclass.name)
+        else:
+            self.varint(number + 1)
+
+    def feature(self, feature):
+        # 0 ends the features of an object, 1 introduces a new feature
+        number = self.features.get(feature)
+        if number is None:
+            self.features[feature] = len(self.features)
+            self.varint(1)
+            self.string(feature.name)
+        else:
+            self.varint(number + 2)
+
+    def value(self, codec, value):
+        value_type = codec.value_type
+        if value_type == _STRING:
+            self.string(value)
+        elif value_type == _DOUBLE:
+            self.out += _double.pack(value)
+        elif value_type == _INTEGER:
+            self.varint(value << 1 if value >= 0 else (-value << 1) - 1)
+        elif value_type == _BOOLEAN:
+            self.out.append(1 if value else 0)
+        elif value_type == _ENUM:
+            self.varint(codec.literals.index(value))
+        else:
+            self.string(codec.feature._eType.to_string(value))
+
+    def eobject(self, obj):
+        self.objects[obj] = len(self.objects)
+        self.eclass(obj.eClass)
+        isset = obj._isset
+        get = obj.__getattribute__
+        for codec in _codecs(obj.eClass)[0]:
+            feature = codec.feature
+            if feature not in isset:
+                continue
+            value = get(feature.name)
+            kind = codec.kind
+            if kind == _ATTRIBUTE:
+                if value is not None:
+                    self.feature(feature)
+                    self.value(codec, value)
+            elif kind == _CONTAINMENT:
+                if value is not None:
+                    self.feature(feature)
+                    self.eobject(value)
+            elif kind == _ATTRIBUTE_MANY:
+                if value:
+                    self.feature(feature)
+                    self.varint(len(value))
+                    for v in value:
+                        self.value(codec, v)
+            elif kind == _CONTAINMENT_MANY:
+                if value:
+                    self.feature(feature)
+                    if all(_is_plain_point(v) for v in value):
+                        # the number of points and 1: a packed array of latitudes and longitudes
+                        self.varint(len(value) << 1 | 1)
+                        coordinates = []
+                        for point in value:
+                            self.objects[point] = len(self.objects)
+                            coordinates.append(point.lat)
+                            coordinates.append(point.lon)
+                        self.out += _pack_doubles(coordinates)
+                    else:
+                        self.varint(len(value) << 1)
+                        for v in value:
+                            self.eobject(v)
+            elif kind == _REFERENCE:
+                if value is not None:
+                    self.references.append((self.objects[obj], codec, (value, )))
+            elif value:
+                self.references.append((self.objects[obj], codec, list(value)))
+        self.varint(0)
+
+    def reference(self, value) -> tuple:
+        """Returns the number of an object in this resource + 1, or 0 and the URI of an object in another resource"""
+        if not getattr(value, 'resolved', True):
+            return 0, value._proxy_path
+        number = self.objects.get(value)
+        if number is not None:
+            return number + 1, None
+        path, is_crossref = self.resource._build_path_from(value)
+        # objects that are not in a resource are left out
+        return (0, path) if is_crossref else None
+
+    def encode(self) -> bytes:
+        self.out += MAGIC
+        self.out.append(FORMAT_VERSION)
+        self.varint(len(self.resource.contents))
+        for root in self.resource.contents:
+            self.eobject(root)
+        references = []
+        for number, codec, values in self.references:
+            values = [r for r in (self.reference(value) for value in values) if r is not None]
+            if values:
+                references.append((number, codec, values))
+        self.varint(len(references))
+        for number, codec, values in references:
+            self.varint(number)
+            self.feature(codec.feature)
+            self.varint(len(values))
+            for number_or_0, path in values:
+                self.varint(number_or_0)
+                if path is not None:
+                    self.string(path)
+        return bytes(self.out)
+
+
+class _Decoder:
+    def __init__(self, resource, data):
+        self.resource = resource
+        self.data = memoryview(data)
+        self.pos = 0
+        self.eclasses = []
+        self.features = []
+        self.strings = []
+        self.objects = []
+
+    def varint(self) -> int:
+        data = self.data
+        pos = self.pos
+        b = data[pos]
+        pos += 1
+        if b < 0x80:
+            self.pos = pos
+            return b
+        result = b & 0x7f
+        shift = 7
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return result
+
+    def string(self) -> str:
+        number = self.varint()
+        if number:
+            return self.strings[number - 1]
+        length = self.varint()
+        value = str(self.data[self.pos:self.pos + length], 'UTF-8')
+        self.pos += length
+        self.strings.append(value)
+        return value
+
+    def eclass(self):
+        number = self.varint()
+        if number:
+            return self.eclasses[number - 1]
+        ns_uri = self.string()
+        name = self.string()
+        epackage = self.resource.get_metamodel(ns_uri)
+        # a python class for static meta-models, an EClass for dynamic ones
+        classifier = epackage.getEClassifier(name)
+        if classifier is None:
+            raise ValueError('Unknown class {} in {}'.format(name, ns_uri))
+        self.eclasses.append(classifier)
+        return classifier
+
+    def codec(self, owner_eclass):
+        number = self.varint()
+        if number == 0:
+            return None
+        if number > 1:
+            feature = self.features[number - 2]
+        else:
+            name = self.string()
+            feature = owner_eclass.findEStructuralFeature(name)
+            if feature is None:
+                raise ValueError('Unknown feature {} of {}'.format(name, owner_eclass.name))
+            self.features.append(feature)
+        codec = _codecs(owner_eclass)[1].get(feature)
+        if codec is None:
+            raise ValueError('Feature {} of {} is not serialized'.format(feature.name, owner_eclass.name))
+        return codec
+
+    def value(self, codec):
+        value_type = codec.value_type
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _DOUBLE:
+            value, = _double.unpack_from(self.data, self.pos)
+            self.pos += 8
+            return value
+        if value_type == _INTEGER:
+            n = self.varint()
+            return n >> 1 if not n & 1 else -((n + 1) >> 1)
+        if value_type == _BOOLEAN:
+            value = self.data[self.pos] != 0
+            self.pos += 1
+            return value
+        if value_type == _ENUM:
+            return codec.literals[self.varint()]
+        return codec.feature._eType.from_string(self.string())
+
+    def eobject(self):
+        obj = self.eclass()()
+        eclass = obj.eClass
+        self.objects.append(obj)
+        uuid_dict = self.resource.uuid_dict
+        while True:
+            codec = self.codec(eclass)
+            if codec is None:
+                return obj
+            feature = codec.feature
+            kind = codec.kind
+            if kind == _ATTRIBUTE:
+                value = self.value(codec)
+                init_attribute_value(obj, feature, value)
+                if codec.is_id:
+                    uuid_dict[value] = obj
+            elif kind == _CONTAINMENT:
+                obj.__setattr__(feature.name, self.eobject())
+            elif kind == _ATTRIBUTE_MANY:
+                count = self.varint()
+                obj.__getattribute__(feature.name).extend([self.value(codec) for _ in range(count)])
+            else:
+                header = self.varint()
+                count = header >> 1
+                if header & 1:
+                    children = self.points(count)
+                else:
+                    children = [self.eobject() for _ in range(count)]
+                obj.__getattribute__(feature.name).extend(children)
+
+    def points(self, count) -> list:
+        coordinates = array('d')
+        coordinates.frombytes(self.data[self.pos:self.pos + count * 16])
+        if _BIG_ENDIAN:
+            coordinates.byteswap()
+        self.pos += count * 16
+        lat, lon = _POINT.findEStructuralFeature('lat'), _POINT.findEStructuralFeature('lon')
+        points = []
+        for i in range(0, count * 2, 2):
+            point = esdl.Point()
+            init_attribute_value(point, lat, coordinates[i])
+            init_attribute_value(point, lon, coordinates[i + 1])
+            points.append(point)
+        self.objects.extend(points)
+        return points
+
+    def reference(self):
+        number = self.varint()
+        if number:
+            return self.objects[number - 1], False
+        return EProxy(self.string(), self.resource), True
+
+    def references(self):
+        for _ in range(self.varint()):
+            owner = self.objects[self.varint()]
+            codec = self.codec(owner.eClass)
+            feature = codec.feature
+            values = [self.reference() for _ in range(self.varint())]
+            if feature.many:
+                collection = owner.__getattribute__(feature.name)
+                if feature.eOpposite is None:
+                    collection.extend([value for value, _ in values])
+                else:
+                    for value, is_proxy in values:
+                        collection.append(value, codec.update_opposite and not is_proxy)
+            elif values:
+                value, is_proxy = values[0]
+                owner.eGet(feature)     # creates the EValue of the feature
+                owner.__dict__[feature.name]._set(value, codec.update_opposite and not is_proxy)
+
+    def decode(self):
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a binary ESDL encoding')
+        format_version = self.data[len(MAGIC)]
+        if format_version != FORMAT_VERSION:
+            raise ValueError('Unsupported binary ESDL format version {}'.format(format_version))
+        self.pos = len(MAGIC) + 1
+        roots = [self.eobject() for _ in range(self.varint())]
+        self.references()
+        for root in roots:
+            self.resource.append(root)
+
+
+def encode(resource) -> bytes:
+    """Returns the binary encoding of the contents of a resource"""
+    return _Encoder(resource).encode()
+
+
+def decode(resource, data: bytes):
+    """Adds the objects of a binary encoding (see encode()) to the contents of an empty resource"""
+    with gc_paused(len(data) >= GC_PAUSE_MIN_BYTES):
+        _Decoder(resource, data).decode()
@@ -12,13 +12,257 @@
 #  Manager:
 #      TNO
 
-from pyecore.resources.xmi import XMIResource, XMIOptions, XMI_URL, XSI_URL, XSI
-from lxml.etree import QName, Element, ElementTree
+from pyecore.resources.xmi import XMIResource, XMIOptions, XMI_URL, XSI_URL, XSI, XMI
+from pyecore.ecore import EClass, EProxy, EEnum, EDataType, EString, EBoolean, EBooleanObject, EInt, EInteger, \
+    EIntegerObject, ELong, ELongObject, EDouble, EDoubleObject, EFloat, EFloatObject
+from lxml.etree import QName, iterparse
+from collections import Counter
+from enum import unique, Enum
+from functools import lru_cache
+from esdl.support_functions import gc_paused, init_attribute_value, GC_PAUSE_MIN_BYTES
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_PROGRESS_INTERVAL = 5000    # number of decoded objects between two progress callbacks
+
+# The skeleton of an energy system: the root, its instance and the attributes and geometry of the top area
+SKELETON_PATH = ('instance', 'area')
+SKELETON_FEATURES = ('geometry', )
+
+
+@unique
+class LoadOptions(Enum):
+    """Options of XMLResource.load(), in addition to pyecore's XMIOptions"""
+    ON_SKELETON = 0         # function(root), called when the skeleton of the root has been decoded
+    ON_PROGRESS = 1         # function(LoadProgress), called every PROGRESS_INTERVAL objects and when done
+    PROGRESS_INTERVAL = 2
+
+
+@unique
+class SaveOptions(Enum):
+    """Options of XMLResource.save() and serialize(), in addition to pyecore's XMIOptions"""
+    COMPACT = 0     # no indentation and no default values, for machine to machine transfers
+
+
+class LoadProgress:
+    """Progress of loading a resource, passed to the ON_PROGRESS function"""
+    def __init__(self, total_bytes=None):
+        self.objects = 0
+        self.counts = Counter()     # number of decoded objects per containment feature, e.g. 'asset' or 'kpi'
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.done = False
+
+    def fraction(self):
+        if self.done:
+            return 1.0
+        if not self.total_bytes:
+            return None
+        return min(self.bytes_read / self.total_bytes, 1.0)
+
+    def to_dict(self):
+        return {
+            'objects': self.objects,
+            'assets': self.counts['asset'],
+            'profiles': self.counts['profile'],
+            'kpis': self.counts['kpi'],
+            'bytes_read': self.bytes_read,
+            'total_bytes': self.total_bytes,
+            'fraction': self.fraction(),
+            'done': self.done
+        }
+
+
+class _CountingStream:
+    """Wraps the input stream to know how much of it has been parsed"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def size(self):
+        try:
+            if self.stream.seekable():
+                position = self.stream.tell()
+                size = self.stream.seek(0, 2)
+                self.stream.seek(position)
+                return size - position
+        except (AttributeError, OSError):
+            pass
+        return None
+
+
+# markers on the stack of XMLResource._iterdecode for elements that are not decoded as an EObject when they start
+_ROOTS = object()       # the XMI element that contains multiple roots
+_VALUE = object()       # element with the value of an attribute, decoded when its text is known
+_NONE = object()        # element that does not result in an EObject (e.g. xsi:nil)
+
+
+class _ChunkBuffer:
+    """Collects the written bytes of a serialization until they are taken"""
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+# escaping of attribute values and text, as libxml2 does when lxml serializes a tree
+_ATTRIBUTE_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;',
+                                    '\t': '&#9;'})
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+
+
+# cache of the EPackages of all classes that can be contained (directly or indirectly) by an EClass
+_contained_epackages_cache = dict()
+
+
+def _contained_epackages(root_eclass: EClass) -> list:
+    if root_eclass not in _contained_epackages_cache:
+        epackages = []
+        visited = set()
+        todo = [root_eclass]
+        while todo:
+            eclass = todo.pop()
+            if eclass in visited:
+                continue
+            visited.add(eclass)
+            if eclass.ePackage not in epackages:
+                epackages.append(eclass.ePackage)
+            # subclasses can be used as value of a containment reference as well
+            todo.extend(c for c in eclass.ePackage.eClassifiers
+                        if isinstance(c, EClass) and eclass in c.eAllSuperTypes())
+            for reference in eclass.eAllReferences():
+                if reference.containment:
+                    etype = reference.eType
+                    # generated classes are used as eType in static metamodels
+                    todo.append(etype.eClass if isinstance(etype, type) else etype)
+        _contained_epackages_cache[root_eclass] = epackages
+    return _contained_epackages_cache[root_eclass]
+
+
+# converters of the XML attribute values of the data types that are used most, that do not need the EDataType
+_FAST_CONVERTERS = {
+    EString: str,
+    EBoolean: lambda x: x in ('True', 'true'),
+    EBooleanObject: lambda x: x in ('True', 'true'),
+    EInt: int,
+    EInteger: int,
+    EIntegerObject: int,
+    ELong: int,
+    ELongObject: int,
+    EDouble: float,
+    EDoubleObject: float,
+    EFloat: float,
+    EFloatObject: float,
+}
+
+
+_XSI_NIL = f'{{{XSI_URL}}}nil'
+
+
+class _AttributeDecoder:
+    """How the value of an XML attribute is decoded into a feature of an EClass"""
+    __slots__ = ('feature', 'name', 'is_attribute', 'is_id', 'convert')
+
+    def __init__(self, feature):
+        self.feature = feature
+        self.name = feature.name
+        self.is_attribute = feature.is_attribute
+        self.is_id = self.is_attribute and feature.iD
+        self.convert = None     # only for single valued attributes that can be set directly
+        etype = feature._eType
+        if self.is_attribute and not feature.many and not feature.derived:
+            if etype in _FAST_CONVERTERS:
+                self.convert = _FAST_CONVERTERS[etype]
+            elif isinstance(etype, EEnum):
+                literals = {literal.name: literal for literal in etype.eLiterals}
+                self.convert = literals.get
+            elif isinstance(etype, EDataType):
+                self.convert = etype.from_string
+
+    def set_value(self, eobject, value):
+        """Sets the value of the feature of a new eobject, see init_attribute_value()"""
+        init_attribute_value(eobject, self.feature, self.convert(value))
+
+
+# cache of the decoders of the features of an EClass, by feature name
+_attribute_decoders_cache = dict()
+
+
+def _attribute_decoders(eclass: EClass) -> dict:
+    decoders = _attribute_decoders_cache.get(eclass)
+    if decoders is None:
+        decoders = dict()
+        for feature in eclass.eAllStructuralFeatures():
+            # same as findEStructuralFeature(): the first feature with a name
+            if feature.name not in decoders:
+                decoders[feature.name] = _AttributeDecoder(feature)
+        _attribute_decoders_cache[eclass] = decoders
+    return decoders
+
+
+# kinds of features in a writer plan
+_ATTRIBUTE = 0
+_ATTRIBUTE_MANY = 1
+_CONTAINMENT = 2
+_CONTAINMENT_MANY = 3
+_REFERENCE = 4
+_REFERENCE_MANY = 5
+_MAP = 6
+
+# cache of the writer plans of EClasses
+_writer_plans_cache = dict()
+
+
+def _writer_plan(eclass: EClass) -> list:
+    """
+    The features of an EClass that are serialized, in the order of the EClass, as (feature, name, kind,
+    to_string, default value) tuples. Derived and transient features and container references are left out.
+    """
+    plan = _writer_plans_cache.get(eclass)
+    if plan is None:
+        plan = []
+        for feature in eclass.eAllStructuralFeatures():
+            if feature.derived or feature.transient:
+                continue
+            etype = feature._eType
+            to_string = default = None
+            if hasattr(etype, 'eType') and etype.eType is dict:
+                kind = _MAP
+            elif feature.is_attribute:
+                kind = _ATTRIBUTE_MANY if feature.many else _ATTRIBUTE
+                to_string = etype.to_string
+                default = feature.get_default_value()
+            elif feature.containment:
+                kind = _CONTAINMENT_MANY if feature.many else _CONTAINMENT
+            elif feature.eOpposite and feature.eOpposite.containment:
+                continue
+            else:
+                kind = _REFERENCE_MANY if feature.many else _REFERENCE
+            plan.append((feature, feature.name, kind, to_string, default))
+        _writer_plans_cache[eclass] = plan
+    return plan
+
+
 """
 Extension of pyecore's XMIResource to support the XMLResource in EMF.
 It basically removes the xmi:version stuff from the serialization.
@@ -31,47 +275,494 @@ class XMLResource(XMIResource):
         self.prefixes = {}
         self.reverse_nsmap = {}
         self.parse_information = []
+        self._xsi_types = dict()    # value of xsi:type -> EClass, for the prefixes of the loaded document
 
     def get_parse_information(self):
         return self.parse_information
 
-    def save(self, output=None, options=None):
+    def load(self, options=None):
+        """
+        Loads the resource incrementally with lxml's iterparse, instead of parsing the whole document into an lxml
+        tree first. Every element is decoded into an EObject when it starts and removed from the lxml tree when it
+        ends, so the XML tree and the objects are not in memory at the same time. References are resolved when the
+        whole document has been decoded.
+        With the LoadOptions.ON_SKELETON option, the root is passed to a function as soon as the skeleton (the
+        energy system, its instance and the attributes and geometry of the top area) has been decoded, such that
+        e.g. the outline of the area can be shown while the rest is loaded. References of the skeleton are not
+        resolved at that time. LoadOptions.ON_PROGRESS gets a LoadProgress every PROGRESS_INTERVAL objects.
+        """
         self.options = options or {}
+        self.cache_enabled = True
+        instream = _CountingStream(self.uri.create_instream())
+        progress = LoadProgress(instream.size())
+        on_progress = self.options.get(LoadOptions.ON_PROGRESS)
+        try:
+            # streams of unknown size are treated as large
+            with gc_paused(progress.total_bytes is None or progress.total_bytes >= GC_PAUSE_MIN_BYTES):
+                self._iterdecode(instream, progress)
+                if self.contents:
+                    self._decode_ereferences()
+        finally:
+            self._clean_registers()
+            self.uri.close_stream()
+        progress.bytes_read = instream.bytes_read
+        progress.done = True
+        if on_progress:
+            on_progress(progress)
+
+    def _init_root_namespaces(self, xmlroot):
+        self.prefixes.update(xmlroot.nsmap)
+        self.reverse_nsmap = {v: k for k, v in self.prefixes.items()}
+        self.xsitype = f'{{{self.prefixes.get(XSI)}}}type'
+        self._xsi_types.clear()
+        self.xmiid = f'{{{self.prefixes.get(XMI)}}}id'
+        self.schema_tag = f'{{{self.prefixes.get(XSI)}}}schemaLocation'
+
+        self.schema_locations = {}
+        schema_locations = xmlroot.attrib.get(self.schema_tag, '').split()
+        for prefix, path in zip(schema_locations[::2], schema_locations[1::2]):
+            if '#' not in path:
+                path = path + '#'
+            self.schema_locations[prefix] = EProxy(path, self)
+
+    def _iterdecode(self, instream, progress):
+        """Decodes the elements in document order, same as XMIResource._decode_eobject() does recursively"""
+        on_skeleton = self.options.get(LoadOptions.ON_SKELETON)
+        on_progress = self.options.get(LoadOptions.ON_PROGRESS)
+        progress_interval = self.options.get(LoadOptions.PROGRESS_INTERVAL, DEFAULT_PROGRESS_INTERVAL)
+        next_progress = progress_interval
+        stack = []      # the EObjects (or markers) of the elements that have started but not ended
+        path = []       # the local names of the tags of those elements
+        # the containment features the EObjects of those elements are added to when they end. Objects are added to
+        # their container when they are complete, because every change of an object in the resource notifies
+        # (the resource of) the object, which takes longer the deeper it is contained. Only the skeleton is added
+        # when it starts, such that it can be passed to ON_SKELETON before its contents are complete.
+        containers = []
+
+        for event, node in iterparse(instream, events=('start', 'end')):
+            if event == 'start':
+                _, tag = self.extract_namespace(node.tag)
+                feature = None
+                if not stack:
+                    self._init_root_namespaces(node)
+                    if node.tag == f'{{{self.prefixes.get(XMI)}}}XMI':
+                        item = _ROOTS
+                    else:
+                        item = self._init_modelroot(node)
+                elif stack[-1] is _ROOTS:
+                    item = self._init_modelroot(node)
+                else:
+                    # the first element in the top area that is not part of the skeleton
+                    if on_skeleton and tuple(path[1:]) == SKELETON_PATH and tag not in SKELETON_FEATURES:
+                        on_skeleton(self.contents[0])
+                        on_skeleton = None
+                    feature, item = self._decode_start(stack[-1], node, tag)
+                    if feature is not None:
+                        progress.objects += 1
+                        progress.counts[tag] += 1
+                        if len(path) <= len(SKELETON_PATH):
+                            self._add_to_container(stack[-1], feature, item)
+                            feature = None
+                stack.append(item)
+                path.append(tag)
+                containers.append(feature)
+            else:
+                item = stack.pop()
+                tag = path.pop()
+                feature = containers.pop()
+                if feature is not None:
+                    self._add_to_container(stack[-1], feature, item)
+                elif item is _VALUE:
+                    _, eobject, eatts, _, from_tag = self._decode_node(stack[-1], node)
+                    for eattribute, value in eatts:
+                        self._decode_eattribute_value(eobject, eattribute, value, from_tag)
+                elif on_skeleton and tuple(path[1:]) + (tag, ) == SKELETON_PATH:
+                    # the top area ended without other elements than the skeleton
+                    on_skeleton(self.contents[0])
+                    on_skeleton = None
+                # the element is decoded, remove it (and the elements before it) from the lxml tree
+                node.clear()
+                parent = node.getparent()
+                if parent is not None:
+                    while node.getprevious() is not None:
+                        del parent[0]
+
+                if on_progress and progress.objects >= next_progress:
+                    next_progress = progress.objects + progress_interval
+                    progress.bytes_read = instream.bytes_read
+                    on_progress(progress)
+
+        if on_skeleton and self.contents:
+            on_skeleton(self.contents[0])
+
+    def _decode_start(self, parent_eobj, node, tag):
+        """
+        Decodes an element that starts in parent_eobj
+        :return: the containment feature of parent_eobj the decoded EObject is to be added to and the EObject, or
+                 None and a marker if the element does not result in an EObject
+        """
+        if parent_eobj is _NONE:
+            raise ValueError(f'Unexpected element {tag} in an element without value, line {node.sourceline}')
+        container_decoder = _attribute_decoders(parent_eobj.eClass).get(tag)
+        if container_decoder is not None and container_decoder.is_attribute and not self._is_none_node(node):
+            return None, _VALUE     # the text of the element is not known yet
+        feat_container, eobject, eatts, erefs, from_tag = self._decode_node(parent_eobj, node)
+        for eattribute, value in eatts:
+            self._decode_eattribute_value(eobject, eattribute, value, from_tag)
+        if erefs:
+            self._later.append((eobject, erefs))
+        if not feat_container:
+            return None, _NONE
+        return feat_container, eobject
+
+    @staticmethod
+    def _add_to_container(parent_eobj, feat_container, eobject):
+        if feat_container.many:
+            parent_eobj.__getattribute__(feat_container.name).append(eobject)
+        else:
+            parent_eobj.__setattr__(feat_container.name, eobject)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def extract_namespace(tag):
+        qname = QName(tag)
+        return qname.namespace, qname.localname
+
+    def _decode_node(self, parent_eobj, node):
+        """
+        Same as XMIResource._decode_node(), but the attributes of a new EObject are decoded with the compiled
+        decoders of its EClass and set directly, so the returned list of attributes to set is empty. Elements
+        without a new EObject (xsi:nil, href, values of attributes) and metamodel elements are left to XMIResource.
+        """
+        _, node_tag = self.extract_namespace(node.tag)
+        container_decoder = _attribute_decoders(parent_eobj.eClass).get(node_tag)
+        if not container_decoder:
+            raise ValueError(f'Feature "{node_tag}" is unknown '
+                             f'for {parent_eobj.eClass.name}, '
+                             f'line {node.sourceline}')
+        feature_container = container_decoder.feature
+        attrib = dict(node.attrib)
+        if container_decoder.is_attribute or _XSI_NIL in attrib or attrib.get('href'):
+            return super()._decode_node(parent_eobj, node)
+        type_attribute = attrib.pop(self.xsitype, None) or self._type_attribute(node)
+        if type_attribute:
+            etype = self._xsi_types.get(type_attribute)
+            if etype is None:
+                prefix, _type = type_attribute.split(':')
+                epackage = self.prefix2epackage(prefix)
+                etype = epackage.getEClassifier(_type) if epackage else None
+                if not etype:
+                    raise ValueError(f'Type {_type} is unknown in {epackage}, '
+                                     f'{node.tag} line {node.sourceline}')
+                self._xsi_types[type_attribute] = etype
+        else:
+            etype = feature_container._eType
+            if isinstance(etype, EProxy):
+                etype.force_resolve()
+        if isinstance(etype, EDataType) or etype is EClass or etype is EClass.eClass:
+            return super()._decode_node(parent_eobj, node)
+
+        eobject = etype()
+        decoders = _attribute_decoders(eobject.eClass)
+        erefs = []
+        for key, value in attrib.items():
+            decoder = decoders.get(key)
+            if decoder is None:
+                # xmi:id, xmi:type and unknown attributes
+                self._decode_attribute(eobject, key, value, node)
+            elif not decoder.is_attribute:
+                erefs.append((decoder.feature, value))
+            else:
+                if decoder.convert:
+                    decoder.set_value(eobject, value)
+                else:
+                    self._decode_eattribute_value(eobject, decoder.feature, value)
+                if decoder.is_id:
+                    self.uuid_dict[value] = eobject
+        return feature_container, eobject, (), erefs, False
+
+    def save(self, output=None, options=None):
         output = self.open_out_stream(output)
+        for chunk in self.serialize(options):
+            output.write(chunk)
+        output.flush()
+        return self.uri.close_stream()
+
+    def serialize(self, options=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Generator that serializes the contents of this resource to XML and yields it as UTF-8 encoded chunks of
+        bytes of about chunk_size. Elements are written one by one, in the same way as lxml serializes a tree, instead
+        of building a complete lxml tree of the energy system first, so memory use does not grow with the size of
+        the energy system. Can be used directly as the body of a (chunked) HTTP response or request.
+        With the SaveOptions.COMPACT option the XML is not indented and default values are never written. The
+        features of each object are then written in the order of precomputed plans of their EClass.
+        """
+        self.options = options or {}
         self.prefixes.clear()
         self.reverse_nsmap.clear()
 
         serialize_default = \
             self.options.get(XMIOptions.SERIALIZE_DEFAULT_VALUES,
                              False)
+        compact = self.options.get(SaveOptions.COMPACT, False)
+
+        # the namespaces must be known when writing the root element, so register them before writing
+        for root in self.contents:
+            self.register_eobject_epackage(root)
+            for epackage in _contained_epackages(root.eClass):
+                self.register_nsmap(epackage.nsPrefix, epackage.nsURI)
         nsmap = {XSI: XSI_URL} # remove XMI for XML serialization
+        nsmap.update(self.prefixes)
+        self._namespace_prefixes = {uri: prefix for prefix, uri in nsmap.items()}
 
+        buffer = _ChunkBuffer()
+        buffer.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
         if len(self.contents) == 1:
-            root = self.contents[0]
-            self.register_eobject_epackage(root)
-            tmp_xmi_root = self._go_across(root, serialize_default)
+            yield from self._write_eobject(buffer, self.contents[0], 0, serialize_default, chunk_size, nsmap, compact)
         else:
             # this case hasn't been verified for XML serialization
-            tag = QName(XMI_URL, 'XMI')
-            tmp_xmi_root = Element(tag)
+            name, start_tag = self._start_tag(QName(XMI_URL, 'XMI'), {}, nsmap)
+            buffer.write((start_tag + '>').encode('UTF-8'))
             for root in self.contents:
-                root_node = self._go_across(root, serialize_default)
-                tmp_xmi_root.append(root_node)
+                if not compact:
+                    buffer.write(b'\n  ')
+                yield from self._write_eobject(buffer, root, 1, serialize_default, chunk_size, compact=compact)
+            if not compact:
+                buffer.write(b'\n')
+            buffer.write('</{}>'.format(name).encode('UTF-8'))
+        buffer.write(b'\n')
+        if len(self.prefixes) + 1 > len(nsmap):
+            logger.warning('Namespaces {} are used in {}, but not declared'.format(
+                [prefix for prefix in self.prefixes if prefix not in nsmap], self.uri))
+        yield buffer.take()
 
-        # update nsmap with prefixes register during the nodes creation
-        nsmap.update(self.prefixes)
-        xmi_root = Element(tmp_xmi_root.tag, nsmap=nsmap)
-        xmi_root[:] = tmp_xmi_root[:]
-        xmi_root.attrib.update(tmp_xmi_root.attrib)
-        #xmi_version = etree.QName(XMI_URL, 'version') # remove XMI version in XML serialization
-        #xmi_root.attrib[xmi_version] = '2.0'
-        tree = ElementTree(xmi_root)
-        tree.write(output,
-                   pretty_print=True,
-                   xml_declaration=True,
-                   encoding=tree.docinfo.encoding)
-        output.flush()
-        return self.uri.close_stream()
+    def _write_eobject(self, buffer, obj, depth, serialize_default, chunk_size, nsmap=None, compact=False):
+        if compact:
+            tag, attrib, contents = self._eobject_node_compact(obj)
+        else:
+            tag, attrib, contents = self._eobject_node(obj, serialize_default)
+        name, start_tag = self._start_tag(tag, attrib, nsmap)
+        if not contents:
+            buffer.write((start_tag + '/>').encode('UTF-8'))
+        else:
+            buffer.write((start_tag + '>').encode('UTF-8'))
+            indent = '' if compact else '\n' + '  ' * (depth + 1)
+            for item in contents:
+                if isinstance(item, tuple):
+                    sub_tag, sub_attrib, sub_text = item
+                    sub_name, sub_start_tag = self._start_tag(sub_tag, sub_attrib)
+                    if sub_text:
+                        element = '{}{}>{}</{}>'.format(indent, sub_start_tag, sub_text.translate(_TEXT_ESCAPES),
+                                                       sub_name)
+                    else:
+                        element = indent + sub_start_tag + '/>'
+                    buffer.write(element.encode('UTF-8'))
+                else:
+                    if indent:
+                        buffer.write(indent.encode('UTF-8'))
+                    yield from self._write_eobject(buffer, item, depth + 1, serialize_default, chunk_size,
+                                                   compact=compact)
+            end_tag = '</{}>'.format(name) if compact else '\n{}</{}>'.format('  ' * depth, name)
+            buffer.write(end_tag.encode('UTF-8'))
+        if buffer.size >= chunk_size:
+            yield buffer.take()
+
+    def _start_tag(self, tag, attrib, nsmap=None):
+        """
+        Returns the name of an element and its start tag without the closing '>', as lxml writes them when it
+        serializes a tree: the namespace declarations (of the root) and the attributes in the order of attrib. Elements
+        without contents are closed with '/>'. Namespaces that were not declared at the root are declared here.
+        """
+        declarations = dict(nsmap) if nsmap else dict()
+        name = self._prefixed_name(tag, declarations)
+        attributes = ''.join(' {}="{}"'.format(self._prefixed_name(key, declarations),
+                                               value.translate(_ATTRIBUTE_ESCAPES))
+                             for key, value in attrib.items())
+        namespaces = ''.join(' xmlns:{}="{}"'.format(prefix, uri.translate(_ATTRIBUTE_ESCAPES))
+                             for prefix, uri in declarations.items())
+        return name, '<{}{}{}'.format(name, namespaces, attributes)
+
+    def _prefixed_name(self, name, declarations):
+        if isinstance(name, QName):
+            namespace, localname = name.namespace, name.localname
+        elif name.startswith('{'):
+            namespace, _, localname = name[1:].partition('}')
+        else:
+            return name
+        prefix = self._namespace_prefixes.get(namespace)
+        if prefix is None:
+            prefix = next((p for p, uri in declarations.items() if uri == namespace), None)
+        if prefix is None:
+            prefix = self.reverse_nsmap.get(namespace, 'ns{}'.format(len(declarations)))
+            declarations[prefix] = namespace
+        return '{}:{}'.format(prefix, localname)
+
+    def _eobject_node(self, obj, serialize_default=False):
+        """
+        Same as XMIResource._go_across(), but instead of creating an lxml Element including all its children, it
+        returns the tag and the attributes of the element of this object and a list of its contents in the order
+        they need to be written: contained EObjects and (tag, attrib, text) tuples for the other sub elements.
+        """
+        attrib = dict()
+        contents = list()
+        tag = self._eobject_tag(obj, attrib)
+
+        isset, get_value = self._object_state(obj)
+        for feat in isset:
+            if feat.derived or feat.transient:
+                continue
+            feat_name = feat.name
+            value = get_value(feat_name)
+            if value is None:
+                if serialize_default:
+                    contents.append(self._none_node(feat_name))
+                continue
+            if hasattr(feat._eType, 'eType') and feat._eType.eType is dict:
+                for key, val in value.items():
+                    contents.append((feat_name, {'key': key, 'value': val}, None))
+            elif feat.is_attribute:
+                etype = feat._eType
+                if feat.many and value:
+                    self._add_many_attribute(attrib, contents, feat_name, etype.to_string, value)
+                    continue
+                default_value = feat.get_default_value()
+                if value != default_value or serialize_default:
+                    attrib[feat_name] = etype.to_string(value)
+                continue
+
+            elif feat.is_reference and \
+                    feat.eOpposite and feat.eOpposite.containment:
+                continue
+            elif feat.is_reference and not feat.containment:
+                if feat.many:
+                    self._add_many_reference(attrib, contents, feat_name, value)
+                else:
+                    self._add_reference(attrib, contents, feat_name, value)
+
+            if feat.is_reference and feat.containment:
+                if feat.many:
+                    contents.extend(value)
+                else:
+                    contents.append(value)
+        return tag, attrib, contents
+
+    def _eobject_node_compact(self, obj):
+        """
+        Same as _eobject_node(), for compact serialization: the features are written in the order of the writer
+        plan of the EClass of the object, and default values are never written
+        """
+        attrib = dict()
+        contents = list()
+        tag = self._eobject_tag(obj, attrib)
+
+        isset, get_value = self._object_state(obj)
+        for feat, feat_name, kind, to_string, default_value in _writer_plan(obj.eClass):
+            if feat not in isset:
+                continue
+            value = get_value(feat_name)
+            if value is None:
+                continue
+            if kind == _ATTRIBUTE:
+                if value != default_value:
+                    attrib[feat_name] = to_string(value)
+            elif kind == _CONTAINMENT_MANY:
+                contents.extend(value)
+            elif kind == _CONTAINMENT:
+                contents.append(value)
+            elif kind == _REFERENCE_MANY:
+                if value:
+                    self._add_many_reference(attrib, contents, feat_name, value)
+            elif kind == _REFERENCE:
+                self._add_reference(attrib, contents, feat_name, value)
+            elif kind == _ATTRIBUTE_MANY:
+                if value:
+                    self._add_many_attribute(attrib, contents, feat_name, to_string, value)
+            else:
+                for key, val in value.items():
+                    contents.append((feat_name, {'key': key, 'value': val}, None))
+        return tag, attrib, contents
+
+    @staticmethod
+    def _object_state(obj):
+        """Returns the features of obj that are set and a function that returns the value of a feature by name"""
+        return obj._isset, obj.__getattribute__
+
+    @staticmethod
+    def _containment_feature(obj):
+        return obj.eContainmentFeature()
+
+    def _eobject_tag(self, obj, attrib):
+        """Returns the tag of the element of obj and adds the type and id attributes of the element to attrib"""
+        eclass = obj.eClass
+        containment_feature = self._containment_feature(obj)
+        if not containment_feature:  # obj is the root
+            epackage = eclass.ePackage
+            nsURI = epackage.nsURI
+            tag = QName(nsURI, eclass.name) if nsURI else eclass.name
+        else:
+            tag = containment_feature.name
+            if containment_feature._eType != eclass:
+                self._add_explicit_type_attrib(attrib, obj)
+
+        if self.use_uuid:
+            self._assign_uuid(obj)
+            xmi_id = f'{{{XMI_URL}}}id'
+            attrib[xmi_id] = obj._internal_id
+        return tag
+
+    def _add_many_attribute(self, attrib, contents, feat_name, to_str, value):
+        has_special_char = False
+        result_list = []
+        for v in value:
+            string = None if v is None else to_str(v)
+            if not string or any(x.isspace() for x in string):
+                has_special_char = True
+            result_list.append(string)
+        if has_special_char:
+            for v in result_list:
+                if v is None:
+                    contents.append(self._none_node(feat_name))
+                else:
+                    contents.append((feat_name, {}, v))
+        else:
+            attrib[feat_name] = ' '.join(result_list)
+
+    def _add_many_reference(self, attrib, contents, feat_name, value):
+        results = [self._build_path_from(x) for x in value]
+        embedded = []
+        crossref = []
+        for i, result in enumerate(results):
+            frag, cref = result
+            if cref:
+                crossref.append((i, frag))
+            else:
+                embedded.append(frag)
+        if embedded:
+            attrib[feat_name] = ' '.join(embedded)
+        for i, ref in crossref:
+            sub_attrib = {'href': ref}
+            self._add_explicit_type_attrib(sub_attrib, value[i])
+            contents.append((feat_name, sub_attrib, None))
+
+    def _add_reference(self, attrib, contents, feat_name, value):
+        frag, is_crossref = self._build_path_from(value)
+        if is_crossref:
+            sub_attrib = {'href': frag}
+            self._add_explicit_type_attrib(sub_attrib, value)
+            contents.append((feat_name, sub_attrib, None))
+        else:
+            attrib[feat_name] = frag
+
+    def _add_explicit_type_attrib(self, attrib, obj):
+        uri = obj.eClass.ePackage.nsURI
+        if uri not in self.reverse_nsmap:
+            epackage = self.get_metamodel(uri)
+            self.register_nsmap(epackage.nsPrefix, uri)
+        prefix = self.reverse_nsmap[uri]
+        attrib[QName(self.xsi_type_url(), 'type')] = f'{prefix}:{obj.eClass.name}'
+
+    def _none_node(self, feature_name):
+        return feature_name, {QName(self.xsi_type_url(), 'nil'): 'true'}, None
 
     """
     This function has been overriden XMIResource, to make it a little more robust for ESDL's that
@@ -25,9 +25,14 @@
 """
 Support functions for managing EObjects
 """
-from pyecore.ecore import EAttribute, EObject, EClass, EReference, EStructuralFeature
-from pyecore.valuecontainer import ECollection
+from pyecore.ecore import EAttribute, EObject, EClass
+from pyecore.valuecontainer import ECollection, EValue, EList, EAbstractSet
+from pyecore.notification import Notification, Kind
+from contextlib import contextmanager
+import functools
+import gc
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -56,80 +61,315 @@ def clone(self):
     return newone
 
 
-def deepcopy(self, memo=None):
+# minimum size of the data (in bytes) or number of objects for which gc_paused() is used when loading
+GC_PAUSE_MIN_BYTES = 2**20
+GC_PAUSE_MIN_OBJECTS = 20000
+
+_gc_pause_lock = threading.Lock()
+_gc_pauses = 0              # number of gc_paused() blocks that are running (in any thread)
+_gc_was_enabled = False     # whether the collector was enabled before the first of them
+
+
+@contextmanager
+def gc_paused(pause=True):
+    """
+    Disables the cyclic garbage collector in the enclosed code, for code that creates many objects and no garbage
+    (e.g. loading or copying a large energy system). The collector would repeatedly inspect all those objects for
+    nothing, which takes longer the larger the energy system.
+    The collector can only be disabled for the whole process, so the cyclic garbage of all other threads (e.g. the
+    requests of other users) is not collected either until the last running gc_paused() block ends. Therefore only
+    pause it for large loads, see GC_PAUSE_MIN_BYTES and GC_PAUSE_MIN_OBJECTS.
+    :param pause: False to run the enclosed code with the collector as it is, e.g. for small energy systems
+    """
+    global _gc_pauses, _gc_was_enabled
+    if not pause:
+        yield
+        return
+    with _gc_pause_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_pause_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+_new_evalue = EValue.__new__
+
+
+def init_attribute_value(eobject: EObject, feature: EAttribute, value):
+    """
+    Sets the value of a single valued attribute of a new eobject, that is not contained anywhere and has no listeners
+    yet. Does the same as eobject.__setattr__(), without the type check (the value must have the right type) and
+    without the notification (there is nobody to notify).
+    """
+    evalue = _new_evalue(EValue)      # EValue(eobject, feature) without computing the default value
+    evalue.owner = eobject
+    evalue.feature = feature
+    evalue.is_ref = evalue.is_cont = False
+    evalue.generic_type = None
+    evalue._value = value
+    eobject.__dict__[feature.name] = evalue
+    eobject._isset.add(feature)
+
+
+# The notifications of pyecore collections do not tell where an element is added or removed, which is needed to undo
+# or replay a change in an ordered collection. These versions of ECollection.insert(), remove() and pop() do the same
+# as pyecore's, and add the index of the element to the notification as notification.position (as in EMF).
+# Notifications of append() and extend() have no position: the elements are added at the end. Like remove() and
+# append(), insert() and pop() can leave the opposite reference alone, to undo or replay a change of both sides.
+
+def insert_with_position(self, i, y, update_opposite=True):
+    self.check(y)
+    size = len(self)
+    position = min(i, size) if i >= 0 else max(size + i, 0)    # where list.insert() puts it
+    if self.is_ref:
+        self._update_container(y)
+        if update_opposite:
+            self._update_opposite(y, self.owner)
+    if isinstance(self, list):
+        super(ECollection, self).insert(i, y)
+    elif y not in self:
+        # ordered sets have no insert(): add the element at the end and move it to its position
+        super(ECollection, self).add(y)
+        items = self.items
+        items.insert(position, items.pop())
+        for index in range(position, len(items)):
+            self.map[items[index]] = index
+    notification = Notification(new=y, feature=self.feature, kind=Kind.ADD)
+    notification.position = position
+    self.owner.notify(notification)
+    self.owner._isset.add(self.feature)
+
+
+def remove_with_position(self, value, update_opposite=True):
+    try:
+        position = self.index(value)
+    except (AttributeError, ValueError, KeyError):   # unordered collections or values that are not in it
+        position = None
+    if self.is_ref:
+        self._update_container(None, previous_value=value)
+        if update_opposite:
+            self._update_opposite(value, self.owner, remove=True)
+    super(ECollection, self).remove(value)
+    notification = Notification(old=value, feature=self.feature, kind=Kind.REMOVE)
+    notification.position = position
+    self.owner.notify(notification)
+
+
+def pop_with_position(self, index=None, update_opposite=True):
+    position = len(self) - 1 if index is None else index if index >= 0 else len(self) + index
+    if index is None:
+        value = super(ECollection, self).pop()
+    else:
+        value = super(ECollection, self).pop(index)
+    if self.is_ref:
+        self._update_container(None, previous_value=value)
+        if update_opposite:
+            self._update_opposite(value, self.owner, remove=True)
+    notification = Notification(old=value, feature=self.feature, kind=Kind.REMOVE)
+    notification.position = position
+    self.owner.notify(notification)
+    return value
+
+
+def setitem_with_position(self, i, y):
+    """
+    EList.__setitem__() as the removal of the replaced elements and the insertion of the new ones. pyecore only
+    notifies the new elements (and notifies the removal of a slice before it has been removed).
+    """
+    if isinstance(i, slice):
+        indices = range(len(self))[i]
+        values = list(y)
+        if indices.step != 1 and len(values) != len(indices):
+            raise ValueError('attempt to assign sequence of size {} to extended slice of size {}'.format(
+                len(values), len(indices)))
+    else:
+        indices = range(len(self))[i:i + 1 if i != -1 else None]
+        if not indices:
+            raise IndexError('list assignment index out of range')
+        values = [y]
+    for value in values:
+        self.check(value)
+    if indices.step != 1:
+        for index, value in zip(indices, values):
+            self.pop(index)
+            self.insert(index, value)
+        return
+    for _ in indices:
+        self.pop(indices.start)
+    for index, value in enumerate(values, indices.start):
+        self.insert(index, value)
+
+
+# pyecore notifies the observers of an object after it has changed a value. A FrozenView (see frozen_view.py) that reads
+# the value in another thread before the notification has been sent would see the new value as if it had not been
+# changed. model_lock serializes the changes of values, including their notification, with the reads of views.
+model_lock = threading.RLock()
+
+_CHANGING_METHODS = ((EValue, ('_set',)), (ECollection, ('insert', 'remove', 'pop', 'clear')),
+                     (EList, ('append', 'extend', '__setitem__')), (EAbstractSet, ('add', 'append', 'update', 'extend')))
+
+
+def _holding_model_lock(method):
+    if getattr(method, 'holds_model_lock', False):
+        return method
+
+    @functools.wraps(method)
+    def locked(*args, **kwargs):
+        with model_lock:
+            return method(*args, **kwargs)
+    locked.holds_model_lock = True
+    return locked
+
+
+def lock_model_changes():
+    """Makes the methods of pyecore that change values hold model_lock until their notification has been sent"""
+    for cls, names in _CHANGING_METHODS:
+        for name in names:
+            setattr(cls, name, _holding_model_lock(cls.__dict__[name]))
+
+
+class CopyPlan:
+    """
+    The features of an EClass, separated in the way deepcopy() handles them: attributes are copied, contained
+    objects are copied recursively and cross references are set to the copies of the referenced objects when the
+    whole tree is copied. Container references (references with a containment eOpposite) are set by pyecore.
+    Each feature is stored as a (feature, name, many) tuple.
+    """
+    def __init__(self, eclass: EClass):
+        self.attributes = []
+        self.containments = []
+        self.references = []
+        for feature in eclass.eAllStructuralFeatures():
+            entry = (feature, feature.name, feature.many)
+            if isinstance(feature, EAttribute):
+                self.attributes.append(entry)
+            elif feature.containment:
+                self.containments.append(entry)
+            elif not (feature.eOpposite and feature.eOpposite.containment):
+                self.references.append(entry)
+
+
+# cache of the CopyPlan of each EClass
+_copy_plans = dict()
+
+
+def get_copy_plan(eclass: EClass) -> CopyPlan:
+    plan = _copy_plans.get(eclass)
+    if plan is None:
+        plan = CopyPlan(eclass)
+        _copy_plans[eclass] = plan
+    return plan
+
+
+def _copy_attributes(obj, plan: CopyPlan):
+    """Creates a new object of the same type as obj, with the attributes that are set in obj"""
+    newone = type(obj)()
+    isset = obj._isset
+    for feature, name, many in plan.attributes:
+        if feature not in isset:
+            continue
+        value = obj.__getattribute__(name)
+        if many:
+            newone.__getattribute__(name).extend(value)
+        else:
+            init_attribute_value(newone, feature, value)
+    return newone
+
+
+def deepcopy(self, memo=None, keep_external_references=False):
     """
-    Deep copying an EObject.
+    Deep copying an EObject: the object and all objects it contains, in a single traversal of the containment tree
+    that uses the (cached) CopyPlan of each EClass. Cross references between the copied objects are set to the
+    copies when the traversal is done. References to objects outside of the copied tree (e.g. carriers of ports when
+    copying an asset) refer to the original objects. This is logged as a warning, unless keep_external_references is
+    True, as is the case when copying a subtree of an energy system on purpose.
     Does not work yet for copying references from other resources than this one.
+    :param memo: dict of original object -> copy, filled with all copied objects (also used by copy.deepcopy())
     """
-    #logger.debug("deepcopy: processing {}".format(self))
-    first_call = False
     if memo is None:
         memo = dict()
-        first_call = True
     if self in memo:
         return memo[self]
+    with gc_paused():
+        return _deepcopy(self, memo, keep_external_references)
 
-    copy: EObject = self.clone()
-    #logger.debug("Shallow copy: {}".format(copy))
-    eclass: EClass = self.eClass
-    for x in eclass.eAllStructuralFeatures():
-        if isinstance(x, EReference):
-            #logger.debug("deepcopy: processing reference {}".format(x.name))
-            ref: EReference = x
-            value: EStructuralFeature = self.eGet(ref)
+
+def _deepcopy(self, memo, keep_external_references):
+    plan = get_copy_plan(self.eClass)
+    copy = _copy_attributes(self, plan)
+    memo[self] = copy
+    references = []     # (original, copy, reference features) of the copied objects that have cross references
+    # (copy, containment feature name, many, copies of the contained objects) in the order of the traversal. The
+    # copies are added to their container last, in reverse order, such that each object is complete before it is
+    # added: changing a contained object notifies (the resource of) the root of the tree it is contained in.
+    containments = []
+    todo = [(self, copy, plan)]
+    while todo:
+        original, duplicate, plan = todo.pop()
+        isset = original._isset
+        for feature, name, many in plan.containments:
+            if feature not in isset:
+                continue
+            value = original.__getattribute__(name)
             if value is None:
                 continue
-            if ref.containment:
-                if ref.many and isinstance(value, ECollection):
-                    #clone all containment elements
-                    eAbstractSet = copy.eGet(ref.name)
-                    for ref_value in value:
-                        duplicate = ref_value.__deepcopy__(memo)
-                        eAbstractSet.append(duplicate)
-                else:
-                    copy.eSet(ref.name, value.__deepcopy__(memo))
-            #else:
-            #    # no containment relation, but a reference
-            #    # this can only be done after a full copy
-            #    pass
-    # now copy should a full copy, but without cross references
+            children = value if many else (value, )
+            child_copies = []
+            for child in children:
+                child_copy = memo.get(child)
+                if child_copy is None:
+                    child_plan = get_copy_plan(child.eClass)
+                    child_copy = _copy_attributes(child, child_plan)
+                    memo[child] = child_copy
+                    todo.append((child, child_copy, child_plan))
+                child_copies.append(child_copy)
+            containments.append((duplicate, name, many, child_copies))
+        if plan.references:
+            references.append((original, duplicate, plan.references))
 
-    memo[self] = copy
+    for original, duplicate, reference_features in references:
+        isset = original._isset
+        for feature, name, many in reference_features:
+            if feature not in isset:
+                continue
+            value = original.__getattribute__(name)
+            if value is None:
+                continue
+            if many:
+                if value:
+                    targets = duplicate.__getattribute__(name)
+                    for ref_value in value:
+                        copy_ref_value = _copied_reference(memo, ref_value, original, name, keep_external_references)
+                        # the opposite of a bidirectional reference (e.g. connectedTo) can already be set
+                        if copy_ref_value not in targets:
+                            targets.append(copy_ref_value)
+            else:
+                duplicate.__setattr__(name, _copied_reference(memo, value, original, name, keep_external_references))
 
-    if first_call:
-        #logger.debug("copying references")
-        for k, v in memo.items():
-            eclass: EClass = k.eClass
-            for x in eclass.eAllStructuralFeatures():
-                if isinstance(x, EReference):
-                    #logger.debug("deepcopy: processing x-reference {}".format(x.name))
-                    ref: EReference = x
-                    orig_value: EStructuralFeature = k.eGet(ref)
-                    if orig_value is None:
-                        continue
-                    if not ref.containment:
-                        opposite = ref.eOpposite
-                        if opposite and opposite.containment:
-                            # do not handle eOpposite relations, they are handled automatically in pyEcore
-                            continue
-                        if x.many:
-                            eAbstractSet = v.eGet(ref.name)
-                            for orig_ref_value in orig_value:
-                                try:
-                                    copy_ref_value = memo[orig_ref_value]
-                                except KeyError:
-                                    logger.warning(f'Cannot find reference of type {orig_ref_value.eClass.name} for reference {k.eClass.name}.{ref.name} in deepcopy memo, using original')
-                                    copy_ref_value = orig_ref_value
-                                eAbstractSet.append(copy_ref_value)
-                        else:
-                            try:
-                                copy_value = memo[orig_value]
-                            except KeyError:
-                                logger.warning(f'Cannot find reference of type {orig_value.eClass.name} of reference {k.eClass.name}.{ref.name} in deepcopy memo, using original')
-                                copy_value = orig_value
-                            v.eSet(ref.name, copy_value)
+    for duplicate, name, many, child_copies in reversed(containments):
+        if many:
+            duplicate.__getattribute__(name).extend(child_copies)
+        else:
+            duplicate.__setattr__(name, child_copies[0])
     return copy
 
+
+def _copied_reference(memo, value, owner, reference_name, keep_external_references):
+    copy_value = memo.get(value)
+    if copy_value is None:
+        if not keep_external_references:
+            logger.warning(f'Cannot find reference of type {value.eClass.name} of reference {owner.eClass.name}.'
+                           f'{reference_name} in deepcopy memo, using original')
+        copy_value = value
+    return copy_value
+
     # show deleted object from memory
     # setattr(EObject, '__del__', lambda x: print('Deleted {}'.format(x.eClass.name)))
 
@@ -11,12 +11,18 @@
 #      TNO         - Initial implementation
 #  Manager:
 #      TNO
-from collections import UserList
+from collections import UserList, deque
+from contextlib import contextmanager
+import sys
+import threading
+import time
+import warnings
 
 from pyecore.notification import EObserver, Notification, Kind
-from pyecore.ecore import EObject, EStructuralFeature, EReference
+from pyecore.ecore import EObject, EStructuralFeature, EReference, EEnumLiteral
 from pyecore.resources import Resource
 from pyecore.commands import Set, Add, Delete, Remove, CommandStack, Compound, Command, AbstractCommand
+from esdl.support_functions import model_lock
 from src.log import get_logger
 from dataclasses import dataclass
 
@@ -97,11 +103,11 @@ class UndoRedoCommandStack(CommandStack):
             # gives problems
             if len(commands) == 1 and len(self.compound) > 0 and \
                     commands[-1].feature.name == 'connectedTo' and self.compound[-1].feature.name == 'connectedTo':
-                print('Ignore 2nd connectedTo', commands)
+                log.debug('Ignore 2nd connectedTo {}'.format(commands))
                 # todo add check if notifier is same as old
                 return # ignore 2nd connected to relation
             # only adding multiple commands to the compound
-            print("Adding combined command {} to action '{}'".format(commands, self.compound.label))
+            log.debug("Adding combined command {} to action '{}'".format(commands, self.compound.label))
             self.compound.extend(commands)
             return
         if not self._recording:
@@ -131,10 +137,10 @@ class UndoRedoCommandStack(CommandStack):
 
     def redo(self):
         if self._combineCommands is True:
-            print("Cannot redo while recording combined commands")
+            log.warning("Cannot redo while recording combined commands")
             return
         self._recording = False  # suppress generated notifications for redo
-        print('Undo', self.peek_next_top)
+        log.debug('Redo {}'.format(self.peek_next_top))
         super().redo()
         self._recording = True
 
@@ -143,10 +149,10 @@ class UndoRedoCommandStack(CommandStack):
 
     def undo(self):
         if self._combineCommands is True:
-            print("Cannot undo while recording combined commands")
+            log.warning("Cannot undo while recording combined commands")
             return
         self._recording = False # suppress generated notification for undo
-        print('Undo', self.top)
+        log.debug('Undo {}'.format(self.top))
         super().undo()
         self._recording = True
 
@@ -158,13 +164,12 @@ def handleNotification(stack: UndoRedoCommandStack, notification: Notification):
         #print('Ignoring ', notification)
         return
     if notification.old is None and notification.new is None:
-        print('Ignoring (change=None)', notification)
+        log.debug('Ignoring (change=None) {}'.format(notification))
         return
-    print('Handling', notification)
     if notification.kind == Kind.SET:
         f: EStructuralFeature = notification.feature
         if isinstance(f, EReference) and f.eOpposite and f.eOpposite.containment:
-            print("  \ -- Ignoring opposite setters for", f.name)
+            log.debug("  \ -- Ignoring opposite setters for {}".format(f.name))
             return
         setNotification = Set(owner=notification.notifier, feature=notification.feature, value=notification.new)
         setNotification.previous_value = notification.old
@@ -174,7 +179,7 @@ def handleNotification(stack: UndoRedoCommandStack, notification: Notification):
         if notification.old is not None:
             f: EStructuralFeature = notification.feature
             if isinstance(f, EReference) and f.eOpposite and f.eOpposite.containment:
-                print("  \ -- Ignoring opposite unset for ", f.name)
+                log.debug("  \ -- Ignoring opposite unset for {}".format(f.name))
                 return
             unsetNotification = Delete(owner=notification.notifier)
             unsetNotification.feature = notification.feature
@@ -199,7 +204,7 @@ def handleNotification(stack: UndoRedoCommandStack, notification: Notification):
             removeNotification.value = notification.old
             if notification.feature.many:
                 removeNotification._collection = notification.notifier.eGet(notification.feature)
-                print("collection of {} is {}".format(notification.feature.name, removeNotification._collection))
+                log.debug("collection of {} is {}".format(notification.feature.name, removeNotification._collection))
                 try:
                     removeNotification.index = notification.notifier.eGet(notification.feature).index(notification.old)
                 except KeyError:
@@ -212,12 +217,16 @@ def handleNotification(stack: UndoRedoCommandStack, notification: Notification):
     #     deleteNotification._executed = True
     #     stack.append(deleteNotification)
     else:
-        print("Not handled notification: ", notification)
+        log.debug("Not handled notification: {}".format(notification))
 
 
 
 # observe every change in the model, but this works for *all* EObjects in memory... so this is not very handy.
+# Deprecated: the editor uses the UndoJournal of each energy system (EnergySystemHandler.undo() and redo()), that
+# observes a single resource without patching EObject.__init__.
 def monitor_esdl_changes(command_stack: UndoRedoCommandStack):
+    warnings.warn('monitor_esdl_changes() patches EObject.__init__ for all sessions, use UndoJournal instead',
+                  DeprecationWarning, stacklevel=2)
     observer = EObserver(notifyChanged=lambda x: handleNotification(command_stack, x))
     old_init = EObject.__init__
 
@@ -251,7 +260,7 @@ class ChangeTracker:
         resource = eobj.eResource
         if resource is None:
             raise Exception("Can't create new tracker: Resource is None")
-        print("Tracking changes for resource with URI {}".format(resource.uri.plain))
+        log.debug("Tracking changes for resource with URI {}".format(resource.uri.plain))
         stack = UndoRedoCommandStack()
         ro = ResourceObserver(command_stack=stack)
         ro.observe(resource)
@@ -277,3 +286,319 @@ class ChangeTracker:
                 del t.observer
                 #del t.resource # needed?
 
+
+# ---------------------------------------------------------------------------------------------------------------------
+#  Undo journal
+# ---------------------------------------------------------------------------------------------------------------------
+COALESCE_INTERVAL = 2.0             # seconds between changes of the same kind that are merged into one action
+DEFAULT_MAX_BYTES = 8 * 2**20       # memory of the undo history of a resource
+OBJECT_SIZE = 2000                  # estimated memory of an EObject (with its attributes) that is kept by the history
+
+
+class Change:
+    """A change of a feature of an object, as notified by pyecore"""
+    __slots__ = ('owner', 'feature', 'kind', 'old', 'new', 'position', 'size')
+
+    def __init__(self, owner, feature, kind, old, new, position):
+        self.owner = owner
+        self.feature = feature
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.position = position
+        self.size = _CHANGE_SIZE + _value_size(feature, old) + _value_size(feature, new)
+
+    def undo(self):
+        kind = self.kind
+        if kind in (Kind.SET, Kind.UNSET):
+            _set(self.owner, self.feature, self.old)
+        elif kind == Kind.ADD:
+            _remove(self.owner, self.feature, self.new, self.position)
+        elif kind == Kind.ADD_MANY:
+            for value in reversed(self.new):
+                _remove(self.owner, self.feature, value, None)
+        elif kind == Kind.REMOVE:
+            _insert(self.owner, self.feature, self.old, self.position)
+        elif kind == Kind.REMOVE_MANY:
+            for value in self.old:
+                _insert(self.owner, self.feature, value, None)
+
+    def redo(self):
+        kind = self.kind
+        if kind in (Kind.SET, Kind.UNSET):
+            _set(self.owner, self.feature, self.new)
+        elif kind == Kind.ADD:
+            _insert(self.owner, self.feature, self.new, self.position)
+        elif kind == Kind.ADD_MANY:
+            for value in self.new:
+                _insert(self.owner, self.feature, value, None)
+        elif kind == Kind.REMOVE:
+            _remove(self.owner, self.feature, self.old, self.position)
+        elif kind == Kind.REMOVE_MANY:
+            for value in self.old:
+                _remove(self.owner, self.feature, value, None)
+
+    def __repr__(self):
+        return '{}({}.{}: {} -> {})'.format(self.kind.name, self.owner.eClass.name, self.feature.name, self.old,
+                                            self.new)
+
+
+_CHANGE_SIZE = sys.getsizeof(Change.__new__(Change))
+
+
+def _value_size(feature, value) -> int:
+    if value is None or isinstance(value, (bool, int, EEnumLiteral)):
+        return 0
+    if isinstance(value, EObject):
+        # removed or replaced objects are only kept alive by the history
+        return OBJECT_SIZE * (1 + sum(1 for _ in value.eAllContents())) if feature.containment else 0
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(feature, v) for v in value)
+    return sys.getsizeof(value)
+
+
+# Changes are undone and redone one side at a time: the changes of the opposite references have been recorded
+# as well, so the opposites are left alone (except for references without opposite, of which pyecore keeps track
+# in _inverse_rels)
+
+def _without_opposite(feature: EStructuralFeature) -> bool:
+    return not isinstance(feature, EReference) or feature.eOpposite is None
+
+
+def _set(owner: EObject, feature: EStructuralFeature, value):
+    owner.__getattribute__(feature.name)    # creates the EValue if the feature has never been used
+    owner.__dict__[feature.name]._set(value, update_opposite=_without_opposite(feature))
+
+
+def _insert(owner: EObject, feature: EStructuralFeature, value, position):
+    collection = owner.__getattribute__(feature.name)
+    if position is None:
+        collection.append(value, _without_opposite(feature))
+    else:
+        collection.insert(position, value, _without_opposite(feature))
+
+
+def _remove(owner: EObject, feature: EStructuralFeature, value, position):
+    collection = owner.__getattribute__(feature.name)
+    if position is not None and isinstance(collection, list) and position < len(collection) \
+            and collection[position] is value:
+        collection.pop(position, _without_opposite(feature))
+    else:
+        collection.remove(value, _without_opposite(feature))
+
+
+class Action:
+    """The changes of one user action, that are undone and redone together"""
+    def __init__(self, label=None, coalesce_key=None):
+        self.label = label
+        self.coalesce_key = coalesce_key
+        self.changes = []
+        self.size = 0
+        self.last_change = time.monotonic()
+        self._sets = dict()     # (owner, feature) -> Change of a single valued feature, to merge later changes with
+
+    def add(self, change: Change):
+        if change.kind == Kind.SET:
+            previous = self._sets.get((change.owner, change.feature))
+            if previous is not None and previous.new is change.old:
+                # merge with the previous change of this feature, e.g. when a line is dragged around on the map
+                self.size -= previous.size
+                previous.new = change.new
+                previous.size = _CHANGE_SIZE + _value_size(previous.feature, previous.old) + \
+                    _value_size(previous.feature, previous.new)
+                self.size += previous.size
+                return
+            self._sets[(change.owner, change.feature)] = change
+        self.changes.append(change)
+        self.size += change.size
+
+    def undo(self):
+        for change in reversed(self.changes):
+            change.undo()
+
+    def redo(self):
+        for change in self.changes:
+            change.redo()
+
+    def __repr__(self):
+        return 'Action({}: {} changes)'.format(self.label, len(self.changes))
+
+
+class UndoJournal(EObserver):
+    """
+    Records the changes of the objects in a resource (by observing the resource), grouped in actions that can be
+    undone and redone. Changes are grouped in the action that is started with action() or begin_action() by the
+    thread that makes them. Changes of other threads (e.g. background jobs) or made outside an action are grouped in
+    an action per thread, which is added to the history before the current action by end_action(). Actions with the
+    same coalesce_key that follow each other quickly are merged into one, and the oldest actions are forgotten when
+    the history uses more than max_bytes (estimated). The journal is changed while holding model_lock.
+    Use UndoJournal.of(resource) to get (or create) the journal of a resource.
+    """
+    def __init__(self, resource: Resource, max_bytes=DEFAULT_MAX_BYTES, coalesce_interval=COALESCE_INTERVAL):
+        super().__init__()
+        self.resource = resource
+        self.max_bytes = max_bytes
+        self.coalesce_interval = coalesce_interval
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0               # of the actions in both stacks
+        self.current = None         # action that records the changes of the thread that began it
+        self._action_thread = None
+        self._thread_actions = dict()   # thread ident -> action with the changes of that thread outside current
+        self._replaying = False
+        self._observed = dict()     # objects that are removed from the resource, that are observed directly
+        self._last_notification = None
+        self.observe(resource)
+
+    @staticmethod
+    def of(resource: Resource, **kwargs) -> 'UndoJournal':
+        journal = getattr(resource, 'undo_journal', None)
+        if journal is None:
+            journal = UndoJournal(resource, **kwargs)
+            resource.undo_journal = journal
+        return journal
+
+    def close(self):
+        """Stops recording changes and forgets the history"""
+        self.resource.listeners.remove(self)
+        for obj in self._observed:
+            obj.listeners.remove(self)
+        self._observed.clear()
+        self.clear()
+        if getattr(self.resource, 'undo_journal', None) is self:
+            del self.resource.undo_journal
+
+    def clear(self):
+        with model_lock:
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+            self.current = None
+            self._thread_actions.clear()
+            self.size = 0
+
+    def begin_action(self, label=None, coalesce_key=None):
+        """
+        Starts recording the changes of a new action
+        :param coalesce_key: if the previous action has the same (not None) key and its last change was less than
+                             coalesce_interval seconds ago, this action is merged with that action
+        """
+        with model_lock:
+            self.end_action()
+            top = self.undo_stack[-1] if self.undo_stack else None
+            if coalesce_key is not None and top is not None and top.coalesce_key == coalesce_key and \
+                    time.monotonic() - top.last_change < self.coalesce_interval and not self.redo_stack:
+                self.undo_stack.pop()
+                self.size -= top.size
+                self.current = top
+            else:
+                self.current = Action(label, coalesce_key)
+            self._action_thread = threading.get_ident()
+
+    def end_action(self):
+        """
+        Stops recording the changes of the current action and adds it to the history (if anything changed), after the
+        changes made by other threads
+        """
+        with model_lock:
+            actions = [*self._thread_actions.values(), self.current]
+            self.current = None
+            self._thread_actions.clear()
+            for action in actions:
+                if action is None or not action.changes:
+                    continue
+                self.undo_stack.append(action)
+                self.size += action.size
+            while self.size > self.max_bytes and len(self.undo_stack) > 1:
+                self.size -= self.undo_stack.popleft().size
+
+    @contextmanager
+    def action(self, label=None, coalesce_key=None):
+        """Records the changes in the enclosed code as one action, see begin_action()"""
+        self.begin_action(label, coalesce_key)
+        try:
+            yield self.current
+        finally:
+            self.end_action()
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_stack) or bool(self.current and self.current.changes) or \
+            any(action.changes for action in self._thread_actions.values())
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """Undoes the last action and returns it (None if there is nothing to undo)"""
+        with model_lock:
+            self.end_action()
+            if not self.undo_stack:
+                return None
+            action = self.undo_stack.pop()
+            self._replay(action.undo)
+            self.redo_stack.append(action)
+            return action
+
+    def redo(self):
+        """Redoes the last undone action and returns it (None if there is nothing to redo)"""
+        with model_lock:
+            self.end_action()
+            if not self.redo_stack:
+                return None
+            action = self.redo_stack.pop()
+            self._replay(action.redo)
+            self.undo_stack.append(action)
+            return action
+
+    def _replay(self, replay):
+        self._replaying = True
+        try:
+            replay()
+        finally:
+            self._replaying = False
+
+    def notifyChanged(self, notification: Notification):
+        with model_lock:
+            self._record(notification)
+
+    def _record(self, notification: Notification):
+        # objects that are moved within the resource notify both the resource and the journal itself
+        if self._replaying or notification is self._last_notification:
+            return
+        self._last_notification = notification
+        feature = notification.feature
+        if feature.derived or feature.transient:
+            return
+        kind = notification.kind
+        position = getattr(notification, 'position', None)
+        if kind == Kind.ADD and position is None and feature.many:
+            collection = notification.notifier.__getattribute__(feature.name)
+            if isinstance(collection, list):
+                position = len(collection) - 1     # appended
+        if isinstance(feature, EReference) and feature.containment and kind in (Kind.SET, Kind.UNSET, Kind.REMOVE,
+                                                                                 Kind.REMOVE_MANY):
+            self._observe_removed(notification.old)
+        if self.redo_stack:
+            for action in self.redo_stack:
+                self.size -= action.size
+            self.redo_stack.clear()
+        thread = threading.get_ident()
+        if self.current is not None and thread == self._action_thread:
+            action = self.current
+        else:
+            # e.g. changes of a background job, that should not be undone as part of the user's action
+            action = self._thread_actions.get(thread)
+            if action is None:
+                action = self._thread_actions[thread] = Action()
+        change = Change(notification.notifier, feature, kind, notification.old, notification.new, position)
+        action.add(change)
+        action.last_change = time.monotonic()
+
+    def _observe_removed(self, value):
+        # changes of removed objects are recorded as well, to be able to undo them after the removal is undone
+        if value is None:
+            return
+        for v in ([value] if isinstance(value, EObject) else value):
+            for obj in (v, *v.eAllContents()):
+                if obj not in self._observed:
+                    self._observed[obj] = None
+                    obj.listeners.append(self)
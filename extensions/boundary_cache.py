@@ -0,0 +1,274 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Cache for the boundaries retrieved from the boundary service.
+
+The BoundaryCache keeps the most recently used boundaries in memory, bounded by the number of boundaries and by an
+estimate of the memory they use. Boundaries that are evicted from memory are not lost when an on-disk tier is
+configured (SQLiteBoundaryStore): every boundary is also written to a SQLite database, so it survives restarts of the
+MapEditor and is shared by all worker processes. The geometry of a boundary is stored at full resolution, as it is
+added to the ESDL of the user; a simplified variant of it is stored next to it (SIMPLIFIED_GEOMETRY_KEY) once, the
+zoom variants for the map are computed from that variant.
+
+Cached boundaries carry the simplified variants of their geometry for the zoom bands of the map (see
+src.geometry_simplification), so the area layer can be sent at the resolution of the zoom level of the client.
+
+Besides the boundaries themselves the cache remembers the codes of the sub boundaries of an area (e.g. all
+neighbourhoods of a municipality), so a request for the same sub boundaries can be answered from the cache as well.
+
+prefetch() retrieves a batch of boundaries that are not in the cache yet concurrently.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sqlite3
+import threading
+from src.geometry_simplification import simplify_geometry, with_zoom_geometries, zoom_variants, ZOOM_GEOMETRIES_KEY, \
+    FULL_RESOLUTION
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+DEFAULT_SIMPLIFY_TOLERANCE = 0.00001    # in degrees, about 1 meter
+DEFAULT_PREFETCH_WORKERS = 8
+
+# rough estimate of the memory used by one coordinate ([x, y] list of two floats) of a decoded geometry
+COORDINATE_SIZE_ESTIMATE = 140
+ENTRY_SIZE_ESTIMATE = 1024
+
+# key of the geometry of a boundary simplified with the tolerance of the SQLiteBoundaryStore
+SIMPLIFIED_GEOMETRY_KEY = 'simplified_geom'
+
+
+def boundary_key(year, code):
+    return str(year) + code
+
+
+def subboundaries_key(year, scope, subscope, code):
+    return '{}/{}/{}/{}'.format(year, subscope.name, scope.name, code)
+
+
+def estimate_size(value):
+    """Estimates the memory used by a boundary by counting the coordinates of its geometry (and its variants)"""
+    size = ENTRY_SIZE_ESTIMATE
+    todo = [value.get('geom'), value.get(SIMPLIFIED_GEOMETRY_KEY), value.get(ZOOM_GEOMETRIES_KEY)] \
+        if isinstance(value, dict) else []
+    while todo:
+        item = todo.pop()
+        if isinstance(item, dict):
+            todo.append(item.get('coordinates'))
+        elif isinstance(item, (list, tuple)):
+            if item and isinstance(item[0], (int, float)):
+                size += COORDINATE_SIZE_ESTIMATE
+            else:
+                todo.extend(item)
+    return size
+
+
+class SQLiteBoundaryStore:
+    """On-disk tier of the BoundaryCache, stores boundaries and a simplified variant of their geometry in SQLite"""
+    def __init__(self, path, simplify_tolerance=DEFAULT_SIMPLIFY_TOLERANCE):
+        self.path = path
+        self.simplify_tolerance = simplify_tolerance
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS boundary (key TEXT PRIMARY KEY, data TEXT)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS subboundaries (key TEXT PRIMARY KEY, codes TEXT)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT data FROM boundary WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, boundary):
+        """Stores the boundary and returns the stored version of it, with its simplified geometry and zoom variants"""
+        if isinstance(boundary.get('geom'), dict):
+            boundary = dict(boundary)
+            simplified = simplify_geometry(boundary['geom'], self.simplify_tolerance)
+            boundary[SIMPLIFIED_GEOMETRY_KEY] = simplified
+            boundary[ZOOM_GEOMETRIES_KEY] = zoom_variants(simplified)[:FULL_RESOLUTION]
+        data = json.dumps(boundary)
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO boundary (key, data) VALUES (?, ?)', (key, data))
+        return boundary
+
+    def get_codes(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT codes FROM subboundaries WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_codes(self, key, codes):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO subboundaries (key, codes) VALUES (?, ?)',
+                                     (key, json.dumps(codes)))
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM boundary').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class BoundaryCache:
+    """Thread safe LRU cache of boundaries, bounded by number of entries and estimated memory use"""
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_memory=DEFAULT_MAX_MEMORY, store=None):
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.store = store
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (boundary, estimated size)
+        self._codes = OrderedDict()     # sub boundaries key -> list of codes
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def from_config(config):
+        store = None
+        if config.get('sqlite_path'):
+            try:
+                store = SQLiteBoundaryStore(config['sqlite_path'],
+                                            config.get('simplify_tolerance', DEFAULT_SIMPLIFY_TOLERANCE))
+                logger.info('Using boundary cache database {}'.format(config['sqlite_path']))
+            except Exception as e:
+                logger.error('Cannot open boundary cache database {}: {}'.format(config['sqlite_path'], e))
+        return BoundaryCache(config.get('max_entries', DEFAULT_MAX_ENTRIES),
+                             config.get('max_memory', DEFAULT_MAX_MEMORY), store)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        boundary = self.store.get(key) if self.store is not None else None
+        if boundary is not None:
+            boundary = with_zoom_geometries(boundary)   # for boundaries that were stored without the variants
+        with self._lock:
+            if boundary is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._add(key, boundary)
+        return boundary
+
+    def put(self, key, boundary):
+        if self.store is not None:
+            try:
+                boundary = self.store.put(key, boundary)
+            except Exception as e:
+                logger.warning('Cannot store boundary {} in boundary cache database: {}'.format(key, e))
+        boundary = with_zoom_geometries(boundary)
+        with self._lock:
+            self._add(key, boundary)
+        return boundary
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        boundary = self.get(key)
+        if boundary is None:
+            raise KeyError(key)
+        return boundary
+
+    def __setitem__(self, key, boundary):
+        self.put(key, boundary)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_subboundary_codes(self, key):
+        with self._lock:
+            if key in self._codes:
+                self._codes.move_to_end(key)
+                return self._codes[key]
+        codes = self.store.get_codes(key) if self.store is not None else None
+        if codes is not None:
+            with self._lock:
+                self._add_codes(key, codes)
+        return codes
+
+    def put_subboundary_codes(self, key, codes):
+        if self.store is not None:
+            try:
+                self.store.put_codes(key, codes)
+            except Exception as e:
+                logger.warning('Cannot store sub boundaries {} in boundary cache database: {}'.format(key, e))
+        with self._lock:
+            self._add_codes(key, codes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._codes.clear()
+            self.memory = 0
+
+    def _add(self, key, boundary):
+        if key in self._entries:
+            self.memory -= self._entries.pop(key)[1]
+        size = estimate_size(boundary)
+        self._entries[key] = (boundary, size)
+        self.memory += size
+        # always keep the boundary that has just been added, even if it is larger than max_memory itself
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.memory > self.max_memory):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.memory -= evicted_size
+
+    def _add_codes(self, key, codes):
+        self._codes[key] = codes
+        self._codes.move_to_end(key)
+        while len(self._codes) > self.max_entries:
+            self._codes.popitem(last=False)
+
+
+def prefetch(cache: BoundaryCache, keys, fetch, max_workers=DEFAULT_PREFETCH_WORKERS):
+    """
+    Retrieves the boundaries of the keys that are not in the cache yet concurrently and adds them to the cache.
+    :param keys: dict of cache key -> arguments for the fetch function
+    :param fetch: function that retrieves one boundary from the service, called with the arguments of a key
+    :return: the number of boundaries that have been retrieved
+    """
+    missing = [(key, args) for key, args in keys.items() if key not in cache]
+    if not missing:
+        return 0
+
+    def fetch_one(item):
+        key, args = item
+        try:
+            boundary = fetch(*args)
+        except Exception as e:
+            logger.warning('Error prefetching boundary {}: {}'.format(key, e))
+            return 0
+        if boundary:
+            cache.put(key, boundary)
+            return 1
+        return 0
+
+    if len(missing) == 1 or max_workers <= 1:
+        return sum(map(fetch_one, missing))
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+        return sum(executor.map(fetch_one, missing))
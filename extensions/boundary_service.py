@@ -14,19 +14,23 @@
 
 from flask import Flask
 from flask_socketio import SocketIO, emit
+from concurrent.futures import ThreadPoolExecutor
 
-import time
 import requests
 import json
 import uuid
 import re
 import os
+import threading
 
 from esdl import esdl
 from esdl.processing import ESDLGeometry
 from extensions.session_manager import get_handler, get_session, set_session
 from extensions.settings_storage import SettingsStorage
+from extensions.boundary_cache import BoundaryCache, boundary_key, subboundaries_key, prefetch
 
+from src.area_layer import emit_area_layer, set_zoom_variants
+from src.geometry_simplification import boundary_zoom_variants, polygon_variants
 from src.shape import Shape
 import src.settings as settings
 import src.log as log
@@ -60,8 +64,8 @@ boundary_service_mapping = {
     'COUNTRY': 'countries'
 }
 
-#create a cache for the boundary service
-boundary_cache = dict()
+# create a cache for the boundary service, bounded in size and optionally backed by a database on disk
+boundary_cache = BoundaryCache.from_config(settings.boundary_cache_config)
 DEFAULT_BOUNDARIES_YEAR = 2019
 
 
@@ -78,6 +82,7 @@ class BoundaryService:
         self.socketio = socket
         self.settings_storage = settings_storage
         self.plugin_settings = self.get_settings()
+        self._http_sessions = threading.local()
         self.register()
 
         if settings.boundaries_config["host"] is None or settings.boundaries_config["host"] == "":
@@ -220,12 +225,13 @@ class BoundaryService:
                     if shape:
                         shape_dictionary[identifier] = shape
 
+                    zoom_variants = boundary_zoom_variants(boundary)
                     for i in range(0, len(geom['coordinates'])):
                         if len(geom['coordinates']) > 1:
                             area_id_number = " ({} of {})".format(i + 1, len(geom['coordinates']))
                         else:
                             area_id_number = ""
-                        area_list.append({
+                        area_list.append(set_zoom_variants({
                             "type": "Feature",
                             "geometry": {
                                 "type": "Polygon",
@@ -236,7 +242,7 @@ class BoundaryService:
                                 "name": area.name,
                                 "KPIs": []
                             }
-                        })
+                        }, polygon_variants(zoom_variants, i)))
 
             if initialize_ES:
                 # change ID, name and scope of ES
@@ -311,12 +317,13 @@ class BoundaryService:
                                 area.area.append(sub_area)
                                 esh.add_object_to_dict(active_es_id, sub_area)
 
+                            zoom_variants = boundary_zoom_variants(boundary)
                             for i in range(0, len(geom['coordinates'])):
                                 if len(geom['coordinates']) > 1:
                                     area_id_number = " ({} of {})".format(i + 1, len(geom['coordinates']))
                                 else:
                                     area_id_number = ""
-                                area_list.append({
+                                area_list.append(set_zoom_variants({
                                     "type": "Feature",
                                     "geometry": {
                                         "type": "Polygon",
@@ -327,10 +334,10 @@ class BoundaryService:
                                         "name": sub_area_name,
                                         "KPIs": []
                                     }
-                                })
+                                }, polygon_variants(zoom_variants, i)))
 
             set_session('shape_dictionary', shape_dictionary)
-            emit('geojson', {"layer": "area_layer", "geojson": area_list})
+            emit_area_layer(active_es_id, area_list, add=True)
             print('Ready processing boundary information')
 
     def get_user_settings(self, user):
@@ -365,37 +372,45 @@ class BoundaryService:
         :return: the geomertry of the indicated 'scope'
         """
         if is_valid_boundary_id(id):
-            time.sleep(0.01) # yield a little concurrency when running this in a thread
-
-            if str(year)+id in boundary_cache:
+            boundary = boundary_cache.get(boundary_key(year, id))
+            if boundary:
                 # print('Retrieve boundary from cache', str(year)+id)
-                # res_boundary = copy.deepcopy(boundary_cache[id])   # this doesn't solve messing up cache
-                # return res_boundary
-                return boundary_cache[str(year)+id]
+                return boundary
 
-            try:
-                url = 'http://' + settings.boundaries_config["host"] + ':' + settings.boundaries_config["port"] + \
-                      settings.boundaries_config["path_boundaries"] + '/YEAR/' + str(year) + '/' + boundary_service_mapping[scope.name] + '/' + id
-                # print('Retrieve from boundary service', id)
-                r = requests.get(url)
-                if len(r.text) > 0:
-                    reply = json.loads(r.text)
-                    # geom = reply['geom']
-                    # {'type': 'MultiPolygon', 'coordinates': [[[[253641.50000000006, 594417.8126220703], [253617, .... ,
-                    # 594477.125], [253641.50000000006, 594417.8126220703]]]]}, 'code': 'BU00030000', 'name': 'Appingedam-Centrum',
-                    # 'tCode': 'GM0003', 'tName': 'Appingedam'}
-                    boundary_cache[str(year)+id] = reply
-                    return reply
-                else:
-                    print("WARNING: Empty response for Boundary service for {} with id {}".format(scope.name, id))
-                    return None
+            boundary = self.__request_boundary(year, scope, id)
+            if boundary:
+                boundary = boundary_cache.put(boundary_key(year, id), boundary)
+            return boundary
+        else:
+            return None
 
-            except Exception as e:
-                print('ERROR in accessing Boundary service for {} with id {}: {}'.format(scope.name, id, e))
+    def __request_boundary(self, year, scope, id):
+        try:
+            url = 'http://' + settings.boundaries_config["host"] + ':' + settings.boundaries_config["port"] + \
+                  settings.boundaries_config["path_boundaries"] + '/YEAR/' + str(year) + '/' + boundary_service_mapping[scope.name] + '/' + id
+            # print('Retrieve from boundary service', id)
+            r = self.__http_session().get(url)
+            if len(r.text) > 0:
+                reply = json.loads(r.text)
+                # geom = reply['geom']
+                # {'type': 'MultiPolygon', 'coordinates': [[[[253641.50000000006, 594417.8126220703], [253617, .... ,
+                # 594477.125], [253641.50000000006, 594417.8126220703]]]]}, 'code': 'BU00030000', 'name': 'Appingedam-Centrum',
+                # 'tCode': 'GM0003', 'tName': 'Appingedam'}
+                return reply
+            else:
+                print("WARNING: Empty response for Boundary service for {} with id {}".format(scope.name, id))
                 return None
-        else:
+
+        except Exception as e:
+            print('ERROR in accessing Boundary service for {} with id {}: {}'.format(scope.name, id, e))
             return None
 
+    def __http_session(self):
+        # a requests session per thread, to reuse the connections to the boundary service when prefetching
+        if not hasattr(self._http_sessions, 'session'):
+            self._http_sessions.session = requests.Session()
+        return self._http_sessions.session
+
     def __get_subboundaries_from_service(self, year, scope, subscope, id):
         """
         :param scope: any of the following: zipcode, neighbourhood, district, municipality, energyregion, province, country
@@ -405,12 +420,20 @@ class BoundaryService:
         """
 
         if is_valid_boundary_id(id):
+            # answer from the cache when all sub boundaries of this area have been retrieved before
+            key = subboundaries_key(year, scope, subscope, id)
+            codes = boundary_cache.get_subboundary_codes(key)
+            if codes is not None:
+                sub_boundaries = [boundary_cache.get(boundary_key(year, code)) for code in codes]
+                if all(sub_boundaries):
+                    return sub_boundaries
+
             try:
                 url = 'http://' + settings.boundaries_config["host"] + ':' + settings.boundaries_config["port"] \
                       + settings.boundaries_config["path_boundaries"] + '/YEAR/' + str(year) + '/' \
                       + boundary_service_mapping[subscope.name] + '/' \
                       + boundary_service_mapping[scope.name] + '/' + id
-                r = requests.get(url)
+                r = self.__http_session().get(url)
                 reply = json.loads(r.text)
                 # print(reply)
 
@@ -418,7 +441,14 @@ class BoundaryService:
                 # {'code': 'BU00140500', 'geom': '{"type":"MultiPolygon","bbox":[...],"coordinates":[[[[6.583651,53.209594],
                 # [6.58477,...,53.208816],[6.583651,53.209594]]]]}'}
 
-                return reply
+                sub_boundaries = []
+                for sub_boundary in reply:
+                    if sub_boundary.get('code') and sub_boundary.get('geom'):
+                        sub_boundary = boundary_cache.put(boundary_key(year, sub_boundary['code']), sub_boundary)
+                    sub_boundaries.append(sub_boundary)
+                if all(sub_boundary.get('code') for sub_boundary in sub_boundaries):
+                    boundary_cache.put_subboundary_codes(key, [sub_boundary['code'] for sub_boundary in sub_boundaries])
+                return sub_boundaries
             except Exception as e:
                 print('ERROR in accessing Boundary service for {} with id {}, subscope {}: {}'.format(scope.name, id, subscope.name, str(e)))
                 return {}
@@ -426,29 +456,51 @@ class BoundaryService:
             return {}
 
     def __preload_subboundaries_in_cache(self, year, top_area_scope, sub_area_scope, top_area_id):
-        sub_boundaries = self.__get_subboundaries_from_service(year, top_area_scope, sub_area_scope, top_area_id)
-
-        for sub_boundary in sub_boundaries:
-            code = sub_boundary['code']
-            geom = sub_boundary['geom']
-            if code and geom:
-                boundary_cache[str(year)+code] = sub_boundary
+        # retrieving the sub boundaries adds them to the cache
+        self.__get_subboundaries_from_service(year, top_area_scope, sub_area_scope, top_area_id)
 
     def preload_area_subboundaries_in_cache(self, top_area):
+        """
+        Retrieves the boundaries of all areas in the area tree of top_area that have no geometry in the ESDL and are
+        not in the cache yet. First the sub boundaries of all areas with sub areas are requested (one request per
+        area), then the remaining boundaries are requested one by one. Both batches are requested concurrently.
+        """
         user = get_session('user-email')
         user_settings = self.get_user_settings(user)
         boundaries_year = user_settings['boundaries_year']
 
-        top_area_scope = top_area.scope
         # fix bug in that the top area does not have an id
         if top_area.id is None:
             top_area.id = str(uuid.uuid4())
-        top_area_id = top_area.id
 
-        sub_areas = top_area.area
-        if sub_areas:
-            first_sub_area = sub_areas[0]
-            sub_area_scope = first_sub_area.scope
+        parents = dict()    # sub boundaries key -> arguments for __get_subboundaries_from_service
+        boundaries = dict() # boundary key -> arguments for __request_boundary
+        todo = [top_area]
+        while todo:
+            area = todo.pop()
+            sub_areas = area.area
+            todo.extend(sub_areas)
+            if sub_areas and area.scope and sub_areas[0].scope and area.id and is_valid_boundary_id(area.id) and \
+                    any(self.__needs_boundary(sub_area) for sub_area in sub_areas):
+                parents[subboundaries_key(boundaries_year, area.scope, sub_areas[0].scope, str.upper(area.id))] = \
+                    (boundaries_year, area.scope, sub_areas[0].scope, str.upper(area.id))
+            if self.__needs_boundary(area):
+                boundaries[boundary_key(boundaries_year, str.upper(area.id))] = \
+                    (boundaries_year, area.scope, str.upper(area.id))
+
+        workers = settings.boundary_cache_config['prefetch_workers']
+        if parents:
+            missing = [args for key, args in parents.items() if boundary_cache.get_subboundary_codes(key) is None]
+            if len(missing) > 1 and workers > 1:
+                with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+                    list(executor.map(lambda args: self.__get_subboundaries_from_service(*args), missing))
+            else:
+                for args in missing:
+                    self.__get_subboundaries_from_service(*args)
+        if boundaries:
+            prefetch(boundary_cache, boundaries, self.__request_boundary, workers)
 
-            if top_area_scope and sub_area_scope and is_valid_boundary_id(top_area_id):
-                self.__preload_subboundaries_in_cache(boundaries_year, top_area_scope, sub_area_scope, top_area_id)
\ No newline at end of file
+    @staticmethod
+    def __needs_boundary(area):
+        return area.geometry is None and area.id and area.scope and area.scope.name != 'UNDEFINED' \
+               and is_valid_boundary_id(area.id)
\ No newline at end of file
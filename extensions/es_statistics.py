@@ -41,7 +41,7 @@ class ESStatisticsService:
             with self.flask_app.app_context():
                 esh = get_handler()
                 active_es_id = get_session('active_es_id')
-                esdl_str = esh.to_string(active_es_id)
+                esdl_str = esh.to_string(active_es_id, compact=True)
                 return self.call_es_statistics_service(esdl_str)
 
     def call_es_statistics_service(self, esdl_str):
@@ -14,7 +14,7 @@
 
 from flask import Flask, request
 from flask_socketio import SocketIO
-from extensions.session_manager import managed_sessions
+from extensions.session_manager import get_client_ids, get_session_of_client
 import src.log as log
 
 logger = log.get_logger(__name__)
@@ -30,12 +30,10 @@ class ESDL_API:
 
     def get_sessions_from_managed_sessions(self):
         socketio_sid_list = dict()
-        for client_id in managed_sessions:
-            session_info = managed_sessions[client_id]
-            if 'user-email' in session_info and 'socketio_sid' in session_info:
-                user_email = session_info['user-email']
-                socketio_sid = session_info['socketio_sid']
-
+        for client_id in get_client_ids():
+            user_email = get_session_of_client(client_id, 'user-email')
+            socketio_sid = get_session_of_client(client_id, 'socketio_sid')
+            if user_email is not None and socketio_sid is not None:
                 if user_email in socketio_sid_list:
                     socketio_sid_list[user_email].append(socketio_sid)
                 else:
@@ -53,7 +51,7 @@ class ESDL_API:
             content = request.get_json(silent=True)
             # print(content)
             # print(session)             # bevat info over de sessie van deze API call
-            print(managed_sessions)    # bevat de client_id's als keys en alle sessie info als values (van alle browser connecties)
+            print(get_client_ids())    # bevat de client_id's van alle browser connecties
 
             if content:
                 if "sender" not in content or "email" not in content or "esdl" not in content:
@@ -38,8 +38,9 @@ class ESDLCompare:
                 es_id1 = esdls['esdl1']
                 es_id2 = esdls['esdl2']
 
-                es1_str = esh.to_string(es_id1).encode()    # convert string to bytes
-                es2_str = esh.to_string(es_id2).encode()    # convert string to bytes
+                # compact ESDL has no whitespace text nodes, that only slow down the comparison
+                es1_str = esh.to_string(es_id1, compact=True).encode()    # convert string to bytes
+                es2_str = esh.to_string(es_id2, compact=True).encode()    # convert string to bytes
 
                 logger.info("Comparing EnergySystems with id {} and {}".format(es_id1, es_id2))
                 results = main.diff_texts(es1_str, es2_str)
@@ -306,7 +306,9 @@ class ESDLDriveHttpURI(URI):
         if self.writing:
             logger.debug("Writing to {}".format(self.plain))
             headers = self.headers_function()
-            response = requests.put(self.plain, data=self.__stream.getvalue(), headers=headers, params=self.putparams)
+            # send the stream itself instead of a copy of its contents, requests will read it in blocks
+            self.__stream.seek(0)
+            response = requests.put(self.plain, data=self.__stream, headers=headers, params=self.putparams)
             if response.status_code > 400:
                 logger.error("Error writing to ESDLDrive: headers={}, response={}".format(response.headers, response.content))
                 #raise Exception("Error saving {}: HTTP Status {}".format(self.plain, response.status_code))
@@ -42,6 +42,121 @@ def send_alert(message):
     # emit('alert', message, namespace='/esdl')
 
 
+def json_stream_with_esdl(payload: dict, key: str, esdl_chunks):
+    """
+    Generator that yields the JSON encoding of payload, with the ESDL from esdl_chunks (a generator of bytes as
+    returned by EnergySystemHandler.to_chunks()) base64 encoded as the value of key. Each chunk is encoded when it is
+    serialized, so this can be used as the body of a chunked HTTP request.
+    """
+    placeholder = '__esdl_contents_{}__'.format(uuid.uuid4())
+    payload = dict(payload, **{key: placeholder})
+    prefix, suffix = json.dumps(payload).split(placeholder)
+    yield prefix.encode('utf-8')
+    remainder = b''
+    for chunk in esdl_chunks:
+        data = remainder + chunk
+        # base64 encodes blocks of 3 bytes, keep the rest for the next chunk to prevent padding in between
+        end = len(data) - len(data) % 3
+        yield base64.b64encode(data[:end])
+        remainder = data[end:]
+    yield base64.b64encode(remainder)
+    yield suffix.encode('utf-8')
+
+
+ESSIM_REQUEST_HEADERS = {
+    'Content-Type': "application/json",
+    'Accept': "application/json",
+    'User-Agent': "ESDL Mapeditor/0.1"
+    # 'Cache-Control': "no-cache",
+    # 'Host': ESSIM_config['ESSIM_host'],
+    # 'accept-encoding': "gzip, deflate",
+    # 'Connection': "keep-alive",
+    # 'cache-control': "no-cache"
+}
+
+
+def simulation_payload(user, scenario_id, sim_description, sim_start_datetime, sim_end_datetime, essim_kpis):
+    """Creates the payload to start an ESSIM simulation, without the ESDL (see json_stream_with_esdl)"""
+    ESSIM_config = settings.essim_config
+    payload = {
+        'user': user.strip(),
+        'scenarioID': scenario_id,
+        'simulationDescription': sim_description,
+        'startDate': sim_start_datetime,
+        'endDate': sim_end_datetime,
+        'influxURL': ESSIM_config['influxURL'],
+        # 'grafanaURL': ESSIM_config['grafanaURL'],
+        # 'esdlContents': urllib.parse.quote(esdlstr)
+        # 'esdlContents' is added as base64 encoded ESDL while streaming the request, see json_stream_with_esdl
+    }
+
+    if essim_kpis:
+        kpi_module = {
+            # 'kafkaURL': ESSIM_config['kafka_url'],
+            'modules': []
+        }
+        # payload['kafkaURL'] = ESSIM_config['kafka_url']
+        payload['natsURL'] = ESSIM_config['natsURL']
+
+        # TODO: Fix hard-coded TimeResolution = hourly
+        for kpi_id in essim_kpis:
+            kpi_module['modules'].append({
+                'id': kpi_id,
+                'config': {'TimeResolution': 'yearly'}
+                # 'config': [{'key': 'TimeResolution', 'value': 'hourly'}]
+            })
+        payload['kpiModule'] = kpi_module
+    return payload
+
+
+def post_simulation(url, payload, esdl_chunks, http=requests):
+    """
+    Starts an ESSIM simulation. The request body is streamed, such that the (base64 encoded) ESDL is never
+    completely in memory.
+    :param http: the requests module or a requests.Session
+    :return: the response of ESSIM, with status code 201 and the simulation id when the simulation is started
+    """
+    body = json_stream_with_esdl(payload, 'esdlContents', esdl_chunks)
+    return http.post(url, data=body, headers=ESSIM_REQUEST_HEADERS)
+
+
+def kpi_results_of_simulation(kpi_result_array, kpi_list):
+    """
+    Converts the KPI results of a simulation as returned by ESSIM to the KPI information for the frontend
+    :param kpi_list: list of KPI modules (id, name and descr) to look up the name and description of a KPI
+    :return: tuple of the list of KPI information and whether a KPI is still being calculated
+    """
+    kpis_this_sim_run = []
+    one_still_calculating = False
+
+    for kpi_result_item in kpi_result_array:
+        kpi_id = list(kpi_result_item.keys())[0]
+        kpi_result = kpi_result_item[kpi_id]
+
+        kpi_info = dict()
+        kpi_info['id'] = kpi_id
+        kpi_info['name'] = None
+        kpi_info['descr'] = None
+        for kpi in kpi_list or []:
+            if kpi['id'] == kpi_id:
+                kpi_info['name'] = kpi['name']
+                kpi_info['descr'] = kpi['descr']
+
+        kpi_info['calc_status'] = kpi_result['status']
+        if kpi_info['calc_status'] == 'Not yet started':
+            one_still_calculating = True
+        if kpi_info['calc_status'] == 'Calculating':
+            kpi_info['progress'] = kpi_result['progress']
+            one_still_calculating = True
+        if kpi_info['calc_status'] == 'Success':
+            kpi_info['kpi'] = kpi_result['kpi']
+            if 'unit' in kpi_info:
+                kpi_info['unit'] = kpi_result['unit']
+
+        kpis_this_sim_run.append(kpi_info)
+    return kpis_this_sim_run, one_still_calculating
+
+
 class ESSIM:
     def __init__(self, flask_app: Flask, socket: SocketIO, executor: Executor, essim_kpis: ESSIM_KPIs, settings_storage: SettingsStorage):
         self.flask_app = flask_app
@@ -392,11 +507,6 @@ class ESSIM:
             current_es_name = current_es.name
             if current_es_name == "":
                 current_es_name = "Untitled energysystem"
-            esdlstr = esh.to_string(active_es_id)
-            esdlstr_bytes = esdlstr.encode('utf-8')
-            esdlstr_base64_bytes = base64.b64encode(esdlstr_bytes)
-            esdlstr_base64 = esdlstr_base64_bytes.decode('utf-8')
-
             ESSIM_config = settings.essim_config
 
             print("essim_loadflow: {}".format(essim_loadflow))
@@ -406,50 +516,14 @@ class ESSIM:
                 url = ESSIM_config['ESSIM_host'] + ESSIM_config['ESSIM_path']
             # print('ESSIM url: ', url)
 
-            payload = {
-                'user': user_fullname.strip(),
-                'scenarioID': active_es_id,
-                'simulationDescription': sim_description,
-                'startDate': sim_start_datetime,
-                'endDate': sim_end_datetime,
-                'influxURL': ESSIM_config['influxURL'],
-                # 'grafanaURL': ESSIM_config['grafanaURL'],
-                # 'esdlContents': urllib.parse.quote(esdlstr)
-                'esdlContents': esdlstr_base64
-            }
-
-            if essim_kpis:
-                kpi_module = {
-                    # 'kafkaURL': ESSIM_config['kafka_url'],
-                    'modules': []
-                }
-                # payload['kafkaURL'] = ESSIM_config['kafka_url']
-                payload['natsURL'] = ESSIM_config['natsURL']
-
-                # TODO: Fix hard-coded TimeResolution = hourly
-                for kpi_id in essim_kpis:
-                    kpi_module['modules'].append({
-                        'id': kpi_id,
-                        'config': {'TimeResolution': 'yearly'}
-                        # 'config': [{'key': 'TimeResolution', 'value': 'hourly'}]
-                    })
-                payload['kpiModule'] = kpi_module
-
+            payload = simulation_payload(user_fullname, active_es_id, sim_description, sim_start_datetime,
+                                         sim_end_datetime, essim_kpis)
             # print(payload)
 
-            headers = {
-                'Content-Type': "application/json",
-                'Accept': "application/json",
-                'User-Agent': "ESDL Mapeditor/0.1"
-                # 'Cache-Control': "no-cache",
-                # 'Host': ESSIM_config['ESSIM_host'],
-                # 'accept-encoding': "gzip, deflate",
-                # 'Connection': "keep-alive",
-                # 'cache-control': "no-cache"
-            }
-
             try:
-                r = requests.post(url, json=payload, headers=headers)
+                # the energy system is streamed while the user can continue editing it, so send a frozen view of it
+                with esh.freeze(active_es_id) as es_view:
+                    r = post_simulation(url, payload, es_view.to_chunks(compact=True))
                 # print(r)
                 # print(r.content)
                 if r.status_code == 201:
@@ -489,35 +563,8 @@ class ESSIM:
             return 1
 
     def process_kpi_results(self, kpi_result_array):
-        kpis_this_sim_run = []
-        one_still_calculating = False
         kpi_list = get_session('kpi_list')  # contains id, name and description
-
-        for kpi_result_item in kpi_result_array:
-            kpi_id = list(kpi_result_item.keys())[0]
-            kpi_result = kpi_result_item[kpi_id]
-
-            kpi_info = dict()
-            kpi_info['id'] = kpi_id
-            kpi_info['name'] = None
-            kpi_info['descr'] = None
-            for kpi in kpi_list:
-                if kpi['id'] == kpi_id:
-                    kpi_info['name'] = kpi['name']
-                    kpi_info['descr'] = kpi['descr']
-
-            kpi_info['calc_status'] = kpi_result['status']
-            if kpi_info['calc_status'] == 'Not yet started':
-                one_still_calculating = True
-            if kpi_info['calc_status'] == 'Calculating':
-                kpi_info['progress'] = kpi_result['progress']
-                one_still_calculating = True
-            if kpi_info['calc_status'] == 'Success':
-                kpi_info['kpi'] = kpi_result['kpi']
-                if 'unit' in kpi_info:
-                    kpi_info['unit'] = kpi_result['unit']
-
-            kpis_this_sim_run.append(kpi_info)
+        kpis_this_sim_run, one_still_calculating = kpi_results_of_simulation(kpi_result_array, kpi_list)
 
         simid = get_session('es_simid')
         active_es_id = get_session('active_es_id')
@@ -12,15 +12,21 @@
 #  Manager:
 #      TNO
 
-from flask import Flask
+from flask import Flask, session
 from flask_socketio import SocketIO, emit
 from si_prefix import si_format
+from concurrent.futures import ThreadPoolExecutor
 from extensions.settings_storage import SettingsStorage
-from extensions.session_manager import get_handler, get_session, set_session, del_session
+from extensions.session_manager import get_handler, get_session, set_session, del_session, get_client_ids, \
+    get_session_of_client
+from esdl.esdl_handler import EnergySystemHandler
 from esdl.processing import ESDLEcore
 from src.esdl_helper import get_port_profile_info
-from extensions.essim import ESSIM
+from extensions.essim import ESSIM, simulation_payload, post_simulation, kpi_results_of_simulation
+import src.settings as settings
 import src.log as log
+import requests
+import threading
 import time
 import copy
 
@@ -35,6 +41,250 @@ def send_alert(message):
     emit('alert', message, namespace='/esdl')
 
 
+def get_obj_attr_name(esh, es_id, asset_id, attr):
+    if attr.startswith('attr_name_'):
+        object = esh.get_by_id(es_id, asset_id)
+        attr_name = attr.replace('attr_name_', '')
+    else:
+        # profile_id_
+        profile_id = attr.replace('profile_id_', '')
+        object = esh.get_by_id(es_id, profile_id)
+        attr_name = 'multiplier'
+
+    return object, attr_name
+
+
+def set_param(esh, es_id, object, attr_name, attr_value):
+    try:
+        attribute = object.eClass.findEStructuralFeature(attr_name)
+        if attribute is not None:
+            if attr_value == "":
+                parsed_value = attribute.eType.default_value
+            else:
+                parsed_value = attribute.eType.from_string(attr_value)
+            if attribute.many:
+                eOrderedSet = object.eGet(attr_name)
+                eOrderedSet.clear()  # TODO no support for multi-select of enums
+                eOrderedSet.append(parsed_value)
+                object.eSet(attr_name, eOrderedSet)
+            else:
+                if attribute.name == 'id':
+                    esh.remove_object_from_dict(es_id, object)
+                    object.eSet(attr_name, parsed_value)
+                    esh.add_object_to_dict(es_id, object)
+                else:
+                    object.eSet(attr_name, parsed_value)
+        else:
+            print('Error setting attribute {} of {} to {}, unknown attribute'.format(attr_name,
+                                                                                     object.name,
+                                                                                     attr_value))
+    except Exception as e:
+        print('Error setting attribute {} of {} to {}, caused by {}'.format(attr_name, object.name,
+                                                                            attr_value, str(e)))
+
+
+def apply_mutations(esh, es_id, var_list):
+    """Sets the values of a mutation of the sensitivity analysis in an energy system and returns its title"""
+    sim_title = ''
+    for v in var_list:
+        obj, attr_name = get_obj_attr_name(esh, es_id, v['asset_id'], v['attr'])
+        set_param(esh, es_id, obj, attr_name, v['value'])
+        if sim_title != '':
+            sim_title += ' & '
+        sim_title += attr_name + '=' + si_format(v['value'], precision=2)
+    return sim_title
+
+
+class SensitivityRun:
+    """State of the simulation of one mutation of a sensitivity analysis"""
+    def __init__(self, index, mutations):
+        self.index = index
+        self.mutations = mutations
+        self.title = None
+        self.sim_id = None
+        self.status = 'WAITING'     # WAITING, STARTING, CREATED, RUNNING, KPIS, COMPLETE, ERROR or CANCELLED
+        self.percentage = 0.0
+        self.dashboard_url = None
+        self.description = None
+        self.kpi_results = None     # KPI results as returned by ESSIM
+
+    def is_finished(self):
+        return self.status in ('COMPLETE', 'ERROR', 'CANCELLED')
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'title': self.title,
+            'simulationRun': self.sim_id,
+            'status': self.status,
+            'percentage': self.percentage,
+            'url': self.dashboard_url,
+            'description': self.description
+        }
+
+
+class SensitivityAnalysis:
+    """
+    Runs the simulations of a sensitivity analysis on the server, independent of the browser. Every mutation is
+    applied to its own copy of the energy system, loaded from the binary encoding of the energy system at the start
+    of the analysis (see EnergySystemHandler.to_binary()), so the energy system of the user is not changed. At most
+    max_concurrent simulations are started and monitored at the same time; on_update(analysis, run) is called
+    whenever the state of a simulation changes.
+    """
+    def __init__(self, es_data, mutations, payload, essim_url, max_concurrent=4, poll_interval=2.0,
+                 with_kpis=False, on_update=None):
+        self.es_data = es_data
+        self.runs = [SensitivityRun(i, m) for i, m in enumerate(mutations)]
+        self.payload = payload
+        self.essim_url = essim_url
+        self.max_concurrent = max(1, max_concurrent)
+        self.poll_interval = poll_interval
+        self.with_kpis = with_kpis
+        self.on_update = on_update
+        self.start_time = None
+        self.end_time = None
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._remaining = len(self.runs)
+        self._http = threading.local()
+
+    def start(self):
+        self.start_time = time.time()
+        if not self.runs:
+            self._finish()
+            return
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrent, len(self.runs)),
+                                      thread_name_prefix='ESSIM-Sensitivity')
+        for run in self.runs:
+            executor.submit(self._execute, run)
+        executor.shutdown(wait=False)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def is_finished(self):
+        return self._finished.is_set()
+
+    def progress(self):
+        return {
+            'total': len(self.runs),
+            'finished': sum(1 for run in self.runs if run.is_finished()),
+            'errors': sum(1 for run in self.runs if run.status == 'ERROR'),
+            'done': self.is_finished(),
+            'runs': [run.to_dict() for run in self.runs]
+        }
+
+    def _session(self):
+        # a requests session per worker thread, to reuse the connections to ESSIM
+        if not hasattr(self._http, 'session'):
+            self._http.session = requests.Session()
+        return self._http.session
+
+    def _update(self, run, **changes):
+        changed = False
+        for name, value in changes.items():
+            if getattr(run, name) != value:
+                setattr(run, name, value)
+                changed = True
+        if changed and self.on_update:
+            try:
+                self.on_update(self, run)
+            except Exception as e:
+                logger.error('Error reporting sensitivity analysis progress: {}'.format(e))
+
+    def _finish(self):
+        self.end_time = time.time()
+        self.es_data = None     # all simulations have been started, the energy system is not needed anymore
+        self._finished.set()
+        if self.on_update:
+            try:
+                self.on_update(self, None)
+            except Exception as e:
+                logger.error('Error reporting end of sensitivity analysis: {}'.format(e))
+
+    def _execute(self, run):
+        try:
+            if self._cancelled.is_set():
+                self._update(run, status='CANCELLED')
+            else:
+                self._start_simulation(run)
+                if run.sim_id:
+                    self._monitor_simulation(run)
+        except Exception as e:
+            logger.error('Error in simulation {} of sensitivity analysis: {}'.format(run.index, e))
+            self._update(run, status='ERROR', description=str(e))
+        finally:
+            with self._lock:
+                self._remaining -= 1
+                finished = self._remaining == 0
+            if finished:
+                self._finish()
+
+    def _start_simulation(self, run):
+        self._update(run, status='STARTING')
+        # the mutation is applied to an isolated copy of the energy system, that is released after starting
+        esh = EnergySystemHandler()
+        es, _ = esh.load_from_binary(self.es_data, name='sensitivity_{}'.format(run.index))
+        title = apply_mutations(esh, es.id, run.mutations)
+        payload = dict(self.payload, simulationDescription=title)
+        r = post_simulation(self.essim_url, payload, esh.to_chunks(es.id, compact=True), http=self._session())
+        if r.status_code == 201:
+            self._update(run, title=title, sim_id=r.json()['id'], status='CREATED')
+            logger.info('ESSIM sensitivity simulation {} started, sim_id: {}'.format(run.index, run.sim_id))
+        else:
+            self._update(run, title=title, status='ERROR',
+                         description='Error starting ESSIM simulation - response {} with reason: {}'.format(
+                             r.status_code, r.reason))
+
+    def _monitor_simulation(self, run):
+        url = self.essim_url + '/' + run.sim_id
+        while not self._cancelled.is_set():
+            r = self._session().get(url + '/status')
+            if r.status_code != 200:
+                self._update(run, status='ERROR', description='Error in getting the ESSIM progress status')
+                return
+            result = r.json()
+            status = result['State']
+            if status == 'ERROR':
+                self._update(run, status='ERROR', description=result.get('Description'))
+                return
+            if status == 'COMPLETE':
+                r = self._session().get(url)
+                dashboard_url = r.json().get('dashboardURL') if r.status_code == 200 else None
+                if self.with_kpis:
+                    self._update(run, status='KPIS', percentage=1.0, dashboard_url=dashboard_url)
+                    self._monitor_kpis(run)
+                else:
+                    self._update(run, status='COMPLETE', percentage=1.0, dashboard_url=dashboard_url)
+                return
+            percentage = 0.0 if status == 'CREATED' else float(result.get('Description', 0))
+            self._update(run, status=status, percentage=percentage)
+            self._cancelled.wait(self.poll_interval)
+        self._update(run, status='CANCELLED')
+
+    def _monitor_kpis(self, run):
+        url = self.essim_url + '/' + run.sim_id + '/kpi'
+        while not self._cancelled.is_set():
+            r = self._session().get(url)
+            if r.status_code == 200:
+                kpi_results = r.json()
+                if kpi_results is not None:
+                    _, still_calculating = kpi_results_of_simulation(kpi_results, None)
+                    if not still_calculating:
+                        run.kpi_results = kpi_results
+                        self._update(run, status='COMPLETE')
+                        return
+            else:
+                self._update(run, status='ERROR', description='Error in getting the ESSIM KPI results')
+                return
+            self._cancelled.wait(self.poll_interval)
+        self._update(run, status='CANCELLED')
+
+
 class ESSIMSensitivity:
     def __init__(self, flask_app: Flask, socket: SocketIO, settings_storage: SettingsStorage, essim: ESSIM):
         self.flask_app = flask_app
@@ -42,6 +292,9 @@ class ESSIMSensitivity:
         self.settings_storage = settings_storage
         self.essim = essim
         self.essim_sensitivity_plugin_settings = self.get_config()
+        self.analyses = dict()  # client_id -> SensitivityAnalysis
+        # the simulations of a user are stored in one settings entry, that is read, changed and written
+        self._store_lock = threading.Lock()
 
         self.register()
 
@@ -83,81 +336,105 @@ class ESSIMSensitivity:
             var_list = list()
             self.get_sa_mutations(sensitivity_info, sa_mutations, var_list)
             logger.info('Starting sensitivity analysis with {} mutations'.format(len(sa_mutations)))
+            if not sa_mutations:
+                return 0
 
-            sa_index = 0
-            var_list = sa_mutations[sa_index]
-
-            sim_title = ''
-            for v in var_list:
-                asset_id = v['asset_id']
-                attr = v['attr']
-                value = v['value']
-                obj, attr_name = self.get_obj_attr_name(asset_id, attr)
-                self.set_param(obj, attr_name, value)
-                if sim_title != '':
-                    sim_title += ' & '
-                sim_title += attr_name + '=' + si_format(value, precision=2)
-
-            result = self.essim.run_simulation(sim_title, sim_period_start, sim_period_end, selected_kpis, False)
-            if result:
-                set_session('sensitivity_analysis', {
-                    'index': sa_index,
-                    'info': sensitivity_info,
-                    'mutations': sa_mutations,
-                    'sim_period_start': sim_period_start,
-                    'sim_period_end': sim_period_end,
-                    'selected_kpis': selected_kpis
-                })
-            else:
-                del_session('sensitivity_analysis')
-
-            return result
-
-        @self.socketio.on('essim_sensitivity_next_simulation', namespace='/esdl')
-        def essim_sensitivity_next_simulation():
-            time.sleep(1)
-            sensitivity_analysis = get_session('sensitivity_analysis')
-            if sensitivity_analysis:
-                sensitivity_info = sensitivity_analysis['info']
-                sa_mutations = sensitivity_analysis['mutations']
-                sa_index = sensitivity_analysis['index']
-                sim_period_start = sensitivity_analysis['sim_period_start']
-                sim_period_end = sensitivity_analysis['sim_period_end']
-
-                sa_index = sa_index + 1
-                if sa_index == len(sa_mutations):
-                    del_session('sensitivity_analysis')
-                    return 0        # end of sensitivity analysis
-                var_list = sa_mutations[sa_index]
-
-                sim_title = ''
-                for v in var_list:
-                    asset_id = v['asset_id']
-                    attr = v['attr']
-                    value = v['value']
-                    obj, attr_name = self.get_obj_attr_name(asset_id, attr)
-                    self.set_param(obj, attr_name, value)
-                    if sim_title != '':
-                        sim_title += ' & '
-                    sim_title += attr_name + '=' + si_format(value, precision=2)
-
-                selected_kpis = sensitivity_analysis['selected_kpis']
-
-                result = self.essim.run_simulation(sim_title, sim_period_start, sim_period_end, selected_kpis, False)
-                if result:
-                    set_session('sensitivity_analysis', {
-                        'index': sa_index,
-                        'info': sensitivity_info,
-                        'mutations': sa_mutations,
-                        'sim_period_start': sim_period_start,
-                        'sim_period_end': sim_period_end,
-                        'selected_kpis': selected_kpis
-                    })
-
-                return result
-            else:
+            client_id = session['client_id']
+            self._remove_analyses_of_closed_sessions()
+            previous_analysis = self.analyses.get(client_id)
+            if previous_analysis:
+                previous_analysis.cancel()
+
+            esh = get_handler()
+            active_es_id = get_session('active_es_id')
+            user_fullname = get_session('user-fullname')
+            if user_fullname is None:
+                user_fullname = 'essim'
+            ESSIM_config = settings.essim_config
+            if not ESSIM_config['ESSIM_host']:
+                send_alert('ESSIM is not configured')
                 return 0
 
+            payload = simulation_payload(user_fullname, active_es_id, '', sim_period_start, sim_period_end,
+                                         selected_kpis)
+            analysis = SensitivityAnalysis(esh.to_binary(active_es_id), sa_mutations, payload,
+                                           ESSIM_config['ESSIM_host'] + ESSIM_config['ESSIM_path'],
+                                           max_concurrent=ESSIM_config['sensitivity_max_concurrent'],
+                                           poll_interval=ESSIM_config['sensitivity_poll_interval'],
+                                           with_kpis=bool(selected_kpis),
+                                           on_update=self._progress_reporter(client_id, get_session('user-email')))
+            self.analyses[client_id] = analysis
+            set_session('sensitivity_analysis', {
+                'info': sensitivity_info,
+                'sim_period_start': sim_period_start,
+                'sim_period_end': sim_period_end,
+                'selected_kpis': selected_kpis
+            })
+            analysis.start()
+            return 1
+
+        @self.socketio.on('essim_sensitivity_progress', namespace='/esdl')
+        def essim_sensitivity_progress():
+            # e.g. when the browser reconnects, the analysis continues on the server
+            analysis = self.analyses.get(session['client_id'])
+            if analysis:
+                return analysis.progress()
+            return None
+
+        @self.socketio.on('essim_sensitivity_cancel', namespace='/esdl')
+        def essim_sensitivity_cancel():
+            analysis = self.analyses.get(session['client_id'])
+            if analysis:
+                analysis.cancel()
+
+        @self.socketio.on('essim_sensitivity_show_kpis', namespace='/esdl')
+        def essim_sensitivity_show_kpis():
+            with self.flask_app.app_context():
+                analysis = self.analyses.get(session['client_id'])
+                if analysis:
+                    kpi_list = get_session('kpi_list')
+                    kpi_result_list = {
+                        'es_id': get_session('active_es_id'),
+                        'kpis_per_simid': dict()
+                    }
+                    for run in analysis.runs:
+                        if run.kpi_results is not None:
+                            kpi_result_list['kpis_per_simid'][run.sim_id], _ = \
+                                kpi_results_of_simulation(run.kpi_results, kpi_list)
+                    set_session('kpi_result_list', kpi_result_list)
+                    self.essim.emit_kpis_for_visualization(kpi_result_list)
+
+    def _progress_reporter(self, client_id, user_email):
+        """
+        Returns the on_update function of a SensitivityAnalysis, that sends the progress to the browser of the client.
+        The socket.io session of the client is looked up for every update, so a reloaded page keeps receiving them.
+        """
+        def emit_to_client(event, data):
+            sid = get_session_of_client(client_id, 'socketio_sid')
+            if sid is not None:
+                self.socketio.emit(event, data, namespace='/esdl', room=sid)
+
+        def on_update(analysis, run):
+            if run is None:
+                logger.info('Sensitivity analysis finished in {:.1f}s'.format(analysis.end_time - analysis.start_time))
+                emit_to_client('essim_sensitivity_finished', analysis.progress())
+                self._remove_analyses_of_closed_sessions()
+                return
+            if run.status == 'CREATED':
+                # runs are monitored by several threads
+                with self._store_lock:
+                    self.essim.store_simulation(user_email, run.sim_id, time.strftime("%Y-%m-%d %H:%M:%S"),
+                                                run.title, None)
+            emit_to_client('essim_sensitivity_run_progress', run.to_dict())
+        return on_update
+
+    def _remove_analyses_of_closed_sessions(self):
+        """Forgets the finished analyses of clients whose session has been cleaned up"""
+        client_ids = set(get_client_ids())
+        for client_id, analysis in list(self.analyses.items()):
+            if analysis.is_finished() and client_id not in client_ids:
+                self.analyses.pop(client_id, None)
+
     def get_sa_mutations(self, sensitivity_info, sa_mut: list, var_list: list, var_idx=0):
         num_vars = len(sensitivity_info)
         if var_idx < num_vars:
@@ -183,50 +460,3 @@ class ESSIMSensitivity:
                     current = current + attr_step
         else:
             sa_mut.append(copy.deepcopy(var_list))
-
-    def get_obj_attr_name(self, asset_id, attr):
-        with self.flask_app.app_context():
-            esh = get_handler()
-            active_es_id = get_session('active_es_id')
-
-            if attr.startswith('attr_name_'):
-                object = esh.get_by_id(active_es_id, asset_id)
-                attr_name = attr.replace('attr_name_', '')
-            else:
-                # profile_id_
-                profile_id = attr.replace('profile_id_', '')
-                object = esh.get_by_id(active_es_id, profile_id)
-                attr_name = 'multiplier'
-
-            return object, attr_name
-
-    def set_param(self, object, attr_name, attr_value):
-        with self.flask_app.app_context():
-            esh = get_handler()
-            active_es_id = get_session('active_es_id')
-            try:
-                attribute = object.eClass.findEStructuralFeature(attr_name)
-                if attribute is not None:
-                    if attr_value == "":
-                        parsed_value = attribute.eType.default_value
-                    else:
-                        parsed_value = attribute.eType.from_string(attr_value)
-                    if attribute.many:
-                        eOrderedSet = object.eGet(attr_name)
-                        eOrderedSet.clear()  # TODO no support for multi-select of enums
-                        eOrderedSet.append(parsed_value)
-                        object.eSet(attr_name, eOrderedSet)
-                    else:
-                        if attribute.name == 'id':
-                            esh.remove_object_from_dict(active_es_id, object)
-                            object.eSet(attr_name, parsed_value)
-                            esh.add_object_to_dict(active_es_id, object)
-                        else:
-                            object.eSet(attr_name, parsed_value)
-                else:
-                    print('Error setting attribute {} of {} to {}, unknown attribute'.format(attr_name,
-                                                                                             object.name,
-                                                                                             attr_value))
-            except Exception as e:
-                print('Error setting attribute {} of {} to {}, caused by {}'.format(attr_name, object.name,
-                                                                                    attr_value, str(e)))
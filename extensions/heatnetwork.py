@@ -265,7 +265,8 @@ def _shift_point(point: Point):
 def duplicate_energy_asset(esh: EnergySystemHandler, es_id, energy_asset_id: str):
     original_asset = esh.get_by_id(es_id, energy_asset_id)
 
-    duplicate_asset = original_asset.deepcopy()
+    # the ports of the duplicate refer to the same carriers, their connections are removed below
+    duplicate_asset = original_asset.deepcopy(keep_external_references=True)
     # reset all id's
     for c in duplicate_asset.eContents:
         if c.eClass.findEStructuralFeature('id'):
@@ -14,8 +14,10 @@
 
 from flask import session
 from esdl.esdl_handler import EnergySystemHandler
-from datetime import datetime
+from esdl.edit_journal import EditJournalDirectory
+from extensions.session_store import create_session_backend
 import esdl.processing.EcoreDocumentation as esdl_doc
+import src.settings as settings
 import threading
 import time
 import src.log as log
@@ -24,25 +26,38 @@ import os, glob
 logger = log.get_logger(__name__)
 managed_sessions = dict()
 ESH_KEY = 'esh'
-LAST_ACCESSED_KEY = 'last-accessed'
 SESSION_TIMEOUT = 60*60*24  # 1 day
 CLEANUP_INTERVAL = 60*60  # every hour
 
+# where the session values are kept, by default in managed_sessions. Use a filesystem or Redis session store
+# (see settings.session_store_config) when running multiple worker processes
+session_backend = create_session_backend(dict(settings.session_store_config, timeout=SESSION_TIMEOUT),
+                                         managed_sessions)
+
+# journals of the changes of the energy systems in the sessions, to restore them after a restart
+edit_journals = EditJournalDirectory(settings.edit_journal_config['path']) \
+    if settings.edit_journal_config['path'] else None
+
 
 def get_handler():
-    global managed_sessions
     client_id = session['client_id']
-    if client_id in managed_sessions:
-        if ESH_KEY in managed_sessions[client_id]:
-            esh = managed_sessions[client_id][ESH_KEY]
+    if session_backend.has_client(client_id):
+        esh = session_backend.get(client_id, ESH_KEY)
+        if esh is not None:
             logger.debug('Retrieve ESH client_id={}'.format(client_id))
         else:
-            logger.warning('No EnergySystemHandler in session. Returning empty energy system')
-            esh = EnergySystemHandler()
-            esh.create_empty_energy_system('Untitled EnergySystem', '', 'Untitled Instance', 'Untitled Area', esdlVersion=esdl_doc.esdlVersion)
+            esh = _restore_handler(client_id)
+            if esh is None:
+                logger.warning('No EnergySystemHandler in session. Returning empty energy system')
+                esh = EnergySystemHandler()
+                esh.create_empty_energy_system('Untitled EnergySystem', '', 'Untitled Instance', 'Untitled Area', esdlVersion=esdl_doc.esdlVersion)
             set_handler(esh)
         return esh
     else:
+        esh = _restore_handler(client_id)
+        if esh is not None:
+            set_handler(esh)
+            return esh
         logger.warning('Session has timed-out. Returning empty energy system')
         esh = EnergySystemHandler()
         esh.create_empty_energy_system('Untitled EnergySystem', '', 'Untitled Instance', 'Untitled Area', esdlVersion=esdl_doc.esdlVersion)
@@ -50,8 +65,20 @@ def get_handler():
         return esh
 
 
+def _restore_handler(client_id):
+    """Returns the energy systems of the session as restored from the edit journal, or None"""
+    if edit_journals is None or not edit_journals.has_client(client_id):
+        return None
+    try:
+        esh = edit_journals.restore(client_id)
+        logger.info('Restored ESH from edit journal client_id={}'.format(client_id))
+        return esh
+    except Exception as e:
+        logger.exception('Cannot restore ESH from edit journal client_id={}: {}'.format(client_id, e))
+        return None
+
+
 def set_handler(esh):
-    global managed_sessions
     client_id = session['client_id']
     logger.debug('Set ESH client_id={}'.format(client_id))
     set_session(ESH_KEY, esh)
@@ -64,17 +91,12 @@ def valid_session():
 
 
 def set_session(key, value):
-    global managed_sessions
     #logger.debug('Current Thread %s' % threading.currentThread().getName())
     if 'client_id' not in session:
         logger.warning('No client_id for the session is available, cannot set value for key {}'.format(key))
         return
     client_id = session['client_id']
-    if client_id not in managed_sessions:
-        managed_sessions[client_id] = dict()
-    managed_sessions[client_id][LAST_ACCESSED_KEY] = datetime.now()
-    managed_sessions[client_id][key] = value
-    #logger.debug(managed_sessions)
+    session_backend.set(client_id, key, value)
 
 
 def get_session(key=None):
@@ -83,51 +105,72 @@ def get_session(key=None):
     :param key: key to retrieve a value for. If key is None, it will return the whole session for this client
     :return:
     """
-    global managed_sessions
     if 'client_id' not in session:
         logger.warning('No client id for the session is available, cannot return value for key {}'.format(key))
         return None
     client_id = session['client_id']
-    if client_id not in managed_sessions:
+    if not session_backend.has_client(client_id):
         logger.warning('No client id in the managed_sessions is available, cannot return value for key {}'.format(key))
         return None
     else:
         if key is None:
-            return managed_sessions[client_id]
+            return session_backend.get_all(client_id)
         else:
             try:
-                return managed_sessions[client_id][key]
+                return session_backend.get(client_id, key)
             except:
                 return None
 
 
 def del_session(key):
-    global managed_sessions
     client_id = session['client_id']
-    if client_id not in managed_sessions:
+    if not session_backend.has_client(client_id):
         logger.warning('No client id for the session is available, cannot return value for key {}'.format(key))
         return None
     else:
-        if key in managed_sessions[client_id]:
-            del managed_sessions[client_id][key]
+        session_backend.delete(client_id, key)
+
+
+def commit_session(exception=None):
+    """
+    Stores the session values that have been changed during this request in the session store, such that other
+    worker processes see them. Registered as teardown_request function, which is also called after each socket.io
+    event. Does nothing for the default in-memory sessions.
+    """
+    if 'client_id' in session:
+        client_id = session['client_id']
+        session_backend.commit(client_id)
+        if edit_journals is not None:
+            esh = session_backend.get(client_id, ESH_KEY) if session_backend.has_client(client_id) else None
+            if esh is not None:
+                try:
+                    edit_journals.sync(client_id, esh)
+                except Exception as e:
+                    logger.exception('Cannot write edit journal client_id={}: {}'.format(client_id, e))
+
+
+def get_client_ids():
+    """Returns the client ids of all sessions"""
+    return session_backend.client_ids()
+
+
+def get_session_of_client(client_id, key):
+    """Returns a session value of another client (e.g. to find the socket.io session of a user)"""
+    if not session_backend.has_client(client_id):
+        return None
+    return session_backend.get(client_id, key)
 
 
 def clean_up_sessions():
-    global managed_sessions
     logger.debug('Current Thread %s' % threading.currentThread().getName())
-    logger.info('Clean up sessions: current number of sessions: {}'.format(len(managed_sessions)))
-    for key in list(managed_sessions.keys()):  # make a copy of the keys in the list
-        last_accessed = managed_sessions[key][LAST_ACCESSED_KEY]
-        now = datetime.now()
-        difference = (now - last_accessed).total_seconds()
-        if difference > SESSION_TIMEOUT:
-            logger.info('Cleaning up session with client_id={}'.format(key))
-            del managed_sessions[key]
+    logger.info('Clean up sessions: current number of sessions: {}'.format(len(session_backend.client_ids())))
+    session_backend.clean_up(SESSION_TIMEOUT)
+    if edit_journals is not None:
+        edit_journals.clean_up(SESSION_TIMEOUT)
 
 
 def schedule_session_clean_up():
     logger.info("Scheduling session clean-up thread every {} seconds".format(CLEANUP_INTERVAL))
-    global managed_sessions
     clean_thread = threading.Thread(target=_clean_up_sessions_every_hour, name='Session-Cleanup-Thread')
     clean_thread.start()
 
@@ -0,0 +1,524 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Session backends for the session_manager.
+
+The MemorySessionBackend keeps all session values of all clients in a dict in this process, which only works when
+the MapEditor runs in a single process. The SharedSessionBackend stores the session values as bytes in a store that
+can be shared by multiple (uWSGI worker) processes: a directory on the local filesystem (FileSystemByteStore) or a
+local Redis compatible server (RedisByteStore).
+
+Each stored value has a version stamp that is increased at every write. A value is only written when the stored
+version is still the version it was read at (compare-and-set), so when two processes change the same value
+concurrently, the last one to commit gets a VersionConflict instead of silently overwriting the other's changes;
+commit() logs and returns the conflicting keys and discards the local value. A process keeps the values it has decoded in
+a local cache together with their version, and only decodes (rehydrates) a value again when it is requested and
+another process has written a newer version. EnergySystemHandlers are stored as binary snapshots (see
+EnergySystemHandler.to_snapshot()), all other values are pickled.
+
+As the values returned by get() are often changed in place (e.g. the energy system in the handler), the shared
+backend writes the values that have been handed out to a client when commit() is called at the end of the request,
+but only if they have been changed.
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from pyecore.notification import EObserver
+from esdl.esdl_handler import EnergySystemHandler, SNAPSHOT_MAGIC
+from urllib.parse import quote, unquote
+import hashlib
+import os
+import pickle
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import src.log as log
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the MapEditor runs as a single process
+    fcntl = None
+
+logger = log.get_logger(__name__)
+
+LAST_ACCESSED_KEY = 'last-accessed'
+
+
+class MemorySessionBackend:
+    """Keeps the session values as objects in a dict in this process, this is the original behaviour"""
+    def __init__(self, sessions: dict):
+        self.sessions = sessions
+
+    def has_client(self, client_id):
+        return client_id in self.sessions
+
+    def get(self, client_id, key):
+        return self.sessions[client_id].get(key)
+
+    def get_all(self, client_id):
+        return self.sessions[client_id]
+
+    def set(self, client_id, key, value):
+        if client_id not in self.sessions:
+            self.sessions[client_id] = dict()
+        self.sessions[client_id][LAST_ACCESSED_KEY] = datetime.now()
+        self.sessions[client_id][key] = value
+
+    def delete(self, client_id, key):
+        if key in self.sessions[client_id]:
+            del self.sessions[client_id][key]
+
+    def client_ids(self):
+        return list(self.sessions.keys())
+
+    def commit(self, client_id):
+        return []
+
+    def clean_up(self, timeout):
+        for client_id in list(self.sessions.keys()):  # make a copy of the keys in the list
+            last_accessed = self.sessions[client_id][LAST_ACCESSED_KEY]
+            difference = (datetime.now() - last_accessed).total_seconds()
+            if difference > timeout:
+                logger.info('Cleaning up session with client_id={}'.format(client_id))
+                del self.sessions[client_id]
+
+
+class ByteStore(ABC):
+    """Stores versioned bytes per client and key"""
+
+    @abstractmethod
+    def version(self, client_id, key):
+        """:return: the version of the value of key, or None if there is no value"""
+        pass
+
+    @abstractmethod
+    def read(self, client_id, key):
+        """:return: tuple (version, data) or None if there is no value"""
+        pass
+
+    @abstractmethod
+    def write(self, client_id, key, data: bytes, expected_version=None) -> int:
+        """
+        Writes the value and returns its new version. When expected_version is given, the value is only written
+        when the stored value still has that version, otherwise VersionConflict is raised.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, client_id, key):
+        pass
+
+    @abstractmethod
+    def keys(self, client_id) -> list:
+        pass
+
+    @abstractmethod
+    def client_ids(self) -> list:
+        pass
+
+    @abstractmethod
+    def clean_up(self, timeout):
+        """Removes all values of clients that have not been written to for timeout seconds"""
+        pass
+
+
+class FileSystemByteStore(ByteStore):
+    """
+    Stores each value in a separate file <path>/<client_id>/<key>, starting with its version as 8 byte integer.
+    Files are replaced atomically, so readers in other processes never see a partially written value. Writers lock
+    the file <path>/<client_id>/.lock while they check the version and replace the file.
+    """
+    VERSION_HEADER = '<Q'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _client_dir(self, client_id):
+        return os.path.join(self.path, quote(client_id, safe=''))
+
+    def _file(self, client_id, key):
+        return os.path.join(self._client_dir(client_id), quote(key, safe=''))
+
+    def version(self, client_id, key):
+        try:
+            with open(self._file(client_id, key), 'rb') as f:
+                return struct.unpack(self.VERSION_HEADER, f.read(struct.calcsize(self.VERSION_HEADER)))[0]
+        except FileNotFoundError:
+            return None
+
+    def read(self, client_id, key):
+        try:
+            with open(self._file(client_id, key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        header_size = struct.calcsize(self.VERSION_HEADER)
+        return struct.unpack(self.VERSION_HEADER, data[:header_size])[0], data[header_size:]
+
+    @contextmanager
+    def _locked(self, client_dir):
+        with open(os.path.join(client_dir, self.LOCK_FILE), 'ab') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+            yield
+
+    def write(self, client_id, key, data: bytes, expected_version=None) -> int:
+        client_dir = self._client_dir(client_id)
+        os.makedirs(client_dir, exist_ok=True)
+        with self._locked(client_dir):
+            version = self.version(client_id, key)
+            if expected_version is not None and version != expected_version:
+                raise VersionConflict(client_id, key, expected_version, version)
+            version = (version or 0) + 1
+            fd, tmp_file = tempfile.mkstemp(dir=client_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack(self.VERSION_HEADER, version))
+                f.write(data)
+            os.replace(tmp_file, self._file(client_id, key))
+        return version
+
+    def delete(self, client_id, key):
+        try:
+            os.remove(self._file(client_id, key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, client_id) -> list:
+        try:
+            return [unquote(f) for f in os.listdir(self._client_dir(client_id)) if not f.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    def client_ids(self) -> list:
+        return [unquote(d) for d in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, d))]
+
+    def clean_up(self, timeout):
+        now = time.time()
+        for client_id in self.client_ids():
+            client_dir = self._client_dir(client_id)
+            files = [os.path.join(client_dir, f) for f in os.listdir(client_dir)]
+            last_modified = max([os.path.getmtime(f) for f in files], default=0)
+            if now - last_modified > timeout:
+                logger.info('Cleaning up session with client_id={}'.format(client_id))
+                shutil.rmtree(client_dir, ignore_errors=True)
+
+
+class RedisError(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """Raised when a value is written that has been changed by another process since it was read"""
+    def __init__(self, client_id, key, expected_version, version):
+        super().__init__('Session value {} of client {} has version {}, expected version {}'.format(
+            key, client_id, version, expected_version))
+        self.client_id = client_id
+        self.key = key
+
+
+class RedisByteStore(ByteStore):
+    """
+    Stores the values of a client in a Redis hash '<prefix>:<client_id>' with a '<key>:v' (version) and a
+    '<key>:d' (data) field per key. Uses a minimal RESP client over a unix domain socket or TCP connection, one
+    connection per thread. The hash expires when it has not been written for timeout seconds. Values are written
+    by a Lua script, which checks the version and writes the value atomically.
+    """
+    # KEYS[1]: hash, ARGV: key, data, expected version ('' when any version may be overwritten), timeout
+    WRITE_SCRIPT = """
+local version = redis.call('HGET', KEYS[1], ARGV[1] .. ':v')
+if ARGV[3] ~= '' and version ~= ARGV[3] then
+    return {0, version}
+end
+version = redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':v', 1)
+redis.call('HSET', KEYS[1], ARGV[1] .. ':d', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, version}
+"""
+
+    def __init__(self, unix_socket=None, host='localhost', port=6379, prefix='esdl-mapeditor-session',
+                 timeout=60*60*24):
+        self.unix_socket = unix_socket
+        self.host = host
+        self.port = int(port)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.unix_socket:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.unix_socket)
+            else:
+                sock = socket.create_connection((self.host, self.port))
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    @staticmethod
+    def _encode_command(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('UTF-8')
+            elif isinstance(arg, int):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n' % len(arg))
+            parts.append(arg)
+            parts.append(b'\r\n')
+        return b''.join(parts)
+
+    @staticmethod
+    def _read_reply(reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by Redis server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [RedisByteStore._read_reply(reader) for _ in range(length)]
+        raise RedisError('Unknown reply from Redis server: {}'.format(line))
+
+    def execute(self, *commands):
+        """Executes one or more commands (each a tuple of arguments) in one round trip and returns the replies"""
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b''.join(self._encode_command(args) for args in commands))
+            return [self._read_reply(reader) for _ in commands]
+        except (OSError, ConnectionError):
+            self._local.conn = None
+            sock.close()
+            raise
+
+    def _hash(self, client_id):
+        return '{}:{}'.format(self.prefix, client_id)
+
+    def version(self, client_id, key):
+        version = self.execute(('HGET', self._hash(client_id), key + ':v'))[0]
+        return None if version is None else int(version)
+
+    def read(self, client_id, key):
+        version, data = self.execute(('HMGET', self._hash(client_id), key + ':v', key + ':d'))[0]
+        if version is None or data is None:
+            return None
+        return int(version), data
+
+    def write(self, client_id, key, data: bytes, expected_version=None) -> int:
+        written, version = self.execute(('EVAL', self.WRITE_SCRIPT, 1, self._hash(client_id), key, data,
+                                         '' if expected_version is None else expected_version, self.timeout))[0]
+        if not written:
+            raise VersionConflict(client_id, key, expected_version, None if version is None else int(version))
+        return int(version)
+
+    def delete(self, client_id, key):
+        self.execute(('HDEL', self._hash(client_id), key + ':v', key + ':d'))
+
+    def keys(self, client_id) -> list:
+        fields = self.execute(('HKEYS', self._hash(client_id)))[0]
+        return [f.decode('UTF-8')[:-2] for f in fields if f.endswith(b':v')]
+
+    def client_ids(self) -> list:
+        names = self.execute(('KEYS', self.prefix + ':*'))[0]
+        return [n.decode('UTF-8')[len(self.prefix) + 1:] for n in names]
+
+    def clean_up(self, timeout):
+        pass  # the hashes expire by themselves
+
+
+class _ChangeCounter(EObserver):
+    """Counts the notifications of the resources of an EnergySystemHandler, to detect changes of the model"""
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.resources = set()
+
+    def observe_resources(self, esh: EnergySystemHandler):
+        for resource in esh.rset.resources.values():
+            if resource not in self.resources:
+                self.observe(resource)
+                self.resources.add(resource)
+
+    def notifyChanged(self, notification):
+        self.count += 1
+
+
+class _CacheEntry:
+    def __init__(self, version, value, digest=None):
+        self.version = version  # the stored version the value is based on, None when it was never read or written
+        self.value = value
+        self.digest = digest    # hash of the written bytes, or a fingerprint of an EnergySystemHandler
+        self.change_counter = None
+
+
+def _handler_fingerprint(esh: EnergySystemHandler, counter: _ChangeCounter):
+    return (counter.count, id(esh.rset), id(esh.resource), tuple(esh.rset.resources.keys()),
+            tuple(esh.esid_uri_dict.items()))
+
+
+class SharedSessionBackend:
+    """Session values in a ByteStore with a local cache of rehydrated values per version"""
+    def __init__(self, store: ByteStore):
+        self.store = store
+        self._cache = dict()        # client_id -> {key: _CacheEntry}
+        self._handed_out = dict()   # client_id -> set of keys that could be changed in place before commit()
+        self._lock = threading.RLock()
+
+    def has_client(self, client_id):
+        return client_id in self._cache or len(self.store.keys(client_id)) > 0
+
+    def get(self, client_id, key):
+        version = self.store.version(client_id, key)
+        with self._lock:
+            client_cache = self._cache.setdefault(client_id, dict())
+            entry = client_cache.get(key)
+            if entry is not None and entry.version is not None and entry.version != version:
+                entry = None  # changed or deleted by another process
+            if entry is None:
+                if version is None:
+                    client_cache.pop(key, None)
+                    return None
+                version, data = self.store.read(client_id, key)
+                entry = self._decode(version, data)
+                client_cache[key] = entry
+            self._handed_out.setdefault(client_id, set()).add(key)
+            return entry.value
+
+    def get_all(self, client_id):
+        return {key: self.get(client_id, key) for key in self.store.keys(client_id)}
+
+    def set(self, client_id, key, value):
+        with self._lock:
+            client_cache = self._cache.setdefault(client_id, dict())
+            entry = client_cache.get(key)
+            if entry is None or entry.value is not value:
+                client_cache[key] = _CacheEntry(None if entry is None else entry.version, value)
+            handed_out = self._handed_out.setdefault(client_id, set())
+            handed_out.add(key)
+            client_cache[LAST_ACCESSED_KEY] = _CacheEntry(None, datetime.now())
+            handed_out.add(LAST_ACCESSED_KEY)
+
+    def delete(self, client_id, key):
+        with self._lock:
+            self._cache.get(client_id, dict()).pop(key, None)
+            self._handed_out.get(client_id, set()).discard(key)
+        self.store.delete(client_id, key)
+
+    def client_ids(self):
+        return self.store.client_ids()
+
+    def commit(self, client_id):
+        """
+        Writes the values that have been handed out to or set by this client, when they have been changed.
+        :return: the keys of the values that were not written, because another process has changed them since they
+        were read. The local values of these keys are discarded, get() returns the value of the other process.
+        """
+        conflicts = []
+        with self._lock:
+            keys = self._handed_out.pop(client_id, set())
+            client_cache = self._cache.get(client_id, dict())
+            for key in keys:
+                entry = client_cache.get(key)
+                if entry is None:
+                    continue
+                try:
+                    self._write_if_changed(client_id, key, entry)
+                except VersionConflict as e:
+                    logger.warning('Changes of session value {} of client {} are lost, it has been changed by '
+                                   'another process: {}'.format(key, client_id, e))
+                    del client_cache[key]
+                    conflicts.append(key)
+                except Exception as e:
+                    logger.warning('Cannot store session value {} of client {}: {}'.format(key, client_id, e))
+        return conflicts
+
+    def clean_up(self, timeout):
+        self.store.clean_up(timeout)
+        with self._lock:
+            for client_id in list(self._cache.keys()):
+                if client_id not in self._handed_out and not self.store.keys(client_id):
+                    del self._cache[client_id]
+
+    def _decode(self, version, data):
+        # pickled values start with the PROTO opcode (0x80), so they are never mistaken for a snapshot
+        if data[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC:
+            esh = EnergySystemHandler.from_snapshot(data)
+            entry = _CacheEntry(version, esh)
+            entry.change_counter = _ChangeCounter()
+            entry.change_counter.observe_resources(esh)
+            entry.digest = _handler_fingerprint(esh, entry.change_counter)
+        else:
+            entry = _CacheEntry(version, pickle.loads(data), hashlib.sha1(data).digest())
+        return entry
+
+    def _write_if_changed(self, client_id, key, entry: _CacheEntry):
+        value = entry.value
+        if isinstance(value, EnergySystemHandler):
+            if entry.change_counter is None:
+                entry.change_counter = _ChangeCounter()
+            counter = entry.change_counter
+            counter.observe_resources(value)
+            fingerprint = _handler_fingerprint(value, counter)
+            if entry.version is not None and fingerprint == entry.digest:
+                return
+            entry.version = self.store.write(client_id, key, value.to_snapshot(), entry.version)
+            entry.digest = fingerprint
+        else:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.sha1(data).digest()
+            if entry.version is not None and digest == entry.digest:
+                return
+            entry.version = self.store.write(client_id, key, data, entry.version)
+            entry.digest = digest
+
+
+def create_session_backend(config: dict, sessions: dict):
+    """
+    Creates the session backend from the session_store_config in settings:
+    type 'memory' (default), 'filesystem' (uses 'path') or 'redis' (uses 'redis_socket' or 'redis_host' and
+    'redis_port')
+    """
+    store_type = (config.get('type') or 'memory').lower()
+    if store_type == 'memory':
+        return MemorySessionBackend(sessions)
+    if store_type == 'filesystem':
+        logger.info('Using session store in directory {}'.format(config['path']))
+        return SharedSessionBackend(FileSystemByteStore(config['path']))
+    if store_type == 'redis':
+        logger.info('Using Redis session store at {}'.format(config.get('redis_socket') or config.get('redis_host')))
+        return SharedSessionBackend(RedisByteStore(unix_socket=config.get('redis_socket'),
+                                                   host=config.get('redis_host') or 'localhost',
+                                                   port=config.get('redis_port') or 6379,
+                                                   timeout=config.get('timeout') or 60*60*24))
+    raise ValueError('Unknown session store type {}'.format(store_type))
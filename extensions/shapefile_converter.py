@@ -24,21 +24,101 @@ import zipfile
 import tempfile
 import glob
 from uuid import uuid4
-from esdl.processing.ESDLGeometry import distance
+from esdl.processing.ESDLGeometry import update_conductor_lengths
 from pyproj import Proj, Transformer
 from pyecore.ecore import EClass
 import shapefile
-import importlib
+import numpy as np
+import time
+from functools import lru_cache
+from itertools import islice
 from src.process_es_area_bld import process_energy_system
 import src.log as log
 
 logger = log.get_logger(__name__)
 
+# number of shape records that are read at once, the coordinates of all records in a batch are transformed together
+RECORD_BATCH_SIZE = 10000
 
 inner_diameter_keys = ('inner diam', 'diameter', 'inner diameter', 'innerdiameter')
 outer_diameter_keys = ('outer diam', 'diameter', 'outer diameter', 'outerdiameter')
 name_keys = ('name', 'naam', 'layer')
 
+class RecordFields:
+    """Positions of the fields of the records of a shapefile that are used to create ESDL objects"""
+    def __init__(self, fields):
+        # the first field is the deletion flag, it is not part of the records
+        names = [field[0].lower() for field in fields if field[0] != 'DeletionFlag']
+        self.name = self._find(names, name_keys)
+        self.type = self._find(names, ('type',))
+        self.inner_diameter = self._find(names, inner_diameter_keys)
+        self.outer_diameter = self._find(names, outer_diameter_keys)
+
+    @staticmethod
+    def _find(names, possible_names):
+        for index, name in enumerate(names):
+            if name in possible_names:
+                return index
+        return None
+
+    @staticmethod
+    def get(record, index, default_value=None):
+        if index is None:
+            return default_value
+        return record[index]
+
+
+@lru_cache(maxsize=None)
+def _energy_asset_types():
+    types = list()
+    for esdl_type in esdl.eClassifiers:
+        t: EClass = esdl.getEClassifier(esdl_type).eClass
+        if esdl.EnergyAsset.eClass in t.eAllSuperTypes():
+            types.append(esdl_type)
+    return types
+
+
+@lru_cache(maxsize=1024)
+def find_energy_asset_type(value):
+    """Returns the first EnergyAsset class of which the name contains value, or GenericProducer"""
+    if value is not None:
+        for esdl_type in _energy_asset_types():
+            if str(value).lower() in esdl_type.lower():
+                logger.debug('Using {} as type for shapes with type {}'.format(esdl_type, value))
+                return esdl.getEClassifier(esdl_type)
+    return esdl.GenericProducer
+
+
+def transform_shape_points(transformer, shape_points):
+    """
+    Transforms the points of a list of shapes with a single call to the transformer
+    :param shape_points: list with the list of points ((x, y) pairs) of each shape
+    :return: list with a tuple (lons, lats) of lists of transformed coordinates for each shape
+    """
+    lengths = [len(points) for points in shape_points]
+    total = sum(lengths)
+    if total == 0:
+        return [([], []) for _ in shape_points]
+    xs = np.empty(total)
+    ys = np.empty(total)
+    offset = 0
+    for points, length in zip(shape_points, lengths):
+        if length:
+            array = np.asarray(points, dtype=np.float64)
+            xs[offset:offset + length] = array[:, 0]
+            ys[offset:offset + length] = array[:, 1]
+        offset += length
+    lons, lats = transformer.transform(xs, ys)
+    lons = np.asarray(lons).tolist()
+    lats = np.asarray(lats).tolist()
+    result = list()
+    offset = 0
+    for length in lengths:
+        result.append((lons[offset:offset + length], lats[offset:offset + length]))
+        offset += length
+    return result
+
+
 #FIXME: the row-indexed array won't work if multiple people are uploading zipfiles
 #FIXME: the tempdir is never cleaned
 #FIXME: use a unique id to have a common link to a zipfile and store the tempdir
@@ -165,155 +245,136 @@ class ShapefileConverter:
         print("File: ", filename)
         print("- Shapefile: ", sf)
         print("- Fields: ", sf.fields)
-        print("- # Shaperecords: ", len(sf.shapeRecords()))
+        print("- # Shaperecords: ", len(sf))
 
-        self.to_esdl(area, sf, transformer, energy_asset)
+        timings = self.to_esdl(area, sf, transformer, energy_asset)
+        print("- Timings: " + ", ".join('{} {:.3f}s'.format(phase, t) for phase, t in timings.items()))
 
     def to_esdl(self, area, sf, transformer, energy_asset):
+        """
+        Converts all shape records of the shapefile to ESDL and adds them to area. The records are read once, in
+        batches of RECORD_BATCH_SIZE records, of which all coordinates are transformed with a single call to pyproj.
+        :return: dict with the time spent per phase (reading records, transforming coordinates, creating ESDL)
+        """
+        timings = {'read': 0.0, 'transform': 0.0, 'convert': 0.0}
+        fields = RecordFields(sf.fields)
+        if energy_asset in ("type_record", "esdl_area"):
+            esdl_class = None
+        else:
+            esdl_class = getattr(esdl, energy_asset)
+
         i = 0
-        for shapeRecord in sf.shapeRecords():
-            i += 1
-            if shapeRecord.shape.shapeType == shapefile.POLYLINE:
-                print('{} {} = {}'.format(shapeRecord.shape.shapeTypeName, shapeRecord.record[0],
-                                          shapeRecord.shape.points))
-                pipe = esdl.Pipe(name=area.name + '-Pipe' + str(i), id=str(uuid4()))
-                line = esdl.Line()
-                d = 0.0
-                prevlat, prevlon = None, None
-                for point in shapeRecord.shape.points:
-                    lon, lat = transformer.transform(point[0], point[1])
-                    p = esdl.Point(lat=lat, lon=lon)
-                    line.point.append(p)
-                    if prevlat is not None:
-                        d = d + distance((prevlat, prevlon), (lat, lon))
-                    prevlat, prevlon = lat, lon
-                pipe.length = d * 1000  # in m instead of km
-
-                # diameter was put in mm!
-                pipe.innerDiameter = float(self.get_recordproperty(shapeRecord.record, inner_diameter_keys, 0.0)) / 1000
-                pipe.outerDiameter = float(self.get_recordproperty(shapeRecord.record, outer_diameter_keys, 0.0)) / 1000
-
-                pipe.geometry = line
-                inport = esdl.InPort(id=str(uuid4()), name='InPort')
-                outport = esdl.OutPort(id=str(uuid4()), name='OutPort')
-                pipe.port.extend((inport, outport))
-                area.asset.append(pipe)
-
-            if shapeRecord.shape.shapeType == shapefile.POINT:
-                # probably an asset
-
-                if energy_asset == "type_record":
-                    esdl_type = self.get_type(shapeRecord.record)
-                    esdl_object = esdl_type(name=self.get_name(shapeRecord.record), id=str(uuid4()))
-                else:
-                    module = importlib.import_module('esdl.esdl')
-                    class_ = getattr(module, energy_asset)
-                    esdl_object = class_()
-                    esdl_object.id = str(uuid4())
-                    esdl_object.name = self.get_name(shapeRecord.record)
-
-                # instance = esdl.GenericProducer(name=get_name(shapeRecord.record), id=str(uuid4()))
-                point = shapeRecord.shape.points[0]
-                lon, lat = transformer.transform(point[0], point[1])
-                p = esdl.Point(lat=lat, lon=lon)
-                esdl_object.geometry = p
+        shape_records = sf.iterShapeRecords()
+        while True:
+            start = time.perf_counter()
+            batch = list(islice(shape_records, RECORD_BATCH_SIZE))
+            timings['read'] += time.perf_counter() - start
+            if not batch:
+                break
+
+            start = time.perf_counter()
+            coordinates = transform_shape_points(transformer, [shape_record.shape.points for shape_record in batch])
+            timings['transform'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            pipes = []
+            for shape_record, (lons, lats) in zip(batch, coordinates):
+                i += 1
+                pipe = self.shape_record_to_esdl(area, shape_record, lons, lats, fields, energy_asset, esdl_class, i)
+                if pipe is not None:
+                    pipes.append(pipe)
+            # the lengths of all pipes of the batch are calculated at once
+            update_conductor_lengths(pipes)
+            timings['convert'] += time.perf_counter() - start
+
+        timings['total'] = sum(timings.values())
+        logger.info('Converted {} shape records to ESDL: {}'.format(i, timings))
+        return timings
+
+    def shape_record_to_esdl(self, area, shape_record, lons, lats, fields, energy_asset, esdl_class, i):
+        """Adds the ESDL of a shape record to area, returns the pipe of a polyline (of which the length is not set)"""
+        shape_type = shape_record.shape.shapeType
+        record = shape_record.record
+        pipe = None
+        if shape_type == shapefile.POLYLINE:
+            logger.debug('{} {} with {} points'.format(shape_record.shape.shapeTypeName, record[0], len(lons)))
+            pipe = esdl.Pipe(name=area.name + '-Pipe' + str(i), id=str(uuid4()))
+            line = esdl.Line()
+            for lon, lat in zip(lons, lats):
+                line.point.append(esdl.Point(lat=lat, lon=lon))
+
+            # diameter was put in mm!
+            pipe.innerDiameter = float(fields.get(record, fields.inner_diameter, 0.0)) / 1000
+            pipe.outerDiameter = float(fields.get(record, fields.outer_diameter, 0.0)) / 1000
+
+            pipe.geometry = line
+            inport = esdl.InPort(id=str(uuid4()), name='InPort')
+            outport = esdl.OutPort(id=str(uuid4()), name='OutPort')
+            pipe.port.extend((inport, outport))
+            area.asset.append(pipe)
+
+        if shape_type == shapefile.POINT:
+            # probably an asset
+            if energy_asset == "type_record":
+                esdl_type = find_energy_asset_type(fields.get(record, fields.type))
+                esdl_object = esdl_type(name=fields.get(record, fields.name, "unnamed"), id=str(uuid4()))
+            else:
+                esdl_object = esdl_class()
+                esdl_object.id = str(uuid4())
+                esdl_object.name = fields.get(record, fields.name, "unnamed")
+
+            # instance = esdl.GenericProducer(name=get_name(shapeRecord.record), id=str(uuid4()))
+            esdl_object.geometry = esdl.Point(lat=lats[0], lon=lons[0])
+            area.asset.append(esdl_object)
+            inport = esdl.InPort(id=str(uuid4()), name='InPort')
+            outport = esdl.OutPort(id=str(uuid4()), name='OutPort')
+            esdl_object.port.extend((inport, outport))
+
+        if shape_type == shapefile.POLYGON \
+                or shape_type == shapefile.POLYGONM \
+                or shape_type == shapefile.POLYGONZ:
+
+            # If it's a polygon, polygonm or polygonz, we ignore measures and z-coordinates for now
+            # we also ignore holes and multipolygons
+
+            if energy_asset == "type_record":
+                esdl_type = find_energy_asset_type(fields.get(record, fields.type))
+                esdl_object = esdl_type(name=fields.get(record, fields.name, "unnamed"), id=str(uuid4()))
+            elif energy_asset == "esdl_area":
+                esdl_object = esdl.Area(id=str(uuid4()), name=fields.get(record, fields.name, "unnamed"))
+            else:
+                esdl_object = esdl_class()
+                esdl_object.id = str(uuid4())
+                esdl_object.name = fields.get(record, fields.name, "unnamed")
+
+            # This function only supports polygons without holes (so far), each part becomes a polygon
+            parts = list(shape_record.shape.parts) + [len(lons)]
+            parts_len = len(parts) - 1
+            if parts_len > 1:
+                multi_polygon = esdl.MultiPolygon()
+            for pol in range(0, parts_len):
+                exterior = esdl.SubPolygon()
+                polygon = esdl.Polygon(exterior=exterior)
+                for lon, lat in zip(lons[parts[pol]:parts[pol + 1]], lats[parts[pol]:parts[pol + 1]]):
+                    exterior.point.append(esdl.Point(lat=lat, lon=lon))
+
+                if parts_len > 1:
+                    multi_polygon.polygon.append(polygon)
+
+            if parts_len > 1:
+                esdl_object.geometry = multi_polygon
+            else:
+                esdl_object.geometry = polygon
+
+            if energy_asset == "esdl_area":
+                area.area.append(esdl_object)
+            else:
                 area.asset.append(esdl_object)
                 inport = esdl.InPort(id=str(uuid4()), name='InPort')
                 outport = esdl.OutPort(id=str(uuid4()), name='OutPort')
                 esdl_object.port.extend((inport, outport))
 
-            if shapeRecord.shape.shapeType == shapefile.POLYGON \
-                    or shapeRecord.shape.shapeType == shapefile.POLYGONM \
-                    or shapeRecord.shape.shapeType == shapefile.POLYGONZ:
-
-                # If it's a polygon, polygonm or polygonz, we ignore measures and z-coordinates for now
-                # we also ignore holes and multipolygons
-
-                if energy_asset == "type_record":
-                    esdl_type = self.get_type(shapeRecord.record)
-                    esdl_object = esdl_type(name=self.get_name(shapeRecord.record), id=str(uuid4()))
-                elif energy_asset == "esdl_area":
-                    esdl_object = esdl.Area(id=str(uuid4()), name=self.get_name(shapeRecord.record))
-                else:
-                    module = importlib.import_module('esdl.esdl')
-                    class_ = getattr(module, energy_asset)
-                    esdl_object = class_()
-                    esdl_object.id = str(uuid4())
-                    esdl_object.name = self.get_name(shapeRecord.record)
-
-                # This function only supports polygons without holes (so far).
-                parts_len = len(shapeRecord.shape.parts)
-                print(parts_len)
-                if parts_len > 1:
-                    multi_polygon = esdl.MultiPolygon()
-                point_idx = 0
-                for pol in range(0, parts_len):
-                    if parts_len == 1:
-                        # If only one polygon,
-                        length_of_this_polygon = len(shapeRecord.shape.points)
-                    else:
-                        if pol == parts_len-1:
-                            length_of_this_polygon = len(shapeRecord.shape.points) - shapeRecord.shape.parts[pol]
-                        else:
-                            length_of_this_polygon = shapeRecord.shape.parts[pol+1]
-
-                    print('- {}'.format(length_of_this_polygon))
-                    exterior = esdl.SubPolygon()
-                    polygon = esdl.Polygon(exterior=exterior)
-    
-                    for pi in range(0, length_of_this_polygon):
-                        point = shapeRecord.shape.points[point_idx]
-                        lon, lat = transformer.transform(point[0], point[1])
-                        p = esdl.Point(lat=lat, lon=lon)
-                        exterior.point.append(p)
-                        point_idx += 1
-
-                    if parts_len > 1:
-                        multi_polygon.polygon.append(polygon)
-
-                if parts_len > 1:
-                    esdl_object.geometry = multi_polygon
-                else:
-                    esdl_object.geometry = polygon
-
-                if energy_asset == "esdl_area":
-                    area.area.append(esdl_object)
-                else:
-                    area.asset.append(esdl_object)
-                    inport = esdl.InPort(id=str(uuid4()), name='InPort')
-                    outport = esdl.OutPort(id=str(uuid4()), name='OutPort')
-                    esdl_object.port.extend((inport, outport))
-
-    """
-    if the shape record contains the type field, use that to find the appropriate ESDL class
-    """
-    def get_type(self, record: shapefile._Record):
-        record_dict = record.as_dict()
-        for key, value in record_dict.items():
-            if 'type' == key.lower():
-                for esdl_type in esdl.eClassifiers:
-                    t: EClass = esdl.getEClassifier(esdl_type).eClass
-                    if esdl.EnergyAsset.eClass in t.eAllSuperTypes():
-                        # print('checking', esdl_type)
-                        if value.lower() in esdl_type.lower():
-                            print('Using {} as type for this shape'.format(esdl_type))
-                            return esdl.getEClassifier(esdl_type)
-        return esdl.GenericProducer
-
-    def get_name(self, record: shapefile._Record):
-        record_dict = record.as_dict()
-
-        for key, value in record_dict.items():
-            if key.lower() in name_keys:
-                return value
-        return "unnamed"
-
-    def get_recordproperty(self, record: shapefile._Record, possible_names: list, default_value=None):
-        record_dict = record.as_dict()
-        for key, value in record_dict.items():
-            if key.lower() in possible_names:
-                return value
-        return default_value
+        return pipe
 
     def process_zip_files(self, file_info_list, app_context):
         with app_context:
@@ -25,6 +25,7 @@ from extensions.session_manager import get_handler, get_session, set_session
 from extensions.boundary_service import BoundaryService, is_valid_boundary_id
 import esdl.esdl as esdl
 from src.shape import Shape
+from src.spatial_index import SpatialIndex
 from src.esdl_helper import energy_asset_to_ui, get_asset_and_coord_from_port_id
 import src.log as log
 import requests
@@ -174,32 +175,25 @@ class SpatialOperations:
                 active_es_id = get_session('active_es_id')
                 es = esh.get_energy_system(active_es_id)
 
-                # Collect all assets of the required types
-                connect_asset_list = list()
-                connect_to_asset_list = list()
-                for c in es.eAllContents():
-                    if type(c).__name__ == connect_asset_type:
-                        connect_asset_list.append(c)
-                    if type(c).__name__ == connect_to_asset_type:
-                        connect_to_asset_list.append(c)
+                # Collect all assets of the required types, using the object index of the energy system
+                connect_asset_list = esh.get_object_index(active_es_id).instances_of(
+                    esdl.getEClassifier(connect_asset_type).eClass, exact=True)
+                # Spatial index of all assets to connect to, to find the closest one without comparing all of them
+                connect_to_index = SpatialIndex.of_types(esh, active_es_id, [esdl.getEClassifier(connect_to_asset_type)])
 
                 connections_list = list()
                 # Iterate over connect_asset_list
-                for c in connect_asset_list:
+                for c in list(connect_asset_list):
                     # TODO: fix assume one port
                     port_c = c.port[0]
 
-                    if not port_c.connectedTo:
+                    if not port_c.connectedTo and c.geometry:
                         shape_c = Shape.create(c.geometry)
-                        min_distance = 1e99
-                        closest_ct = None
 
                         # Find closest asset to connect to
-                        for ct in connect_to_asset_list:
-                            shape_ct = Shape.create(ct.geometry)
-                            if shape_ct.shape.distance(shape_c.shape) < min_distance:
-                                min_distance = shape_ct.shape.distance(shape_c.shape)
-                                closest_ct = ct
+                        closest_ct, min_distance = connect_to_index.nearest(shape_c.shape, exclude=lambda ct: ct is c)
+                        if closest_ct is None:
+                            continue
 
                         # Determine the type of port to connect to
                         if type(port_c) == esdl.InPort:
@@ -18,7 +18,7 @@ from flask_executor import Executor
 from datetime import datetime
 from datetime import timedelta
 from dateutil import rrule
-from influxdb import InfluxDBClient
+from src.influxdb_pool import get_database
 from geojson import Feature, MultiLineString, FeatureCollection, dumps
 from math import fabs
 import pytz
@@ -164,9 +164,9 @@ class TimeDimension:
         self.settings_storage.set_user(user, TIME_DIMENSION_USER_CONFIG, user_settings)
 
     def connect_to_database(self):
+        # the client (and its connections) to the InfluxDB server is shared by all users
         database = get_session('timedimension-database')
-        return InfluxDBClient(host=self.config['ESSIM_database_server'],
-                                              port=self.config['ESSIM_database_port'], database=database)
+        return get_database(self.config['ESSIM_database_server'], self.config['ESSIM_database_port'], database)
 
     def preprocess_data(self, networks):
         influxdb_client = self.connect_to_database()
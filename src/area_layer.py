@@ -0,0 +1,77 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Sends the area layer to the client at the resolution of its zoom level.
+
+The features of the area layer are sent with the geometry of the zoom band at which the whole layer fits on the screen
+(the client zooms to the energy system after loading it). The variants of the geometries for all zoom bands are kept in
+the session, so the client can ask for the geometries of another zoom band ('get_area_layer_geometries') when the
+user zooms in or out.
+"""
+
+from flask_socketio import emit
+from extensions.session_manager import get_session_for_esid, set_session_for_esid
+from src.geometry_simplification import ZOOM_BANDS, FULL_RESOLUTION, zoom_band, zoom_variants, fit_zoom, \
+    geometry_bounds
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+AREA_LAYER_GEOMETRIES = 'area_layer_geometries'
+ZOOM_VARIANTS = '_zoom_variants'    # key of the precomputed variants of the geometry of a feature, not sent
+
+
+def set_zoom_variants(feature, variants):
+    """Attaches the (cached) variants of the geometry of a feature, features without them are simplified when sent"""
+    feature[ZOOM_VARIANTS] = variants
+    return feature
+
+
+def emit_area_layer(es_id, area_list, add=False):
+    """
+    Emits the features of the area layer of an energy system, with their geometry at the resolution of the zoom band at
+    which the layer fits on the screen. If add is True the features are added to the area layer that was sent before.
+    """
+    variants = get_session_for_esid(es_id, AREA_LAYER_GEOMETRIES) if add else None
+    if variants is None:
+        variants = dict()
+
+    band = FULL_RESOLUTION
+    features = []
+    for feature in area_list:
+        feature_variants = feature.pop(ZOOM_VARIANTS, None)
+        geometry = feature.get('geometry')
+        feature_id = feature.get('properties', {}).get('id')
+        if feature_id is not None and isinstance(geometry, dict) and geometry.get('type') in ('Polygon', 'MultiPolygon'):
+            variants[feature_id] = feature_variants or zoom_variants(geometry)
+            features.append(feature)
+
+    if features:
+        bounds = geometry_bounds([variants[f['properties']['id']][0] for f in features])
+        if bounds:
+            band = zoom_band(fit_zoom(bounds))
+        for feature in features:
+            feature['geometry'] = variants[feature['properties']['id']][band]
+
+    set_session_for_esid(es_id, AREA_LAYER_GEOMETRIES, variants)
+    emit('geojson', {"layer": "area_layer", "geojson": area_list, "es_id": es_id, "zoom_band": band,
+                     "zoom_bands": list(ZOOM_BANDS)})
+
+
+def get_area_layer_geometries(es_id, zoom):
+    """Returns the zoom band of a zoom level and the geometries of the area layer (feature id -> geometry) for it"""
+    band = zoom_band(zoom)
+    variants = get_session_for_esid(es_id, AREA_LAYER_GEOMETRIES) or dict()
+    return band, {feature_id: feature_variants[band] for feature_id, feature_variants in variants.items()}
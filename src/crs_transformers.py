@@ -0,0 +1,151 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Process-wide registry of pyproj Transformers, keyed by source and target CRS.
+
+Creating a Transformer is far more expensive than transforming the coordinates of a geometry with it, so the
+transformers are kept and reused. A pyproj Transformer must not be used by two threads at the same time, so the
+registry lends them out: transformer() takes an idle transformer for the CRSs (or creates one when all are in use) and
+returns it when the enclosed code is done. The number of transformers for a pair of CRSs therefore never exceeds the
+number of concurrent users.
+
+transform_geometry() and transform_geometries() transform all coordinates of shapely geometries (including multi
+geometries and geometry collections) with a single call to the transformer.
+"""
+
+from contextlib import contextmanager
+import threading
+import numpy as np
+import pyproj
+from shapely.geometry import Point, LineString, LinearRing, Polygon, MultiPoint, MultiLineString, MultiPolygon, \
+    GeometryCollection
+from src.log import get_logger
+
+logger = get_logger(__name__)
+
+WGS84 = "EPSG:4326"
+
+
+def normalize_crs(crs):
+    """Returns the CRS as it is used in the registry: "EPSG:4326" for WGS84, an empty or a missing CRS"""
+    if crs is None or crs == "" or crs == "WGS84":
+        return WGS84
+    return crs
+
+
+class TransformerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = dict()       # (from_crs, to_crs) -> transformers that are not in use
+
+    @contextmanager
+    def transformer(self, from_crs, to_crs=WGS84):
+        """Context manager that lends out a Transformer (with x, y in lon, lat order) from from_crs to to_crs"""
+        key = (normalize_crs(from_crs), normalize_crs(to_crs))
+        with self._lock:
+            idle = self._idle.get(key)
+            transformer = idle.pop() if idle else None
+        if transformer is None:
+            logger.debug('Creating a coordinate transformer from {} to {}'.format(*key))
+            transformer = pyproj.Transformer.from_crs(pyproj.CRS(key[0]), pyproj.CRS(key[1]), always_xy=True)
+        try:
+            yield transformer
+        finally:
+            with self._lock:
+                self._idle.setdefault(key, []).append(transformer)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def transform(self, xs, ys, from_crs, to_crs=WGS84):
+        """Transforms arrays of x and y coordinates, returns the transformed (xs, ys) as arrays"""
+        with self.transformer(from_crs, to_crs) as transformer:
+            xs, ys = transformer.transform(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+        return np.asarray(xs), np.asarray(ys)
+
+    def transform_geometry(self, geometry, from_crs, to_crs=WGS84):
+        """Returns the shapely geometry transformed from from_crs to to_crs, the geometry itself if they are equal"""
+        return self.transform_geometries([geometry], from_crs, to_crs)[0]
+
+    def transform_geometries(self, geometries, from_crs, to_crs=WGS84):
+        """Transforms a list of shapely geometries with one transformation of all their coordinates"""
+        if normalize_crs(from_crs) == normalize_crs(to_crs):
+            return list(geometries)
+        arrays = []
+        for geometry in geometries:
+            _collect_coordinates(geometry, arrays)
+        if not arrays:
+            return list(geometries)
+        coordinates = np.concatenate([array[:, :2] for array in arrays])
+        xs, ys = self.transform(coordinates[:, 0], coordinates[:, 1], from_crs, to_crs)
+        transformed = iter(_split_coordinates(arrays, xs, ys))
+        return [_rebuild(geometry, transformed) for geometry in geometries]
+
+
+# the registry that is used by the whole process
+transformers = TransformerRegistry()
+
+
+def _coordinates(sequence) -> np.ndarray:
+    array = np.asarray(sequence, dtype=np.float64)
+    return array.reshape(len(array), -1) if len(array) else np.empty((0, 2))
+
+
+def _collect_coordinates(geometry, arrays: list):
+    """Appends the coordinate arrays of a geometry to arrays, in the order in which _rebuild() takes them"""
+    if isinstance(geometry, Polygon):
+        if not geometry.is_empty:
+            arrays.append(_coordinates(geometry.exterior.coords))
+            arrays.extend(_coordinates(interior.coords) for interior in geometry.interiors)
+    elif isinstance(geometry, (MultiPoint, MultiLineString, MultiPolygon, GeometryCollection)):
+        for part in geometry.geoms:
+            _collect_coordinates(part, arrays)
+    elif isinstance(geometry, (Point, LineString)):
+        arrays.append(_coordinates(geometry.coords))
+    else:
+        raise Exception("Cannot transform a {}".format(type(geometry).__name__))
+
+
+def _split_coordinates(arrays: list, xs, ys) -> list:
+    result = []
+    offset = 0
+    for array in arrays:
+        n = len(array)
+        transformed = array.copy()
+        transformed[:, 0] = xs[offset:offset + n]
+        transformed[:, 1] = ys[offset:offset + n]
+        result.append(transformed)
+        offset += n
+    return result
+
+
+def _rebuild(geometry, transformed):
+    """Returns a new geometry of the same type as geometry, with the next arrays of the transformed iterator"""
+    if isinstance(geometry, Polygon):
+        if geometry.is_empty:
+            return geometry
+        exterior = next(transformed)
+        return Polygon(exterior, [next(transformed) for _ in geometry.interiors])
+    if isinstance(geometry, (MultiPoint, MultiLineString, MultiPolygon)):
+        return type(geometry)([_rebuild(part, transformed) for part in geometry.geoms])
+    if isinstance(geometry, GeometryCollection):
+        return GeometryCollection([_rebuild(part, transformed) for part in geometry.geoms])
+    coordinates = next(transformed)
+    if geometry.is_empty:
+        return geometry
+    if isinstance(geometry, Point):
+        return Point(coordinates[0])
+    return (LinearRing if isinstance(geometry, LinearRing) else LineString)(coordinates)
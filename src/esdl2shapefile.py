@@ -24,6 +24,7 @@ import zipfile
 import time
 
 from esdl import esdl
+from esdl.object_index import ObjectIndex
 from extensions.session_manager import set_session, get_session, get_handler
 from pyecore.ecore import EAttribute
 import src.log as log
@@ -98,13 +99,16 @@ class ESDL2Shapefile:
     @staticmethod
     def convert_esdl_to_shapefiles_zipfile(es: esdl.EnergySystem):
         assets_with_geometry = dict()
-        for obj in es.eAllContents():
-            if isinstance(obj, esdl.Asset):
-                if obj.geometry and not obj.geometry.CRS == 'Simple':
-                    if obj.eClass.name in assets_with_geometry:
-                        assets_with_geometry[obj.eClass.name]['objects'].append(obj)
-                    else:
-                        assets_with_geometry[obj.eClass.name] = {'objects': [obj], 'attr_types': []}
+        if es.eResource is not None:
+            all_assets = ObjectIndex.of(es.eResource).instances_of(esdl.Asset.eClass)
+        else:
+            all_assets = [obj for obj in es.eAllContents() if isinstance(obj, esdl.Asset)]
+        for obj in all_assets:
+            if obj.geometry and not obj.geometry.CRS == 'Simple':
+                if obj.eClass.name in assets_with_geometry:
+                    assets_with_geometry[obj.eClass.name]['objects'].append(obj)
+                else:
+                    assets_with_geometry[obj.eClass.name] = {'objects': [obj], 'attr_types': []}
 
         # collect attribute types
         for asset_type, assets in assets_with_geometry.items():
@@ -203,7 +203,7 @@ class ESDLServices:
                 area_subscope = service_params["area_subscope"]
                 url = url.replace(area_subscope_tag, area_subscope)
         elif service["type"].startswith("send_esdl"):
-            esdlstr = esh.to_string(active_es_id)
+            esdlstr = esh.to_string(active_es_id, compact=True)
 
             if service["body"] == "url_encoded":
                 body["energysystem"] = urllib.parse.quote(esdlstr)
@@ -215,7 +215,7 @@ class ESDLServices:
             else:
                 body = esdlstr
         elif service["type"] == "simulation":
-            esdlstr = esh.to_string(active_es_id)
+            esdlstr = esh.to_string(active_es_id, compact=True)
 
             if service["body"] == "url_encoded":
                 body["energysystem"] = urllib.parse.quote(esdlstr)
@@ -228,7 +228,7 @@ class ESDLServices:
 
         if "body_config" in service:
             if service["body_config"]["type"] == "text":
-                esdlstr = esh.to_string(active_es_id)
+                esdlstr = esh.to_string(active_es_id, compact=True)
                 if service["body_config"]["encoding"] == "none":
                     body = esdlstr
                 if service["body_config"]["encoding"] == "url_encoded":
@@ -241,7 +241,7 @@ class ESDLServices:
                 body = {}
                 for param in service["body_config"]['parameters']:
                     if param["type"] == "esdl":
-                        esdlstr = esh.to_string(active_es_id)
+                        esdlstr = esh.to_string(active_es_id, compact=True)
                         if param["encoding"] == "none":
                             body[param["parameter"]] = esdlstr
                         if param["encoding"] == "url_encoded":
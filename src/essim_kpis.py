@@ -16,7 +16,8 @@ from flask import Flask
 from flask_socketio import SocketIO, emit
 from extensions.session_manager import get_handler, get_session
 import src.settings as settings
-from influxdb import InfluxDBClient
+from src.influxdb_pool import get_database
+from src.load_duration_curve import ldc_data
 from datetime import datetime
 import src.log as log
 
@@ -69,8 +70,8 @@ class ESSIM_KPIs:
         self.simulationRun = simulationRun
 
     def connect_to_database(self):
-        self.database_client = InfluxDBClient(host=self.config['ESSIM_database_server'],
-                                              port=self.config['ESSIM_database_port'], database=self.scenario_id)
+        self.database_client = get_database(self.config['ESSIM_database_server'], self.config['ESSIM_database_port'],
+                                            self.scenario_id)
 
     def calculate_load_duration_curve(self, asset_id, asset_name):
         logger.debug("--- calculate_load_duration_curve ---")
@@ -92,38 +93,21 @@ class ESSIM_KPIs:
                 power = asset.power
             elif hasattr(asset, 'capacity'):
                 power = asset.capacity
-            power_pos = None
-            power_neg = None
 
             allocation_energy = None
             try:
                 query = 'SELECT "allocationEnergy" FROM /' + es.name + '.*/ WHERE (time >= \'' + influxdb_startdate + '\' AND time < \'' + influxdb_enddate + '\' AND "simulationRun" = \'' + sim_id + '\' AND "assetId" = \''+asset_id+'\')'
                 logger.debug(query)
-                allocation_energy = self.database_client.query(query)
+                allocation_energy = self.database_client.query_columns(query)
             except Exception as e:
                 logger.error('error with query: ', str(e))
 
             if allocation_energy:
-                # logger.debug(allocation_energy)
-                first_key = list(allocation_energy.keys())[0]
-                series = allocation_energy[first_key]
-
-                ldc_series = []
-                for item in series:
-                    ldc_series.append(item['allocationEnergy'])
-                ldc_series.sort(reverse=True)
-
-                ldc_series_decimate = []
-                for idx, item in enumerate(ldc_series):
-                    if idx % 40 == 0:
-                        ldc_series_decimate.append(item / 3600)
-                        if item > 0:
-                            power_pos = power
-                        if item < 0:
-                            power_neg = -power
-
-                # logger.debug(ldc_series_decimate)
-                emit('ldc-data', {'asset_name': asset_name, 'ldc_series': ldc_series_decimate, 'power_pos': power_pos, 'power_neg': power_neg})
+                # the first series contains the allocationEnergy (in J) of the asset, the LDC is shown in W
+                ldc = ldc_data(allocation_energy[0]['allocationEnergy'], power, step=settings.ldc_config['decimation_step'],
+                               max_points=settings.ldc_config['max_points'], scale=1 / 3600)
+                ldc['asset_name'] = asset_name
+                emit('ldc-data', ldc)
 
             else:
                 logger.warn('query returned no results')
@@ -0,0 +1,142 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Simplified variants of GeoJSON geometries for zoom bands of the map.
+
+Area and boundary layers are drawn at every zoom level, but details smaller than a pixel are invisible. The zoom levels
+are divided in bands (ZOOM_BANDS); for each band but the last a variant of a geometry is simplified with a tolerance of
+half a pixel at the highest zoom level of the band, keeping the topology intact (no self intersections, no rings are
+removed). The last band uses the geometry at full resolution. The variants are computed from fine to coarse, each one
+from the previous (smaller) one.
+
+A list of variants has one geometry per band, so it can be indexed with zoom_band(zoom).
+"""
+
+import json
+import math
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+# the highest zoom level of each band of simplified geometries, above the last one the full resolution is used
+ZOOM_BANDS = (8, 11, 14)
+TOLERANCE_PIXELS = 0.5
+FULL_RESOLUTION = len(ZOOM_BANDS)
+
+# key of the simplified geometries of a boundary (a list of a geometry per zoom band, without the full resolution)
+ZOOM_GEOMETRIES_KEY = 'zoom_geoms'
+
+
+def pixel_size(zoom):
+    """Returns the width of a pixel at a zoom level of the map, in degrees longitude"""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def band_tolerance(band):
+    return TOLERANCE_PIXELS * pixel_size(ZOOM_BANDS[band])
+
+
+def zoom_band(zoom):
+    """Returns the zoom band of a zoom level"""
+    for band, max_zoom in enumerate(ZOOM_BANDS):
+        if zoom <= max_zoom:
+            return band
+    return FULL_RESOLUTION
+
+
+def fit_zoom(bounds, width=1280, height=800):
+    """Returns the highest zoom level at which bounds (min lon, min lat, max lon, max lat) fit in width x height pixels"""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    zooms = []
+    if max_lon > min_lon:
+        zooms.append(math.log2(width * 360.0 / (256 * (max_lon - min_lon))))
+    if max_lat > min_lat:
+        # in web mercator a degree latitude is larger than a degree longitude, by 1 / cos(latitude)
+        latitude = math.radians((min_lat + max_lat) / 2)
+        zooms.append(math.log2(height * 360.0 * math.cos(latitude) / (256 * (max_lat - min_lat))))
+    return max(0, int(math.floor(min(zooms)))) if zooms else ZOOM_BANDS[-1] + 1
+
+
+def simplify_geometry(geom, tolerance):
+    """Simplifies a GeoJSON geometry (dict) with shapely, keeping the topology (no self intersections) intact"""
+    if not tolerance:
+        return geom
+    try:
+        from shapely.geometry import shape, mapping, MultiPolygon
+        simplified = shape(geom).simplify(tolerance, preserve_topology=True)
+        if simplified.geom_type == 'Polygon' and geom['type'] == 'MultiPolygon':
+            # a MultiPolygon with a single polygon can be simplified to a Polygon
+            simplified = MultiPolygon([simplified])
+        if simplified.is_empty or simplified.geom_type != geom['type']:
+            return geom
+        # convert the tuples of shapely's mapping() to lists, as if the geometry was decoded from JSON
+        return json.loads(json.dumps(mapping(simplified)))
+    except Exception as e:
+        logger.warning('Cannot simplify boundary geometry: {}'.format(e))
+        return geom
+
+
+def zoom_variants(geom) -> list:
+    """Returns the variants of a GeoJSON geometry for all zoom bands, the last one is geom itself"""
+    variants = [geom]
+    for band in reversed(range(len(ZOOM_BANDS))):
+        variants.append(simplify_geometry(variants[-1], band_tolerance(band)))
+    variants.reverse()
+    return variants
+
+
+def with_zoom_geometries(boundary):
+    """Returns a copy of a boundary with the simplified variants of its geometry, the boundary itself if it has them"""
+    geom = boundary.get('geom')
+    if not isinstance(geom, dict) or ZOOM_GEOMETRIES_KEY in boundary:
+        return boundary
+    boundary = dict(boundary)
+    boundary[ZOOM_GEOMETRIES_KEY] = zoom_variants(geom)[:FULL_RESOLUTION]
+    return boundary
+
+
+def boundary_zoom_variants(boundary) -> list:
+    """
+    Returns the variants of the geometry of a boundary for all zoom bands. The variants of a boundary that has been
+    stored without them are calculated, but not added to the boundary, as it can be shared by the BoundaryCache.
+    """
+    variants = boundary.get(ZOOM_GEOMETRIES_KEY)
+    if variants is None:
+        variants = zoom_variants(boundary['geom'])[:FULL_RESOLUTION]
+    return variants + [boundary['geom']]
+
+
+def polygon_variants(variants: list, i) -> list:
+    """Returns the variants of the i-th polygon of the variants of a MultiPolygon, as Polygon geometries"""
+    full = variants[-1]['coordinates'][i]
+    return [{'type': 'Polygon',
+             'coordinates': v['coordinates'][i] if len(v['coordinates']) == len(variants[-1]['coordinates']) else full}
+            for v in variants]
+
+
+def geometry_bounds(geoms):
+    """Returns the bounds (min lon, min lat, max lon, max lat) of a list of GeoJSON geometries, None if there are none"""
+    from shapely.geometry import shape
+    bounds = None
+    for geom in geoms:
+        try:
+            b = shape(geom).bounds
+        except Exception:
+            continue
+        if not b:
+            continue
+        bounds = b if bounds is None else (min(bounds[0], b[0]), min(bounds[1], b[1]),
+                                           max(bounds[2], b[2]), max(bounds[3], b[3]))
+    return bounds
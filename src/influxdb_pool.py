@@ -0,0 +1,114 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Shared access to InfluxDB servers.
+
+Instead of creating a new InfluxDBClient (with a new HTTP connection pool) for every request, there is one client per
+server, shared by all requests and threads. get_database() returns an InfluxDatabase, a lightweight handle that
+queries a specific database using the shared client of the server.
+
+query_columns() returns the results of a query as columns (NumPy arrays) instead of a Python dict per point.
+"""
+
+from influxdb import InfluxDBClient
+import threading
+import numpy as np
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+
+_clients = dict()   # (host, port, username) -> InfluxDBClient
+_clients_lock = threading.Lock()
+
+
+def get_client(host, port, username='root', password='root', pool_size=DEFAULT_POOL_SIZE) -> InfluxDBClient:
+    """Returns the shared InfluxDBClient for a server, its requests session keeps a pool of connections"""
+    key = (host, str(port), username)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.debug('Creating InfluxDB client for {}:{}'.format(host, port))
+            client = InfluxDBClient(host=host, port=port, username=username, password=password, pool_size=pool_size)
+            _clients[key] = client
+        return client
+
+
+def get_database(host, port, database, **kwargs):
+    return InfluxDatabase(get_client(host, port, **kwargs), database)
+
+
+class InfluxSeries:
+    """Result series of a query, with the values of each column in a NumPy array"""
+    def __init__(self, name, tags, columns):
+        self.name = name
+        self.tags = tags or {}
+        self.columns = columns   # column name -> numpy array
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+
+def series_to_columns(series):
+    """Converts a series of the raw (JSON) result of an InfluxDB query to an InfluxSeries"""
+    names = series.get('columns', [])
+    values = series.get('values') or []
+    columns = dict()
+    if not values:
+        for name in names:
+            columns[name] = np.empty(0, dtype=np.float64)
+    else:
+        try:
+            # fast path: all columns are numeric (epoch timestamps and numeric fields), null becomes NaN
+            table = np.array(values, dtype=np.float64)
+            for i, name in enumerate(names):
+                columns[name] = table[:, i]
+        except (TypeError, ValueError):
+            for i, name in enumerate(names):
+                column = [row[i] for row in values]
+                try:
+                    columns[name] = np.array(column, dtype=np.float64)
+                except (TypeError, ValueError):
+                    columns[name] = np.array(column, dtype=object)
+        if 'time' in columns and columns['time'].dtype == np.float64:
+            columns['time'] = columns['time'].astype(np.int64)
+    return InfluxSeries(series.get('name'), series.get('tags'), columns)
+
+
+class InfluxDatabase:
+    """A database on an InfluxDB server, queried with the shared client of that server"""
+    def __init__(self, client: InfluxDBClient, database):
+        self.client = client
+        self.database = database
+
+    def query(self, query, **kwargs):
+        kwargs.setdefault('database', self.database)
+        return self.client.query(query, **kwargs)
+
+    def query_columns(self, query, epoch='s', **kwargs):
+        """
+        Queries the database and returns a list of InfluxSeries, one for each series in the result. Timestamps are
+        returned as integers in epoch format (by default in seconds), so all columns of numeric fields can be
+        converted to NumPy arrays at once.
+        """
+        result = self.query(query, epoch=epoch, **kwargs)
+        return [series_to_columns(series) for series in result.raw.get('series', [])]
@@ -0,0 +1,85 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Load duration curve (LDC) calculation on NumPy arrays.
+
+A load duration curve is the series of values sorted in descending order. Only a limited number of points of the
+curve is sent to the frontend: every n-th value, or a number of values at equally spaced quantiles. The values are
+sorted in NumPy; only when very few points are needed they are selected with a partitioned sort (numpy.partition),
+as selecting many order statistics with numpy.partition is slower than sorting all values.
+"""
+
+import numpy as np
+
+# by default every 40th value of the sorted series is used, as was done before
+DEFAULT_DECIMATION_STEP = 40
+MAX_PARTITION_POINTS = 3
+
+
+def decimation_positions(number_of_values, step=DEFAULT_DECIMATION_STEP, max_points=None):
+    """
+    Returns the positions in the descending sorted series that are part of the decimated curve: either every step-th
+    position, or max_points positions at equally spaced quantiles (always including the first and the last value)
+    """
+    if number_of_values == 0:
+        return np.empty(0, dtype=np.intp)
+    if max_points is not None and max_points < number_of_values:
+        if max_points <= 1:
+            return np.zeros(1, dtype=np.intp)
+        return np.unique(np.round(np.linspace(0, number_of_values - 1, max_points)).astype(np.intp))
+    return np.arange(0, number_of_values, max(1, step), dtype=np.intp)
+
+
+def load_duration_curve(values, step=DEFAULT_DECIMATION_STEP, max_points=None, scale=1.0):
+    """
+    Calculates the decimated load duration curve of values
+    :param values: sequence or array of values, NaN values (missing values in the database) are ignored
+    :param step: use every step-th value of the descending sorted values
+    :param max_points: if given, use max_points values at equally spaced quantiles instead
+    :param scale: positive factor to multiply the values of the curve with (e.g. for a unit conversion)
+    :return: NumPy array with the decimated curve in descending order
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n = values.size
+    positions = decimation_positions(n, step, max_points)
+    if positions.size == 0:
+        return np.empty(0, dtype=np.float64)
+    # position p in the descending series is order statistic n - 1 - p in ascending order
+    kth = n - 1 - positions
+    if positions.size <= MAX_PARTITION_POINTS:
+        selected = np.partition(values, kth)[kth]
+    else:
+        selected = np.sort(values)[kth]
+    if scale != 1.0:
+        selected = selected * scale
+    return selected
+
+
+def ldc_data(values, power=None, step=DEFAULT_DECIMATION_STEP, max_points=None, scale=1.0):
+    """
+    Creates the contents of the 'ldc-data' message for the frontend: the decimated curve as a list and the positive
+    and negative power (capacity) of the asset when the curve has positive or negative values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    curve = load_duration_curve(values, step, max_points, scale)
+    power_pos = None
+    power_neg = None
+    if curve.size and power is not None:
+        if np.nanmax(values) > 0:
+            power_pos = power
+        if np.nanmin(values) < 0:
+            power_neg = -power
+    return {'ldc_series': curve.tolist(), 'power_pos': power_pos, 'power_neg': power_neg}
@@ -28,7 +28,10 @@ from extensions.session_manager import set_handler, get_handler, get_session, se
 from src.esdl_helper import generate_profile_info, get_asset_and_coord_from_port_id, asset_state_to_ui, \
     get_tooltip_asset_attrs, add_spatial_attributes
 from src.shape import Shape, ShapePoint
+from src.area_layer import emit_area_layer, set_zoom_variants
 from src.assets_to_be_added import AssetsToBeAdded
+from src.geometry_simplification import boundary_zoom_variants, polygon_variants
+from src.process_es_delta import emit_full, emit_delta, get_emitted_state
 from utils.RDWGSConverter import RDWGSConverter
 import shapely
 import math
@@ -367,6 +370,7 @@ def find_area_info_geojson(area_list, pot_list, this_area, shape_dictionary):
                 boundary_wgs = BoundaryService.get_instance().get_boundary_from_service(boundaries_year, area_scope, str.upper(area_id))
                 if boundary_wgs:
                     sh = Shape.parse_geojson_geometry(boundary_wgs['geom'])
+                    zoom_variants = boundary_zoom_variants(boundary_wgs)
                     num_sub_polygons = len(sh.shape.geoms)
                     for i, pol in enumerate(sh.shape.geoms):
                         if num_sub_polygons > 1:
@@ -382,12 +386,12 @@ def find_area_info_geojson(area_list, pot_list, this_area, shape_dictionary):
                                     geojson_dist_kpis[kpi.name]["location"] = [shape.shape.centroid.coords.xy[1][0],
                                                                                shape.shape.centroid.coords.xy[0][0]]
 
-                        area_list.append(shape_polygon.get_geojson_feature({
+                        area_list.append(set_zoom_variants(shape_polygon.get_geojson_feature({
                             "id": area_id + area_id_number,
                             "name": boundary_wgs['name'],
                             "KPIs": geojson_KPIs,
                             "dist_KPIs": geojson_dist_kpis
-                        }))
+                        }), polygon_variants(zoom_variants, i)))
 
                     area_shape = sh
 
@@ -434,13 +438,13 @@ def create_area_info_geojson(area):
     return area_list, pot_list
 
 
-def find_boundaries_in_ESDL(top_area):
+def find_boundaries_in_ESDL(top_area, es_id):
     print("Finding area and potential boundaries in ESDL")
     area_list, pot_list = create_area_info_geojson(top_area)
 
     # Sending an empty list triggers removing the legend at client side
     print('- Sending area information to client, size={}'.format(getsizeof(area_list)))
-    emit('geojson', {"layer": "area_layer", "geojson": area_list})
+    emit_area_layer(es_id, area_list)
     # Buildings are now taken care of in process_building
     # print('- Sending building information to client, size={}'.format(getsizeof(building_list)))
     # emit('geojson', {"layer": "bld_layer", "geojson": building_list})
@@ -809,6 +813,23 @@ def get_building_connections(building):
 #  If this function is run through process_energy_system.submit(filename, es_title) it is executed
 #  in a separate thread.
 # ---------------------------------------------------------------------------------------------------------------------
+def emit_energy_system_skeleton(es):
+    """
+    Shows an energy system that is still being loaded (see EnergySystemHandler.load_options): a new layer with the
+    outline of the top area and its sub areas that have been loaded. process_energy_system() shows the rest.
+    """
+    title = es.name if es.name else 'Untitled Energysystem'
+    emit('create_new_esdl_layer', {'es_id': es.id, 'title': title})
+    emit('set_active_layer_id', es.id)
+    if es.instance and es.instance[0].area:
+        area_list, pot_list = create_area_info_geojson(es.instance[0].area)
+        emit_area_layer(es.id, area_list)
+
+
+def emit_load_progress(progress):
+    emit('esdl_load_progress', progress.to_dict())
+
+
 def process_energy_system(esh, filename=None, es_title=None, app_context=None, force_update_es_id=None, zoom=True):
     # emit('clear_ui')
     print("Processing energysystems in esh")
@@ -835,7 +856,9 @@ def process_energy_system(esh, filename=None, es_title=None, app_context=None, f
         if es.id is None:
             es.id = str(uuid.uuid4())
 
-        if es.id not in es_info_list or es.id == force_update_es_id or force_update_es_id == "all":
+        es_uri = esh.esid_uri_dict.get(es.id)
+        es_replaced = es.id in es_info_list and es_info_list[es.id].get("uri") != es_uri
+        if es.id not in es_info_list or es.id == force_update_es_id or force_update_es_id == "all" or es_replaced:
             print("- Processing energysystem with id {}".format(es.id))
             name = es.name
             if not name:
@@ -843,11 +866,20 @@ def process_energy_system(esh, filename=None, es_title=None, app_context=None, f
             else:
                 title = name
 
-            emit('create_new_esdl_layer', {'es_id': es.id, 'title': title}) # removes old layer if exists
-            emit('set_active_layer_id', es.id)
+            # An energy system that is already shown in the browser (and not cleared by 'all') only gets the
+            # differences with what has been sent before
+            send_delta = es.id in es_info_list and force_update_es_id != "all" and get_emitted_state(es.id) is not None
+            if send_delta:
+                emit('set_active_layer_id', es.id)
+                emit('clear_ui', {'layer': 'areas'})
+                emit('clear_ui', {'layer': 'potentials'})
+                emit('clear_ui', {'layer': 'notes'})
+            else:
+                emit('create_new_esdl_layer', {'es_id': es.id, 'title': title}) # removes old layer if exists
+                emit('set_active_layer_id', es.id)
 
             area = es.instance[0].area
-            find_boundaries_in_ESDL(area)       # also adds coordinates to assets if possible
+            find_boundaries_in_ESDL(area, es.id)       # also adds coordinates to assets if possible
             carrier_list = ESDLEnergySystem.get_carrier_list(es)
             emit('carrier_list', {'es_id': es.id, 'carrier_list': carrier_list})
             sector_list = ESDLEnergySystem.get_sector_list(es)
@@ -874,10 +906,10 @@ def process_energy_system(esh, filename=None, es_title=None, app_context=None, f
             process_area(esh, es.id, asset_list, building_list, area_bld_list, conn_list, area, 0)
             notes_list = get_notes_list(es)
 
-            emit('add_building_objects', {'es_id': es.id, 'building_list': building_list, 'zoom': zoom})
-            emit('add_esdl_objects', {'es_id': es.id, 'asset_pot_list': asset_list, 'zoom': zoom})
-            emit('area_bld_list', {'es_id': es.id,  'area_bld_list': area_bld_list})
-            emit('add_connections', {'es_id': es.id, 'add_to_building': False, 'conn_list': conn_list})
+            if send_delta:
+                emit_delta(es.id, asset_list, building_list, area_bld_list, conn_list)
+            else:
+                emit_full(es.id, asset_list, building_list, area_bld_list, conn_list, zoom)
             emit('add_notes', {'es_id': es.id,  'notes_list': notes_list})
 
             set_session_for_esid(es.id, 'conn_list', conn_list)
@@ -886,7 +918,8 @@ def process_energy_system(esh, filename=None, es_title=None, app_context=None, f
 
             # TODO: update asset_list???
             es_info_list[es.id] = {
-                "processed": True
+                "processed": True,
+                "uri": es_uri
             }
 
             # If one energysystem is added (by calling an external service or via the API) the active_es_id (backend) and
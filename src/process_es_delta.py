@@ -0,0 +1,131 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Keeps track of what process_energy_system has sent to the browser for each energy system in a session, such that a
+reload of an energy system that is already shown only sends the added, changed and removed entries of the asset_list,
+building_list and conn_list instead of the complete lists.
+
+Every emit increases a version number per energy system. A delta message contains the version it was calculated
+against ('base_version'), so the browser can detect that it missed an update and ask for a full refresh.
+"""
+
+from flask_socketio import emit
+
+from extensions.session_manager import get_session_for_esid, set_session_for_esid
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+EMITTED_STATE_KEY = 'emitted_state'
+
+
+def asset_pot_key(entry):
+    # ['point', 'asset', name, id, class_name, ...] or ['point', 'potential', name, id, class_name, ...]
+    return entry[3]
+
+
+def building_key(entry):
+    # ['point', name, id, class_name, ...] or ['polygon', name, id, class_name, ...]
+    return entry[2]
+
+
+def connection_key(entry):
+    return entry['from-port-id'], entry['to-port-id']
+
+
+class EmittedState:
+    """
+    The asset_list, building_list, area_bld_list and conn_list of an energy system as last emitted to the browser,
+    indexed by their key. The entries are the same objects as the ones stored in the session, so no copies are made.
+    """
+    def __init__(self, version, asset_pot_list, building_list, area_bld_list, conn_list):
+        self.version = version
+        self.asset_pots = {asset_pot_key(e): e for e in asset_pot_list}
+        self.buildings = {building_key(e): e for e in building_list}
+        self.connections = {connection_key(c): c for c in conn_list}
+        self.area_bld_list = area_bld_list
+
+
+def diff_entries(previous: dict, current: dict):
+    """
+    Compares two dicts of emitted entries
+    :return: tuple (added, changed, removed) with lists of added and changed entries and a list of removed keys
+    """
+    added = []
+    changed = []
+    for key, entry in current.items():
+        if key not in previous:
+            added.append(entry)
+        elif previous[key] != entry:
+            changed.append(entry)
+    removed = [key for key in previous if key not in current]
+    return added, changed, removed
+
+
+def get_emitted_state(es_id) -> EmittedState:
+    return get_session_for_esid(es_id, EMITTED_STATE_KEY)
+
+
+def reset_emitted_state(es_id):
+    """Forget what has been sent to the browser, the next process_energy_system will do a full emit"""
+    set_session_for_esid(es_id, EMITTED_STATE_KEY, None)
+
+
+def emit_full(es_id, asset_list, building_list, area_bld_list, conn_list, zoom=True):
+    """Sends the complete lists to the browser, the layers of this energy system are expected to be empty"""
+    previous = get_emitted_state(es_id)
+    version = previous.version + 1 if previous else 1
+
+    emit('add_building_objects', {'es_id': es_id, 'building_list': building_list, 'zoom': zoom})
+    emit('add_esdl_objects', {'es_id': es_id, 'asset_pot_list': asset_list, 'zoom': zoom})
+    emit('area_bld_list', {'es_id': es_id, 'area_bld_list': area_bld_list})
+    emit('add_connections', {'es_id': es_id, 'add_to_building': False, 'conn_list': conn_list})
+    emit('esdl_emit_version', {'es_id': es_id, 'version': version})
+
+    set_session_for_esid(es_id, EMITTED_STATE_KEY,
+                         EmittedState(version, asset_list, building_list, area_bld_list, conn_list))
+
+
+def emit_delta(es_id, asset_list, building_list, area_bld_list, conn_list):
+    """
+    Sends only the differences with the previously emitted state to the browser. Use get_emitted_state() first to
+    check if there is a previous state to compare with, otherwise use emit_full().
+    """
+    previous = get_emitted_state(es_id)
+    current = EmittedState(previous.version + 1, asset_list, building_list, area_bld_list, conn_list)
+    asset_pots_added, asset_pots_changed, asset_pots_removed = diff_entries(previous.asset_pots, current.asset_pots)
+    bld_added, bld_changed, bld_removed = diff_entries(previous.buildings, current.buildings)
+    conn_added, conn_changed, conn_removed = diff_entries(previous.connections, current.connections)
+
+    delta = {
+        'es_id': es_id,
+        'version': current.version,
+        'base_version': previous.version,
+        'asset_pot_list': {'added': asset_pots_added, 'changed': asset_pots_changed, 'removed': asset_pots_removed},
+        'building_list': {'added': bld_added, 'changed': bld_changed, 'removed': bld_removed},
+        'conn_list': {'added': conn_added, 'changed': conn_changed,
+                      'removed': [{'from-port-id': f, 'to-port-id': t} for f, t in conn_removed]},
+        # the area_bld_list is small and order dependent, only send it when it has changed
+        'area_bld_list': area_bld_list if area_bld_list != previous.area_bld_list else None
+    }
+    logger.info('Sending delta for energysystem {} (v{} -> v{}): assets/potentials +{} ~{} -{}, '
+                'buildings +{} ~{} -{}, connections +{} ~{} -{}'.format(
+                    es_id, previous.version, current.version,
+                    len(asset_pots_added), len(asset_pots_changed), len(asset_pots_removed),
+                    len(bld_added), len(bld_changed), len(bld_removed),
+                    len(conn_added), len(conn_changed), len(conn_removed)))
+    emit('esdl_objects_delta', delta)
+
+    set_session_for_esid(es_id, EMITTED_STATE_KEY, current)
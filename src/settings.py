@@ -32,6 +32,22 @@ OIDC_CLIENT_SECRETS = os.environ.get('OIDC_CLIENT_SECRETS', None) # 'credentials
 _use_gevent = os.environ.get('MAPEDITOR_USE_GEVENT', '')
 USE_GEVENT = (_use_gevent.upper() == 'TRUE' or _use_gevent == '1')
 
+# where sessions (including the loaded energy systems) are kept: 'memory' (only for a single process), 'filesystem'
+# (a directory shared by all worker processes) or 'redis' (a Redis compatible server, using a unix socket or host/port)
+session_store_config = {
+    "type": os.environ.get('SESSION_STORE_TYPE', 'memory'),
+    "path": os.environ.get('SESSION_STORE_PATH', '/tmp/esdl_mapeditor_sessions'),
+    "redis_socket": os.environ.get('SESSION_STORE_REDIS_SOCKET', None),  # e.g. "/var/run/redis/redis.sock"
+    "redis_host": os.environ.get('SESSION_STORE_REDIS_HOST', None),
+    "redis_port": os.environ.get('SESSION_STORE_REDIS_PORT', "6379")
+}
+
+# directory where the changes of the energy systems of all sessions are journaled, to restore the sessions after a
+# restart of the MapEditor (see esdl/edit_journal.py). Disabled when no path is given
+edit_journal_config = {
+    "path": os.environ.get('EDIT_JOURNAL_PATH', None)  # e.g. "/var/lib/esdl_mapeditor/journals"
+}
+
 settings_storage_config = {
     "host": os.environ.get('SETTINGS_STORAGE_HOST', None),  # "mongo",
     "port": os.environ.get('SETTINGS_STORAGE_PORT', "27017"),
@@ -51,6 +67,14 @@ boundaries_config = {
     "path_boundaries": "/boundaries"
 }
 
+boundary_cache_config = {
+    "max_entries": int(os.environ.get('BOUNDARY_CACHE_MAX_ENTRIES', "5000")),
+    "max_memory": int(os.environ.get('BOUNDARY_CACHE_MAX_MEMORY_MB', "256")) * 1024 * 1024,
+    "sqlite_path": os.environ.get('BOUNDARY_CACHE_SQLITE_PATH', None),  # e.g. "/data/boundary_cache.sqlite"
+    "simplify_tolerance": float(os.environ.get('BOUNDARY_CACHE_SIMPLIFY_TOLERANCE', "0.00001")),  # degrees
+    "prefetch_workers": int(os.environ.get('BOUNDARY_PREFETCH_WORKERS', "8"))
+}
+
 profile_database_config = {
     "protocol": "http",
     "host": os.environ.get('PROFILE_DATABASE_HOST', None),  # "influxdb",
@@ -82,7 +106,22 @@ essim_config = {
     "ESSIM_database_port": os.environ.get('ESSIM_DATABASE_PORT', 8086),
     "start_datetime": "2015-01-01T00:00:00+0100",
     "end_datetime": "2016-01-01T00:00:00+0100",
-    "natsURL": "nats://nats:4222"
+    "natsURL": "nats://nats:4222",
+    # number of simulations of a sensitivity analysis that run at the same time, and the interval to poll their status
+    "sensitivity_max_concurrent": int(os.environ.get('ESSIM_SENSITIVITY_MAX_CONCURRENT', "4")),
+    "sensitivity_poll_interval": float(os.environ.get('ESSIM_SENSITIVITY_POLL_INTERVAL', "2"))
+}
+
+# decimation of load duration curves: every decimation_step-th value, or max_points values at equally spaced quantiles
+ldc_config = {
+    "decimation_step": int(os.environ.get('LDC_DECIMATION_STEP', "40")),
+    "max_points": int(os.environ['LDC_MAX_POINTS']) if os.environ.get('LDC_MAX_POINTS') else None
+}
+
+esdl_load_config = {
+    # ESDL files of at least this size (in bytes) are loaded in the background, showing the outline of the area and
+    # the progress while loading
+    "background_threshold": int(os.environ.get('ESDL_BACKGROUND_LOAD_THRESHOLD', str(5 * 1024 * 1024)))
 }
 
 edr_config = {
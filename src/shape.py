@@ -16,10 +16,10 @@ import geojson
 import json
 from shapely import wkt, wkb
 from shapely.geometry import Point, LineString, Polygon, MultiPolygon, GeometryCollection, shape
-from shapely.ops import transform
 from shapely_geojson import Feature, dumps
+from esdl.processing import GeometryArrays
+from src.crs_transformers import transformers
 import esdl
-import pyproj
 
 class Shape:
     def __init__(self):
@@ -136,17 +136,13 @@ class Shape:
 
     @staticmethod
     def transform_crs(shp, from_crs):
-        if from_crs == "WGS84" or from_crs == "" or from_crs is None:
-            from_crs = "EPSG:4326"
+        # the transformers are cached, see src/crs_transformers.py
+        return transformers.transform_geometry(shp, from_crs)
 
-        if from_crs != "EPSG:4326":
-            wgs84 = pyproj.CRS("EPSG:4326")
-            original_crs = pyproj.CRS(from_crs)
-
-            project = pyproj.Transformer.from_crs(original_crs, wgs84, always_xy=True).transform
-            return transform(project, shp)
-        else:
-            return shp
+    @staticmethod
+    def transform_crs_many(shapes, from_crs):
+        # transforms a list of shapely geometries with the same CRS at once
+        return transformers.transform_geometries(shapes, from_crs)
 
 
 class ShapePoint(Shape):
@@ -192,10 +188,7 @@ class ShapeLine(Shape):
     @staticmethod
     def parse_esdl(esdl_geometry):
         if isinstance(esdl_geometry, esdl.Line):
-            linestring = list()
-            for p in esdl_geometry.point:
-                linestring.append((p.lon, p.lat))
-            return Shape.transform_crs(LineString(linestring), esdl_geometry.CRS)
+            return Shape.transform_crs(GeometryArrays.to_shapely(esdl_geometry), esdl_geometry.CRS)
         else:
             raise Exception("Cannot instantiate a Shapely LineString with an ESDL geometry other than esdl.Line")
 
@@ -210,11 +203,7 @@ class ShapeLine(Shape):
             raise Exception("Incorrect instantiation of a Shapely LineString with leaflet coordinates")
 
     def get_esdl(self):
-        line = esdl.Line()
-        for p in self.shape.coords:
-            point = esdl.Point(lon=p[0], lat=p[1])
-            line.point.append(point)
-        return line
+        return GeometryArrays.from_shapely(self.shape)
 
 
 class ShapePolygon(Shape):
@@ -231,16 +220,7 @@ class ShapePolygon(Shape):
     @staticmethod
     def parse_esdl(esdl_geometry):
         if isinstance(esdl_geometry, esdl.Polygon):
-            exterior = list()
-            interiors = list()
-            for p in esdl_geometry.exterior.point:
-                exterior.append([p.lon, p.lat])
-            for pol in esdl_geometry.interior:
-                interior = list()
-                for p in pol.point:
-                    interior.append([p.lon, p.lat])
-                interiors.append(interior)
-            return Shape.transform_crs(Polygon(exterior, interiors), esdl_geometry.CRS)
+            return Shape.transform_crs(GeometryArrays.to_shapely(esdl_geometry), esdl_geometry.CRS)
         else:
             raise Exception("Cannot instantiate a Shapely Polygon with an ESDL geometry other than esdl.Polygon")
 
@@ -262,17 +242,7 @@ class ShapePolygon(Shape):
             raise Exception("Incorrect instantiation of a Shapely Polygon with leaflet coordinates")
 
     def get_esdl(self):
-        pol = esdl.Polygon()
-        exterior = esdl.SubPolygon()
-        for p in self.shape.exterior.coords:
-            exterior.point.append(esdl.Point(lon=p[0], lat=p[1]))
-        pol.exterior = exterior
-        for ip in self.shape.interiors:
-            interior = esdl.SubPolygon()
-            for p in ip.coords:
-                interior.point.append(esdl.Point(lon=p[0], lat=p[1]))
-            pol.interior.append(interior)
-        return pol
+        return GeometryArrays.from_shapely(self.shape)
 
 
 class ShapeMultiPolygon(Shape):
@@ -289,10 +259,16 @@ class ShapeMultiPolygon(Shape):
     @staticmethod
     def parse_esdl(esdl_geometry):
         if isinstance(esdl_geometry, esdl.MultiPolygon):
-            plist = list()
-            for p in esdl_geometry.polygon:
-                plist.append(ShapePolygon.parse_esdl(p))
-            return Shape.transform_crs(MultiPolygon(plist), esdl_geometry.CRS)
+            # each polygon can have its own CRS, the polygons with the same CRS are transformed at once
+            polygons = list(GeometryArrays.to_shapely(esdl_geometry).geoms)
+            polygons_by_crs = dict()
+            for i, p in enumerate(esdl_geometry.polygon):
+                polygons_by_crs.setdefault(p.CRS, []).append(i)
+            for crs, indices in polygons_by_crs.items():
+                transformed = Shape.transform_crs_many([polygons[i] for i in indices], crs)
+                for i, polygon in zip(indices, transformed):
+                    polygons[i] = polygon
+            return Shape.transform_crs(MultiPolygon(polygons), esdl_geometry.CRS)
         else:
             raise Exception(
                 "Cannot instantiate a Shapely MultiPolygon with an ESDL geometry other than esdl.MultiPolygon")
@@ -309,7 +285,7 @@ class ShapeMultiPolygon(Shape):
                 "Incorrect instantiation of a Shapely MultiPolygon with leaflet coordinates")
 
     def get_esdl(self):
-        raise Exception("Not implemented yet, MultiPolygon is not a frequent ESDL geometry")
+        return GeometryArrays.from_shapely(self.shape)
 
 
 class ShapeGeometryCollection(Shape):
@@ -0,0 +1,123 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Spatial index over ESDL objects with a geometry (assets, conductors, buildings, areas), using a shapely STRtree.
+
+The index converts the ESDL geometry of every object to a shapely geometry once, and answers nearest neighbour and
+within distance queries without comparing the query geometry with all objects. Distances are in the units of the
+coordinates (degrees for WGS84 coordinates), as with shapely's distance().
+
+Works with the STRtree API of shapely 1.7 (queries return geometries) and shapely 2.x (queries return indices).
+"""
+
+from shapely.geometry import box
+from shapely.geometry.base import BaseGeometry
+from shapely.strtree import STRtree
+from src.shape import Shape
+import src.log as log
+
+logger = log.get_logger(__name__)
+
+
+class SpatialIndex:
+    def __init__(self, objects):
+        """
+        Creates the index of all objects with a geometry, objects without (a valid) geometry are ignored
+        :param objects: ESDL objects with a geometry attribute
+        """
+        self.objects = list()
+        self.shapes = list()
+        for obj in objects:
+            geometry = getattr(obj, 'geometry', None)
+            if geometry is None:
+                continue
+            try:
+                shp = Shape.create(geometry).shape
+            except Exception as e:
+                logger.warning('Cannot create shape for geometry of {}: {}'.format(obj, e))
+                continue
+            if shp is None or shp.is_empty:
+                continue
+            self.objects.append(obj)
+            self.shapes.append(shp)
+        # shapely 1.7 returns the geometries from queries, map them back to their position
+        self._positions = {id(shp): i for i, shp in enumerate(self.shapes)}
+        self._object_positions = {id(obj): i for i, obj in enumerate(self.objects)}
+        self.tree = STRtree(self.shapes) if self.shapes else None
+        self.bounds = None
+        if self.shapes:
+            all_bounds = [shp.bounds for shp in self.shapes]
+            self.bounds = (min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+                           max(b[2] for b in all_bounds), max(b[3] for b in all_bounds))
+
+    @staticmethod
+    def of_types(esh, es_id, esdl_types, exact=True):
+        """Creates the index of all instances of esdl_types (ESDL classes) in an energy system"""
+        index = esh.get_object_index(es_id)
+        objects = list()
+        for esdl_type in esdl_types:
+            objects.extend(index.instances_of(esdl_type.eClass, exact=exact))
+        return SpatialIndex(objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def shape_of(self, obj):
+        position = self._object_positions.get(id(obj))
+        return self.shapes[position] if position is not None else None
+
+    def _position(self, item):
+        if isinstance(item, BaseGeometry):
+            return self._positions[id(item)]
+        return int(item)
+
+    def nearest(self, geometry: BaseGeometry, exclude=None):
+        """
+        Returns the object nearest to geometry and its distance, or (None, None) if the index is empty
+        :param exclude: optional function that returns True for objects that should not be returned
+        """
+        if self.tree is None:
+            return None, None
+        position = self._position(self.tree.nearest(geometry))
+        if exclude is None or not exclude(self.objects[position]):
+            return self.objects[position], self.shapes[position].distance(geometry)
+
+        # the nearest object is excluded, search in an envelope around the geometry that grows until an object
+        # that is not excluded is found
+        minx, miny, maxx, maxy = self.bounds
+        search_distance = max(maxx - minx, maxy - miny) / max(len(self.objects), 1) ** 0.5 or 1e-6
+        max_distance = geometry.distance(box(minx, miny, maxx, maxy)) + (maxx - minx) + (maxy - miny)
+        while True:
+            for obj, distance in self.within_distance(geometry, search_distance):
+                if not exclude(obj):
+                    return obj, distance
+            if search_distance > max_distance:
+                return None, None
+            search_distance *= 2
+
+    def within_distance(self, geometry: BaseGeometry, distance):
+        """Returns a list of (object, distance) of all objects within distance of geometry, nearest first"""
+        if self.tree is None:
+            return []
+        minx, miny, maxx, maxy = geometry.bounds
+        envelope = box(minx - distance, miny - distance, maxx + distance, maxy + distance)
+        result = list()
+        for item in self.tree.query(envelope):
+            position = self._position(item)
+            d = self.shapes[position].distance(geometry)
+            if d <= distance:
+                result.append((self.objects[position], d))
+        result.sort(key=lambda r: r[1])
+        return result
@@ -958,6 +958,45 @@ function add_potential_geojson_layer(geojson_pontential_data) {
     }).addTo(get_layers(active_layer_id, 'pot_layer'));
 }
 
+// ------------------------------------------------------------------------------------------------------------
+//   The server sends the geometries of the area layer simplified for a band of zoom levels, the geometries of
+//   another band are requested when the map is zoomed to it
+// ------------------------------------------------------------------------------------------------------------
+var area_layer_zoom_bands = [];
+var area_layer_zoom_band = {};      // es_id -> zoom band of the geometries of the area layer
+
+function get_zoom_band(zoom) {
+    for (let band = 0; band < area_layer_zoom_bands.length; band++) {
+        if (zoom <= area_layer_zoom_bands[band]) return band;
+    }
+    return area_layer_zoom_bands.length;
+}
+
+function request_area_layer_geometries(socket, map) {
+    let band = get_zoom_band(map.getZoom());
+    for (let es_id in area_layer_zoom_band) {
+        if (!(es_id in esdl_list)) {
+            delete area_layer_zoom_band[es_id];     // the energy system has been closed
+        } else if (area_layer_zoom_band[es_id] != band) {
+            area_layer_zoom_band[es_id] = band;
+            socket.emit('get_area_layer_geometries', {es_id: es_id, zoom: map.getZoom()});
+        }
+    }
+}
+
+function update_area_layer_geometries(layer, geometries) {
+    if (layer.feature && layer.setLatLngs) {
+        let geometry = geometries[layer.feature.properties.id];
+        if (geometry) {
+            let levels_deep = geometry.type == 'MultiPolygon' ? 2 : 1;
+            layer.feature.geometry = geometry;
+            layer.setLatLngs(L.GeoJSON.coordsToLatLngs(geometry.coordinates, levels_deep));
+        }
+    } else if (layer.eachLayer) {
+        layer.eachLayer(function(sublayer) { update_area_layer_geometries(sublayer, geometries); });
+    }
+}
+
 function add_geojson_listener(socket, map) {
     socket.on('geojson', function(message) {
         let layer = message['layer'];
@@ -966,6 +1005,11 @@ function add_geojson_listener(socket, map) {
         if (layer == 'area_layer') {
             geojson_area_data = message['geojson'];     // store for redraw based on other KPI
             add_area_geojson_layer_with_legend(geojson_area_data);
+            if ('zoom_band' in message) {
+                area_layer_zoom_bands = message['zoom_bands'];
+                area_layer_zoom_band[message['es_id']] = message['zoom_band'];
+                request_area_layer_geometries(socket, map);
+            }
         }
 
         // add_building_geojson_layer_with_legend is now called from the 'add_building_objects' socketIO handler
@@ -979,6 +1023,17 @@ function add_geojson_listener(socket, map) {
             add_potential_geojson_layer(message['geojson']);
         }
     });
+
+    socket.on('area_layer_geometries', function(message) {
+        let es_id = message['es_id'];
+        if (es_id in esdl_list && area_layer_zoom_band[es_id] == message['zoom_band']) {
+            update_area_layer_geometries(get_layers(es_id, 'area_layer'), message['geometries']);
+        }
+    });
+
+    map.on('zoomend', function() {
+        request_area_layer_geometries(socket, map);
+    });
 }
 
 // ------------------------------------------------------------------------------------------------------------
@@ -219,6 +219,19 @@ function add_area_map_handlers(socket, map) {
             event.preventDefault();
             return true;
         }
+        // Undo (Ctrl+Z) and redo (Ctrl+Y or Ctrl+Shift+Z) the last edit, except in text fields that have their own undo
+        let in_text_field = $(event.target).is('input, textarea, select, [contenteditable="true"]');
+        if (!in_text_field && event.ctrlKey && !event.altKey && !event.metaKey) {
+            if (event.key.toLowerCase() === 'z' && !event.shiftKey) {
+                socket.emit('undo');
+                event.preventDefault();
+                return true;
+            } else if (event.key.toLowerCase() === 'y' || (event.key.toLowerCase() === 'z' && event.shiftKey)) {
+                socket.emit('redo');
+                event.preventDefault();
+                return true;
+            }
+        }
     });
 
     map.on('keydown', function(e){
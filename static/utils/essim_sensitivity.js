@@ -18,9 +18,6 @@ class ESSIM_sensitivity{
     constructor() {
         this.initSocketIO();
 
-        this.attempt = 0;
-        this.kpi_progress_prev_progress = 0;
-        this.kpi_progress_attempt = 0;
         this.kpis = false;
         this.asset_list = [];
         this.sim_start_datetime = "";
@@ -29,6 +26,14 @@ class ESSIM_sensitivity{
 
     initSocketIO() {
         console.log("Registering ESSIM sensitivity plugin");
+
+        // the simulations of the sensitivity analysis run on the server, which reports the progress of each of them
+        socket.on('essim_sensitivity_run_progress', function(run) {
+            essim_sensitivity_plugin.show_run_progress(run);
+        });
+        socket.on('essim_sensitivity_finished', function(progress) {
+            essim_sensitivity_plugin.show_finished(progress);
+        });
     }
 
     show_ESSIM_sensitivity_analysis_window() {
@@ -81,141 +86,53 @@ class ESSIM_sensitivity{
         $('#essim_sens_button_div').hide();
     }
 
-    next_simulation() {
-        socket.emit('essim_sensitivity_next_simulation', function(res) {
-            if (res == 1) {
-                setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_progress, 1000);
-            } else {
-                $('#essim_sensitivity_title').text('ESSIM Sensitivity Analysis - Simulations finished');
-                $('#sens_analysis_progress').empty();
-                if (essim_sensitivity_plugin.kpis.length) {
-                    socket.emit('kpi_visualization');
-                }
-            }
-        });
+    cancel_simulations() {
+        socket.emit('essim_sensitivity_cancel');
     }
 
-    generate_kpi_calculation_status(status) {
-        let $line = $('<div>');
-        let text = 'KPIs: ';
-        let summed_progress = 0.0;
-        for (let i=0; i<status.length; i++) {
-            let kpi_result_status = status[i];
-
-            let kpi_name = kpi_result_status['name'];
-            let kpi_calc_status = kpi_result_status['calc_status'];
-
-            if (kpi_calc_status === 'Calculating') {
-                let progr_str = kpi_result_status['progress'];
-                let progr_float = Math.round(((100*parseFloat(progr_str))+Number.EPSILON) * 100) / 100;
-                text = text + ((progr_float).toString() + '%-');
-                summed_progress = summed_progress + progr_float;
-            } else {
-                text = text + kpi_calc_status+'-';
-            }
+    run_progress_text(run) {
+        let text = run['title'] ? run['title'] : 'Simulation ' + (run['index'] + 1);
+        if (run['status'] === 'RUNNING') {
+            text = text + ': ' + Math.round(parseFloat(run['percentage']) * 100) + '%';
+        } else if (run['status'] === 'KPIS') {
+            text = text + ': calculating KPIs';
+        } else if (run['status'] === 'ERROR') {
+            text = text + ': error - ' + run['description'];
+        } else {
+            text = text + ': ' + run['status'].toLowerCase();
         }
-        $line.append($('<p>').text(text));
-        return [$line, summed_progress];
+        return text;
     }
 
-    monitor_sensitivity_analysis_kpi_progress() {
-        $.ajax({
-            url: ESSIM_simulation_URL_prefix + 'essim_kpi_results',
-            success: function(data){
-                console.log(data);
-
-                $('#kpi_progress_div').empty();
-                if (data['still_calculating']) {
-                    let status = data['results'];
-                    let result = essim_sensitivity_plugin.generate_kpi_calculation_status(status);
-                    let $line = result[0];
-                    let summed_progress = result[1];
-                    $('#sens_analysis_progress').empty().append($line);
-
-                    if (essim_sensitivity_plugin.kpi_progress_prev_progress < 1e-6) {
-                        if (Math.abs(summed_progress - essim_sensitivity_plugin.kpi_progress_prev_progress) < 1e-6) {
-                            essim_sensitivity_plugin.kpi_progress_attempt = essim_sensitivity_plugin.kpi_progress_attempt + 1;
-                            if (essim_sensitivity_plugin.kpi_progress_attempt == 20) {
-                                $('#sens_analysis_progress').append($('<div>').append($('<p>').text('No KPI progress anymore')));
-                                essim_sensitivity_plugin.kpi_progress_prev_progress = 0.0;
-                                essim_sensitivity_plugin.kpi_progress_attempt = 0;
-                                return;
-                            }
-                        } else {
-                            essim_sensitivity_plugin.kpi_progress_prev_progress = summed_progress;
-                            essim_sensitivity_plugin.kpi_progress_attempt = 0;
-                        }
-                    } else
-                        essim_sensitivity_plugin.kpi_progress_prev_progress = summed_progress;
+    show_run_progress(run) {
+        let $progress = $('#sens_analysis_progress');
+        let $line = $('#sens_analysis_run_' + run['index']);
+        if ($line.length === 0) {
+            $line = $('<p>').attr('id', 'sens_analysis_run_' + run['index']).css('font-size', '70%');
+            $progress.append($line);
+        }
 
-                    setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_kpi_progress, 1000);
-                } else {
-                    essim_sensitivity_plugin.kpi_progress_prev_line = null;
-                    essim_sensitivity_plugin.kpi_progress_attempt = 0;
-                    essim_sensitivity_plugin.next_simulation();
-                }
-            },
-            dataType: "json",
-            error: function(xhr, ajaxOptions, thrownError) {
-                console.log(xhr.status);
-                console.log(thrownError);
-
-                if (essim_sensitivity_plugin.attempt<5) {
-                    essim_sensitivity_plugin.attempt = essim_sensitivity_plugin.attempt + 1;
-                    setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_kpi_progress, 1000);
-                } else {
-                    essim_sensitivity_plugin.attempt = 0;
-                }
+        if (run['status'] === 'COMPLETE') {
+            $line.remove();
+            let $finished = $('<p>').text(run['title'] + ': ');
+            if (run['url']) {
+                $finished.append($('<a>').attr('href', run['url']).attr('target', '#').text('dashboard'));
             }
-        });
+            $('#essim_sens_finished_div').append($finished);
+        } else {
+            $line.text(essim_sensitivity_plugin.run_progress_text(run));
+        }
     }
 
-    monitor_sensitivity_analysis_progress() {
-        $.ajax({
-            url: ESSIM_simulation_URL_prefix + 'simulation_progress',
-            success: function(data){
-                // console.log(data);
-                if (data["status"] == "ERROR") {
-                    let description = data["description"];
-                    let more_info = data["moreInfo"];
-
-                    $('#essim_sensitivity_title').text('ESSIM Sensitivity Analysis - Simulation error');
-                    document.getElementById('sens_analysis_progress').innerHTML = '<p style="font-size:70%;" title="'+more_info+'">'+description+'</p>';
-                } else if (data["status"] == "COMPLETE") {
-                    let dashboardURL = data["url"];
-                    let simulationRun = data["simulationRun"];
-
-                    $('#essim_sens_finished_div').append($('<p>').text(simulationRun + ': Go to ')
-                        .append($('<a>').attr('href', dashboardURL).attr('target', '#').text('dashboard')));
-
-                    let progress = document.getElementById('sens_analysis_progress');
-                    progress.innerHTML =  '';
-
-                    essim_sensitivity_plugin.attempt = 0;
-                    if (essim_sensitivity_plugin.kpis.length)
-                        essim_sensitivity_plugin.monitor_sensitivity_analysis_kpi_progress();
-                    else
-                        essim_sensitivity_plugin.next_simulation();
-                } else {
-                    let percentage = Math.round(parseFloat(data["percentage"]) * 100);
-                    let progress = document.getElementById('sens_analysis_progress');
-                    progress.innerHTML = 'ESSIM simulation progress: ' + percentage + '%';
-                    setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_progress, 1000);
-                }
-            },
-            dataType: "json",
-            error: function(xhr, ajaxOptions, thrownError) {
-                console.log(xhr.status);
-                console.log(thrownError);
-
-                if (essim_sensitivity_plugin.attempt<5) {
-                    essim_sensitivity_plugin.attempt = essim_sensitivity_plugin.attempt + 1;
-                    setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_progress, 1000);
-                } else {
-                    essim_sensitivity_plugin.attempt = 0;
-                }
-            }
-        });
+    show_finished(progress) {
+        $('#essim_sensitivity_title').text('ESSIM Sensitivity Analysis - Simulations finished');
+        $('#essim_sens_cancel_button').hide();
+        if (progress['errors'] === 0) {
+            $('#sens_analysis_progress').empty();
+        }
+        if (essim_sensitivity_plugin.kpis.length) {
+            socket.emit('essim_sensitivity_show_kpis');
+        }
     }
 
     show_sensitivity_analyis_progress_monitoring() {
@@ -228,13 +145,20 @@ class ESSIM_sensitivity{
 
         let $progress_div = $('<div>').attr('id', 'essim_sens_progress_div').addClass('sidebar-div');
         $div.append($progress_div);
-        $progress_div.append($('<p>').attr('id', 'sens_analysis_progress'));
-        $progress_div.append($('<p>').attr('id', 'sens_analysis_dashboard_url'));
-        $progress_div.append($('<p>').attr('id', 'sens_analysis_simulationRun'));
+        $progress_div.append($('<div>').attr('id', 'sens_analysis_progress'));
 
-        // Query progress
-        essim_sensitivity_plugin.monitor_sensitivity_analysis_progress();
-        // setTimeout(essim_sensitivity_plugin.monitor_sensitivity_analysis_progress, 1000);
+        let $cancel_button = $('<button>').attr('id', 'essim_sens_cancel_button').text('Cancel');
+        $cancel_button.click(function () { essim_sensitivity_plugin.cancel_simulations(); });
+        $progress_div.append($cancel_button);
+
+        // show the state of an analysis that was already running, e.g. after a page reload
+        socket.emit('essim_sensitivity_progress', function(progress) {
+            if (progress) {
+                for (let i=0; i<progress['runs'].length; i++) {
+                    essim_sensitivity_plugin.show_run_progress(progress['runs'][i]);
+                }
+            }
+        });
     }
 
     select_kpis_window() {
@@ -270,6 +270,37 @@ function find_layer_by_id(es_id, layer_name, id) {
     }
 }
 
+function remove_esdl_object_by_id(es_id, id) {
+    let layer = find_layer_by_id(es_id, 'esdl_layer', id);
+    if (layer !== undefined) {
+        remove_object_from_layer(es_id, 'esdl_layer', layer);
+    }
+}
+
+function remove_building_by_id(es_id, id) {
+    // a building is shown as a marker in the esdl_layer and/or as a feature of a geojson layer in the bld_layer
+    remove_esdl_object_by_id(es_id, id);
+    let geojson_layers = get_layers(es_id, 'bld_layer').getLayers();
+    for (let i=0; i<geojson_layers.length; i++) {
+        if (geojson_layers[i] instanceof L.GeoJSON) {
+            let bld_layers = geojson_layers[i].getLayers();
+            for (let j=0; j<bld_layers.length; j++) {
+                if (bld_layers[j].feature.properties.id == id) {
+                    geojson_layers[i].removeLayer(bld_layers[j]);
+                    return;
+                }
+            }
+        }
+    }
+}
+
+function remove_connection_by_id(es_id, id) {
+    let conn = find_layer_by_id(es_id, 'connection_layer', id);
+    if (conn !== undefined) {
+        remove_object_from_layer(es_id, 'connection_layer', conn);
+    }
+}
+
 function clear_layers(es_id, layer_name) {
     if (es_id != null) {
         esdl_list[es_id].layers[layer_name].clearLayers();
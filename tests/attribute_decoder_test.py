@@ -0,0 +1,85 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import gc
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from esdl.support_functions import gc_paused
+
+ESDL = """<?xml version='1.0' encoding='UTF-8'?>
+<esdl:EnergySystem xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:esdl="http://www.tno.nl/esdl" id="es" name="Decoders">
+  <instance xsi:type="esdl:Instance" id="inst" name="Instance">
+    <area xsi:type="esdl:Area" id="area" name="Area" scope="MUNICIPALITY">
+      <asset xsi:type="esdl:HeatingDemand" id="hd" name="Demand" power="1500.5" aggregationCount="3" state="OPTIONAL" oldAttribute="1">
+        <port xsi:type="esdl:InPort" id="hd_in" name="In" connectedTo="pv_out"/>
+        <geometry xsi:type="esdl:Point" lat="52.1" lon="4.3"/>
+      </asset>
+      <asset xsi:type="esdl:PVInstallation" id="pv" name="PV" aggregated="true" surfaceArea="20">
+        <port xsi:type="esdl:OutPort" id="pv_out" name="Out" connectedTo="hd_in"/>
+      </asset>
+      <asset id="hd2" xsi:type="esdl:HeatingDemand" unknownAttribute="x"/>
+    </area>
+  </instance>
+</esdl:EnergySystem>
+"""
+
+
+def test_attribute_values():
+    esh = EnergySystemHandler()
+    es, parse_info = esh.load_from_string(ESDL)
+    hd = esh.get_by_id(es.id, 'hd')
+    assert isinstance(hd, esdl.HeatingDemand)
+    assert hd.power == 1500.5 and isinstance(hd.power, float)
+    assert hd.aggregationCount == 3 and isinstance(hd.aggregationCount, int)
+    assert hd.state == esdl.AssetStateEnum.OPTIONAL
+    assert hd.geometry.lat == 52.1
+    pv = esh.get_by_id(es.id, 'pv')
+    assert pv.aggregated is True and pv.surfaceArea == 20
+    assert es.instance[0].area.scope == esdl.AreaScopeEnum.MUNICIPALITY
+    assert hd.port[0].connectedTo[0] is pv.port[0]
+    # attributes that are not in the file have their default value and are not set
+    assert pv.power == 0.0 and not pv.eIsSet('power')
+    assert hd.eIsSet('power')
+
+    # unknown attributes are ignored and reported, for each element
+    assert len(parse_info) == 2
+    assert 'oldAttribute' in parse_info[0] and 'HeatingDemand' in parse_info[0] and 'line 5' in parse_info[0]
+    assert 'unknownAttribute' in parse_info[1] and 'line 12' in parse_info[1]
+
+    # changes after loading are notified as usual
+    notifications = []
+    hd.listeners.append(type('Listener', (), {'notifyChanged': lambda self, n: notifications.append(n)})())
+    hd.power = 10.0
+    assert notifications[0].old == 1500.5 and notifications[0].new == 10.0
+
+
+def test_gc_paused():
+    assert gc.isenabled()
+    # small energy systems are loaded with the collector enabled
+    with gc_paused(False):
+        assert gc.isenabled()
+    # the collector is enabled again when the last pause ends, also when the pauses of threads overlap
+    first, second = gc_paused(), gc_paused()
+    first.__enter__()
+    second.__enter__()
+    assert not gc.isenabled()
+    first.__exit__(None, None, None)
+    assert not gc.isenabled()
+    second.__exit__(None, None, None)
+    assert gc.isenabled()
+
+
+if __name__ == '__main__':
+    test_attribute_values()
+    test_gc_paused()
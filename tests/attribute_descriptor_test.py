@@ -0,0 +1,43 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+from esdl import esdl
+from esdl.processing import ESDLEcore
+from esdl.processing.EcoreDocumentation import EcoreDocumentation
+
+
+def test_asset_attributes():
+    esdl_doc = EcoreDocumentation(esdlEcoreFile="esdl/esdl.ecore")
+    ESDLEcore.cache_attribute_descriptors(esdl_doc=esdl_doc)
+    descriptors = ESDLEcore.get_attribute_descriptors(esdl.HeatingDemand.eClass, esdl_doc)
+    assert ESDLEcore.get_attribute_descriptors(esdl.HeatingDemand.eClass, esdl_doc) is descriptors
+
+    demand = esdl.HeatingDemand(id='hd', name='Demand', power=1500.0, state=esdl.AssetStateEnum.OPTIONAL)
+    attributes = ESDLEcore.get_asset_attributes(demand, esdl_doc)
+    assert [a['name'] for a in attributes] == sorted(a['name'] for a in attributes)
+    attrs = {a['name']: a for a in attributes}
+    assert attrs['power']['value'] == '1500.0' and attrs['power']['unit'] == 'W'
+    assert attrs['power']['doc'] is not None
+    assert attrs['state']['type'] == 'EEnum' and attrs['state']['value'] == 'OPTIONAL'
+    assert attrs['state']['default'] == 'ENABLED' and 'DISABLED' in attrs['state']['options']
+    assert attrs['aggregated']['options'] == ['true', 'false']
+
+    # the cached descriptors are not changed by the values of an object
+    other = ESDLEcore.get_asset_attributes(esdl.HeatingDemand(name='Other'), esdl_doc)
+    assert {a['name']: a for a in other}['name']['value'] == 'Other' and attrs['name']['value'] == 'Demand'
+    assert all(descriptor['value'] is None for _, descriptor in descriptors)
+
+
+if __name__ == '__main__':
+    test_asset_attributes()
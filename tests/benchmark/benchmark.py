@@ -0,0 +1,278 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Benchmarks of loading, processing, serializing, copying, merging and comparing energy systems.
+
+Run from the root of the repository:
+
+    python -m tests.benchmark.benchmark --scales small,medium
+
+Every benchmark is run on synthetic energy systems (see esdl_generator) of each scale. The wall time (best of
+--repeat runs), the peak memory (measured with tracemalloc in a separate run) and the size of the produced payload
+(ESDL string, emitted socket.io messages) are appended to a JSON history file, together with the git commit, and
+compared with the previous entry of the history to find regressions.
+"""
+
+import argparse
+import copy
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from xmldiff import main as xmldiff
+from esdl.esdl_handler import EnergySystemHandler
+from src.merge import ESDLMerger
+from src.process_es_area_bld import process_energy_system
+from tests.benchmark.esdl_generator import SCALES, generate_esdl_string, count_objects
+from tests.benchmark.stubs import offline, reset_session
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), 'history.json')
+REGRESSION_THRESHOLD = 1.2
+
+
+def load(esdl_string):
+    esh = EnergySystemHandler()
+    es, _ = esh.load_from_string(esdl_string)
+    return esh, es
+
+
+def mutate(esdl_string):
+    """Returns the ESDL of the energy system with some changed attributes, to compare it with the original"""
+    esh, es = load(esdl_string)
+    assets = [obj for obj in es.eAllContents() if hasattr(obj, 'power')]
+    for asset in assets[::10]:
+        asset.power = asset.power * 2
+    return esh.to_string(es.id)
+
+
+# Every benchmark has a setup function, that is called before each run and is not timed, and a run function that
+# returns the size of its result (or None)
+
+def setup_load_from_string(data):
+    return data['esdl']
+
+
+def run_load_from_string(esdl_string):
+    load(esdl_string)
+    return len(esdl_string)
+
+
+def setup_loaded(data):
+    return load(data['esdl'])
+
+
+def run_process_energy_system(state):
+    esh, es = state
+    with offline() as recorder:
+        process_energy_system(esh)
+        return recorder.total_size(), dict(recorder.events)
+
+
+def run_to_string(state):
+    esh, es = state
+    return len(esh.to_string(es.id))
+
+
+def run_deepcopy(state):
+    esh, es = state
+    copy.deepcopy(es)
+
+
+def setup_merge(data):
+    return load(data['esdl'])[1], load(data['other_esdl'])[1]
+
+
+def run_merge(state):
+    left, right = state
+    ESDLMerger().merge(left, right)
+
+
+def setup_compare(data):
+    return data['esdl'], data['mutated_esdl']
+
+
+def run_compare(state):
+    # as ESDLCompare does
+    left, right = state
+    return len(str(xmldiff.diff_texts(left.encode(), right.encode())))
+
+
+BENCHMARKS = {
+    'load_from_string': (setup_load_from_string, run_load_from_string),
+    'process_energy_system': (setup_loaded, run_process_energy_system),
+    'to_string': (setup_loaded, run_to_string),
+    'deepcopy': (setup_loaded, run_deepcopy),
+    'merge': (setup_merge, run_merge),
+    'compare': (setup_compare, run_compare),
+}
+
+# the XML diff of ESDLCompare is quadratic, it is skipped for energy systems with more objects
+MAX_OBJECTS = {
+    'compare': 10000
+}
+
+
+def create_data(scale):
+    esdl_string = generate_esdl_string(**scale)
+    return {
+        'esdl': esdl_string,
+        'other_esdl': generate_esdl_string(seed=2, prefix='other_', **scale),
+        'mutated_esdl': mutate(esdl_string),
+        'objects': count_objects(load(esdl_string)[1])
+    }
+
+
+def measure(setup, run, data, repeat):
+    """Runs a benchmark and returns its result: best wall time, peak memory and size of the payload"""
+    result = dict()
+    wall_times = []
+    with redirect_stdout(io.StringIO()):   # processing and merging print a lot
+        for _ in range(repeat):
+            state = setup(data)
+            start = time.perf_counter()
+            payload = run(state)
+            wall_times.append(time.perf_counter() - start)
+            del state
+
+        state = setup(data)
+        tracemalloc.start()
+        try:
+            run(state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del state
+
+    result['wall_time'] = min(wall_times)
+    result['peak_memory'] = peak
+    if isinstance(payload, tuple):
+        payload, result['emitted'] = payload
+    if payload is not None:
+        result['payload_size'] = payload
+    return result
+
+
+def run_benchmarks(scales, benchmarks=None, repeat=3, log=print):
+    """
+    :param scales: dict of scale name -> parameters of generate_energy_system
+    :param benchmarks: names of the benchmarks to run, by default all
+    :return: dict of scale name -> benchmark name -> result
+    """
+    results = dict()
+    for scale_name, scale in scales.items():
+        data = create_data(scale)
+        results[scale_name] = {'objects': data['objects'], 'esdl_size': len(data['esdl'])}
+        log('{} ({} objects, {} bytes of ESDL)'.format(scale_name, data['objects'], len(data['esdl'])))
+        for name in benchmarks or BENCHMARKS:
+            if data['objects'] > MAX_OBJECTS.get(name, data['objects']):
+                log('  {:24s} skipped'.format(name))
+                continue
+            setup, run = BENCHMARKS[name]
+            result = measure(setup, run, data, repeat)
+            results[scale_name][name] = result
+            log('  {:24s} {:9.4f}s {:10.1f}MB{}'.format(name, result['wall_time'], result['peak_memory'] / 2**20,
+                                                       '  {} bytes'.format(result['payload_size'])
+                                                       if 'payload_size' in result else ''))
+        reset_session()
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(__file__)).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)).strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path, results):
+    history = read_history(path)
+    entry = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    history.append(entry)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+    return entry
+
+
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares the results of two history entries
+    :return: list of (scale, benchmark, metric, previous value, current value) of the metrics that increased more
+             than threshold times
+    """
+    regressions = []
+    for scale_name, benchmarks in current['results'].items():
+        previous_benchmarks = previous['results'].get(scale_name, {})
+        for name, result in benchmarks.items():
+            if not isinstance(result, dict) or name not in previous_benchmarks:
+                continue
+            for metric in ('wall_time', 'peak_memory', 'payload_size'):
+                old, new = previous_benchmarks[name].get(metric), result.get(metric)
+                if old and new and new > old * threshold:
+                    regressions.append((scale_name, name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ESDL MapEditor benchmarks')
+    parser.add_argument('--scales', default='small,medium', help='comma separated: ' + ', '.join(SCALES))
+    parser.add_argument('--benchmarks', default=None, help='comma separated: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON file the results are appended to')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='report metrics that increased more than this factor since the previous run')
+    args = parser.parse_args(argv)
+
+    scales = {name: SCALES[name] for name in args.scales.split(',')}
+    benchmarks = args.benchmarks.split(',') if args.benchmarks else None
+    previous = read_history(args.history)
+    results = run_benchmarks(scales, benchmarks, args.repeat)
+    entry = append_history(args.history, results)
+    print('Results of commit {} appended to {}'.format(entry['commit'], args.history))
+
+    if previous:
+        regressions = compare(previous[-1], entry, args.threshold)
+        for scale_name, name, metric, old, new in regressions:
+            print('Regression in {} {} {}: {:.4g} -> {:.4g}'.format(scale_name, name, metric, old, new))
+        if not regressions:
+            print('No regressions compared with commit {}'.format(previous[-1]['commit']))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
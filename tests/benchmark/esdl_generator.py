@@ -0,0 +1,150 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Generates synthetic energy systems of a given size for benchmarks.
+
+An energy system has a top area with municipalities (areas with a boundary id, without geometry, such that their
+boundary is requested from the BoundaryService) and neighbourhoods with a polygon geometry. Each neighbourhood has
+buildings with assets (a heating demand and a PV installation) and a grid of cables that connects the buildings to
+a transformer. The generator is deterministic for a given seed, except for the (random) id of the energy system.
+"""
+
+import random
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+
+SMALL = dict(areas=2, buildings=10, assets=2, conductors=10)
+MEDIUM = dict(areas=5, buildings=50, assets=3, conductors=50)
+LARGE = dict(areas=10, buildings=200, assets=4, conductors=200)
+
+SCALES = {
+    'small': SMALL,
+    'medium': MEDIUM,
+    'large': LARGE
+}
+
+ORIGIN_LAT = 52.0
+ORIGIN_LON = 4.5
+AREA_SIZE = 0.02        # degrees
+
+
+def polygon(lat, lon, size):
+    pol = esdl.Polygon(CRS='WGS84')
+    sub = esdl.SubPolygon()
+    for dlat, dlon in ((0, 0), (0, size), (size, size), (size, 0), (0, 0)):
+        sub.point.append(esdl.Point(lat=lat + dlat, lon=lon + dlon))
+    pol.exterior = sub
+    return pol
+
+
+def line(lat1, lon1, lat2, lon2):
+    geometry = esdl.Line()
+    geometry.point.append(esdl.Point(lat=lat1, lon=lon1))
+    geometry.point.append(esdl.Point(lat=lat2, lon=lon2))
+    return geometry
+
+
+def create_neighbourhood(prefix, area_index, lat, lon, buildings, assets, conductors, carrier, rnd):
+    area = esdl.Area(id='{}WK{:06d}'.format(prefix, area_index), name='Neighbourhood {}'.format(area_index),
+                     scope=esdl.AreaScopeEnum.NEIGHBOURHOOD)
+    area.geometry = polygon(lat, lon, AREA_SIZE)
+
+    transformer = esdl.Transformer(id='{}tr{}'.format(prefix, area_index), name='Transformer {}'.format(area_index))
+    transformer.geometry = esdl.Point(lat=lat + AREA_SIZE / 2, lon=lon + AREA_SIZE / 2)
+    transformer_out = esdl.OutPort(id=transformer.id + '_out', name='Out', carrier=carrier)
+    transformer.port.append(esdl.InPort(id=transformer.id + '_in', name='In', carrier=carrier))
+    transformer.port.append(transformer_out)
+    area.asset.append(transformer)
+
+    # a chain of cables from the transformer, the buildings are connected to the cables
+    cable_out_ports = list()
+    previous_port = transformer_out
+    prev_lat, prev_lon = transformer.geometry.lat, transformer.geometry.lon
+    for c in range(conductors):
+        cable_lat = lat + rnd.random() * AREA_SIZE
+        cable_lon = lon + rnd.random() * AREA_SIZE
+        cable = esdl.ElectricityCable(id='{}cable{}_{}'.format(prefix, area_index, c), name='Cable {}'.format(c))
+        cable.geometry = line(prev_lat, prev_lon, cable_lat, cable_lon)
+        cable.length = 1000.0
+        cable_in = esdl.InPort(id=cable.id + '_in', name='In', carrier=carrier)
+        cable_out = esdl.OutPort(id=cable.id + '_out', name='Out', carrier=carrier)
+        cable_in.connectedTo.append(previous_port)
+        cable.port.extend([cable_in, cable_out])
+        area.asset.append(cable)
+        cable_out_ports.append(cable_out)
+        previous_port = cable_out
+        prev_lat, prev_lon = cable_lat, cable_lon
+
+    for b in range(buildings):
+        bld_lat = lat + rnd.random() * AREA_SIZE
+        bld_lon = lon + rnd.random() * AREA_SIZE
+        building = esdl.Building(id='{}bld{}_{}'.format(prefix, area_index, b), name='Building {}'.format(b),
+                                 buildingYear=1950 + rnd.randint(0, 70), floorArea=rnd.uniform(50, 500))
+        building.geometry = polygon(bld_lat, bld_lon, 0.0002)
+        for a in range(assets):
+            asset_id = '{}_a{}'.format(building.id, a)
+            if a % 2 == 0:
+                asset = esdl.HeatingDemand(id=asset_id, name='Heating demand {}'.format(a), power=rnd.uniform(1e3, 1e4))
+                asset.port.append(esdl.InPort(id=asset_id + '_in', name='In', carrier=carrier))
+            else:
+                asset = esdl.PVInstallation(id=asset_id, name='PV {}'.format(a), power=rnd.uniform(1e3, 5e3))
+                asset.port.append(esdl.OutPort(id=asset_id + '_out', name='Out', carrier=carrier))
+            asset.geometry = esdl.Point(lat=bld_lat + 0.0001, lon=bld_lon + 0.0001)
+            if cable_out_ports and isinstance(asset.port[0], esdl.InPort):
+                asset.port[0].connectedTo.append(rnd.choice(cable_out_ports))
+            building.asset.append(asset)
+        area.asset.append(building)
+    return area
+
+
+def generate_energy_system(areas=2, buildings=10, assets=2, conductors=10, seed=1, prefix=''):
+    """
+    Creates an energy system with areas municipalities, each with a neighbourhood with the given number of
+    buildings (with assets assets each) and conductors
+    :param prefix: prefix of the ids of all objects except the municipalities, to generate energy systems with
+                   different neighbourhoods in the same municipalities, that can be merged
+    :return: the EnergySystemHandler and the energy system
+    """
+    rnd = random.Random(seed)
+    esh = EnergySystemHandler()
+    es = esh.create_empty_energy_system('Benchmark {}'.format(prefix), 'Synthetic energy system', 'Instance',
+                                        'Top area')
+    es.instance[0].id = prefix + 'instance'
+    carrier = esdl.ElectricityCommodity(id=prefix + 'electricity', name='Electricity', voltage=400.0)
+    es.energySystemInformation = esdl.EnergySystemInformation(id=prefix + 'esi')
+    es.energySystemInformation.carriers = esdl.Carriers(id=prefix + 'carriers')
+    es.energySystemInformation.carriers.carrier.append(carrier)
+
+    top_area = es.instance[0].area
+    top_area.id = prefix + 'top_area'
+    for m in range(areas):
+        municipality = esdl.Area(id='GM{:04d}'.format(m), name='Municipality {}'.format(m),
+                                 scope=esdl.AreaScopeEnum.MUNICIPALITY)
+        lat = ORIGIN_LAT + (m // 10) * AREA_SIZE * 1.5
+        lon = ORIGIN_LON + (m % 10) * AREA_SIZE * 1.5
+        municipality.area.append(create_neighbourhood(prefix, m, lat, lon, buildings, assets, conductors, carrier,
+                                                      rnd))
+        top_area.area.append(municipality)
+    return esh, es
+
+
+def generate_esdl_string(**kwargs):
+    esh, es = generate_energy_system(**kwargs)
+    return esh.to_string(es.id)
+
+
+def count_objects(es):
+    """Number of objects in the energy system (the root and all its contents)"""
+    return 1 + sum(1 for _ in es.eAllContents())
@@ -0,0 +1,118 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+"""
+Local replacements for the socket.io emits, the user session and the BoundaryService, such that the processing of
+an energy system can be benchmarked offline, without a browser, a session store or a boundary service.
+"""
+
+import importlib
+import json
+import re
+from contextlib import contextmanager
+from flask import Flask, session
+import extensions.boundary_service
+from extensions.session_manager import session_backend
+
+CLIENT_ID = 'benchmark'
+
+# modules that emit to the browser while processing an energy system
+EMITTING_MODULES = [
+    'src.process_es_area_bld',
+    'src.area_layer',
+    'src.process_es_delta',
+    'src.esdl_helper',
+    'src.assets_to_be_added',
+]
+
+
+class EmitRecorder:
+    """Replaces flask_socketio.emit, records the number of messages and the size of their JSON payload per event"""
+    def __init__(self):
+        self.events = dict()    # event -> {'count': ..., 'size': ...}
+
+    def __call__(self, event, *args, **kwargs):
+        size = sum(len(json.dumps(arg, default=str)) for arg in args)
+        stats = self.events.setdefault(event, {'count': 0, 'size': 0})
+        stats['count'] += 1
+        stats['size'] += size
+
+    def total_size(self):
+        return sum(stats['size'] for stats in self.events.values())
+
+    def clear(self):
+        self.events.clear()
+
+
+class StubBoundaryService:
+    """Returns a square boundary for every (valid) boundary id, derived from the number in the id"""
+    def __init__(self):
+        self.requests = 0
+
+    def get_user_settings(self, user):
+        return {'boundaries_year': 2019}
+
+    def preload_area_subboundaries_in_cache(self, top_area):
+        pass
+
+    def get_boundary_from_service(self, year, scope, id):
+        if not extensions.boundary_service.is_valid_boundary_id(id):
+            return None
+        self.requests += 1
+        number = int(re.sub('[^0-9]', '', id) or 0)
+        lat = 52.0 + (number // 10) * 0.03
+        lon = 4.5 + (number % 10) * 0.03
+        square = [[lon, lat], [lon + 0.025, lat], [lon + 0.025, lat + 0.025], [lon, lat + 0.025], [lon, lat]]
+        return {
+            'geom': {'type': 'MultiPolygon', 'coordinates': [[square]]},
+            'code': id,
+            'name': 'Boundary {}'.format(id)
+        }
+
+
+def reset_session():
+    """Starts with an empty session, as if the energy system is loaded in a new browser tab"""
+    if session_backend.has_client(CLIENT_ID):
+        for key in list(session_backend.get_all(CLIENT_ID)):
+            session_backend.delete(CLIENT_ID, key)
+    session_backend.set(CLIENT_ID, 'es_info_list', {})
+    session_backend.set(CLIENT_ID, 'user-email', 'benchmark@localhost')
+
+
+@contextmanager
+def offline(recorder: EmitRecorder = None):
+    """
+    Runs the enclosed code in a request context with a session of the benchmark client, with the emits of the
+    processing modules recorded by recorder and with the StubBoundaryService
+    :return: (yields) the recorder
+    """
+    recorder = recorder or EmitRecorder()
+    app = Flask('benchmark')
+    app.secret_key = 'benchmark'
+
+    modules = [importlib.import_module(name) for name in EMITTING_MODULES]
+    original_emits = [module.emit for module in modules]
+    original_boundary_service = extensions.boundary_service.boundary_service
+    for module in modules:
+        module.emit = recorder
+    extensions.boundary_service.boundary_service = StubBoundaryService()
+    try:
+        with app.test_request_context():
+            session['client_id'] = CLIENT_ID
+            reset_session()
+            yield recorder
+    finally:
+        for module, emit in zip(modules, original_emits):
+            module.emit = emit
+        extensions.boundary_service.boundary_service = original_boundary_service
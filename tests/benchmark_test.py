@@ -0,0 +1,59 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+import tempfile
+from tests.benchmark.benchmark import BENCHMARKS, run_benchmarks, append_history, read_history, compare
+from tests.benchmark.esdl_generator import generate_energy_system, count_objects
+
+
+def test_generator():
+    esh, es = generate_energy_system(areas=2, buildings=3, assets=2, conductors=4)
+    # top area, 2 municipalities with a neighbourhood, each with a transformer, 4 cables and 3 buildings with 2 assets
+    assert len(es.instance[0].area.area) == 2
+    neighbourhood = es.instance[0].area.area[0].area[0]
+    assert len(neighbourhood.asset) == 1 + 4 + 3
+    assert all(len(b.asset) == 2 for b in neighbourhood.asset[5:])
+    esh2, es2 = generate_energy_system(areas=2, buildings=3, assets=2, conductors=4)
+    assert esh.to_string(es.id) == esh2.to_string(es2.id).replace(es2.id, es.id)
+    assert count_objects(es) == count_objects(es2)
+
+
+def test_benchmarks():
+    scales = {'tiny': dict(areas=1, buildings=5, assets=2, conductors=3)}
+    results = run_benchmarks(scales, repeat=1, log=lambda message: None)
+    tiny = results['tiny']
+    for name in BENCHMARKS:
+        assert tiny[name]['wall_time'] > 0 and tiny[name]['peak_memory'] > 0
+    assert tiny['to_string']['payload_size'] == tiny['esdl_size']
+    # runs offline: the emits are recorded, the boundary of the municipality comes from the stub BoundaryService
+    emitted = tiny['process_energy_system']['emitted']
+    assert emitted['add_esdl_objects']['count'] == 1
+    assert emitted['geojson']['size'] > 100
+    assert tiny['process_energy_system']['payload_size'] == sum(e['size'] for e in emitted.values())
+
+    with tempfile.TemporaryDirectory() as directory:
+        history_file = os.path.join(directory, 'history.json')
+        first = append_history(history_file, results)
+        slower = {'tiny': dict(tiny, to_string=dict(tiny['to_string'], wall_time=tiny['to_string']['wall_time'] * 2))}
+        second = append_history(history_file, slower)
+        assert len(read_history(history_file)) == 2
+        assert compare(first, second) == [('tiny', 'to_string', 'wall_time', tiny['to_string']['wall_time'],
+                                           tiny['to_string']['wall_time'] * 2)]
+        assert compare(first, first) == []
+
+
+if __name__ == '__main__':
+    test_generator()
+    test_benchmarks()
@@ -0,0 +1,72 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import struct
+import time
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler, SNAPSHOT_HEADER, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION
+from tests.benchmark.esdl_generator import generate_energy_system
+from tests.frozen_view_test import edit
+
+
+def test_binary_round_trip():
+    esh, es = generate_energy_system(areas=2, buildings=20, assets=3, conductors=10)
+    es.instance[0].area.area[0].area[0].asset[-1].buildingYear = -1
+    es.energySystemInformation.sectors = esdl.Sectors(id='sectors')
+    es.energySystemInformation.sectors.sector.append(esdl.Sector(id='sector', name='Sector'))
+    es.instance[0].area.area[0].sector = es.energySystemInformation.sectors.sector[0]
+    xml = esh.to_string(es.id, compact=True)
+
+    start = time.time()
+    data = esh.to_binary(es.id)
+    encode_time = time.time() - start
+    start = time.time()
+    restored = EnergySystemHandler()
+    restored_es, parse_info = restored.load_from_binary(data)
+    decode_time = time.time() - start
+    print('Binary: {} bytes (XML {} bytes), encode {:.3f}s, decode {:.3f}s'.format(len(data), len(xml), encode_time,
+                                                                                  decode_time))
+    assert len(data) * 3 < len(xml)
+    assert restored.to_string(restored_es.id, compact=True) == xml and parse_info == []
+    assert restored.get_by_id(es.id, 'tr0_out').connectedTo[0] is restored.get_by_id(es.id, 'cable0_0_in')
+    assert restored.get_by_id(es.id, 'tr0_in').energyasset is restored.get_by_id(es.id, 'tr0')
+    assert restored.get_by_id(es.id, 'bld0_19').buildingYear == -1
+    assert restored_es.instance[0].area.area[0].sector is restored.get_by_id(es.id, 'sector')
+
+    # references to removed objects are left out, as in XML
+    edit(esh, es)
+    expected = EnergySystemHandler()
+    expected.load_from_string(esh.to_string(es.id, compact=True))
+    restored_es, _ = restored.add_from_binary('edited', esh.to_binary(es.id))
+    assert restored.to_string(restored_es.id, compact=True) == expected.to_string(es.id, compact=True)
+    assert restored.get_energy_system(es.id) is restored_es
+
+
+def test_snapshot():
+    esh, es = generate_energy_system(areas=1, buildings=5, assets=2, conductors=3)
+    snapshot = esh.to_snapshot()
+    restored = EnergySystemHandler.from_snapshot(snapshot)
+    assert restored.to_string(es.id, compact=True) == esh.to_string(es.id, compact=True)
+
+    unsupported = struct.pack(SNAPSHOT_HEADER, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION + 1, 0)
+    try:
+        EnergySystemHandler.from_snapshot(unsupported)
+        assert False, 'a snapshot of an unsupported version must be rejected'
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    test_binary_round_trip()
+    test_snapshot()
@@ -0,0 +1,106 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import json
+import math
+import os
+import tempfile
+import threading
+from extensions.boundary_cache import BoundaryCache, SQLiteBoundaryStore, prefetch, estimate_size, \
+    SIMPLIFIED_GEOMETRY_KEY
+from src.geometry_simplification import with_zoom_geometries, ZOOM_GEOMETRIES_KEY
+
+
+def create_boundary(code, number_of_points=100):
+    ring = [[5.0 + 0.01 * math.cos(2 * math.pi * i / number_of_points),
+             52.0 + 0.01 * math.sin(2 * math.pi * i / number_of_points)] for i in range(number_of_points)]
+    ring.append(ring[0])
+    return {'code': code, 'name': 'Area ' + code, 'geom': {'type': 'MultiPolygon', 'coordinates': [[ring]]}}
+
+
+def test_lru_eviction():
+    cache = BoundaryCache(max_entries=3)
+    for code in ['GM0001', 'GM0002', 'GM0003']:
+        cache.put('2019' + code, create_boundary(code))
+    assert cache.get('2019GM0001') is not None  # GM0001 is now the most recently used
+    cache.put('2019GM0004', create_boundary('GM0004'))
+    assert len(cache) == 3
+    assert '2019GM0002' not in cache
+    assert '2019GM0001' in cache
+
+    size = estimate_size(with_zoom_geometries(create_boundary('GM0001')))
+    cache = BoundaryCache(max_entries=100, max_memory=int(size * 2.5))
+    for i in range(10):
+        cache.put('2019GM000{}'.format(i), create_boundary('GM000{}'.format(i)))
+    assert len(cache) == 2
+    assert cache.memory <= cache.max_memory
+
+
+def test_sqlite_tier():
+    with tempfile.TemporaryDirectory() as path:
+        db = os.path.join(path, 'boundaries.sqlite')
+        cache = BoundaryCache(max_entries=1, store=SQLiteBoundaryStore(db, simplify_tolerance=0.001))
+        cache.put('2019GM0001', create_boundary('GM0001', 1000))
+        cache.put('2019GM0002', create_boundary('GM0002'))
+        cache.put_subboundary_codes('2019/MUNICIPALITY/PROVINCE/PV27', ['GM0001', 'GM0002'])
+        assert len(cache) == 1
+
+        # evicted from memory, but still available from the database, at full resolution and simplified
+        boundary = cache.get('2019GM0001')
+        assert boundary['name'] == 'Area GM0001'
+        assert boundary['geom'] == create_boundary('GM0001', 1000)['geom']
+        assert boundary[SIMPLIFIED_GEOMETRY_KEY]['type'] == 'MultiPolygon'
+        assert 4 <= len(boundary[SIMPLIFIED_GEOMETRY_KEY]['coordinates'][0][0]) < 1000
+
+        # a new process uses the same database
+        cache.store.close()
+        cache2 = BoundaryCache(store=SQLiteBoundaryStore(db))
+        assert cache2.get('2019GM0002')['code'] == 'GM0002'
+        assert cache2.get_subboundary_codes('2019/MUNICIPALITY/PROVINCE/PV27') == ['GM0001', 'GM0002']
+        assert cache2.get('2019GM0003') is None
+
+        # boundaries that were stored without the zoom variants get them when they are loaded
+        with cache2.store._lock, cache2.store._connection:
+            cache2.store._connection.execute('INSERT INTO boundary (key, data) VALUES (?, ?)',
+                                             ('2019GM0004', json.dumps(create_boundary('GM0004'))))
+        assert ZOOM_GEOMETRIES_KEY in cache2.get('2019GM0004')
+        assert ZOOM_GEOMETRIES_KEY not in cache2.store.get('2019GM0004')
+        cache2.store.close()
+
+
+def test_prefetch():
+    cache = BoundaryCache()
+    cache.put('2019GM0000', create_boundary('GM0000'))
+    requested = []
+    lock = threading.Lock()
+    # the missing boundaries are requested concurrently: every request waits until all of them have been made
+    all_requested = threading.Barrier(9, timeout=30)
+
+    def fetch(year, code):
+        with lock:
+            requested.append(code)
+        all_requested.wait()
+        return create_boundary(code)
+
+    keys = {'2019GM000{}'.format(i): (2019, 'GM000{}'.format(i)) for i in range(10)}
+    assert prefetch(cache, keys, fetch, max_workers=10) == 9
+    assert sorted(requested) == ['GM000{}'.format(i) for i in range(1, 10)]
+    assert all(key in cache for key in keys)
+    assert prefetch(cache, keys, fetch) == 0
+
+
+if __name__ == '__main__':
+    test_lru_eviction()
+    test_sqlite_tier()
+    test_prefetch()
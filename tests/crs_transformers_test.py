@@ -0,0 +1,88 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+from concurrent.futures import ThreadPoolExecutor
+import pyproj
+from shapely import wkt
+from shapely.ops import transform
+from esdl import esdl
+from esdl.processing import GeometryArrays
+from src.crs_transformers import TransformerRegistry
+from src.shape import Shape
+
+RD_NEW = "EPSG:28992"
+GEOMETRIES = [
+    "POINT (155000 463000)",
+    "LINESTRING (155000 463000, 156000 464000, 157000 463500)",
+    "POLYGON ((155000 463000, 156000 463000, 156000 464000, 155000 463000), "
+    "(155200 463100, 155800 463100, 155800 463600, 155200 463100))",
+    "MULTIPOLYGON (((155000 463000, 156000 463000, 156000 464000, 155000 463000)), "
+    "((157000 465000, 158000 465000, 158000 466000, 157000 465000)))",
+    "GEOMETRYCOLLECTION (POINT (155000 463000), LINESTRING (155000 463000, 156000 464000), POLYGON EMPTY)",
+]
+
+
+def expected(geometry):
+    project = pyproj.Transformer.from_crs(pyproj.CRS(RD_NEW), pyproj.CRS("EPSG:4326"), always_xy=True).transform
+    return transform(project, geometry)
+
+
+def test_transform_geometries():
+    registry = TransformerRegistry()
+    geometries = [wkt.loads(g) for g in GEOMETRIES]
+    transformed = registry.transform_geometries(geometries, RD_NEW)
+    for geometry, result in zip(geometries, transformed):
+        assert result.geom_type == geometry.geom_type
+        assert result.equals_exact(expected(geometry), 1e-9)
+    assert registry.transform_geometry(geometries[2], RD_NEW).equals_exact(transformed[2], 1e-12)
+    assert registry.transform_geometry(geometries[0], "WGS84", None) is geometries[0]
+    assert len(registry._idle[(RD_NEW, "EPSG:4326")]) == 1
+
+    shape = Shape.parse_wkt(GEOMETRIES[1], RD_NEW)
+    assert shape.shape.equals_exact(transformed[1], 1e-12)
+
+
+def test_concurrent_use():
+    # a transformer is never used by two threads at the same time, and returned to the registry afterwards
+    registry = TransformerRegistry()
+    geometry = wkt.loads(GEOMETRIES[3])
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: registry.transform_geometry(geometry, RD_NEW), range(200)))
+    assert all(result.equals_exact(results[0], 1e-12) for result in results)
+    idle = registry._idle[(RD_NEW, "EPSG:4326")]
+    assert 1 <= len(idle) <= 4 and len(set(map(id, idle))) == len(idle)
+
+    with registry.transformer(RD_NEW) as first, registry.transformer(RD_NEW) as second:
+        assert first is not second
+
+
+def test_multipolygon_with_polygons_in_other_crs():
+    rd_polygon = wkt.loads(GEOMETRIES[2])
+    wgs_polygon = expected(wkt.loads(GEOMETRIES[3]).geoms[1])
+    multipolygon = esdl.MultiPolygon(polygon=[GeometryArrays.from_shapely(rd_polygon),
+                                              GeometryArrays.from_shapely(wgs_polygon),
+                                              GeometryArrays.from_shapely(rd_polygon)])
+    multipolygon.polygon[0].CRS = RD_NEW
+    multipolygon.polygon[2].CRS = RD_NEW
+    shape = Shape.create(multipolygon).shape
+    assert [p.geom_type for p in shape.geoms] == ['Polygon'] * 3
+    assert shape.geoms[0].equals_exact(expected(rd_polygon), 1e-9)
+    assert shape.geoms[1].equals_exact(wgs_polygon, 1e-12)
+    assert shape.geoms[2].equals_exact(expected(rd_polygon), 1e-9)
+
+
+if __name__ == '__main__':
+    test_transform_geometries()
+    test_concurrent_use()
+    test_multipolygon_with_polygons_in_other_crs()
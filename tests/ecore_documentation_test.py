@@ -0,0 +1,52 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import json
+import os
+import tempfile
+from esdl.processing.EcoreDocumentation import EcoreDocumentation
+
+
+def test_documentation_index():
+    # the index in the repository is up to date with esdl.ecore, the meta-model is not loaded
+    esdl_doc = EcoreDocumentation(esdlEcoreFile="esdl/esdl.ecore")
+    assert esdl_doc._esdl_model is None
+    assert esdl_doc.get_esdl_version() != 'unknown'
+    assert esdl_doc.get_unit('HeatingDemand', 'power') == 'W'
+    assert esdl_doc.get_unit('HeatingDemand', 'name') == ''
+    power = esdl_doc.esdl_model.getEClassifier('HeatingDemand').findEStructuralFeature('power')
+    assert esdl_doc.get_doc('HeatingDemand', 'power') == power.__doc__
+    assert esdl_doc.get_doc('HeatingDemand', 'unknown') is None and esdl_doc.get_unit('Unknown', 'power') is None
+    # the index only contains the features a class defines, the inherited features are looked up
+    assert esdl_doc.index['classes']['HeatingDemand'][0] == ['Consumer']
+    assert 'power' not in esdl_doc.index['classes']['HeatingDemand'][1]
+    assert os.path.getsize('esdl/esdl_doc_index.json') < os.path.getsize('esdl/esdl.ecore') / 4
+
+    # an index of another ecore file is not used
+    with tempfile.TemporaryDirectory() as path:
+        index_file = os.path.join(path, 'index.json')
+        esdl_doc.write_index(index_file)
+        with open(index_file) as f:
+            index = json.load(f)
+        assert index['classes']['Consumer'][1]['power'][1] == 'W'
+        index['source'] = 'other'
+        index['classes']['Consumer'][1]['power'][1] = 'kW'
+        with open(index_file, 'w') as f:
+            json.dump(index, f)
+        assert EcoreDocumentation(esdlEcoreFile="esdl/esdl.ecore", index_file=index_file) \
+            .get_unit('HeatingDemand', 'power') == 'W'
+
+
+if __name__ == '__main__':
+    test_documentation_index()
@@ -0,0 +1,114 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+import tempfile
+import time
+from esdl import esdl
+import esdl.edit_journal as edit_journal
+from esdl.edit_journal import EditJournalDirectory
+from tests.benchmark.esdl_generator import generate_energy_system
+from tests.frozen_view_test import edit
+
+
+def test_restore():
+    with tempfile.TemporaryDirectory() as path:
+        journals = EditJournalDirectory(path)
+        esh, es = generate_energy_system(areas=2, buildings=5, assets=3, conductors=5)
+        journals.sync('client', esh)
+        journal = es.eResource.edit_journal
+
+        edit(esh, es)
+        neighbourhood = es.instance[0].area.area[0].area[0]
+        new_asset = es.instance[0].area.area[1].area[0].asset[-1]
+        new_asset.port.append(esdl.InPort(id='new_port', name='In'))
+        neighbourhood.asset[0].port[1].connectedTo.append(new_asset.port[0])
+        removed = neighbourhood.asset.pop(0)
+        neighbourhood.asset.append(removed)                                  # removed and added again
+        journals.sync('client', esh)
+        expected = esh.to_string(es.id, compact=True)
+
+        restored = journals.restore('client')
+        assert restored.to_string(es.id, compact=True) == expected
+        assert restored.get_by_id(es.id, 'new_port').energyasset.id == 'new'
+
+        # a new checkpoint replaces the journal (references to removed objects, such as the carriers, are not saved),
+        # a partially written record is ignored
+        journal.checkpoint()
+        assert sorted(os.listdir(journal.directory)) == ['checkpoint.{}.bin'.format(journal.generation)]
+        checkpoint = journals.restore('client').to_string(es.id, compact=True)
+        es.name = 'Renamed'
+        journals.sync('client', esh)
+        expected = checkpoint.replace('name="Benchmark "', 'name="Renamed"', 1)
+        with open(os.path.join(journal.directory, 'journal.{}.log'.format(journal.generation)), 'ab') as f:
+            f.write(b'["s",[null],"na')
+        assert journals.restore('client').to_string(es.id, compact=True) == expected
+
+        journal.close(delete=True)
+        assert not os.path.exists(journal.directory)
+
+
+def test_restore_from_removed_subtree():
+    with tempfile.TemporaryDirectory() as path:
+        journals = EditJournalDirectory(path)
+        esh, es = generate_energy_system(areas=2, buildings=5, assets=3, conductors=5)
+        journals.sync('client', esh)
+
+        top = es.instance[0].area
+        n0, n1 = top.area[0].area[0], top.area[1].area[0]
+        n1.asset.append(n0.asset[0])
+        top.area.remove(top.area[1])
+        n1.asset[-1].name = 'Changed after removal'
+        n1.id = 'moved'
+        top.area.append(n1)                                                  # moved out of a removed subtree
+        cable = n0.asset[0]
+        geometry = cable.geometry
+        cable.geometry = None
+        geometry.point[0].lat = 51.0
+        cable.geometry = geometry
+        journals.sync('client', esh)
+        expected = esh.to_string(es.id, compact=True)
+
+        restored = journals.restore('client')
+        assert restored.to_string(es.id, compact=True) == expected
+        assert restored.get_by_id(es.id, 'cable0_0_in').connectedTo[0].id == 'tr0_out'
+        assert restored.get_by_id(es.id, 'moved').asset[-1].name == 'Changed after removal'
+        es.eResource.edit_journal.close(delete=True)
+
+
+def test_flush_after_interval():
+    fsync_interval = edit_journal.FSYNC_INTERVAL
+    edit_journal.FSYNC_INTERVAL = 0.01
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            journals = EditJournalDirectory(path)
+            esh, es = generate_energy_system(areas=1, buildings=1, assets=1, conductors=1)
+            journals.sync('client', esh)
+            journal = es.eResource.edit_journal
+            es.name = 'Changed by a background job'     # without a request that flushes the journal
+            for _ in range(500):
+                if journal.journal_bytes:
+                    break
+                time.sleep(0.01)
+            assert edit_journal.read_records(journal.directory, journal.generation) == \
+                [['s', [es.id], 'name', 'Changed by a background job']]
+            journal.close(delete=True)
+    finally:
+        edit_journal.FSYNC_INTERVAL = fsync_interval
+
+
+if __name__ == '__main__':
+    test_restore()
+    test_restore_from_removed_subtree()
+    test_flush_after_interval()
@@ -12,8 +12,55 @@
 #  Manager:
 #      TNO
 
+import copy
+from unittest import mock
 from esdl.esdl_handler import EnergySystemHandler
-from esdl import esdl
+from esdl import esdl, support_functions
+from tests.benchmark.esdl_generator import generate_energy_system
+
+
+def assert_copied(original, duplicate, memo):
+    pairs = list(zip(original.eAllContents(), duplicate.eAllContents()))
+    assert len(pairs) == sum(1 for _ in original.eAllContents())
+    for orig, dup in [(original, duplicate)] + pairs:
+        assert orig is not dup and memo[orig] is dup and type(orig) is type(dup)
+        container_features = {f for f in orig._isset if f.is_reference and f.eOpposite and f.eOpposite.containment}
+        assert orig._isset - container_features <= dup._isset
+        for feature in orig.eClass.eAllAttributes():
+            assert orig.eGet(feature) == dup.eGet(feature)
+
+
+def test_deepcopy():
+    esh, es = generate_energy_system(areas=2, buildings=5, assets=2, conductors=3)
+    neighbourhood = es.instance[0].area.area[0].area[0]
+
+    memo = dict()
+    with mock.patch.object(support_functions.logger, 'warning') as warning:
+        duplicate = neighbourhood.deepcopy(memo)
+    assert_copied(neighbourhood, duplicate, memo)
+    assert duplicate.eContainer() is None and neighbourhood.eContainer() is not None
+    # the carrier is not part of the copy, a warning is logged for each reference to it
+    assert warning.call_count == sum(1 for o in neighbourhood.eAllContents() if isinstance(o, esdl.Port))
+
+    cable = next(o for o in neighbourhood.asset if o.id == 'cable0_1')
+    cable_copy = memo[cable]
+    assert cable_copy.port[0].connectedTo[0] is memo[cable.port[0].connectedTo[0]]
+    assert list(cable_copy.port[0].connectedTo[0].connectedTo) == [memo[p] for p in cable.port[0].connectedTo[0].connectedTo]
+    assert cable_copy.port[0].carrier is cable.port[0].carrier
+    assert cable_copy.port[0].energyasset is cable_copy
+    # the original is not changed
+    assert len(cable.port[0].connectedTo) == 1 and cable.port[0].connectedTo[0].eContainer().eContainer() is neighbourhood
+
+    with mock.patch.object(support_functions.logger, 'warning') as warning:
+        neighbourhood.deepcopy(keep_external_references=True)
+    assert warning.call_count == 0
+
+    # copying a complete energy system, also with the copy module
+    memo = dict()
+    es_copy = copy.deepcopy(es, memo)
+    assert_copied(es, es_copy, memo)
+    carrier_copy = es_copy.energySystemInformation.carriers.carrier[0]
+    assert all(port.carrier is carrier_copy for port in es_copy.eAllContents() if isinstance(port, esdl.Port))
 
 
 if __name__ == '__main__':
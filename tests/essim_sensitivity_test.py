@@ -0,0 +1,183 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from extensions.essim_sensitivity import SensitivityAnalysis, ESSIMSensitivity
+
+SIMULATION_DURATION = 0.5
+
+
+class StubESSIM(BaseHTTPRequestHandler):
+    """Minimal ESSIM REST API: a simulation is running for SIMULATION_DURATION seconds after it is posted"""
+    simulations = dict()    # id -> (start time, posted payload)
+    completed = dict()      # id -> time at which the simulation was first reported to be complete
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        if 'Content-Length' in self.headers:
+            return self.rfile.read(int(self.headers['Content-Length']))
+        # the ESDL is streamed, with chunked transfer encoding
+        body = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunk = self.rfile.read(size + 2)[:size]
+            if size == 0:
+                return body
+            body += chunk
+
+    def do_POST(self):
+        payload = json.loads(self.read_body())
+        with StubESSIM.lock:
+            sim_id = 'sim{}'.format(len(StubESSIM.simulations))
+            StubESSIM.simulations[sim_id] = (time.time(), payload)
+        self.reply(201, {'id': sim_id})
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')    # essim/simulation/<id>[/status]
+        start, payload = StubESSIM.simulations[parts[2]]
+        if parts[-1] == 'status':
+            elapsed = time.time() - start
+            if elapsed < SIMULATION_DURATION:
+                self.reply(200, {'State': 'RUNNING', 'Description': str(elapsed / SIMULATION_DURATION)})
+            else:
+                with StubESSIM.lock:
+                    StubESSIM.completed.setdefault(parts[2], time.time())
+                self.reply(200, {'State': 'COMPLETE', 'Description': ''})
+        else:
+            self.reply(200, {'dashboardURL': 'http://dashboard/' + parts[2]})
+
+
+def create_energy_system():
+    esh = EnergySystemHandler()
+    es = esh.create_empty_energy_system('Sensitivity', '', 'Instance', 'Area')
+    es.instance[0].area.asset.append(esdl.WindTurbine(id='wt', name='Wind turbine', power=1e6))
+    return esh, es
+
+
+class StubStoringESSIM:
+    """Stores simulations like ESSIM.store_simulation(): reads the list of the user, adds one and writes it back"""
+    def __init__(self):
+        self.sim_list = []
+
+    def store_simulation(self, user_email, simulation_id, simulation_datetime, simulation_descr,
+                         simulation_es_name=None):
+        sim_list = list(self.sim_list)
+        time.sleep(0.01)
+        self.sim_list = [simulation_id] + sim_list
+
+
+class StubSocketIO:
+    def emit(self, event, data, namespace=None, room=None):
+        pass
+
+
+def max_running(sim_ids):
+    """Returns the maximum number of the simulations that were running at the same time, according to the stub"""
+    intervals = [(StubESSIM.simulations[sim_id][0], StubESSIM.completed[sim_id]) for sim_id in sim_ids]
+    return max(sum(1 for start, end in intervals if start <= t < end) for t, _ in intervals)
+
+
+def start_stub_essim():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubESSIM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/essim/simulation'.format(server.server_address[1])
+
+
+def test_sensitivity_analysis():
+    server, url = start_stub_essim()
+    try:
+        esh, es = create_energy_system()
+        es_data = esh.to_binary(es.id)
+        mutations = [[{'asset_id': 'wt', 'attr': 'attr_name_power', 'value': 1e6 * (i + 1)}] for i in range(8)]
+
+        updates = list()
+        analysis = SensitivityAnalysis(es_data, mutations, {'user': 'test'}, url, max_concurrent=4,
+                                       poll_interval=0.05, on_update=lambda a, run: updates.append(run))
+        analysis.start()
+        assert analysis.wait(timeout=30)
+        # the simulations are monitored concurrently, not one after the other, but not more than max_concurrent
+        assert 1 < max_running([run.sim_id for run in analysis.runs]) <= 4
+
+        progress = analysis.progress()
+        assert progress['done'] and progress['finished'] == 8 and progress['errors'] == 0
+        assert updates[-1] is None
+        for run in analysis.runs:
+            assert run.status == 'COMPLETE'
+            assert run.dashboard_url == 'http://dashboard/' + run.sim_id
+            _, payload = StubESSIM.simulations[run.sim_id]
+            assert payload['simulationDescription'] == run.title and run.title.startswith('power=')
+            # each simulation gets its own mutation of the energy system
+            mutated = EnergySystemHandler()
+            mutated_es, _ = mutated.load_from_string(base64.b64decode(payload['esdlContents']).decode('utf-8'))
+            assert mutated.get_by_id(mutated_es.id, 'wt').power == run.mutations[0]['value']
+
+        # the original energy system is not changed
+        assert es.instance[0].area.asset[0].power == 1e6
+
+        # cancelled analyses do not start remaining simulations
+        analysis = SensitivityAnalysis(es_data, mutations, {'user': 'test'}, url, max_concurrent=1,
+                                       poll_interval=0.05)
+        analysis.cancel()
+        analysis.start()
+        assert analysis.wait(timeout=30)
+        assert all(run.status == 'CANCELLED' for run in analysis.runs)
+    finally:
+        server.shutdown()
+
+
+def test_concurrent_runs_are_stored():
+    server, url = start_stub_essim()
+    try:
+        esh, es = create_energy_system()
+        mutations = [[{'asset_id': 'wt', 'attr': 'attr_name_power', 'value': 1e6 * (i + 1)}] for i in range(8)]
+
+        # the extension without its socket.io handlers
+        sensitivity = ESSIMSensitivity.__new__(ESSIMSensitivity)
+        sensitivity.socketio = StubSocketIO()
+        sensitivity.essim = StubStoringESSIM()
+        sensitivity.analyses = dict()
+        sensitivity._store_lock = threading.Lock()
+
+        analysis = SensitivityAnalysis(esh.to_binary(es.id), mutations, {'user': 'test'}, url, max_concurrent=8,
+                                       poll_interval=0.05,
+                                       on_update=sensitivity._progress_reporter('client', 'user@test'))
+        analysis.start()
+        assert analysis.wait(timeout=30)
+        assert all(run.status == 'COMPLETE' for run in analysis.runs)
+        assert sorted(sensitivity.essim.sim_list) == sorted(run.sim_id for run in analysis.runs)
+        assert analysis.es_data is None
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    test_sensitivity_analysis()
+    test_concurrent_runs_are_stored()
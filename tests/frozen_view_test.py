@@ -0,0 +1,125 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import threading
+from esdl import esdl
+from tests.benchmark.esdl_generator import generate_energy_system
+
+
+def edit(esh, es):
+    """Changes the energy system in all the ways the MapEditor does"""
+    neighbourhood = es.instance[0].area.area[0].area[0]
+    other_neighbourhood = es.instance[0].area.area[1].area[0]
+    cable = neighbourhood.asset[1]
+    building = neighbourhood.asset[-1]
+
+    cable.name = 'Renamed cable'
+    cable.length = 5.0
+    cable.geometry.point[0].lat = 51.0
+    cable.geometry.point.insert(1, esdl.Point(lat=52.0, lon=4.0))
+    neighbourhood.geometry.exterior.point.pop(2)
+    neighbourhood.asset.remove(neighbourhood.asset[2])                    # delete a cable
+    building.asset[0].port[0].connectedTo.clear()                         # disconnect
+    removed = building.asset.pop(1)
+    removed.name = 'Changed after removal'
+    removed.port[0].id = 'changed_port_id'
+    other_neighbourhood.asset.insert(0, building)                         # move to another area
+    other_neighbourhood.asset.append(esdl.HeatingDemand(id='new', name='New'))
+    es.instance[0].area.area[1].scope = esdl.AreaScopeEnum.UNDEFINED
+    es.energySystemInformation = None
+
+
+def test_frozen_view():
+    esh, es = generate_energy_system(areas=2, buildings=5, assets=3, conductors=5)
+    expected = esh.to_string(es.id, compact=True)
+    expected_pretty = esh.to_string(es.id)
+    expected_contents = list(es.eAllContents())
+    neighbourhood = es.instance[0].area.area[0].area[0]
+    cable = neighbourhood.asset[1]
+
+    view = esh.freeze(es.id)
+    edit(esh, es)
+    assert esh.to_string(es.id, compact=True) != expected
+
+    assert view.to_string(compact=True) == expected
+    assert view.to_string() == expected_pretty
+    assert list(view.eAllContents()) == expected_contents
+    assert view.eGet(cable, 'name') == 'Cable 0'
+    assert len(view.eGet(cable.geometry, 'point')) == 2
+    assert view.eGet(neighbourhood, esdl.Area.asset)[2].name == 'Cable 1'
+
+    # a view of the edited energy system is not affected by the first view
+    with esh.freeze(es.id) as second_view:
+        edited = esh.to_string(es.id, compact=True)
+        cable.name = 'Renamed again'
+        assert second_view.to_string(compact=True) == edited
+    assert second_view.closed and second_view not in es.eResource.listeners
+    assert view.to_string(compact=True) == expected
+
+    view.close()
+    assert view not in es.eResource.listeners
+    assert all(view not in obj.listeners for obj in expected_contents)
+
+
+def test_replaced_elements():
+    esh, es = generate_energy_system(areas=1, buildings=2, assets=2, conductors=2)
+    area = es.instance[0].area.area[0].area[0]
+    cable = next(asset for asset in area.asset if isinstance(asset, esdl.ElectricityCable))
+    profile = esdl.TimeSeriesProfile(id='profile', values=[1.0, 2.0, 3.0, 4.0, 5.0])
+    cable.port[0].profile.append(profile)
+    points = list(cable.geometry.point)
+    assets = list(area.asset)
+    expected = esh.to_string(es.id, compact=True)
+
+    with esh.freeze(es.id) as view:
+        cable.geometry.point[0] = esdl.Point(lat=50.0, lon=3.0)                    # replace an element
+        assert cable.geometry.point[0].lat == 50.0 and len(cable.geometry.point) == len(points)
+        area.asset.remove(area.asset[0])
+        area.asset.insert(0, assets[-1])
+        profile.values[1] = 20.0
+        profile.values[2:4] = [30.0]                                              # replace a slice
+        profile.values[::2] = [10.0, 300.0]                                        # an extended slice
+        assert list(profile.values) == [10.0, 20.0, 300.0, 5.0]
+        assert view.eGet(cable.geometry, 'point') == tuple(points)
+        assert view.eGet(area, 'asset') == tuple(assets)
+        assert view.eGet(profile, 'values') == (1.0, 2.0, 3.0, 4.0, 5.0)
+        assert view.to_string(compact=True) == expected
+
+
+def test_concurrent_changes():
+    esh, es = generate_energy_system(areas=2, buildings=5, assets=3, conductors=5)
+    expected = esh.to_string(es.id, compact=True)
+    assets = [obj for obj in es.eAllContents() if isinstance(obj, esdl.Asset)]
+    done = threading.Event()
+
+    def change():
+        while not done.is_set():
+            for asset in assets:
+                asset.name = asset.name + '.'
+
+    with esh.freeze(es.id) as view:
+        thread = threading.Thread(target=change)
+        thread.start()
+        try:
+            for _ in range(3):
+                assert view.to_string(compact=True) == expected
+        finally:
+            done.set()
+            thread.join()
+
+
+if __name__ == '__main__':
+    test_frozen_view()
+    test_replaced_elements()
+    test_concurrent_changes()
@@ -0,0 +1,72 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import numpy as np
+from shapely.geometry import shape
+from esdl import esdl
+from esdl.processing import ESDLGeometry, GeometryArrays
+
+EXTERIOR = [[4.0, 52.0], [4.2, 52.1], [4.0, 52.2], [4.0, 52.0]]
+INTERIOR = [[4.05, 52.05], [4.06, 52.06], [4.06, 52.05], [4.05, 52.05]]
+MULTIPOLYGON = {'type': 'MultiPolygon', 'coordinates': [[EXTERIOR, INTERIOR], [[[5.0, 51.0], [5.1, 51.0], [5.0, 51.1],
+                                                                              [5.0, 51.0]]]]}
+
+
+def test_esdl_geojson_round_trip():
+    multipolygon = GeometryArrays.from_geojson(MULTIPOLYGON)
+    polygon = multipolygon.polygon[0]
+    assert [(p.lat, p.lon) for p in polygon.interior[0].point] == [(lat, lon) for lon, lat in INTERIOR]
+    assert polygon.exterior.point[1].eContainer() is polygon.exterior
+    assert GeometryArrays.to_geojson(multipolygon, close=False) == MULTIPOLYGON
+    assert ESDLGeometry.create_boundary_from_geometry(polygon)['coordinates'][0] == EXTERIOR + [EXTERIOR[0]]
+
+    line = GeometryArrays.line_from_array(np.array([[4.0, 52.0, 1.5], [4.1, 52.1, 2.5]]))
+    assert [(p.lat, p.lon, p.elevation) for p in line.point] == [(52.0, 4.0, 1.5), (52.1, 4.1, 2.5)]
+    assert GeometryArrays.to_geojson(line) == {'type': 'LineString', 'coordinates': [[4.0, 52.0], [4.1, 52.1]]}
+
+    # the ESDL of constructed geometries is the same as of geometries built point by point
+    expected = esdl.SubPolygon()
+    for lon, lat in INTERIOR:
+        expected.point.append(esdl.Point(lat=lat, lon=lon))
+    assert [p._isset for p in polygon.interior[0].point] == [p._isset for p in expected.point]
+
+
+def test_shapely_and_wkb():
+    multipolygon = GeometryArrays.from_geojson(MULTIPOLYGON)
+    shp = GeometryArrays.to_shapely(multipolygon)
+    assert shp.equals(shape(MULTIPOLYGON))
+    assert GeometryArrays.to_geojson(GeometryArrays.from_shapely(shp), close=False) == MULTIPOLYGON
+
+    for geometry in (multipolygon, multipolygon.polygon[1], esdl.Point(lat=52.0, lon=4.0),
+                     GeometryArrays.line_from_array(EXTERIOR)):
+        for data in (GeometryArrays.to_wkb(geometry), GeometryArrays.to_wkb(geometry, hex=True)):
+            assert GeometryArrays.to_geojson(GeometryArrays.from_wkb(data)) == GeometryArrays.to_geojson(geometry)
+
+
+def test_leaflet_coordinates():
+    latlngs = [{'lat': lat, 'lng': lon} for lon, lat in EXTERIOR[:1] + EXTERIOR[:3]]     # first point sent twice
+    line = ESDLGeometry.create_ESDL_geometry({'type': 'polyline', 'coordinates': latlngs})
+    assert GeometryArrays.line_to_array(line).tolist() == EXTERIOR[:3]
+    polygon = ESDLGeometry.create_ESDL_geometry({'type': 'polygon', 'coordinates': [latlngs]})
+    assert ESDLGeometry.parse_esdl_subpolygon(polygon.exterior) == EXTERIOR
+    assert ESDLGeometry.exchange_coordinates(ESDLGeometry.parse_esdl_subpolygon(polygon.exterior, False)) == \
+        [[lat, lon] for lon, lat in EXTERIOR[:3]]
+    lat, lon = ESDLGeometry.calculate_polygon_center(polygon)
+    assert np.allclose((lat, lon), (52.1, 12.2 / 3))
+
+
+if __name__ == '__main__':
+    test_esdl_geojson_round_trip()
+    test_shapely_and_wkb()
+    test_leaflet_coordinates()
@@ -0,0 +1,88 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import math
+import numpy as np
+from esdl import esdl
+from esdl.processing import ESDLGeometry, GeometryKernels
+
+
+def scalar_distance(lat1, lon1, lat2, lon2):
+    # the original pure Python implementation of ESDLGeometry.distance()
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) * math.sin(dlat / 2) +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) * math.sin(dlon / 2))
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def test_haversine_and_bearing():
+    assert round(ESDLGeometry.distance((48.1372, 11.5756), (52.5186, 13.4083)), 1) == 504.2
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(50.5, 53.5, 1000)
+    lons = rng.uniform(3.5, 7.0, 1000)
+    expected = [scalar_distance(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(999)]
+    assert np.allclose(GeometryKernels.segment_lengths(lats, lons), expected, rtol=1e-12)
+    assert math.isclose(GeometryKernels.polyline_length(lats, lons), sum(expected), rel_tol=1e-12)
+    assert GeometryKernels.polyline_length([52.0], [4.0]) == 0.0
+
+    assert np.allclose(GeometryKernels.bearing(52.0, 4.0, [53.0, 52.0, 51.0, 52.0], [4.0, 5.0, 4.0, 3.0]),
+                       [0.0, 89.6, 180.0, 270.4], atol=0.1)
+
+
+def test_polyline_lengths():
+    lines = [[(52.0, 4.0), (52.01, 4.0), (52.01, 4.01)], [(52.1, 4.1)], [], [(51.0, 5.0), (51.0, 5.1)]]
+    lats = [lat for line in lines for lat, _ in line]
+    lons = [lon for line in lines for _, lon in line]
+    offsets = np.cumsum([0] + [len(line) for line in lines[:-1]])
+    lengths = GeometryKernels.polyline_lengths(lats, lons, offsets)
+    expected = [sum(scalar_distance(*line[i], *line[i + 1]) for i in range(len(line) - 1)) for line in lines]
+    assert np.allclose(lengths, expected, rtol=1e-12, atol=1e-12)
+
+    # empty polylines and single points at the end
+    assert np.array_equal(GeometryKernels.polyline_lengths([52.0, 52.1], [4.0, 4.1], [0, 2]),
+                          [GeometryKernels.polyline_length([52.0, 52.1], [4.0, 4.1]), 0.0])
+    assert np.array_equal(GeometryKernels.polyline_lengths([52.0, 52.1, 52.2], [4.0, 4.1, 4.2], [0, 2, 3, 3]),
+                          [GeometryKernels.polyline_length([52.0, 52.1], [4.0, 4.1]), 0.0, 0.0, 0.0])
+    assert np.array_equal(GeometryKernels.polyline_lengths([], [], [0, 0]), [0.0, 0.0])
+
+    pipes = []
+    for i, line in enumerate(lines):
+        geometry = esdl.Line(point=[esdl.Point(lat=lat, lon=lon) for lat, lon in line])
+        pipes.append(esdl.Pipe(id='pipe{}'.format(i), geometry=geometry))
+    pipes.append(esdl.Pipe(id='without_geometry', length=12.0))
+    assert ESDLGeometry.update_conductor_lengths(pipes) == pipes[:-1]
+    assert [p.length for p in pipes] == [round(length * 1000, 2) for length in expected] + [12.0]
+    assert math.isclose(ESDLGeometry.line_length(pipes[0].geometry), expected[0] * 1000)
+
+
+def test_point_to_line():
+    p1, p2 = {'x': 0.0, 'y': 0.0}, {'x': 2.0, 'y': 0.0}
+    assert ESDLGeometry.distance_point_to_line({'x': 1.0, 'y': 1.0}, p1, p2) == 1.0
+    assert ESDLGeometry.distance_point_to_line({'x': 3.0, 'y': 1.0}, p1, p2) == 2.0
+    assert ESDLGeometry.distance_point_to_line({'x': -1.0, 'y': 0.0}, p1, p2) == 1.0
+    assert ESDLGeometry.distance_point_to_line({'x': 1.0, 'y': 1.0}, p1, p1) == 2.0
+
+    xs, ys = [0.0, 2.0, 2.0, 0.0], [0.0, 0.0, 2.0, 2.0]
+    assert np.array_equal(GeometryKernels.point_to_polyline_distances(1.0, 0.5, xs, ys), [0.25, 1.0, 2.25])
+    assert GeometryKernels.closest_segment(1.5, 1.9, xs, ys) == 2
+    assert GeometryKernels.closest_segment(1.5, 1.9, xs[:1], ys[:1]) is None
+    line = esdl.Line(point=[esdl.Point(lat=x, lon=y) for x, y in zip(xs, ys)])
+    assert ESDLGeometry.closest_segment(line, 2.1, 1.0) == 1
+
+
+if __name__ == '__main__':
+    test_haversine_and_bearing()
+    test_polyline_lengths()
+    test_point_to_line()
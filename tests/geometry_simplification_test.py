@@ -0,0 +1,88 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import json
+import math
+from shapely.geometry import shape
+from src.geometry_simplification import ZOOM_BANDS, FULL_RESOLUTION, ZOOM_GEOMETRIES_KEY, zoom_band, fit_zoom, \
+    zoom_variants, with_zoom_geometries, boundary_zoom_variants, polygon_variants
+
+
+def create_ring(lon, lat, radius, number_of_points):
+    # a wiggly circle, like the coastline of a municipality
+    ring = [[lon + radius * (1 + 0.02 * math.sin(37 * a)) * math.cos(a),
+             lat + radius * (1 + 0.02 * math.sin(37 * a)) * math.sin(a)]
+            for a in (2 * math.pi * i / number_of_points for i in range(number_of_points))]
+    ring.append(ring[0])
+    return ring
+
+
+def create_boundary(number_of_points=20000):
+    return {'code': 'GM0001', 'name': 'Area', 'geom': {'type': 'MultiPolygon', 'coordinates': [
+        [create_ring(5.0, 52.0, 0.1, number_of_points), create_ring(5.0, 52.0, 0.02, number_of_points // 10)],
+        [create_ring(5.5, 52.0, 0.05, number_of_points // 2)]]}}
+
+
+def test_zoom_band():
+    assert zoom_band(0) == 0
+    assert zoom_band(ZOOM_BANDS[0]) == 0
+    assert zoom_band(ZOOM_BANDS[0] + 1) == 1
+    assert zoom_band(ZOOM_BANDS[-1] + 1) == FULL_RESOLUTION
+    # a municipality (about 20 km) fits at zoom level 10 or 11, the Netherlands at about 7
+    assert 9 <= fit_zoom((4.9, 51.9, 5.2, 52.1)) <= 12
+    assert 6 <= fit_zoom((3.3, 50.7, 7.2, 53.6)) <= 8
+
+
+def test_zoom_variants():
+    geom = create_boundary()['geom']
+    variants = zoom_variants(geom)
+    assert len(variants) == len(ZOOM_BANDS) + 1
+    assert variants[-1] is geom
+
+    sizes = [len(json.dumps(v)) for v in variants]
+    assert sizes == sorted(sizes)
+    # the initial payload of an area that fits the screen is an order of magnitude smaller
+    assert sizes[zoom_band(fit_zoom(shape(geom).bounds))] * 10 <= sizes[-1]
+
+    for v in variants:
+        simplified = shape(v)
+        assert simplified.is_valid
+        assert len(v['coordinates']) == 2 and len(v['coordinates'][0]) == 2     # no polygons or holes are removed
+        assert abs(simplified.area - shape(geom).area) < 0.01 * shape(geom).area
+
+
+def test_boundary_variants():
+    boundary = create_boundary(2000)
+    stored = with_zoom_geometries(boundary)
+    assert ZOOM_GEOMETRIES_KEY not in boundary
+    assert len(stored[ZOOM_GEOMETRIES_KEY]) == FULL_RESOLUTION
+    assert with_zoom_geometries(stored) is stored
+    assert json.loads(json.dumps(stored)) == stored
+
+    # the variants of boundaries that were stored without them are calculated, without changing the boundary
+    variants = boundary_zoom_variants(boundary)
+    assert ZOOM_GEOMETRIES_KEY not in boundary
+    assert variants[:-1] == stored[ZOOM_GEOMETRIES_KEY]
+    assert variants[-1] is boundary['geom']
+    assert boundary_zoom_variants(stored)[:-1] == stored[ZOOM_GEOMETRIES_KEY]
+
+    second_polygon = polygon_variants(variants, 1)
+    assert [v['type'] for v in second_polygon] == ['Polygon'] * len(variants)
+    assert second_polygon[-1]['coordinates'] == boundary['geom']['coordinates'][1]
+
+
+if __name__ == '__main__':
+    test_zoom_band()
+    test_zoom_variants()
+    test_boundary_variants()
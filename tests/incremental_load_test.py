@@ -0,0 +1,87 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+from pyecore.resources.xmi import XMIResource
+from esdl.esdl_handler import EnergySystemHandler, StringURI
+from esdl.resources.xmlresource import XMLResource, LoadOptions
+from tests.benchmark.esdl_generator import generate_esdl_string
+
+ESDL_DIR = os.path.join(os.path.dirname(__file__), 'esdl')
+
+
+def load_with_lxml_tree(esdl_string):
+    # how the ESDL was loaded before: parse the whole document, then decode it
+    esh = EnergySystemHandler()
+    load = XMLResource.load
+    XMLResource.load = XMIResource.load
+    try:
+        es, _ = esh.load_from_string(esdl_string)
+    finally:
+        XMLResource.load = load
+    return esh, es
+
+
+def test_same_result():
+    strings = [generate_esdl_string(areas=2, buildings=20, assets=3, conductors=10)]
+    for filename in ('Left.esdl', 'Left+Carriers.esdl', 'Right1.esdl', 'Right2.esdl'):
+        with open(os.path.join(ESDL_DIR, filename), encoding='UTF-8') as f:
+            strings.append(f.read())
+
+    for esdl_string in strings:
+        expected_esh, expected_es = load_with_lxml_tree(esdl_string)
+        esh = EnergySystemHandler()
+        es, parse_info = esh.load_from_string(esdl_string)
+        # the attributes are written in the (arbitrary) order of _isset, unless the output is compact
+        assert esh.to_string(es.id, compact=True) == expected_esh.to_string(expected_es.id, compact=True)
+        assert [o.eClass.name for o in es.eAllContents()] == [o.eClass.name for o in expected_es.eAllContents()]
+
+
+def test_skeleton_and_progress():
+    esdl_string = generate_esdl_string(areas=3, buildings=50, assets=2, conductors=20)
+    skeletons = []
+    progress_updates = []
+
+    def on_skeleton(es):
+        top_area = es.instance[0].area
+        # the skeleton is known, the contents of the top area are not loaded yet
+        skeletons.append((es.id, top_area.id, top_area.name, len(top_area.area)))
+
+    esh = EnergySystemHandler()
+    es, _ = esh.load_from_string(esdl_string, on_skeleton=on_skeleton,
+                                 on_progress=lambda p: progress_updates.append(p.to_dict()))
+    assert progress_updates[-1]['done']
+    assert skeletons == [(es.id, 'top_area', 'Top area', 0)]
+
+    # with a smaller interval the progress is reported while loading
+    progress_updates.clear()
+    options = esh.load_options(on_progress=lambda p: progress_updates.append(p.to_dict()))
+    options[LoadOptions.PROGRESS_INTERVAL] = 100
+    resource = esh.rset.create_resource(StringURI('progress.esdl', esdl_string))
+    resource.load(options=options)
+    es = resource.contents[0]
+    assert progress_updates[-1]['done'] and progress_updates[-1]['fraction'] == 1.0
+    assert progress_updates[-1]['assets'] == 3 * (1 + 20 + 50 + 50 * 2)
+    assert progress_updates[-1]['bytes_read'] == len(esdl_string.encode('UTF-8'))
+    fractions = [p['fraction'] for p in progress_updates]
+    assert len(fractions) > 1 and fractions == sorted(fractions)
+
+    # references are resolved after loading
+    cable = resource.uuid_dict['cable0_1']
+    assert cable.port[0].connectedTo[0].id == 'cable0_0_out'
+
+
+if __name__ == '__main__':
+    test_same_result()
+    test_skeleton_and_progress()
@@ -0,0 +1,65 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import random
+import time
+import numpy as np
+from src.load_duration_curve import load_duration_curve, ldc_data
+
+
+def python_ldc(values, power):
+    # how the load duration curve was calculated before
+    ldc_series = list(values)
+    ldc_series.sort(reverse=True)
+    power_pos = None
+    power_neg = None
+    ldc_series_decimate = []
+    for idx, item in enumerate(ldc_series):
+        if idx % 40 == 0:
+            ldc_series_decimate.append(item / 3600)
+            if item > 0:
+                power_pos = power
+            if item < 0:
+                power_neg = -power
+    return {'ldc_series': ldc_series_decimate, 'power_pos': power_pos, 'power_neg': power_neg}
+
+
+def test_load_duration_curve():
+    random.seed(1)
+    values = [random.uniform(-1e9, 2e9) for _ in range(10 * 8760)]  # 10 years of hourly values
+
+    start = time.time()
+    expected = python_ldc(values, 1000.0)
+    python_time = time.time() - start
+    array = np.array(values)
+    start = time.time()
+    result = ldc_data(array, 1000.0, scale=1 / 3600)
+    numpy_time = time.time() - start
+    print('LDC of {} values: python {:.4f}s, numpy {:.4f}s'.format(len(values), python_time, numpy_time))
+
+    assert result['power_pos'] == expected['power_pos'] and result['power_neg'] == expected['power_neg']
+    assert np.allclose(result['ldc_series'], expected['ldc_series'])
+
+    curve = load_duration_curve(array, max_points=100)
+    assert len(curve) == 100
+    assert curve[0] == array.max() and curve[-1] == array.min()
+    assert np.all(np.diff(curve) <= 0)
+
+    # missing values are ignored
+    assert load_duration_curve([3.0, float('nan'), 1.0, 2.0], step=1).tolist() == [3.0, 2.0, 1.0]
+    assert ldc_data([], 10.0) == {'ldc_series': [], 'power_pos': None, 'power_neg': None}
+
+
+if __name__ == '__main__':
+    test_load_duration_curve()
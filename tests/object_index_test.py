@@ -0,0 +1,72 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from esdl.processing import ESDLEcore
+
+ESDL_FILE = os.path.join(os.path.dirname(__file__), 'esdl', 'Left.esdl')
+
+
+def scan(es, esdl_type):
+    return [o for o in es.eAllContents() if isinstance(o, esdl_type)]
+
+
+def test_object_index():
+    esh = EnergySystemHandler()
+    es, _ = esh.load_file(ESDL_FILE)
+    assert esh.get_all_instances_of_type(esdl.EnergyAsset, es.id) == scan(es, esdl.EnergyAsset)
+    assert esh.get_all_instances_of_type(esdl.Port, es.id) == scan(es, esdl.Port)
+    # the index groups the instances per EClass, unless they are requested in document order
+    index = esh.get_object_index(es.id)
+    assert set(index.instances_of(esdl.EnergyAsset.eClass)) == set(scan(es, esdl.EnergyAsset))
+
+    area = es.instance[0].area
+    sub_area = esdl.Area(id=esh.generate_uuid(), name='sub')
+    area.area.append(sub_area)
+    pv = esdl.PVInstallation(id=esh.generate_uuid(), name='pv')
+    pv.port.append(esdl.OutPort(id=esh.generate_uuid()))
+    area.asset.append(pv)
+    esh.add_object_to_dict(es.id, pv, recursive=True)
+    assert pv in esh.get_all_instances_of_type(esdl.Producer, es.id)
+    assert esh.get_all_instances_of_type(esdl.Port, es.id) == scan(es, esdl.Port)
+    assert esh.get_all_instances_of_type_in_container(esdl.PVInstallation, sub_area, es.id) == []
+    assert esh.get_all_instances_of_type_in_container(esdl.Port, area, es.id) == scan(area, esdl.Port)
+
+    # move to another area, pyecore sends a REMOVE notification first
+    sub_area.asset.append(pv)
+    assert esh.get_all_instances_of_type_in_container(esdl.PVInstallation, sub_area, es.id) == [pv]
+    assert pv in esh.get_all_instances_of_type(esdl.PVInstallation, es.id)
+
+    sub_area.asset.remove(pv)
+    assert pv not in esh.get_all_instances_of_type(esdl.PVInstallation, es.id)
+    assert esh.get_all_instances_of_type(esdl.Port, es.id) == scan(es, esdl.Port)
+
+
+def test_reachable_references_in_document_order():
+    esh = EnergySystemHandler()
+    es, _ = esh.load_file(ESDL_FILE)
+    area = es.instance[0].area
+    # an object that is added later, in front of the others
+    area.asset.insert(0, esdl.PVInstallation(id='first', name='pv', port=[esdl.OutPort(id='first_port')]))
+    types = ['InPort', 'OutPort']
+    references = ESDLEcore.get_reachable_references(es, types)
+    assert [r['id'] for r in references] == [o.id for o in es.eAllContents() if o.eClass.name in types]
+    assert references[0]['id'] == 'first_port'
+
+
+if __name__ == '__main__':
+    test_object_index()
+    test_reachable_references_in_document_order()
@@ -0,0 +1,45 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+from src.process_es_delta import EmittedState, diff_entries
+
+
+def test_diff_entries():
+    asset_list = [
+        ['point', 'asset', 'PV1', 'pv1', 'PVInstallation', [52.0, 5.0], {}, 'ENABLED', [], 'Producer'],
+        ['point', 'asset', 'HP1', 'hp1', 'HeatPump', [52.1, 5.1], {}, 'ENABLED', [], 'Conversion'],
+        ['point', 'potential', 'Wind', 'wp1', 'WindPotential', [52.2, 5.2]],
+    ]
+    conn_list = [{'from-port-id': 'p1', 'from-asset-id': 'pv1', 'to-port-id': 'p2', 'to-asset-id': 'hp1'}]
+    previous = EmittedState(1, asset_list, [], [['Area', 'a1', 'Area', 0]], conn_list)
+
+    new_asset_list = [
+        ['point', 'asset', 'PV1', 'pv1', 'PVInstallation', [52.0, 5.0], {}, 'ENABLED', [], 'Producer'],
+        ['point', 'asset', 'HP1', 'hp1', 'HeatPump', [52.3, 5.3], {}, 'ENABLED', [], 'Conversion'],
+        ['point', 'asset', 'B1', 'b1', 'Battery', [52.4, 5.4], {}, 'ENABLED', [], 'Storage'],
+    ]
+    current = EmittedState(2, new_asset_list, [], [['Area', 'a1', 'Area', 0]], [])
+
+    added, changed, removed = diff_entries(previous.asset_pots, current.asset_pots)
+    assert [a[3] for a in added] == ['b1']
+    assert [a[3] for a in changed] == ['hp1']
+    assert removed == ['wp1']
+
+    added, changed, removed = diff_entries(previous.connections, current.connections)
+    assert added == [] and changed == []
+    assert removed == [('p1', 'p2')]
+
+
+if __name__ == '__main__':
+    test_diff_entries()
@@ -0,0 +1,47 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import numpy as np
+from esdl.processing import ESDLGeometry
+from utils.RDWGSConverter import RDWGSConverter
+
+
+def test_array_conversion_matches_scalar():
+    converter = RDWGSConverter()
+    rng = np.random.default_rng(3)
+    rd = np.column_stack((rng.uniform(0, 300000, 2000), rng.uniform(300000, 620000, 2000)))
+    wgs = converter.fromRdToWgsArray(rd)
+    assert np.allclose(wgs, [converter.fromRdToWgs(c) for c in rd.tolist()], rtol=0, atol=1e-12)
+    assert np.allclose(converter.fromWgsToRdArray(wgs), [converter.fromWgsToRd(c) for c in wgs.tolist()],
+                       rtol=0, atol=1e-8)
+    # the series are approximations, converting back is accurate to within a meter
+    assert np.abs(converter.fromWgsToRdArray(wgs) - rd).max() < 1.0
+
+    # Amersfoort, the origin of RD
+    assert np.allclose(converter.fromRdToWgsArray([[155000, 463000]]), [[52.15517440, 5.38720621]])
+    assert converter.fromRdToWgsArray([]).shape == (0, 2)
+
+
+def test_polygon_conversion():
+    polygon = [[[155000, 463000], [156000, 463000], [156000, 464000, 0.0], [155000, 463000]]]
+    expected = [[RDWGSConverter().fromRdToWgs(point) for point in ring] for ring in polygon]
+    converted = ESDLGeometry.convert_mp_rd_to_wgs([[list(ring) for ring in polygon]])[0]
+    assert np.allclose(converted[0], expected[0], rtol=0, atol=1e-12)
+    assert ESDLGeometry.convert_polygon_rd_to_wgs(polygon) is polygon      # converted in place
+    assert polygon == converted
+
+
+if __name__ == '__main__':
+    test_array_conversion_matches_scalar()
+    test_polygon_conversion()
@@ -0,0 +1,144 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import pickle
+import tempfile
+import time
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from extensions.session_store import SharedSessionBackend, FileSystemByteStore, VersionConflict
+
+
+def create_handler(number_of_assets):
+    esh = EnergySystemHandler()
+    es = esh.create_empty_energy_system('Test', '', 'Instance', 'Area')
+    area = es.instance[0].area
+    for i in range(number_of_assets):
+        pv = esdl.PVInstallation(id='pv{}'.format(i), name='PV {}'.format(i), power=1000.0 + i)
+        pv.geometry = esdl.Point(lat=52.0 + i * 1e-5, lon=5.0 - i * 1e-5)
+        pv.port.append(esdl.OutPort(id='pv{}_out'.format(i), name='Out'))
+        area.asset.append(pv)
+    return esh
+
+
+def model_contents(esh):
+    return [(o.eClass.name, sorted((a.name, str(o.eGet(a))) for a in o.eClass.eAllAttributes()))
+            for o in esh.get_energy_system().eAllContents()]
+
+
+def xml_pickling(esh):
+    # how the EnergySystemHandler was pickled before snapshots were introduced
+    return pickle.dumps({'energySystem': esh.to_string()})
+
+
+def xml_unpickling(data):
+    esh = EnergySystemHandler()
+    esh.load_from_string(pickle.loads(data)['energySystem'])
+    return esh
+
+
+def test_snapshot_round_trip():
+    esh = create_handler(2000)
+
+    start = time.time()
+    xml_data = xml_pickling(esh)
+    xml_save_time = time.time() - start
+    start = time.time()
+    xml_unpickling(xml_data)
+    xml_restore_time = time.time() - start
+
+    start = time.time()
+    snapshot = esh.to_snapshot()
+    snapshot_time = time.time() - start
+    start = time.time()
+    restored = EnergySystemHandler.from_snapshot(snapshot)
+    restore_time = time.time() - start
+
+    print('XML pickling: {} bytes, save {:.3f}s, restore {:.3f}s'.format(len(xml_data), xml_save_time,
+                                                                          xml_restore_time))
+    print('Snapshot:     {} bytes, save {:.3f}s, restore {:.3f}s'.format(len(snapshot), snapshot_time,
+                                                                          restore_time))
+    assert len(snapshot) * 5 < len(xml_data)
+    assert model_contents(restored) == model_contents(esh)
+    assert restored.get_by_id(esh.get_energy_system().id, 'pv10').name == 'PV 10'
+    assert model_contents(pickle.loads(pickle.dumps(esh))) == model_contents(esh)
+
+
+def test_shared_session_backend():
+    with tempfile.TemporaryDirectory() as path:
+        # two worker processes using the same session store
+        worker1 = SharedSessionBackend(FileSystemByteStore(path))
+        worker2 = SharedSessionBackend(FileSystemByteStore(path))
+
+        esh = create_handler(10)
+        worker1.set('client', 'esh', esh)
+        worker1.set('client', 'active_es_id', esh.get_energy_system().id)
+        worker1.commit('client')
+
+        esh2 = worker2.get('client', 'esh')
+        assert worker2.get('client', 'active_es_id') == esh.get_energy_system().id
+        assert model_contents(esh2) == model_contents(esh)
+        version = worker2.store.version('client', 'esh')
+        worker2.commit('client')
+        assert worker2.store.version('client', 'esh') == version  # unchanged values are not written again
+
+        # change the energy system in place in a next request in worker 2, worker 1 rehydrates it when requested
+        esh2 = worker2.get('client', 'esh')
+        esh2.get_energy_system().instance[0].area.asset[0].name = 'Changed'
+        worker2.commit('client')
+        assert worker2.store.version('client', 'esh') == version + 1
+        esh1 = worker1.get('client', 'esh')
+        assert esh1 is not esh
+        assert esh1.get_energy_system().instance[0].area.asset[0].name == 'Changed'
+        assert worker1.get('client', 'esh') is esh1  # no rehydration when the version did not change
+
+        worker1.delete('client', 'active_es_id')
+        assert worker2.get('client', 'active_es_id') is None
+
+
+def test_concurrent_changes():
+    with tempfile.TemporaryDirectory() as path:
+        worker1 = SharedSessionBackend(FileSystemByteStore(path))
+        worker2 = SharedSessionBackend(FileSystemByteStore(path))
+        worker1.set('client', 'esh', create_handler(10))
+        worker1.commit('client')
+
+        # both workers change the same energy system in a request, the changes of the last one are not written
+        esh1 = worker1.get('client', 'esh')
+        esh2 = worker2.get('client', 'esh')
+        esh1.get_energy_system().instance[0].area.asset[0].name = 'Changed by worker 1'
+        esh2.get_energy_system().instance[0].area.asset[1].name = 'Changed by worker 2'
+        assert worker1.commit('client') == []
+        assert worker2.commit('client') == ['esh']
+        esh2 = worker2.get('client', 'esh')
+        assert esh2.get_energy_system().instance[0].area.asset[0].name == 'Changed by worker 1'
+        assert esh2.get_energy_system().instance[0].area.asset[1].name != 'Changed by worker 2'
+
+        store = FileSystemByteStore(path)
+        version = store.write('client', 'value', b'1')
+        assert store.write('client', 'value', b'2', version) == version + 1
+        try:
+            store.write('client', 'value', b'3', version)
+            assert False, 'VersionConflict expected'
+        except VersionConflict as e:
+            assert e.key == 'value'
+        assert store.read('client', 'value') == (version + 1, b'2')
+        assert store.write('client', 'value', b'3') == version + 2
+        assert sorted(store.keys('client')) == ['esh', 'last-accessed', 'value']
+
+
+if __name__ == '__main__':
+    test_snapshot_round_trip()
+    test_shared_session_backend()
+    test_concurrent_changes()
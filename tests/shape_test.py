@@ -39,12 +39,12 @@ if __name__ == '__main__':
     print(multipolygon.get_geojson_feature())
     print(multipolygon.get_wkt())
 
-    # mp_esdl = multipolygon.get_esdl()
-    # print(mp_esdl)
-    #
-    # mp2 = Shape.create(mp_esdl)
-    # if multipolygon.get_geojson_feature() != mp2.get_geojson_feature():
-    #     raise Exception("Serious problem")
+    mp_esdl = multipolygon.get_esdl()
+    print(mp_esdl)
+
+    mp2 = Shape.create(mp_esdl)
+    if multipolygon.get_geojson_feature() != mp2.get_geojson_feature():
+        raise Exception("Serious problem")
 
     mp = {'type': 'MultiPolygon', 'coordinates': [[[[6.517865836818061, 52.61891793172544],
                                                [6.518247060916366, 52.61646820565353],
@@ -0,0 +1,85 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+import random
+import tempfile
+import time
+import shapefile
+from esdl import esdl
+from extensions.shapefile_converter import ShapefileConverter
+
+
+def create_shapefiles(directory, number_of_buildings):
+    random.seed(3)
+    pipes = shapefile.Writer(os.path.join(directory, 'pipes'), shapeType=shapefile.POLYLINE)
+    pipes.field('Name', 'C')
+    pipes.field('Diameter', 'N', decimal=1)
+    pipes.line([[[155000.0, 463000.0], [155100.0, 463000.0], [155100.0, 463250.0]]])
+    pipes.record('Pipe A', 200.0)
+    pipes.close()
+
+    buildings = shapefile.Writer(os.path.join(directory, 'buildings'), shapeType=shapefile.POLYGON)
+    buildings.field('naam', 'C')
+    buildings.field('type', 'C')
+    for i in range(number_of_buildings):
+        x, y = 150000.0 + random.random() * 10000, 460000.0 + random.random() * 10000
+        buildings.poly([[[x, y], [x, y + 10], [x + 10, y + 10], [x + 10, y], [x, y]]])
+        buildings.record('Building {}'.format(i), 'windturbine')
+    # a building with two parts
+    buildings.poly([[[0.0, 0.0], [0.0, 10.0], [10.0, 10.0], [0.0, 0.0]],
+                    [[20.0, 20.0], [20.0, 30.0], [30.0, 30.0], [30.0, 20.0], [20.0, 20.0]]])
+    buildings.record('Two parts', 'windturbine')
+    buildings.close()
+
+
+def test_to_esdl():
+    converter = ShapefileConverter.__new__(ShapefileConverter)
+    transformer = converter.get_coordinate_transformer()
+    with tempfile.TemporaryDirectory() as directory:
+        create_shapefiles(directory, 5000)
+
+        area = esdl.Area(id='area', name='Pipes')
+        sf = shapefile.Reader(os.path.join(directory, 'pipes'))
+        converter.to_esdl(area, sf, transformer, 'type_record')
+        sf.close()
+        pipe = area.asset[0]
+        assert isinstance(pipe, esdl.Pipe)
+        assert pipe.innerDiameter == 0.2 and pipe.outerDiameter == 0.2
+        assert len(pipe.geometry.point) == 3
+        assert 340 < pipe.length < 360
+
+        area = esdl.Area(id='area', name='Buildings')
+        sf = shapefile.Reader(os.path.join(directory, 'buildings'))
+        start = time.time()
+        timings = converter.to_esdl(area, sf, transformer, 'type_record')
+        print('Converted {} buildings in {:.3f}s: {}'.format(len(area.asset), time.time() - start, timings))
+
+        shape_records = sf.shapeRecords()
+        assert len(area.asset) == len(shape_records)
+        for asset, shape_record in zip(area.asset[:100], shape_records):
+            assert isinstance(asset, esdl.WindTurbine)
+            assert asset.name == shape_record.record[0]
+            for point, (x, y) in zip(asset.geometry.exterior.point, shape_record.shape.points):
+                lon, lat = transformer.transform(x, y)  # transform each point, as was done before
+                assert abs(point.lon - lon) < 1e-9 and abs(point.lat - lat) < 1e-9
+
+        two_parts = area.asset[-1]
+        assert isinstance(two_parts.geometry, esdl.MultiPolygon)
+        assert [len(p.exterior.point) for p in two_parts.geometry.polygon] == [4, 5]
+        sf.close()
+
+
+if __name__ == '__main__':
+    test_to_esdl()
@@ -0,0 +1,96 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import random
+import time
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from src.shape import Shape
+from src.spatial_index import SpatialIndex
+
+
+def create_neighbourhood(number_of_houses, number_of_pipes):
+    random.seed(2)
+    esh = EnergySystemHandler()
+    es = esh.create_empty_energy_system('Test', '', 'Instance', 'Area')
+    area = es.instance[0].area
+    for i in range(number_of_houses):
+        hd = esdl.HeatingDemand(id='hd{}'.format(i), name='House {}'.format(i))
+        hd.geometry = esdl.Point(lat=52.0 + random.random() * 0.05, lon=5.0 + random.random() * 0.05)
+        hd.port.append(esdl.InPort(id='hd{}_in'.format(i)))
+        area.asset.append(hd)
+    for i in range(number_of_pipes):
+        pipe = esdl.Pipe(id='pipe{}'.format(i), name='Pipe {}'.format(i))
+        lat, lon = 52.0 + random.random() * 0.05, 5.0 + random.random() * 0.05
+        line = esdl.Line()
+        line.point.append(esdl.Point(lat=lat, lon=lon))
+        line.point.append(esdl.Point(lat=lat + 0.0005, lon=lon + 0.0005))
+        pipe.geometry = line
+        pipe.port.append(esdl.InPort(id='pipe{}_in'.format(i)))
+        pipe.port.append(esdl.OutPort(id='pipe{}_out'.format(i)))
+        area.asset.append(pipe)
+    area.asset.append(esdl.Pipe(id='no_geometry'))
+    return esh, es
+
+
+def brute_force_nearest(shape, objects):
+    # how the closest asset was found before
+    min_distance = 1e99
+    closest = None
+    for obj in objects:
+        distance = Shape.create(obj.geometry).shape.distance(shape)
+        if distance < min_distance:
+            min_distance = distance
+            closest = obj
+    return closest, min_distance
+
+
+def test_spatial_index():
+    esh, es = create_neighbourhood(2000, 1000)
+    houses = esh.get_all_instances_of_type(esdl.HeatingDemand, es.id)
+    pipes = [p for p in esh.get_all_instances_of_type(esdl.Pipe, es.id) if p.geometry]
+
+    start = time.time()
+    index = SpatialIndex.of_types(esh, es.id, [esdl.Pipe])
+    house_shapes = [Shape.create(h.geometry).shape for h in houses]
+    nearest = [index.nearest(shape) for shape in house_shapes]
+    index_time = time.time() - start
+    assert len(index) == 1000  # the pipe without geometry is ignored
+
+    start = time.time()
+    expected = [brute_force_nearest(shape, pipes) for shape in house_shapes[:100]]
+    brute_force_time = (time.time() - start) * len(houses) / 100
+    print('Nearest pipe for {} houses: index {:.3f}s, brute force (estimated) {:.3f}s'.format(
+        len(houses), index_time, brute_force_time))
+    for (pipe, distance), (expected_pipe, expected_distance) in zip(nearest, expected):
+        assert abs(distance - expected_distance) < 1e-12
+
+    # within distance
+    shape = house_shapes[0]
+    result = index.within_distance(shape, 0.005)
+    expected_pipes = {p for p in pipes if Shape.create(p.geometry).shape.distance(shape) <= 0.005}
+    assert {p for p, d in result} == expected_pipes
+    assert [d for p, d in result] == sorted(d for p, d in result)
+
+    # excluding the nearest object itself
+    house_index = SpatialIndex(houses)
+    house, distance = house_index.nearest(house_shapes[0], exclude=lambda h: h is houses[0])
+    assert house is not houses[0]
+    assert distance == min(s.distance(house_shapes[0]) for s in house_shapes[1:])
+
+    assert SpatialIndex([]).nearest(shape) == (None, None)
+
+
+if __name__ == '__main__':
+    test_spatial_index()
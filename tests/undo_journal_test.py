@@ -0,0 +1,147 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import threading
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from esdl.undo import UndoJournal
+from tests.benchmark.esdl_generator import generate_energy_system, line
+from tests.frozen_view_test import edit
+
+
+def test_undo_redo():
+    esh, es = generate_energy_system(areas=2, buildings=5, assets=3, conductors=5)
+    journal = esh.get_undo_journal(es.id)
+    assert UndoJournal.of(es.eResource) is journal
+    original = esh.to_string(es.id, compact=True)
+
+    with journal.action('Edit'):
+        edit(esh, es)
+    edited = esh.to_string(es.id, compact=True)
+    neighbourhood = es.instance[0].area.area[0].area[0]
+    with journal.action('Delete'):
+        neighbourhood.asset.remove(neighbourhood.asset[0])
+    deleted = esh.to_string(es.id, compact=True)
+    assert [a.label for a in journal.undo_stack] == ['Edit', 'Delete']
+
+    assert journal.undo().label == 'Delete'
+    assert esh.to_string(es.id, compact=True) == edited
+    assert journal.undo().label == 'Edit'
+    assert esh.to_string(es.id, compact=True) == original
+    assert journal.undo() is None and not journal.can_undo()
+
+    # undo and redo are not recorded themselves
+    journal.redo()
+    assert esh.to_string(es.id, compact=True) == edited
+    journal.redo()
+    assert esh.to_string(es.id, compact=True) == deleted
+    assert not journal.can_redo()
+
+    # a new change discards the redo history, changes outside action() are grouped until the next action
+    journal.undo()
+    es.name = 'New name'
+    es.description = 'New description'
+    assert not journal.can_redo()
+    journal.undo()
+    assert es.name == 'Benchmark ' and es.description == 'Synthetic energy system'
+
+    journal.close()
+    assert journal not in es.eResource.listeners
+    assert esh.get_undo_journal(es.id) is not journal
+
+
+def test_coalesce_and_memory_limit():
+    esh, es = generate_energy_system(areas=1, buildings=2, assets=1, conductors=3)
+    journal = esh.get_undo_journal(es.id)
+    cable = es.instance[0].area.area[0].area[0].asset[1]
+    original_line = cable.geometry
+
+    # dragging the points of a line around sends a new line for every move
+    for i in range(50):
+        with journal.action('Move cable', coalesce_key=('move', cable.id)):
+            cable.geometry = line(52.0, 4.0 + i / 1000, 52.1, 4.1)
+            cable.length = 1000.0 + i
+    assert len(journal.undo_stack) == 1 and len(journal.undo_stack[0].changes) == 2
+    journal.undo()
+    assert cable.geometry is original_line and cable.length == 1000.0
+    journal.redo()
+    assert cable.geometry.point[0].lon == 4.049
+
+    # other actions are not merged, the oldest ones are dropped when the history uses too much memory
+    with journal.action('Rename'):
+        cable.name = 'Renamed cable'
+    journal.max_bytes = 10 * journal.undo_stack[-1].size
+    for i in range(50):
+        with journal.action('Rename'):
+            cable.name = 'Cable {}'.format(i)
+    assert len(journal.undo_stack) == 10 and journal.size <= journal.max_bytes
+    assert journal.undo_stack[0].label == 'Rename'
+    journal.undo()
+    assert cable.name == 'Cable 48'
+
+
+def test_handler_undo_updates_objects_by_id():
+    generated_esh, generated_es = generate_energy_system(areas=1, buildings=2, assets=3, conductors=2)
+    # loading registers all objects by id
+    esh = EnergySystemHandler()
+    es, _ = esh.load_from_string(generated_esh.to_string(generated_es.id))
+    area = es.instance[0].area
+    asset = next(o for o in es.eAllContents() if isinstance(o, esdl.EnergyAsset) and o.port)
+    journal = esh.get_undo_journal(es.id)
+
+    with journal.action('Delete'):
+        esh.remove_object_from_dict(es.id, asset, recursive=True)
+        asset.eContainer().asset.remove(asset)
+    with journal.action('Add'):
+        pv = esdl.PVInstallation(id='pv', name='PV', port=[esdl.OutPort(id='pv_out')])
+        area.asset.append(pv)
+        esh.add_object_to_dict(es.id, pv, recursive=True)
+
+    assert esh.undo(es.id).label == 'Add'
+    assert 'pv' not in esh.get_resource(es.id).uuid_dict and 'pv_out' not in esh.get_resource(es.id).uuid_dict
+    assert esh.undo(es.id).label == 'Delete'
+    assert esh.get_by_id(es.id, asset.id) is asset and esh.get_by_id(es.id, asset.port[0].id) is asset.port[0]
+    assert esh.undo(es.id) is None
+
+    assert esh.redo(es.id).label == 'Delete'
+    assert asset.id not in esh.get_resource(es.id).uuid_dict
+    assert esh.redo(es.id).label == 'Add'
+    assert esh.get_by_id(es.id, 'pv_out') is pv.port[0]
+
+
+def test_changes_of_other_threads():
+    esh, es = generate_energy_system(areas=1, buildings=2, assets=1, conductors=1)
+    journal = esh.get_undo_journal(es.id)
+    asset = es.instance[0].area.area[0].area[0].asset[0]
+
+    def background_job():
+        es.description = 'Changed by a background job'
+
+    with journal.action('Rename'):
+        asset.name = 'Renamed'
+        job = threading.Thread(target=background_job)
+        job.start()
+        job.join()
+    assert [len(action.changes) for action in journal.undo_stack] == [1, 1]
+    assert journal.undo().label == 'Rename'
+    assert asset.name != 'Renamed' and es.description == 'Changed by a background job'
+    journal.undo()
+    assert es.description == 'Synthetic energy system'
+
+
+if __name__ == '__main__':
+    test_undo_redo()
+    test_coalesce_and_memory_limit()
+    test_handler_undo_updates_objects_by_id()
+    test_changes_of_other_threads()
@@ -0,0 +1,97 @@
+#  This work is based on original code developed and copyrighted by TNO 2020.
+#  Subsequent contributions are licensed to you by the developers of such code and are
+#  made available to the Project under one or several contributor license agreements.
+#
+#  This work is licensed to you under the Apache License, Version 2.0.
+#  You may obtain a copy of the license at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Contributors:
+#      TNO         - Initial implementation
+#  Manager:
+#      TNO
+
+import os
+from io import BytesIO
+from lxml.etree import Element, ElementTree
+from pyecore.resources.xmi import XMIResource
+from esdl.esdl_handler import EnergySystemHandler
+from esdl.resources.xmlresource import XSI, XSI_URL
+from tests.benchmark.esdl_generator import generate_energy_system
+
+ESDL_FILE = os.path.join(os.path.dirname(__file__), 'esdl', 'Left+Carriers.esdl')
+
+
+def test_streaming_serialization():
+    esh = EnergySystemHandler()
+    es, _ = esh.load_file(ESDL_FILE)
+    esdl_string = esh.to_string()
+
+    chunks = list(esh.to_chunks(chunk_size=256))
+    assert len(chunks) > 1
+    assert b''.join(chunks).decode('UTF-8') == esdl_string
+
+    esh2 = EnergySystemHandler()
+    es2, parse_info = esh2.load_from_string(esdl_string)
+    assert parse_info == []
+    assert [o.eClass.name for o in es2.eAllContents()] == [o.eClass.name for o in es.eAllContents()]
+    carrier = es2.energySystemInformation.carriers.carrier[0]
+    assert carrier.name == 'Crude oil' and carrier.emission == 73.3
+    assert carrier.emissionUnit.perMultiplier.name == 'GIGA'
+
+
+def test_compact_serialization():
+    for esh, es in (generate_energy_system(areas=2, buildings=5), (EnergySystemHandler(), None)):
+        if es is None:
+            es, _ = esh.load_file(ESDL_FILE)
+        pretty = esh.to_string(es.id)
+        compact = esh.to_string(es.id, compact=True)
+        assert len(compact) < len(pretty)
+        assert '\n  ' not in compact
+        assert b''.join(esh.to_chunks(es.id, chunk_size=256, compact=True)).decode('UTF-8') == compact
+
+        # the same energy system is loaded from both, the compact serialization of which does not depend on the
+        # order in which the attributes were set
+        for esdl_string in (pretty, compact):
+            esh2 = EnergySystemHandler()
+            es2, parse_info = esh2.load_from_string(esdl_string)
+            assert parse_info == []
+            assert [o.eClass.name for o in es2.eAllContents()] == [o.eClass.name for o in es.eAllContents()]
+            assert esh2.to_string(es2.id, compact=True) == compact
+
+
+def _tree_serialization(resource):
+    """Serializes the energy system by building a complete lxml tree, as the XMLResource did before streaming"""
+    resource.prefixes.clear()
+    resource.reverse_nsmap.clear()
+    root = resource.contents[0]
+    resource.register_eobject_epackage(root)
+    tmp = XMIResource._go_across(resource, root, False)
+    nsmap = {XSI: XSI_URL}
+    nsmap.update(resource.prefixes)
+    xml_root = Element(tmp.tag, nsmap=nsmap)
+    xml_root[:] = tmp[:]
+    xml_root.attrib.update(tmp.attrib)
+    tree = ElementTree(xml_root)
+    output = BytesIO()
+    tree.write(output, pretty_print=True, xml_declaration=True, encoding=tree.docinfo.encoding)
+    return output.getvalue().decode('UTF-8')
+
+
+def test_same_as_tree_serialization():
+    esh, es = generate_energy_system(areas=2, buildings=5)
+    es.name = 'Special & <characters> "quoted"\n\tin a name: \u00e9\u00e8\u20ac'
+    es.description = ''
+    esh2 = EnergySystemHandler()
+    esh2.load_file(ESDL_FILE)
+    for handler in (esh, esh2):
+        streamed = handler.to_string()
+        assert streamed == _tree_serialization(handler.get_resource())
+        assert '></' not in streamed
+
+
+if __name__ == '__main__':
+    test_streaming_serialization()
+    test_compact_serialization()
+    test_same_as_tree_serialization()
@@ -1,2 +1,3 @@
 pyecoregen --verbose --auto-register-package -e https://raw.githubusercontent.com/EnergyTransition/ESDL/master/esdl/model/esdl.ecore -o .
 curl https://raw.githubusercontent.com/EnergyTransition/ESDL/master/esdl/model/esdl.ecore -o esdl/esdl.ecore
+python -m esdl.processing.EcoreDocumentation esdl/esdl.ecore esdl/esdl_doc_index.json
@@ -15,6 +15,49 @@
 # Formules voor benadering zijn gebaseerd op http://www.dekoepel.nl/pdf/Transformatieformules.pdf
 # Bovenstaande link werkt helaas niet meer, daar Stiching de Koepel opgeheven is. Backup link: http://media.thomasv.nl/2015/07/Transformatieformules.pdf
 
+import numpy as np
+
+# coefficients of the series: term k is Kpq[k] * dX^Kp[k] * dY^Kq[k]
+Kp = [0, 2, 0, 2, 0, 2, 1, 4, 2, 4, 1]
+Kq = [1, 0, 2, 1, 3, 2, 0, 0, 3, 1, 1]
+Kpq = [3235.65389, -32.58297, -0.24750, -0.84978, -0.06550, -0.01709, -0.00738, 0.00530, -0.00039, 0.00033,
+       -0.00012]
+
+Lp = [1, 1, 1, 3, 1, 3, 0, 3, 1, 0, 2, 5]
+Lq = [0, 1, 2, 0, 3, 1, 1, 2, 4, 2, 0, 0]
+Lpq = [5260.52916, 105.94684, 2.45656, -0.81885, 0.05594, -0.05607, 0.01199, -0.00256, 0.00128, 0.00022,
+       -0.00022, 0.00026]
+
+Rp = [0, 1, 2, 0, 1, 3, 1, 0, 2]
+Rq = [1, 1, 1, 3, 0, 1, 3, 2, 3]
+Rpq = [190094.945, -11832.228, -114.221, -32.391, -0.705, -2.340, -0.608, -0.008, 0.148]
+
+Sp = [1, 0, 2, 1, 3, 0, 2, 1, 0, 1]
+Sq = [0, 2, 0, 2, 0, 1, 2, 1, 4, 4]
+Spq = [309056.544, 3638.893, 73.077, -157.984, 59.788, 0.433, -6.439, -0.032, 0.092, -0.054]
+
+
+def _powers(values, max_power):
+    """Returns the table of values^0 .. values^max_power (one row per power), by repeated multiplication"""
+    table = np.empty((max_power + 1, len(values)))
+    table[0] = 1.0
+    for p in range(1, max_power + 1):
+        np.multiply(table[p - 1], values, out=table[p])
+    return table
+
+
+def _series(p, q, coefficients, u, v):
+    """Evaluates sum(coefficients[k] * u^p[k] * v^q[k]) for arrays u and v"""
+    u_powers = _powers(u, max(p))
+    v_powers = _powers(v, max(q))
+    return np.asarray(coefficients) @ (u_powers[p] * v_powers[q])
+
+
+def _as_coordinates(coords) -> np.ndarray:
+    coords = np.asarray(coords, dtype=np.float64)
+    return coords.reshape(len(coords), -1) if len(coords) else np.empty((0, 2))
+
+
 class RDWGSConverter:
     X0 = 155000
     Y0 = 463000
@@ -23,16 +66,6 @@ class RDWGSConverter:
 
     def fromRdToWgs(self, coords):
 
-        Kp = [0, 2, 0, 2, 0, 2, 1, 4, 2, 4, 1]
-        Kq = [1, 0, 2, 1, 3, 2, 0, 0, 3, 1, 1]
-        Kpq = [3235.65389, -32.58297, -0.24750, -0.84978, -0.06550, -0.01709, -0.00738, 0.00530, -0.00039, 0.00033,
-               -0.00012]
-
-        Lp = [1, 1, 1, 3, 1, 3, 0, 3, 1, 0, 2, 5]
-        Lq = [0, 1, 2, 0, 3, 1, 1, 2, 4, 2, 0, 0]
-        Lpq = [5260.52916, 105.94684, 2.45656, -0.81885, 0.05594, -0.05607, 0.01199, -0.00256, 0.00128, 0.00022,
-               -0.00022, 0.00026]
-
         dX = 1E-5 * (coords[0] - self.X0)
         dY = 1E-5 * (coords[1] - self.Y0)
 
@@ -51,14 +84,6 @@ class RDWGSConverter:
 
     def fromWgsToRd(self, coords):
 
-        Rp = [0, 1, 2, 0, 1, 3, 1, 0, 2]
-        Rq = [1, 1, 1, 3, 0, 1, 3, 2, 3]
-        Rpq = [190094.945, -11832.228, -114.221, -32.391, -0.705, -2.340, -0.608, -0.008, 0.148]
-
-        Sp = [1, 0, 2, 1, 3, 0, 2, 1, 0, 1]
-        Sq = [0, 2, 0, 2, 0, 1, 2, 1, 4, 4]
-        Spq = [309056.544, 3638.893, 73.077, -157.984, 59.788, 0.433, -6.439, -0.032, 0.092, -0.054]
-
         dPhi = 0.36 * (coords[0] - self.phi0)
         dLam = 0.36 * (coords[1] - self.lam0)
 
@@ -73,4 +98,30 @@ class RDWGSConverter:
             Y = Y + (Spq[s] * dPhi ** Sp[s] * dLam ** Sq[s])
         Y = self.Y0 + Y
 
-        return [X, Y]
\ No newline at end of file
+        return [X, Y]
+
+    def fromRdToWgsArray(self, coords):
+        """
+        Converts many RD coordinates at once: coords is an (n, 2) array (or list) of [x, y], the result an (n, 2)
+        array of [lat, lon], the same as fromRdToWgs() for each pair
+        """
+        coords = _as_coordinates(coords)
+        dX = 1E-5 * (coords[:, 0] - self.X0)
+        dY = 1E-5 * (coords[:, 1] - self.Y0)
+        result = np.empty((len(coords), 2))
+        result[:, 0] = self.phi0 + _series(Kp, Kq, Kpq, dX, dY) / 3600
+        result[:, 1] = self.lam0 + _series(Lp, Lq, Lpq, dX, dY) / 3600
+        return result
+
+    def fromWgsToRdArray(self, coords):
+        """
+        Converts many WGS84 coordinates at once: coords is an (n, 2) array (or list) of [lat, lon], the result an
+        (n, 2) array of [x, y], the same as fromWgsToRd() for each pair
+        """
+        coords = _as_coordinates(coords)
+        dPhi = 0.36 * (coords[:, 0] - self.phi0)
+        dLam = 0.36 * (coords[:, 1] - self.lam0)
+        result = np.empty((len(coords), 2))
+        result[:, 0] = self.X0 + _series(Rp, Rq, Rpq, dPhi, dLam)
+        result[:, 1] = self.Y0 + _series(Sp, Sq, Spq, dPhi, dLam)
+        return result